@@ -4,19 +4,123 @@
 #   - 提供process_ted_text()函数供main.py调用
 #   - 使用workflows.py中定义的工作流
 #   - 返回结构化结果
+#   - 相同transcript命中结果缓存时跳过工作流
+#   - 工作流通过astream异步运行，每个语义块完成时即可回调推送
+#   - 工作流挂载检查点时，相同thread_id再次运行会从断点恢复
 
-from app.workflows import create_parallel_shadow_writing_workflow
-from typing import Callable, Optional
+import asyncio
+from app.workflows import get_async_parallel_shadow_writing_workflow, build_workflow_config
+from app.result_cache import lookup_talk_results, store_talk_results
+from app.provider_router import track_failovers
+from app.json_repair import track_lossy_results
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+
+def normalize_final_chunks(final: List[Any]) -> List[Any]:
+    """
+    把工作流的final_shadow_chunks转换为可序列化的列表
+
+    Args:
+        final: 字典列表或对象列表
+
+    Returns:
+        list: 字典（或字符串）列表
+    """
+    results = []
+    for item in final:
+        if isinstance(item, dict):
+            results.append(item)
+        elif hasattr(item, 'dict'):
+            results.append(item.dict())
+        elif hasattr(item, 'model_dump'):
+            results.append(item.model_dump())
+        else:
+            results.append(str(item))
+    return results
+
+
+async def astream_shadow_writing(
+    workflow,
+    initial_state: dict,
+    config: dict,
+    on_chunk: Optional[Callable[[Any, int, int], Awaitable[None]]] = None
+) -> List[Any]:
+    """
+    以astream运行Shadow Writing工作流，按完成顺序逐个产出语义块结果
+
+    参数见 astream_shadow_writing_with_total
+
+    Returns:
+        list: 全部语义块结果（已转换为dict），顺序为完成顺序
+    """
+    results, _ = await astream_shadow_writing_with_total(workflow, initial_state, config, on_chunk)
+    return results
+
+
+async def astream_shadow_writing_with_total(
+    workflow,
+    initial_state: dict,
+    config: dict,
+    on_chunk: Optional[Callable[[Any, int, int], Awaitable[None]]] = None
+) -> Tuple[List[Any], int]:
+    """
+    以astream运行Shadow Writing工作流，返回结果和语义块总数（用于判断是否每个语义块都产出了结果）
+
+    Args:
+        workflow: 编译后的工作流（异步并行版本）
+        initial_state: 初始状态
+        config: 运行配置（build_workflow_config）。工作流挂载了检查点且config带thread_id时，
+                若该线程已有检查点则从断点恢复（initial_state被忽略）
+        on_chunk: 每个语义块完成时的回调 await on_chunk(结果, 已完成数, 语义块总数)
+
+    Returns:
+        tuple: (全部语义块结果（已转换为dict，顺序为完成顺序）, 语义块总数)
+    """
+    results: List[Any] = []
+    completed_chunks = 0
+    total_chunks = 0
+    stream_input = initial_state
+
+    if getattr(workflow, "checkpointer", None) and config.get("configurable", {}).get("thread_id"):
+        snapshot = await workflow.aget_state(config)
+        if snapshot.values:
+            # 该线程已有检查点：从断点恢复，已完成的语义块直接产出缓存结果，不再调用LLM
+            stream_input = None
+            total_chunks = len(snapshot.values.get("semantic_chunks") or [])
+            print(f"[AGENT] 从检查点恢复: {config['configurable']['thread_id']}")
+            if not snapshot.next:
+                # 上次已运行完毕（结果未及保存），直接使用最终状态
+                results = normalize_final_chunks(snapshot.values.get("final_shadow_chunks") or [])
+                if on_chunk:
+                    for completed_chunks, chunk_result in enumerate(results, 1):
+                        await on_chunk(chunk_result, completed_chunks, total_chunks)
+                return results, total_chunks
+
+    async for update in workflow.astream(stream_input, config=config, stream_mode="updates"):
+        for node_name, node_update in update.items():
+            node_update = node_update or {}
+            if node_name == "semantic_chunking":
+                total_chunks = len(node_update.get("semantic_chunks") or [])
+            elif node_name == "chunk_pipeline":
+                completed_chunks += 1
+                chunk_results = normalize_final_chunks(node_update.get("final_shadow_chunks") or [])
+                results.extend(chunk_results)
+                if on_chunk:
+                    for chunk_result in chunk_results:
+                        await on_chunk(chunk_result, completed_chunks, total_chunks)
+
+    return results, total_chunks
 
 
 # 暴露给main.py的处理函数
-def process_ted_text(
+async def process_ted_text(
     text: str,
     llm: Callable,  # 注入的LLM函数
     target_topic: str = "",
     ted_title: Optional[str] = None,
     ted_speaker: Optional[str] = None,
-    ted_url: Optional[str] = None
+    ted_url: Optional[str] = None,
+    use_cache: bool = True
 ) -> dict:
     """
     处理TED文本的主函数
@@ -27,13 +131,28 @@ def process_ted_text(
         ted_title: TED演讲标题（可选）
         ted_speaker: TED演讲者（可选）
         ted_url: TED演讲URL（可选）
+        use_cache: 是否使用演讲结果缓存（默认True）
         
     Returns:
         dict: 包含处理结果的字典
     """
+
+    # 命中结果缓存：直接返回，不运行工作流
+    cache_key = None
+    if use_cache:
+        cache_key, cached = await asyncio.to_thread(
+            lookup_talk_results, text, target_topic, getattr(llm, "model_name", None)
+        )
+        if cached is not None:
+            return {
+                "success": True,
+                "results": cached,
+                "result_count": len(cached),
+                "cached": True
+            }
     
-    # 创建并行工作流（推荐），传入注入的LLM
-    workflow = create_parallel_shadow_writing_workflow(llm=llm)
+    # 获取共享的异步并行工作流（只编译一次），注入的LLM通过config传入
+    workflow = get_async_parallel_shadow_writing_workflow()
     # workflow = create_shadow_writing_workflow()  # 旧版串行（已弃用）
     
     # 初始状态（并行版本简化）
@@ -43,32 +162,24 @@ def process_ted_text(
         "ted_title": ted_title,
         "ted_speaker": ted_speaker,
         "ted_url": ted_url,        
+        "task_id": None,  # 单文件处理不推送SSE进度
         "semantic_chunks": [],
         "final_shadow_chunks": [],  # 并行版本：operator.add自动汇总
         "current_node": "",
         "error_message": None
     }
     
-    # 运行并行工作流
-    result = workflow.invoke(initial_state)
-    
-    # 提取最终结果
-    final = result.get("final_shadow_chunks", [])
-    
-    # 处理返回值：final 可能是字典列表或对象列表
-    results = []
-    for item in final:
-        if isinstance(item, dict):
-            results.append(item)
-        elif hasattr(item, 'dict'):
-            results.append(item.dict())
-        elif hasattr(item, 'model_dump'):
-            results.append(item.model_dump())
-        else:
-            results.append(str(item))
+    # 异步运行并行工作流（不阻塞事件循环）
+    with track_failovers() as failovers, track_lossy_results() as lossy:
+        results, total_chunks = await astream_shadow_writing_with_total(
+            workflow, initial_state, build_workflow_config(llm=llm)
+        )
+
+    await asyncio.to_thread(store_talk_results, cache_key, results, total_chunks, failovers.count, lossy.count)
     
     return {
         "success": True,
         "results": results,
-        "result_count": len(results)
-    }
\ No newline at end of file
+        "result_count": len(results),
+        "cached": False
+    }
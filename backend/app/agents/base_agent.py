@@ -5,6 +5,7 @@ This module defines the abstract base class for all agents in the system,
 ensuring consistent interface and error handling across different agent implementations.
 """
 
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Dict, Any, TypeVar, Generic, Optional, List, Union
 from dataclasses import dataclass, field
@@ -55,6 +56,21 @@ class BaseAgent(ABC):
         """
         pass
 
+    async def aprocess(self, state: StateType) -> Dict[str, Any]:
+        """
+        Async variant of process.
+
+        Agents that call the LLM override this to await the async LLM path.
+        The default implementation runs the synchronous process in a worker thread.
+
+        Args:
+            state: The current state object to process
+
+        Returns:
+            Dict containing the updated state data
+        """
+        return await asyncio.to_thread(self.process, state)
+
     def validate_input(self, state: StateType) -> bool:
         """
         Validate the input state before processing.
@@ -118,6 +134,29 @@ class BaseAgent(ABC):
         except Exception as e:
             return self.handle_error(e, state)
 
+    async def acall(self, state: StateType) -> Dict[str, Any]:
+        """
+        Async callable interface, mirroring __call__ around aprocess.
+
+        Used as an async LangGraph node so that LLM-bound agents can share one event loop.
+        """
+        try:
+            if not self.validate_input(state):
+                return self.handle_error(
+                    ValueError(f"Invalid input state for agent {self.name}"),
+                    state
+                )
+
+            result = await self.aprocess(state)
+
+            if not isinstance(result, dict):
+                raise ValueError(f"Agent {self.name} must return a dict, got {type(result)}")
+
+            return result
+
+        except Exception as e:
+            return self.handle_error(e, state)
+
 
 class ShadowWritingAgent(BaseAgent):
     """
@@ -0,0 +1,264 @@
+# chunk_batcher.py
+# 作用：语义块流水线的LLM批量调用基类
+# 功能：
+#   - 各语义块流水线仍然独立运行，节点把本块的输入提交给批处理器
+#   - 短时间窗口内提交的输入（最多K个）合并为一次LLM调用，长篇说明只发送一次
+#   - 批量结果按块编号拆回各自的流水线；缺失或无效的块用单块prompt单独调用兜底
+#   - 按 (LLM函数, 用户/优先级, 任务) 分组，不同任务的调用不混在一起，公平调度仍按用户计费
+#   - 批量调用在批次所属任务的上下文中执行（截止时间、token用量的task_id和阶段）
+#   - 子类提供批量/单块prompt、输出格式和单项结果校验（见 shadow_batcher / quality_batcher）
+
+import asyncio
+import contextvars
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from app.config import settings
+from app.fair_scheduler import current_tenant
+from app.token_usage import current_task_id
+
+
+def iter_batch_items(result: Any, count: int) -> Iterator[Tuple[int, dict]]:
+    """
+    遍历批量调用结果中的各项
+
+    Args:
+        result: LLM返回的JSON（{"results": [...]}，也接受直接返回的列表）
+        count: 本批输入数量
+
+    Yields:
+        (块序号(0开始), 结果项)：只包含编号合法的字典项；重复编号只返回第一个
+    """
+    items = result.get("results") if isinstance(result, dict) else result
+    if not isinstance(items, list):
+        return
+
+    seen = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        # 块编号可能是 3、"3" 或 "Chunk 3"
+        number = re.search(r"\d+", str(item.get("chunk_id", "")))
+        if not number:
+            continue
+        index = int(number.group()) - 1
+        if not 0 <= index < count or index in seen:
+            continue
+        seen.add(index)
+        yield index, item
+
+
+@dataclass
+class _Item:
+    """等待批量处理的输入"""
+    payload: Any
+    future: asyncio.Future
+
+
+@dataclass
+class _PendingBatch:
+    """正在收集的批次"""
+    llm_function: Callable
+    context: contextvars.Context
+    items: List[_Item] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+    task: Optional[asyncio.Task] = None
+    waiting: int = 0
+
+
+class ChunkBatcher(ABC):
+    """
+    语义块批处理器基类（事件循环内使用）
+
+    子类需要设置：
+        name: 日志标签
+        size_setting / wait_setting: K和等待时间对应的配置项名
+        batch_format / single_format: 批量/单块调用的输出格式
+    并实现 build_batch_prompt / build_single_prompt / parse_item
+    """
+
+    name = "CHUNK BATCH"
+    size_setting = ""
+    wait_setting = ""
+    batch_format: Dict[str, str] = {}
+    single_format: Dict[str, str] = {}
+
+    def __init__(self, max_batch_size: Optional[int] = None, max_wait_ms: Optional[int] = None):
+        """
+        Args:
+            max_batch_size: 每次调用最多处理的输入数K（默认读取 size_setting 配置项）
+            max_wait_ms: 收集批次的最长等待时间（毫秒，默认读取 wait_setting 配置项）
+        """
+        self._max_batch_size = max_batch_size
+        self._max_wait_ms = max_wait_ms
+        self._open: Dict[Any, _PendingBatch] = {}
+        self._default_llm: Optional[Callable] = None
+        self.total_batches = 0
+        self.total_chunks = 0
+        self.total_fallbacks = 0
+
+    @abstractmethod
+    def build_batch_prompt(self, payloads: List[Any]) -> str:
+        """渲染批量prompt（块编号为列表序号+1）"""
+
+    @abstractmethod
+    def build_single_prompt(self, payload: Any) -> str:
+        """渲染单块prompt（与未开启批量模式时相同）"""
+
+    @abstractmethod
+    def parse_item(self, item: dict) -> Optional[Any]:
+        """把批量结果中的一项转换为单块调用的结果格式，无效时返回None"""
+
+    def split_result(self, result: Any, count: int) -> Dict[int, Any]:
+        """
+        把批量调用的结果拆分为每个输入的结果
+
+        Args:
+            result: LLM返回的JSON
+            count: 本批输入数量
+
+        Returns:
+            Dict[int, Any]: {块序号(0开始): 单块结果}，只包含有效的项
+        """
+        parsed = {}
+        for index, item in iter_batch_items(result, count):
+            value = self.parse_item(item)
+            if value is not None:
+                parsed[index] = value
+        return parsed
+
+    @property
+    def enabled(self) -> bool:
+        """配置中是否开启批量模式"""
+        return getattr(settings, self.size_setting) > 1
+
+    @property
+    def max_batch_size(self) -> int:
+        """每次调用最多处理的输入数K"""
+        return max(1, self._max_batch_size or getattr(settings, self.size_setting))
+
+    @property
+    def max_wait(self) -> float:
+        """收集批次的最长等待时间（秒）"""
+        wait_ms = self._max_wait_ms if self._max_wait_ms is not None else getattr(settings, self.wait_setting)
+        return max(0, wait_ms) / 1000
+
+    def _resolve_llm(self, llm_function: Optional[Callable]) -> Callable:
+        """未注入LLM时共用一个默认异步LLM函数（各流水线的请求因此可以合并）"""
+        if llm_function is not None:
+            return llm_function
+        if self._default_llm is None:
+            from app.utils import ensure_dependencies, create_async_llm_function_native
+            ensure_dependencies()
+            self._default_llm = create_async_llm_function_native()
+        return self._default_llm
+
+    async def submit(self, llm_function: Optional[Callable], payload: Any) -> Any:
+        """
+        提交一个语义块的输入，等待所在批次完成
+
+        Args:
+            llm_function: 异步LLM函数（None时使用默认LLM）
+            payload: 本块的输入（传给 build_batch_prompt / build_single_prompt）
+
+        Returns:
+            与单块调用 llm(build_single_prompt(payload), single_format) 的返回值格式相同
+        """
+        from app.utils import as_async_llm_function
+
+        llm_function = self._resolve_llm(llm_function)
+        loop = asyncio.get_running_loop()
+        key = (id(llm_function), current_tenant(), current_task_id())
+
+        batch = self._open.get(key)
+        if batch is None:
+            # 记录批次所属任务的上下文，批量调用不使用触发刷新的回调/提交者的上下文
+            batch = _PendingBatch(
+                llm_function=as_async_llm_function(llm_function),
+                context=contextvars.copy_context()
+            )
+            batch.timer = loop.call_later(self.max_wait, self._flush, key, batch)
+            self._open[key] = batch
+
+        item = _Item(payload=payload, future=loop.create_future())
+        batch.items.append(item)
+        batch.waiting += 1
+        if len(batch.items) >= self.max_batch_size:
+            self._flush(key, batch)
+
+        try:
+            return await item.future
+        except asyncio.CancelledError:
+            # 批次中所有输入都已取消（任务被取消）时停止批量调用
+            batch.waiting -= 1
+            if batch.waiting == 0:
+                if batch.task is not None:
+                    batch.task.cancel()
+                elif self._open.get(key) is batch:
+                    batch.timer.cancel()
+                    del self._open[key]
+            raise
+
+    def _flush(self, key: Any, batch: _PendingBatch) -> None:
+        """停止收集，在后台任务中执行批量调用"""
+        if self._open.get(key) is not batch:
+            return
+        del self._open[key]
+        batch.timer.cancel()
+        # 后台任务复制批次所属任务的上下文
+        batch.task = batch.context.run(asyncio.get_running_loop().create_task, self._run(batch))
+
+    async def _run(self, batch: _PendingBatch) -> None:
+        """执行批量调用，把结果分发给各输入，失败的输入单独调用"""
+        items = [item for item in batch.items if not item.future.done()]
+        if not items:
+            return
+
+        results: Dict[int, Any] = {}
+        if len(items) > 1:
+            self.total_batches += 1
+            self.total_chunks += len(items)
+            try:
+                prompt = self.build_batch_prompt([item.payload for item in items])
+                results = self.split_result(await batch.llm_function(prompt, self.batch_format), len(items))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{self.name}] [ERROR] 批量调用失败，逐块重试: {e}")
+            print(f"[{self.name}] {len(items)} 个语义块合并调用，成功拆分 {len(results)} 个")
+
+        for index, item in enumerate(items):
+            if index in results and not item.future.done():
+                item.future.set_result(results[index])
+
+        fallbacks = [item for index, item in enumerate(items) if index not in results]
+        if len(items) > 1:
+            self.total_fallbacks += len(fallbacks)
+        await asyncio.gather(*(self._run_single(batch.llm_function, item) for item in fallbacks))
+
+    async def _run_single(self, llm_function: Callable, item: _Item) -> None:
+        """单个输入使用单块prompt调用"""
+        try:
+            result = await llm_function(self.build_single_prompt(item.payload), self.single_format)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        if not item.future.done():
+            item.future.set_result(result)
+
+    def get_stats(self) -> dict:
+        """获取批量调用统计"""
+        return {
+            "enabled": self.enabled,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000),
+            "batches": self.total_batches,
+            "batched_chunks": self.total_chunks,
+            "avg_batch_size": round(self.total_chunks / self.total_batches, 2) if self.total_batches else 0.0,
+            "fallback_chunks": self.total_fallbacks,
+            "collecting": sum(len(batch.items) for batch in self._open.values())
+        }
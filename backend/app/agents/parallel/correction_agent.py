@@ -4,20 +4,115 @@
 from typing import Dict, Any
 from app.state import ChunkProcessState
 from app.agents.base_agent import ChunkProcessingAgent, StateType
+from app.agents.parallel import pre_quality_agent as pre_quality
 from app.prompts import prompt_manager
-from app.utils import ensure_dependencies, create_llm_function_native
+from app.utils import (
+    ensure_dependencies, create_llm_function_native,
+    create_async_llm_function_native, as_async_llm_function
+)
+
+
+CORRECTION_FORMAT = {
+    "original": "Original sentence, str",
+    "imitation": "Improved migrated sentence, str",
+    "map": "Improved word mapping dictionary, dict"
+}
 
 
 class CorrectionChunkAgent(ChunkProcessingAgent):
     """修正单个Chunk"""
 
-    def process(self, state: StateType) -> Dict[str, Any]:
-        """修正单个Chunk（并行版本）"""
-        chunk_id = state.get("chunk_id", 0)
+    def _build_pre_quality_prompt(self, validated, quality_detail: dict) -> str:
+        """本地预检拒绝的语义块：按拒绝原因和预检指标渲染correction模板（没有LLM的各步骤分数）"""
+        issues = quality_detail.get("issues", [])
+        metrics = quality_detail.get("metrics", {})
+        return prompt_manager.render_prompt(
+            "correction.pre_quality",
+            original=validated.original,
+            imitation=validated.imitation,
+            word_map=validated.map,
+            issues_formatted="\n".join('- ' + issue for issue in issues) if issues else '- None',
+            replaced_words=metrics.get("replaced_words", 0),
+            min_replaced_words=pre_quality.MIN_REPLACED_WORDS,
+            content_overlap=metrics.get("content_overlap", 0.0),
+            max_content_overlap=pre_quality.MAX_CONTENT_OVERLAP,
+            map_coverage=metrics.get("map_coverage", 0.0),
+            min_map_coverage=pre_quality.MIN_MAP_COVERAGE,
+            length_ratio=metrics.get("length_ratio", 0.0),
+            min_length_ratio=pre_quality.LENGTH_RATIO_RANGE[0],
+            max_length_ratio=pre_quality.LENGTH_RATIO_RANGE[1]
+        )
+
+    def _build_prompt(self, state: StateType) -> str:
+        """根据验证结果和质量评估详情渲染correction模板"""
         validated = state.get("validated_shadow")
         quality_detail = state.get("quality_detail", {})
 
-        print(f"[Pipeline {chunk_id}] Correction...")
+        if quality_detail.get("source") == "pre_quality":
+            return self._build_pre_quality_prompt(validated, quality_detail)
+
+        # 获取原始数据
+        original = validated.original
+        imitation = validated.imitation
+        word_map = validated.map
+
+        # 获取质量评估详情
+        quality_score = state.get("quality_score", 0)
+        step1_grammar = quality_detail.get('step1_grammar', 0)
+        step2_content = quality_detail.get('step2_content', 0)
+        step3_logic = quality_detail.get('step3_logic', 0)
+        step3_issues = quality_detail.get('step3_issues', [])
+        step4_topic = quality_detail.get('step4_topic', 0)
+        step5_learning = quality_detail.get('step5_learning', 0)
+        quality_reasoning = quality_detail.get('reasoning', '')
+        logic_veto = quality_detail.get('logic_veto', False)
+
+        # 计算模板中需要的条件文本
+        logic_veto_text = "(CRITICAL FAILURE)" if logic_veto else ""
+        step3_issues_formatted = "\n".join('- ' + issue for issue in step3_issues) if step3_issues else '- None'
+
+        # 计算各维度反馈
+        step1_feedback = 'GOOD' if step1_grammar >= 2 else 'NEEDS IMPROVEMENT'
+        step2_feedback = 'GOOD' if step2_content >= 1 else 'NEEDS IMPROVEMENT'
+        step3_feedback = 'CRITICAL ISSUE' if step3_logic < 2 else 'ACCEPTABLE'
+        step4_feedback = 'GOOD' if step4_topic >= 1 else 'NEEDS IMPROVEMENT'
+        step5_feedback = 'GOOD' if step5_learning >= 1 else 'NEEDS IMPROVEMENT'
+
+        # 逻辑问题详情
+        logic_problems_detail = "\n".join(step3_issues) if step3_issues else 'Check time sequence, cause-effect, severity matching'
+
+        # 渲染correction模板
+        return prompt_manager.render_prompt(
+            "correction.main",
+            original=original,
+            imitation=imitation,
+            word_map=word_map,
+            quality_score=quality_score,
+            step1_grammar=step1_grammar,
+            step2_content=step2_content,
+            step3_logic=step3_logic,
+            step3_issues_formatted=step3_issues_formatted,
+            step4_topic=step4_topic,
+            step5_learning=step5_learning,
+            quality_reasoning=quality_reasoning,
+            logic_veto_text=logic_veto_text,
+            step1_feedback=step1_feedback,
+            step2_feedback=step2_feedback,
+            step3_feedback=step3_feedback,
+            step4_feedback=step4_feedback,
+            step5_feedback=step5_feedback,
+            logic_problems_detail=logic_problems_detail
+        )
+
+    def _precheck(self, state: StateType):
+        """检查是否需要调用LLM修正
+
+        Returns:
+            dict: 无需调用LLM时直接返回的状态更新；需要修正时返回None
+        """
+        chunk_id = state.get("chunk_id", 0)
+        validated = state.get("validated_shadow")
+        quality_detail = state.get("quality_detail", {})
 
         if not validated or not quality_detail:
             return {"corrected_shadow": None}
@@ -28,6 +123,56 @@ class CorrectionChunkAgent(ChunkProcessingAgent):
             print(f"[Pipeline {chunk_id}] [SKIP] Quality passed, no correction needed")
             return {"corrected_shadow": validated}
 
+        return None
+
+    def _parse_result(self, state: StateType, result: Any) -> Dict[str, Any]:
+        """验证LLM修正结果并转换为流水线状态更新"""
+        chunk_id = state.get("chunk_id", 0)
+        validated = state.get("validated_shadow")
+        original = validated.original
+        paragraph = validated.paragraph
+
+        if result and isinstance(result, dict):
+            improved_original = str(result.get('original', original)).strip()
+            improved_imitation = str(result.get('imitation', '')).strip()
+            improved_map = result.get('map', {})
+
+            # 验证修正结果
+            if (improved_imitation and
+                len(improved_imitation.split()) >= 8 and
+                isinstance(improved_map, dict) and
+                len(improved_map) >= 2):
+
+                corrected_data = type('obj', (object,), {
+                    'original': improved_original,
+                    'imitation': improved_imitation,
+                    'map': improved_map,
+                    'paragraph': paragraph
+                })
+
+                print(f"[Pipeline {chunk_id}] [SUCCESS] Correction completed")
+                print(f"   Original: {original[:50]}...")
+                print(f"   Improved: {improved_imitation[:50]}...")
+                print(f"   Map entries: {len(improved_map)}")
+
+                return {"corrected_shadow": corrected_data}
+            else:
+                print(f"[Pipeline {chunk_id}] [FAIL] Correction failed: Invalid result format")
+                return {"corrected_shadow": None, "error": "Invalid correction result"}
+        else:
+            print(f"[Pipeline {chunk_id}] [ERROR] Correction failed: Invalid LLM response")
+            return {"corrected_shadow": None, "error": "Invalid LLM response"}
+
+    def process(self, state: StateType) -> Dict[str, Any]:
+        """修正单个Chunk（并行版本）"""
+        chunk_id = state.get("chunk_id", 0)
+
+        print(f"[Pipeline {chunk_id}] Correction...")
+
+        skipped = self._precheck(state)
+        if skipped is not None:
+            return skipped
+
         try:
             # 优先使用注入的LLM函数，如果没有则使用全局配置
             llm_function = state.get("llm_function")
@@ -36,98 +181,32 @@ class CorrectionChunkAgent(ChunkProcessingAgent):
                 ensure_dependencies()
                 llm_function = create_llm_function_native()
 
-            # 获取原始数据
-            original = validated.original
-            imitation = validated.imitation
-            word_map = validated.map
-            paragraph = validated.paragraph
-
-            # 获取质量评估详情
-            quality_score = state.get("quality_score", 0)
-            step1_grammar = quality_detail.get('step1_grammar', 0)
-            step2_content = quality_detail.get('step2_content', 0)
-            step3_logic = quality_detail.get('step3_logic', 0)
-            step3_issues = quality_detail.get('step3_issues', [])
-            step4_topic = quality_detail.get('step4_topic', 0)
-            step5_learning = quality_detail.get('step5_learning', 0)
-            quality_reasoning = quality_detail.get('reasoning', '')
-            logic_veto = quality_detail.get('logic_veto', False)
-
-            # 计算模板中需要的条件文本
-            logic_veto_text = "(CRITICAL FAILURE)" if logic_veto else ""
-            step3_issues_formatted = "\n".join('- ' + issue for issue in step3_issues) if step3_issues else '- None'
-
-            # 计算各维度反馈
-            step1_feedback = 'GOOD' if step1_grammar >= 2 else 'NEEDS IMPROVEMENT'
-            step2_feedback = 'GOOD' if step2_content >= 1 else 'NEEDS IMPROVEMENT'
-            step3_feedback = 'CRITICAL ISSUE' if step3_logic < 2 else 'ACCEPTABLE'
-            step4_feedback = 'GOOD' if step4_topic >= 1 else 'NEEDS IMPROVEMENT'
-            step5_feedback = 'GOOD' if step5_learning >= 1 else 'NEEDS IMPROVEMENT'
-
-            # 逻辑问题详情
-            logic_problems_detail = "\n".join(step3_issues) if step3_issues else 'Check time sequence, cause-effect, severity matching'
-
-            # 渲染correction模板
-            correction_prompt = prompt_manager.render_prompt(
-                "correction.main",
-                original=original,
-                imitation=imitation,
-                word_map=word_map,
-                quality_score=quality_score,
-                step1_grammar=step1_grammar,
-                step2_content=step2_content,
-                step3_logic=step3_logic,
-                step3_issues_formatted=step3_issues_formatted,
-                step4_topic=step4_topic,
-                step5_learning=step5_learning,
-                quality_reasoning=quality_reasoning,
-                logic_veto_text=logic_veto_text,
-                step1_feedback=step1_feedback,
-                step2_feedback=step2_feedback,
-                step3_feedback=step3_feedback,
-                step4_feedback=step4_feedback,
-                step5_feedback=step5_feedback,
-                logic_problems_detail=logic_problems_detail
-            )
-
-            correction_format = {
-                "original": "Original sentence, str",
-                "imitation": "Improved migrated sentence, str",
-                "map": "Improved word mapping dictionary, dict"
-            }
-
-            result = llm_function(correction_prompt, correction_format)
-
-            if result and isinstance(result, dict):
-                improved_original = str(result.get('original', original)).strip()
-                improved_imitation = str(result.get('imitation', '')).strip()
-                improved_map = result.get('map', {})
-
-                # 验证修正结果
-                if (improved_imitation and
-                    len(improved_imitation.split()) >= 8 and
-                    isinstance(improved_map, dict) and
-                    len(improved_map) >= 2):
-
-                    corrected_data = type('obj', (object,), {
-                        'original': improved_original,
-                        'imitation': improved_imitation,
-                        'map': improved_map,
-                        'paragraph': paragraph
-                    })
-
-                    print(f"[Pipeline {chunk_id}] [SUCCESS] Correction completed")
-                    print(f"   Original: {original[:50]}...")
-                    print(f"   Improved: {improved_imitation[:50]}...")
-                    print(f"   Map entries: {len(improved_map)}")
-
-                    return {"corrected_shadow": corrected_data}
-                else:
-                    print(f"[Pipeline {chunk_id}] [FAIL] Correction failed: Invalid result format")
-                    return {"corrected_shadow": None, "error": "Invalid correction result"}
-            else:
-                print(f"[Pipeline {chunk_id}] [ERROR] Correction failed: Invalid LLM response")
-                return {"corrected_shadow": None, "error": "Invalid LLM response"}
+            result = llm_function(self._build_prompt(state), CORRECTION_FORMAT)
+            return self._parse_result(state, result)
+
+        except Exception as e:
+            print(f"[Pipeline {chunk_id}] [ERROR] Correction failed: {e}")
+            return {"corrected_shadow": None, "error": str(e)}
+
+    async def aprocess(self, state: StateType) -> Dict[str, Any]:
+        """修正单个Chunk（异步版本，await异步LLM）"""
+        chunk_id = state.get("chunk_id", 0)
+
+        print(f"[Pipeline {chunk_id}] Correction (async)...")
+
+        skipped = self._precheck(state)
+        if skipped is not None:
+            return skipped
+
+        try:
+            llm_function = state.get("async_llm_function") or state.get("llm_function")
+            if llm_function is None:
+                ensure_dependencies()
+                llm_function = create_async_llm_function_native()
+            llm_function = as_async_llm_function(llm_function)
+
+            result = await llm_function(self._build_prompt(state), CORRECTION_FORMAT)
+            return self._parse_result(state, result)
 
         except Exception as e:
             print(f"[Pipeline {chunk_id}] [ERROR] Correction failed: {e}")
@@ -139,3 +218,9 @@ def correction_single_chunk(state: ChunkProcessState) -> dict:
     """向后兼容性函数"""
     agent = CorrectionChunkAgent()
     return agent(state)
+
+
+async def acorrection_single_chunk(state: ChunkProcessState) -> dict:
+    """异步节点函数"""
+    agent = CorrectionChunkAgent()
+    return await agent.acall(state)
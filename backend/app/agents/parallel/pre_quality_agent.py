@@ -0,0 +1,246 @@
+# pre_quality_agent.py
+# 作用：质量评估前的本地预检（不调用LLM）
+# 功能：
+#   - 在 validation 与 quality 之间计算词汇重叠、词汇映射覆盖率、长度比和句子骨架相似度
+#   - 明显不合格（复述原句、映射的词不在原句中、替换词太少）直接判为未通过，跳过LLM评估进入修正
+#   - 各项指标都明显合格时直接判为通过，跳过LLM评估（分数按指标超出通过条件的程度折算到9-11分）
+#   - 其余（边界情况）仍交给 quality 节点调用LLM评估
+#   - 统计预检通过/拒绝/交给LLM的数量和节省的评估调用数
+
+import re
+import threading
+from difflib import SequenceMatcher
+from typing import Any, Dict, List
+from app.config import settings
+from app.state import ChunkProcessState
+from app.agents.base_agent import ChunkProcessingAgent, StateType
+
+
+# 功能词：构成句子骨架，不计入内容词重叠
+FUNCTION_WORDS = {
+    "a", "an", "the", "and", "or", "but", "so", "if", "then", "because", "as", "than", "that", "which",
+    "who", "whom", "whose", "what", "when", "where", "why", "how", "while", "although", "though",
+    "of", "in", "on", "at", "to", "for", "with", "by", "from", "into", "about", "over", "under",
+    "after", "before", "between", "through", "during", "without", "within", "up", "down", "out",
+    "is", "are", "was", "were", "be", "been", "being", "am", "do", "does", "did", "have", "has", "had",
+    "will", "would", "can", "could", "should", "may", "might", "must", "shall",
+    "i", "you", "he", "she", "it", "we", "they", "me", "him", "her", "us", "them",
+    "my", "your", "his", "its", "our", "their", "this", "these", "those", "there", "here",
+    "not", "no", "all", "some", "any", "every", "each", "more", "most", "very", "just", "only"
+}
+
+# 明显不合格：满足任一条件即拒绝
+MIN_REPLACED_WORDS = 2          # 原句中被替换的内容词至少2个
+MIN_MAP_COVERAGE = 0.5          # 至少一半的映射词出现在原句中
+LENGTH_RATIO_RANGE = (0.5, 2.0)  # 迁移句与原句的词数比
+MAX_CONTENT_OVERLAP = 0.8       # 内容词重叠（Jaccard）过高视为复述原句
+
+# 明显合格：同时满足所有条件才跳过LLM评估
+PASS_MIN_REPLACED_WORDS = 3
+PASS_MIN_MAP_ENTRIES = 2
+PASS_LENGTH_RATIO_RANGE = (0.75, 1.33)
+PASS_MIN_STRUCTURE = 0.85       # 句子骨架（功能词+标点序列）相似度
+PASS_MAX_CONTENT_OVERLAP = 0.5
+
+# 直接通过时的分数区间（与LLM评估的通过阈值和满分一致）
+LOCAL_PASS_SCORE = 9.0
+LOCAL_MAX_SCORE = 11.0
+
+_TOKEN = re.compile(r"[a-z0-9']+|[^\sa-z0-9']")
+
+
+def _tokens(text: str) -> List[str]:
+    """小写切分为单词和标点"""
+    return _TOKEN.findall(text.lower())
+
+
+def _words(tokens: List[str]) -> List[str]:
+    return [token for token in tokens if token[0].isalnum()]
+
+
+def _skeleton(tokens: List[str]) -> List[str]:
+    """句子骨架：功能词和标点保留，内容词替换为占位符"""
+    return [token if token in FUNCTION_WORDS or not token[0].isalnum() else "_" for token in tokens]
+
+
+def compute_pre_quality_metrics(original: str, imitation: str, word_map: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    计算本地预检指标
+
+    Args:
+        original: 原句
+        imitation: 迁移句
+        word_map: 词汇映射（键为原句中的词或短语）
+
+    Returns:
+        dict: identical（是否复述原句）、content_overlap、replaced_words、map_entries、
+              map_coverage、length_ratio、structure_similarity
+    """
+    original_tokens, imitation_tokens = _tokens(original), _tokens(imitation)
+    original_words, imitation_words = _words(original_tokens), _words(imitation_tokens)
+
+    original_content = {word for word in original_words if word not in FUNCTION_WORDS}
+    imitation_content = {word for word in imitation_words if word not in FUNCTION_WORDS}
+    union = original_content | imitation_content
+    content_overlap = len(original_content & imitation_content) / len(union) if union else 1.0
+
+    original_set = set(original_words)
+    keys = [key for key in (word_map or {}) if str(key).strip()]
+    covered = sum(1 for key in keys if all(word in original_set for word in _words(_tokens(str(key)))))
+
+    return {
+        "identical": original_words == imitation_words,
+        "content_overlap": round(content_overlap, 3),
+        "replaced_words": len(original_content - imitation_content),
+        "map_entries": len(keys),
+        "map_coverage": round(covered / len(keys), 3) if keys else 0.0,
+        "length_ratio": round(len(imitation_words) / len(original_words), 3) if original_words else 0.0,
+        "structure_similarity": round(
+            SequenceMatcher(None, _skeleton(original_tokens), _skeleton(imitation_tokens), autojunk=False).ratio(), 3
+        )
+    }
+
+
+def classify_pre_quality(metrics: Dict[str, Any]) -> tuple:
+    """
+    根据指标判定预检结果
+
+    Args:
+        metrics: compute_pre_quality_metrics 的返回值
+
+    Returns:
+        (decision, issues)：decision 为 "reject" / "pass" / "llm"，issues 为拒绝原因列表
+    """
+    issues = []
+    if metrics["identical"]:
+        issues.append("Imitation repeats the original sentence")
+    if metrics["content_overlap"] >= MAX_CONTENT_OVERLAP:
+        issues.append(f"Imitation reuses too many content words ({metrics['content_overlap']:.0%} overlap)")
+    if metrics["replaced_words"] < MIN_REPLACED_WORDS:
+        issues.append(f"Only {metrics['replaced_words']} content word(s) replaced")
+    if metrics["map_coverage"] < MIN_MAP_COVERAGE:
+        issues.append("Word map keys do not appear in the original sentence")
+    low, high = LENGTH_RATIO_RANGE
+    if not low <= metrics["length_ratio"] <= high:
+        issues.append(f"Imitation length is {metrics['length_ratio']}x the original")
+    if issues:
+        return "reject", issues
+
+    low, high = PASS_LENGTH_RATIO_RANGE
+    if (metrics["map_coverage"] == 1.0 and metrics["map_entries"] >= PASS_MIN_MAP_ENTRIES
+            and metrics["replaced_words"] >= PASS_MIN_REPLACED_WORDS
+            and low <= metrics["length_ratio"] <= high
+            and metrics["structure_similarity"] >= PASS_MIN_STRUCTURE
+            and metrics["content_overlap"] <= PASS_MAX_CONTENT_OVERLAP):
+        return "pass", []
+    return "llm", []
+
+
+def local_quality_score(metrics: Dict[str, Any]) -> float:
+    """
+    直接通过的语义块的分数：按骨架相似度、内容词重叠和替换词数超出通过条件的程度，
+    在通过阈值和满分之间折算
+
+    Args:
+        metrics: compute_pre_quality_metrics 的返回值（已判定为 pass）
+
+    Returns:
+        float: 9-11分
+    """
+    margins = [
+        (metrics["structure_similarity"] - PASS_MIN_STRUCTURE) / (1 - PASS_MIN_STRUCTURE),
+        (PASS_MAX_CONTENT_OVERLAP - metrics["content_overlap"]) / PASS_MAX_CONTENT_OVERLAP,
+        (metrics["replaced_words"] - PASS_MIN_REPLACED_WORDS) / PASS_MIN_REPLACED_WORDS,
+    ]
+    margin = sum(min(max(value, 0.0), 1.0) for value in margins) / len(margins)
+    return round(LOCAL_PASS_SCORE + (LOCAL_MAX_SCORE - LOCAL_PASS_SCORE) * margin, 1)
+
+
+class PreQualityGate:
+    """本地预检统计（各流水线共享，线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.passed = 0
+        self.rejected = 0
+        self.sent_to_llm = 0
+
+    def record(self, decision: str) -> None:
+        with self._lock:
+            if decision == "pass":
+                self.passed += 1
+            elif decision == "reject":
+                self.rejected += 1
+            else:
+                self.sent_to_llm += 1
+
+    def get_stats(self) -> dict:
+        """获取预检统计"""
+        total = self.passed + self.rejected + self.sent_to_llm
+        saved = self.passed + self.rejected
+        return {
+            "enabled": settings.pre_quality_enabled,
+            "checked": total,
+            "passed": self.passed,
+            "rejected": self.rejected,
+            "sent_to_llm": self.sent_to_llm,
+            "llm_calls_saved": saved,
+            "saved_rate": round(saved / total * 100, 2) if total else 0.0
+        }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.passed = self.rejected = self.sent_to_llm = 0
+
+
+class PreQualityChunkAgent(ChunkProcessingAgent):
+    """质量评估前的本地预检"""
+
+    def process(self, state: StateType) -> Dict[str, Any]:
+        """
+        本地预检单个Chunk
+
+        Returns:
+            dict: pre_quality（decision + 指标）；decision 为 pass / reject 时同时写入
+                  quality_passed / quality_score / quality_detail，流水线据此跳过LLM评估。
+                  pass 的分数由指标折算；reject 的分数为0，quality_detail 只包含拒绝原因和指标
+                  （没有LLM的各步骤分数，correction 使用预检专用的模板）
+        """
+        chunk_id = state.get("chunk_id", 0)
+        validated = state.get("validated_shadow")
+
+        if not settings.pre_quality_enabled or not validated:
+            return {"pre_quality": {"decision": "llm"}}
+
+        metrics = compute_pre_quality_metrics(validated.original, validated.imitation, validated.map)
+        decision, issues = classify_pre_quality(metrics)
+        pre_quality_gate.record(decision)
+        print(f"[Pipeline {chunk_id}] Pre-quality: {decision} {metrics}")
+
+        update: Dict[str, Any] = {"pre_quality": {"decision": decision, **metrics}}
+        if decision == "llm":
+            return update
+
+        passed = decision == "pass"
+        update.update({
+            "quality_passed": passed,
+            "quality_score": local_quality_score(metrics) if passed else 0.0,
+            "quality_detail": {
+                "issues": issues,
+                "metrics": metrics,
+                "reasoning": "Local pre-check: " + ("all heuristics passed" if passed else "; ".join(issues)),
+                "source": "pre_quality",
+                "logic_veto": False
+            }
+        })
+        return update
+
+
+# 全局预检统计
+pre_quality_gate = PreQualityGate()
+
+
+def pre_quality_single_chunk(state: ChunkProcessState) -> dict:
+    """节点函数（与其他流水线节点一致的函数接口）"""
+    agent = PreQualityChunkAgent()
+    return agent(state)
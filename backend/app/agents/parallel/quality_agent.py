@@ -1,16 +1,89 @@
 # quality_agent.py
 # 并行处理的Quality Check Agent
+# 异步流水线可开启批量评估（settings.quality_batch_size > 1，见 quality_batcher）
+# 未注入LLM时可开启模型级联（settings.quality_cascade_enabled，见 app/model_cascade.py），可与批量评估同时开启
 
+import time
 from typing import Dict, Any
+from app.config import settings
 from app.state import ChunkProcessState
-from app.utils import ensure_dependencies, create_llm_function_native
+from app.utils import (
+    ensure_dependencies, create_llm_function_native,
+    create_async_llm_function_native, as_async_llm_function
+)
 from app.agents.base_agent import ChunkProcessingAgent, StateType
 from app.prompts import prompt_manager
+from app.model_cascade import quality_cascade
+
+
+EVALUATION_FORMAT = {
+    "step1_grammar": "Grammar structure score 0-3, int",
+    "step2_content": "Content replacement score 0-2, int",
+    "step3_logic": "Logic & plausibility score 0-3, int",
+    "step3_issues": "List of critical logical issues, array",
+    "step4_topic": "Topic migration score 0-2, int",
+    "step5_learning": "Learning value score 0-1, int",
+    "total_score": "Total score 0-11, int",
+    "pass": "true if quality passes threshold, bool",
+    "reasoning": "brief summary focusing on logic check, str"
+}
+
+
+def render_evaluation_prompt(validated) -> str:
+    """使用完整的quality评估模板构建单个语义块的提示词"""
+    return prompt_manager.render_prompt(
+        "quality.evaluation",
+        original=validated.original,
+        imitation=validated.imitation,
+        word_map=validated.map,
+        paragraph=validated.paragraph[:200] + "..."
+    )
 
 
 class QualityChunkAgent(ChunkProcessingAgent):
     """质量评估单个Chunk"""
 
+    def _build_prompt(self, validated) -> str:
+        """使用完整的quality评估模板构建提示词"""
+        return render_evaluation_prompt(validated)
+
+    def _parse_result(self, chunk_id: int, result: Any) -> Dict[str, Any]:
+        """把LLM评估结果转换为流水线状态更新"""
+        if result and isinstance(result, dict):
+            passed = result.get('pass', False)
+            total_score = float(result.get('total_score', 0.0))
+            reasoning = result.get('reasoning', '')
+            step3_issues = result.get('step3_issues', [])
+
+            # 检查逻辑否决条件
+            logic_veto = len(step3_issues) > 0 and result.get('step3_logic', 0) < 2
+
+            status = "[OK]" if passed else "[ERROR]"
+            print(f"[Pipeline {chunk_id}] {status} Quality: {total_score}/11")
+            if reasoning:
+                print(f"   推理: {reasoning}")
+            if step3_issues:
+                print(f"   逻辑问题: {len(step3_issues)} 个")
+
+            return {
+                "quality_passed": passed,
+                "quality_score": total_score,
+                "quality_detail": {
+                    "step1_grammar": result.get('step1_grammar', 0),
+                    "step2_content": result.get('step2_content', 0),
+                    "step3_logic": result.get('step3_logic', 0),
+                    "step3_issues": step3_issues,
+                    "step4_topic": result.get('step4_topic', 0),
+                    "step5_learning": result.get('step5_learning', 0),
+                    "reasoning": reasoning,
+                    "evaluation": result,
+                    "logic_veto": logic_veto
+                }
+            }
+        else:
+            print(f"[Pipeline {chunk_id}] [ERROR] Quality评估失败: 无效响应")
+            return {"quality_passed": False, "quality_score": 0.0, "error": "Invalid LLM response"}
+
     def process(self, state: StateType) -> Dict[str, Any]:
         """质量评估单个Chunk（并行版本）"""
         chunk_id = state.get("chunk_id", 0)
@@ -27,71 +100,56 @@ class QualityChunkAgent(ChunkProcessingAgent):
             if llm_function is None:
                 # Fallback到全局配置，保持向后兼容性
                 ensure_dependencies()
-                llm_function = create_llm_function_native()
-
-            # 获取验证通过的Shadow数据
-            original = validated.original
-            imitation = validated.imitation
-            word_map = validated.map
-            paragraph = validated.paragraph
-
-            # 使用完整的quality评估模板
-            quality_prompt = prompt_manager.render_prompt(
-                "quality.evaluation",
-                original=original,
-                imitation=imitation,
-                word_map=word_map,
-                paragraph=paragraph[:200] + "..."
-            )
-
-            evaluation_format = {
-                "step1_grammar": "Grammar structure score 0-3, int",
-                "step2_content": "Content replacement score 0-2, int",
-                "step3_logic": "Logic & plausibility score 0-3, int",
-                "step3_issues": "List of critical logical issues, array",
-                "step4_topic": "Topic migration score 0-2, int",
-                "step5_learning": "Learning value score 0-1, int",
-                "total_score": "Total score 0-11, int",
-                "pass": "true if quality passes threshold, bool",
-                "reasoning": "brief summary focusing on logic check, str"
-            }
+                if settings.quality_cascade_enabled:
+                    llm_function = quality_cascade.create_llm_function()
+                else:
+                    llm_function = create_llm_function_native()
 
-            result = llm_function(quality_prompt, evaluation_format)
-
-            if result and isinstance(result, dict):
-                passed = result.get('pass', False)
-                total_score = float(result.get('total_score', 0.0))
-                reasoning = result.get('reasoning', '')
-                step3_issues = result.get('step3_issues', [])
-
-                # 检查逻辑否决条件
-                logic_veto = len(step3_issues) > 0 and result.get('step3_logic', 0) < 2
-
-                status = "[OK]" if passed else "[ERROR]"
-                print(f"[Pipeline {chunk_id}] {status} Quality: {total_score}/11")
-                if reasoning:
-                    print(f"   推理: {reasoning}")
-                if step3_issues:
-                    print(f"   逻辑问题: {len(step3_issues)} 个")
-
-                return {
-                    "quality_passed": passed,
-                    "quality_score": total_score,
-                    "quality_detail": {
-                        "step1_grammar": result.get('step1_grammar', 0),
-                        "step2_content": result.get('step2_content', 0),
-                        "step3_logic": result.get('step3_logic', 0),
-                        "step3_issues": step3_issues,
-                        "step4_topic": result.get('step4_topic', 0),
-                        "step5_learning": result.get('step5_learning', 0),
-                        "reasoning": reasoning,
-                        "evaluation": result,
-                        "logic_veto": logic_veto
-                    }
-                }
-            else:
-                print(f"[Pipeline {chunk_id}] [ERROR] Quality评估失败: 无效响应")
-                return {"quality_passed": False, "quality_score": 0.0, "error": "Invalid LLM response"}
+            result = llm_function(self._build_prompt(validated), EVALUATION_FORMAT)
+            return self._parse_result(chunk_id, result)
+
+        except Exception as e:
+            print(f"[Pipeline {chunk_id}] [ERROR] Quality失败: {e}")
+            return {"quality_passed": False, "quality_score": 0.0, "error": str(e)}
+
+    async def aprocess(self, state: StateType) -> Dict[str, Any]:
+        """质量评估单个Chunk（异步版本，await异步LLM）"""
+        chunk_id = state.get("chunk_id", 0)
+        validated = state.get("validated_shadow")
+
+        print(f"[Pipeline {chunk_id}] Quality Check (async)...")
+
+        if not validated:
+            return {"quality_passed": False, "quality_score": 0.0}
+
+        try:
+            llm_function = state.get("async_llm_function") or state.get("llm_function")
+
+            if settings.quality_batch_size > 1:
+                # 批量模式：与同时到达的其他语义块合并评估，无效的评估结果自动单独重试
+                from app.agents.parallel.quality_batcher import quality_batcher
+                if llm_function is None and settings.quality_cascade_enabled:
+                    # 级联：批量评估使用轻量模型，不确定或无效的语义块再由默认模型单独评分
+                    ensure_dependencies()
+                    started = time.perf_counter()
+                    result = await quality_batcher.submit(quality_cascade.light_async_llm(), validated)
+                    result = await quality_cascade.arefine(
+                        self._build_prompt(validated), result, time.perf_counter() - started, EVALUATION_FORMAT
+                    )
+                else:
+                    result = await quality_batcher.submit(llm_function, validated)
+                return self._parse_result(chunk_id, result)
+
+            if llm_function is None:
+                ensure_dependencies()
+                if settings.quality_cascade_enabled:
+                    llm_function = quality_cascade.create_llm_function().async_version
+                else:
+                    llm_function = create_async_llm_function_native()
+            llm_function = as_async_llm_function(llm_function)
+
+            result = await llm_function(self._build_prompt(validated), EVALUATION_FORMAT)
+            return self._parse_result(chunk_id, result)
 
         except Exception as e:
             print(f"[Pipeline {chunk_id}] [ERROR] Quality失败: {e}")
@@ -103,3 +161,9 @@ def quality_single_chunk(state: ChunkProcessState) -> dict:
     """向后兼容性函数"""
     agent = QualityChunkAgent()
     return agent(state)
+
+
+async def aquality_single_chunk(state: ChunkProcessState) -> dict:
+    """异步节点函数"""
+    agent = QualityChunkAgent()
+    return await agent.acall(state)
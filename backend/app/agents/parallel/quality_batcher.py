@@ -0,0 +1,92 @@
+# quality_batcher.py
+# 作用：质量评估多语义块批量调用
+# 功能：
+#   - quality 节点把通过验证的 (original, imitation, map) 提交给批处理器
+#   - 短时间窗口内提交的语义块（最多K个）合并为一次评估调用（quality.batch_evaluation模板），
+#     评分说明只发送一次
+#   - 返回的 {"results": [...]} 按块编号拆回各自的流水线，仍写入各自的 quality_passed / quality_detail；
+#     缺少分数或格式错误的项单独调用 quality.evaluation 重新评估
+#   - 批次收集、分组和兜底逻辑见 chunk_batcher.ChunkBatcher
+
+from typing import Any, List, Optional
+from app.prompts import prompt_manager
+from app.agents.parallel.chunk_batcher import ChunkBatcher
+from app.agents.parallel.quality_agent import EVALUATION_FORMAT, render_evaluation_prompt
+
+
+QUALITY_BATCH_FORMAT = {
+    "results": "每个语义块一项：{chunk_id: 块编号, 以及单块评估的全部字段: "
+               + ", ".join(EVALUATION_FORMAT) + "}, list"
+}
+
+
+def render_batch_evaluation_prompt(validated_items: List[Any]) -> str:
+    """
+    渲染批量质量评估prompt
+
+    Args:
+        validated_items: 通过验证的Shadow Writing结果（块编号为列表序号+1）
+
+    Returns:
+        str: prompt
+    """
+    items = "\n\n".join(
+        f"[Chunk {i}]\n"
+        f"ORIGINAL SENTENCE: \"{validated.original}\"\n"
+        f"MIGRATED SENTENCE: \"{validated.imitation}\"\n"
+        f"WORD MAPPING: {validated.map}\n"
+        f"SOURCE PARAGRAPH: \"{validated.paragraph[:200]}...\""
+        for i, validated in enumerate(validated_items, 1)
+    )
+    return prompt_manager.render_prompt("quality.batch_evaluation", items=items)
+
+
+def parse_evaluation_item(item: dict) -> Optional[dict]:
+    """
+    校验批量评估结果中的一项
+
+    Args:
+        item: 结果项
+
+    Returns:
+        dict | None: 与单块评估相同格式的结果；总分不是数字或 pass 不是布尔值时返回None
+    """
+    if not isinstance(item.get("pass"), bool):
+        return None
+    try:
+        float(item.get("total_score"))
+    except (TypeError, ValueError):
+        return None
+    evaluation = {key: value for key, value in item.items() if key != "chunk_id"}
+    if not isinstance(evaluation.get("step3_issues", []), list):
+        evaluation["step3_issues"] = []
+    return evaluation
+
+
+class QualityBatcher(ChunkBatcher):
+    """
+    质量评估批处理器（事件循环内使用）
+
+    使用方式：
+        result = await quality_batcher.submit(llm_function, validated_shadow)
+        # result 与单块调用 llm(quality.evaluation, EVALUATION_FORMAT) 的返回值格式相同
+    """
+
+    name = "QUALITY BATCH"
+    size_setting = "quality_batch_size"
+    wait_setting = "quality_batch_wait_ms"
+    batch_format = QUALITY_BATCH_FORMAT
+    single_format = EVALUATION_FORMAT
+
+    def build_batch_prompt(self, payloads: List[Any]) -> str:
+        return render_batch_evaluation_prompt(payloads)
+
+    def build_single_prompt(self, payload: Any) -> str:
+        return render_evaluation_prompt(payload)
+
+    def parse_item(self, item: dict) -> Optional[dict]:
+        return parse_evaluation_item(item)
+
+
+# 全局批处理器（K和等待时间读取配置）
+quality_batcher = QualityBatcher()
@@ -0,0 +1,98 @@
+# shadow_batcher.py
+# 作用：Shadow Writing 多语义块批量调用
+# 功能：
+#   - 每个语义块流水线仍然独立运行，shadow_writing 节点把语义块提交给批处理器
+#   - 短时间窗口内提交的语义块（最多K个）合并为一次LLM调用（shadow_writing.batch模板），
+#     长篇说明只发送一次，请求数和prompt token约减少为1/K
+#   - 返回的 {"results": [...]} 按块编号拆回各自的流水线；缺失或无效的块单独调用 shadow_writing.main 兜底
+#   - 批次收集、分组和兜底逻辑见 chunk_batcher.ChunkBatcher
+
+from typing import Any, Dict, List, Optional
+from app.prompts import prompt_manager
+from app.agents.parallel.chunk_batcher import ChunkBatcher
+from app.agents.parallel.shadow_writing_agent import SHADOW_WRITING_FORMAT
+
+
+SHADOW_WRITING_BATCH_FORMAT = {
+    "results": "每个语义块一项：{chunk_id: 块编号, original: 原句, imitation: 迁移句, map: 词汇映射}, list"
+}
+
+
+def render_batch_prompt(chunk_texts: List[str]) -> str:
+    """
+    渲染批量Shadow Writing prompt
+
+    Args:
+        chunk_texts: 语义块文本（块编号为列表序号+1）
+
+    Returns:
+        str: prompt
+    """
+    chunks = "\n\n".join(f"[Chunk {i}]\n{text}" for i, text in enumerate(chunk_texts, 1))
+    return prompt_manager.render_prompt("shadow_writing.batch", chunks=chunks)
+
+
+def parse_shadow_item(item: dict) -> Optional[dict]:
+    """
+    校验批量结果中的一项
+
+    Args:
+        item: 结果项
+
+    Returns:
+        dict | None: {"original", "imitation", "map"}，原句或迁移句为空时返回None
+    """
+    original = str(item.get("original") or "").strip()
+    imitation = str(item.get("imitation") or "").strip()
+    if not original or not imitation:
+        return None
+    shadow_map = item.get("map")
+    return {
+        "original": original,
+        "imitation": imitation,
+        "map": shadow_map if isinstance(shadow_map, dict) else {}
+    }
+
+
+def split_batch_result(result: Any, count: int) -> Dict[int, dict]:
+    """
+    把批量调用的结果拆分为每个语义块的结果
+
+    Args:
+        result: LLM返回的JSON（{"results": [...]}，也接受直接返回的列表）
+        count: 语义块数量
+
+    Returns:
+        Dict[int, dict]: {块序号(0开始): {"original", "imitation", "map"}}，
+                         只包含编号合法、原句和迁移句非空的块；重复编号保留第一个
+    """
+    return shadow_batcher.split_result(result, count)
+
+
+class ShadowWritingBatcher(ChunkBatcher):
+    """
+    Shadow Writing 批处理器（事件循环内使用）
+
+    使用方式：
+        result = await shadow_batcher.submit(llm_function, chunk_text)
+        # result 与单块调用 llm(shadow_writing.main, SHADOW_WRITING_FORMAT) 的返回值格式相同
+    """
+
+    name = "SHADOW BATCH"
+    size_setting = "shadow_batch_size"
+    wait_setting = "shadow_batch_wait_ms"
+    batch_format = SHADOW_WRITING_BATCH_FORMAT
+    single_format = SHADOW_WRITING_FORMAT
+
+    def build_batch_prompt(self, payloads: List[str]) -> str:
+        return render_batch_prompt(payloads)
+
+    def build_single_prompt(self, payload: str) -> str:
+        return prompt_manager.render_prompt("shadow_writing.main", chunk_text=payload)
+
+    def parse_item(self, item: dict) -> Optional[dict]:
+        return parse_shadow_item(item)
+
+
+# 全局批处理器（K和等待时间读取配置）
+shadow_batcher = ShadowWritingBatcher()
@@ -1,11 +1,63 @@
 # shadow_writing_agent.py
 # 并行处理的Shadow Writing Agent
+# 开启批量模式（settings.shadow_batch_size > 1）时，异步节点通过 shadow_batcher 与其他语义块合并调用
 
+from app.config import settings
 from app.state import ChunkProcessState
-from app.utils import ensure_dependencies, create_llm_function_native
+from app.utils import (
+    ensure_dependencies, create_llm_function_native,
+    create_async_llm_function_native, as_async_llm_function
+)
 from app.prompts import prompt_manager
 
 
+SHADOW_WRITING_FORMAT = {
+    "original": "完整原句, str",
+    "imitation": "把原句话题换成任意话题的完整新句（≥12词）, str",
+    "map": "词汇映射字典，键为原词，值为同义词列表, dict"
+}
+
+
+def _push_chunk_started(state: ChunkProcessState) -> None:
+    """推送单个语义块开始处理消息"""
+    chunk_id = state.get("chunk_id", 0)
+    task_id = state.get("task_id")
+    total_chunks = state.get("total_chunks", 1)  # 从state获取总数，避免除零错误
+
+    print(f"[Pipeline {chunk_id}] task_id: {task_id}, chunk_length: {len(state.get('chunk_text', ''))}, total_chunks: {total_chunks}")
+
+    if task_id and total_chunks > 0:
+        from app.progress_bus import progress_bus
+        progress_bus.publish(task_id, {
+            "type": "chunk_progress",
+            "current_chunk": chunk_id + 1,
+            "total_chunks": total_chunks,
+            "stage": "shadow_writing",
+            "message": f"处理语义块 {chunk_id + 1}/{total_chunks}: 生成Shadow Writing"
+        })
+        print(f"[Pipeline {chunk_id}] 推送语义块进度消息到task_id: {task_id}, 进度: {chunk_id + 1}/{total_chunks}")
+
+
+def _parse_shadow_result(chunk_id: int, chunk_text: str, result) -> dict:
+    """标准化LLM返回的Shadow Writing结果"""
+    if result and isinstance(result, dict):
+        # 标准化结果（添加paragraph字段）
+        standardized_result = {
+            'original': str(result.get('original', '')).strip(),
+            'imitation': str(result.get('imitation', '')).strip(),
+            'map': result.get('map', {}),
+            'paragraph': chunk_text
+        }
+
+        print(f"[Pipeline {chunk_id}] [OK] Shadow Writing完成")
+        print(f"   原句: {standardized_result['original'][:60]}...")
+
+        return {"raw_shadow": standardized_result}
+    else:
+        print(f"[Pipeline {chunk_id}] [ERROR] LLM返回无效结果")
+        return {"raw_shadow": None, "error": "Invalid LLM response"}
+
+
 def shadow_writing_single_chunk(state: ChunkProcessState) -> dict:
     """
     处理单个语义块的Shadow Writing（并行版本）
@@ -17,69 +69,73 @@ def shadow_writing_single_chunk(state: ChunkProcessState) -> dict:
     """
     chunk_text = state.get("chunk_text", "")
     chunk_id = state.get("chunk_id", 0)
-    task_id = state.get("task_id")
-    total_chunks = state.get("total_chunks", 1)  # 从state获取总数，避免除零错误
 
     print(f"\n[Pipeline {chunk_id}] Shadow Writing...")
-    print(f"[Pipeline {chunk_id}] task_id: {task_id}, chunk_length: {len(chunk_text)}, total_chunks: {total_chunks}")
-
-    # 推送单个语义块开始处理消息
-    if task_id and total_chunks > 0:
-        import asyncio
-        from app.sse_manager import sse_manager
-        asyncio.create_task(
-            sse_manager.add_message(task_id, {
-                "type": "chunk_progress",
-                "current_chunk": chunk_id + 1,
-                "total_chunks": total_chunks,
-                "stage": "shadow_writing",
-                "message": f"处理语义块 {chunk_id + 1}/{total_chunks}: 生成Shadow Writing"
-            })
-        )
-        print(f"[Pipeline {chunk_id}] 推送语义块进度消息到task_id: {task_id}, 进度: {chunk_id + 1}/{total_chunks}")
+    _push_chunk_started(state)
 
     if not chunk_text:
         return {"raw_shadow": None, "error": "Empty chunk"}
-    
+
     try:
         # 从state获取注入的LLM函数，如果没有则使用默认创建
         llm_function = state.get("llm_function")
         if llm_function is None:
             ensure_dependencies()
             llm_function = create_llm_function_native()
-        
-        output_format = {
-            "original": "完整原句, str",
-            "imitation": "把原句话题换成任意话题的完整新句（≥12词）, str", 
-            "map": "词汇映射字典，键为原词，值为同义词列表, dict"
-        }
-        
+
         # 使用Prompt管理系统获取Shadow Writing模板
         shadow_prompt = prompt_manager.render_prompt(
             "shadow_writing.main",
             chunk_text=chunk_text
         )
-        
+
         # 直接调用LLM，不再强制等待
-        result = llm_function(shadow_prompt, output_format)
-        
-        if result and isinstance(result, dict):
-            # 标准化结果（添加paragraph字段）
-            standardized_result = {
-                'original': str(result.get('original', '')).strip(),
-                'imitation': str(result.get('imitation', '')).strip(),
-                'map': result.get('map', {}),
-                'paragraph': chunk_text
-            }
-            
-            print(f"[Pipeline {chunk_id}] [OK] Shadow Writing完成")
-            print(f"   原句: {standardized_result['original'][:60]}...")
-            
-            return {"raw_shadow": standardized_result}
-        else:
-            print(f"[Pipeline {chunk_id}] [ERROR] LLM返回无效结果")
-            return {"raw_shadow": None, "error": "Invalid LLM response"}
-        
+        result = llm_function(shadow_prompt, SHADOW_WRITING_FORMAT)
+        return _parse_shadow_result(chunk_id, chunk_text, result)
+
+    except Exception as e:
+        print(f"[Pipeline {chunk_id}] [ERROR] Shadow Writing失败: {e}")
+        return {"raw_shadow": None, "error": str(e)}
+
+
+async def ashadow_writing_single_chunk(state: ChunkProcessState) -> dict:
+    """
+    处理单个语义块的Shadow Writing（异步版本）
+
+    与同步版本使用相同的prompt和结果格式，LLM调用通过acompletion完成，
+    等待期间不占用线程
+    """
+    chunk_text = state.get("chunk_text", "")
+    chunk_id = state.get("chunk_id", 0)
+
+    print(f"\n[Pipeline {chunk_id}] Shadow Writing (async)...")
+    _push_chunk_started(state)
+
+    if not chunk_text:
+        return {"raw_shadow": None, "error": "Empty chunk"}
+
+    try:
+        llm_function = state.get("async_llm_function") or state.get("llm_function")
+
+        if settings.shadow_batch_size > 1:
+            # 批量模式：与同时到达的其他语义块合并为一次调用，失败的块自动单独重试
+            from app.agents.parallel.shadow_batcher import shadow_batcher
+            result = await shadow_batcher.submit(llm_function, chunk_text)
+            return _parse_shadow_result(chunk_id, chunk_text, result)
+
+        if llm_function is None:
+            ensure_dependencies()
+            llm_function = create_async_llm_function_native()
+        llm_function = as_async_llm_function(llm_function)
+
+        shadow_prompt = prompt_manager.render_prompt(
+            "shadow_writing.main",
+            chunk_text=chunk_text
+        )
+
+        result = await llm_function(shadow_prompt, SHADOW_WRITING_FORMAT)
+        return _parse_shadow_result(chunk_id, chunk_text, result)
+
     except Exception as e:
         print(f"[Pipeline {chunk_id}] [ERROR] Shadow Writing失败: {e}")
         return {"raw_shadow": None, "error": str(e)}
@@ -1,49 +1,224 @@
+# semantic_chunking.py
+# 作用：语义分块Agent
+# 功能：
+#   - 按模型token数（而不是字符数）控制语义块大小，目标/最小/最大token数来自配置
+#   - 句子切分识别常见缩写（Mr. / Dr. / e.g. / U.S.）、人名首字母和小数，不会在这些位置断句
+#   - 超过最大token数的长句按从句（逗号、分号、破折号）再切分，仍然过长时按单词切分
+
 import re
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+from app.config import settings
 from app.state import Shadow_Writing_State
 from app.agents.base_agent import ShadowWritingAgent, StateType
 
 
+# 后面通常紧跟人名/名词的缩写：无论下一个词是否大写都不断句；
+# 其他缩写（e.g. / etc. / a.m.）和省略号只在下一个词小写时不断句
+TITLE_ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "rev", "gen", "col", "capt", "lt", "sgt",
+    "gov", "sen", "pres", "vs", "fig", "vol", "approx", "dept"
+}
+
+# 候选断句点：句末标点（可带右引号/右括号）+ 空白
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'”’)\]]*\s+")
+
+# 长句的从句切分点
+_CLAUSE_END = re.compile(r"(?<=[,;:—–])\s+")
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """
+    获取token编码器（litellm自带的cl100k_base本地副本，不需要联网）
+
+    Llama 3 的词表与 cl100k_base 同为tiktoken风格的BPE，英文文本的token数非常接近
+
+    Returns:
+        tiktoken.Encoding，不可用时返回None（按字符数估算）
+    """
+    try:
+        from litellm.litellm_core_utils.default_encoding import encoding
+        return encoding
+    except Exception as e:
+        print(f"[SEMANTIC CHUNKING] [WARNING] token编码器不可用，按字符数估算: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    计算文本的token数
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: token数（编码器不可用时约4个字符1个token）
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        from app.llm_scheduler import estimate_tokens
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _is_sentence_boundary(text: str, match: re.Match) -> bool:
+    """判断候选断句点是否真的是句尾"""
+    next_text = text[match.end():]
+    if not next_text:
+        return True
+
+    punctuation = match.group().strip()
+    if not punctuation.startswith("."):
+        # ! ? … 结尾：下一个词小写视为同一句（如 "wow! said he"）
+        return not next_text[0].islower()
+
+    # 句号前的单词（含内部的点，如 "U.S"、"e.g"）
+    word_match = re.search(r"([A-Za-z][A-Za-z.]*)$", text[:match.start()])
+    word = word_match.group(1) if word_match else ""
+    lowered = word.lower().rstrip(".")
+
+    if lowered in TITLE_ABBREVIATIONS:
+        return False
+    if len(word) == 1 and word.isupper():
+        # 人名首字母（J. K. Rowling）
+        return False
+    # 下一个词小写：缩写（e.g. / etc.）或省略号后的句中停顿
+    return not next_text[0].islower()
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    把文本切分为句子
+
+    Args:
+        text: 文本
+
+    Returns:
+        List[str]: 句子列表（保留句末标点）
+    """
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        if _is_sentence_boundary(text, match):
+            sentence = text[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+def _split_long_sentence(sentence: str, max_tokens: int) -> List[str]:
+    """把超过最大token数的句子按从句切分，仍然过长的片段按单词切分"""
+    pieces = []
+    for clause in _CLAUSE_END.split(sentence):
+        if count_tokens(clause) <= max_tokens:
+            pieces.append(clause)
+            continue
+        words = clause.split()
+        current: List[str] = []
+        for word in words:
+            if current and count_tokens(" ".join(current + [word])) > max_tokens:
+                pieces.append(" ".join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+
+    # 合并相邻的短从句，尽量接近最大token数
+    merged: List[str] = []
+    for piece in pieces:
+        if merged and count_tokens(merged[-1] + " " + piece) <= max_tokens:
+            merged[-1] = merged[-1] + " " + piece
+        else:
+            merged.append(piece)
+    return merged
+
+
 class Semantic_Chunking_Agent(ShadowWritingAgent):
-    """智能语义分块Agent - 控制块大小在400-600字符"""
-    
-    def __init__(self):
-        self.target_chunk_size = 200   # 目标块大小
-        self.min_chunk_size = 150      # 最小块大小
-        self.max_chunk_size = 250      # 最大块大小
-    
+    """智能语义分块Agent - 按token数控制块大小（默认80-150 tokens，约400-600字符）"""
+
+    def __init__(self, target_tokens: Optional[int] = None, min_tokens: Optional[int] = None,
+                 max_tokens: Optional[int] = None):
+        """
+        Args:
+            target_tokens: 目标块大小（达到后开始新块，默认settings.chunk_target_tokens）
+            min_tokens: 最小块大小（默认settings.chunk_min_tokens）
+            max_tokens: 最大块大小（默认settings.chunk_max_tokens）
+        """
+        super().__init__()
+        self.target_tokens = target_tokens or settings.chunk_target_tokens
+        self.min_tokens = min_tokens or settings.chunk_min_tokens
+        self.max_tokens = max_tokens or settings.chunk_max_tokens
+
     def split_into_chunks(self, text: str) -> List[str]:
-        """将文本分割为适当大小的语义块"""
-        if len(text) <= self.max_chunk_size:
+        """
+        将文本分割为适当大小的语义块
+
+        规则：
+        - 逐句累加，达到目标大小后开始新块
+        - 加入下一句会超过最大大小时，当前块已达到最小大小则先保存
+          （当前块不足最小大小时仍然加入，这是唯一会超过最大大小的情况）
+        - 最后一块不足最小大小时与前一块合并，合并后过大则两块均分
+
+        Args:
+            text: 文本
+
+        Returns:
+            List[str]: 语义块列表
+        """
+        text = text.strip()
+        if not text:
+            return []
+        if count_tokens(text) <= self.max_tokens:
             return [text]
-        
-        # 按句子分割
-        sentences = re.split(r'[.!?]+\s+', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            # 如果添加这个句子会超过最大大小，先保存当前块
-            if len(current_chunk) + len(sentence) > self.max_chunk_size and current_chunk:
-                if len(current_chunk) >= self.min_chunk_size:
-                    chunks.append(current_chunk.strip())
-                    current_chunk = sentence
-                else:
-                    # 当前块太小，继续添加
-                    current_chunk += " " + sentence if current_chunk else sentence
+
+        pieces = []
+        for sentence in split_sentences(text):
+            tokens = count_tokens(sentence)
+            if tokens > self.max_tokens:
+                pieces.extend((piece, count_tokens(piece)) for piece in _split_long_sentence(sentence, self.max_tokens))
             else:
-                current_chunk += " " + sentence if current_chunk else sentence
-        
-        # 添加最后一个块
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-        
-        return chunks
-    
+                pieces.append((sentence, tokens))
+
+        chunks: List[List[Tuple[str, int]]] = []  # 每块为 [(句子, token数)]
+        current: List[Tuple[str, int]] = []
+        current_tokens = 0
+        for piece, tokens in pieces:
+            if current and (current_tokens >= self.target_tokens or
+                            (current_tokens + tokens > self.max_tokens and current_tokens >= self.min_tokens)):
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append((piece, tokens))
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+
+        # 最后一块太小：与前一块合并，合并后超过最大大小时按token数均分为两块
+        if len(chunks) > 1 and sum(tokens for _, tokens in chunks[-1]) < self.min_tokens:
+            merged = chunks.pop(-2) + chunks.pop()
+            chunks.extend(self._balanced_split(merged))
+
+        return [" ".join(piece for piece, _ in chunk) for chunk in chunks]
+
+    def _balanced_split(self, pieces: List[Tuple[str, int]]) -> List[List[Tuple[str, int]]]:
+        """不超过最大大小时保持为一块，否则在最接近token数一半的句子边界处分为两块"""
+        total = sum(tokens for _, tokens in pieces)
+        if total <= self.max_tokens or len(pieces) < 2:
+            return [pieces]
+        best_index, best_gap, prefix = 1, float("inf"), 0
+        for index in range(1, len(pieces)):
+            prefix += pieces[index - 1][1]
+            gap = abs(total / 2 - prefix)
+            if gap < best_gap:
+                best_index, best_gap = index, gap
+        return [pieces[:best_index], pieces[best_index:]]
+
     def process_transcript(self, transcript: str, task_id: str | None = None) -> List[str]:
         """处理完整的transcript，返回语义块列表"""
         print("\n开始智能语义分块处理...")
@@ -51,39 +226,35 @@ class Semantic_Chunking_Agent(ShadowWritingAgent):
 
         # 推送分块开始消息
         if task_id:
-            import asyncio
-            from app.sse_manager import sse_manager
-            asyncio.create_task(
-                sse_manager.add_message(task_id, {
-                    "type": "chunking_started",
-                    "message": f"开始语义分块处理，文本长度: {len(transcript)} 字符",
-                    "text_length": len(transcript)
-                })
-            )
+            from app.progress_bus import progress_bus
+            progress_bus.publish(task_id, {
+                "type": "chunking_started",
+                "message": f"开始语义分块处理，文本长度: {len(transcript)} 字符",
+                "text_length": len(transcript)
+            })
             print(f"[SEMANTIC CHUNKING] 推送分块开始消息到task_id: {task_id}")
 
         chunks = self.split_into_chunks(transcript)
+        chunk_tokens = [count_tokens(chunk) for chunk in chunks]
 
-        print(f"分块完成: {len(chunks)} 个语义块")
-        for i, chunk in enumerate(chunks, 1):
-            print(f"  语义块 {i}: {len(chunk)} 字符")
+        print(f"分块完成: {len(chunks)} 个语义块（目标 {self.target_tokens} tokens）")
+        for i, (chunk, tokens) in enumerate(zip(chunks, chunk_tokens), 1):
+            print(f"  语义块 {i}: {tokens} tokens / {len(chunk)} 字符")
 
         # 推送分块完成消息
         if task_id:
-            import asyncio
-            from app.sse_manager import sse_manager
-            asyncio.create_task(
-                sse_manager.add_message(task_id, {
-                    "type": "chunking_completed",
-                    "total_chunks": len(chunks),
-                    "message": f"语义分块完成，共生成 {len(chunks)} 个语义块",
-                    "chunk_sizes": [len(chunk) for chunk in chunks]
-                })
-            )
+            from app.progress_bus import progress_bus
+            progress_bus.publish(task_id, {
+                "type": "chunking_completed",
+                "total_chunks": len(chunks),
+                "message": f"语义分块完成，共生成 {len(chunks)} 个语义块",
+                "chunk_sizes": [len(chunk) for chunk in chunks],
+                "chunk_tokens": chunk_tokens
+            })
             print(f"[SEMANTIC CHUNKING] 推送分块完成消息到task_id: {task_id}, 块数: {len(chunks)}")
 
         return chunks
-    
+
     def process(self, state: StateType) -> Dict[str, Any]:
         """实现BaseAgent的process方法，处理语义分块"""
         text = state.get("text", "")
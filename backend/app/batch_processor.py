@@ -1,107 +1,124 @@
 # batch_processor.py
 # 作用：批量处理多个TED URLs的核心逻辑
+# 功能：
+#   - 有界并发：同时处理N个URL（N受健康API Key数量约束）
+#   - 字幕提取放到线程池；工作流通过astream在事件循环中异步运行
+#   - 每个语义块完成时立即推送chunk_completed消息（含结果），无需等待整场演讲
+#   - 结果按完成顺序收集，每个URL的SSE消息携带自身序号
+#   - 相同transcript命中结果缓存时跳过工作流
+#   - 任务在可取消的 asyncio.Task 中运行：取消接口或截止时间到达时立即停止，LLM额度随之退还
+#   - 工作流挂载SQLite检查点（按任务+URL区分），服务中途退出后恢复任务时跳过已完成的语义块
+#   - 任务的用户ID和优先级传给公平调度器，多个用户的任务按权重分享LLM额度
 
-from typing import List
+import asyncio
+import time
+from typing import List, Optional
+from app import utils
+from app.config import settings
 from app.task_manager import task_manager
 from app.sse_manager import sse_manager
+from app.progress_bus import progress_bus
 from app.tools.ted_transcript_tool import extract_ted_transcript
-from app.workflows import create_parallel_shadow_writing_workflow
+from app.workflows import get_async_parallel_shadow_writing_workflow, build_workflow_config
+from app.agent import astream_shadow_writing_with_total
+from app.result_cache import lookup_talk_results, store_talk_results
+from app.provider_router import track_failovers
+from app.json_repair import track_lossy_results
+from app.checkpointer import open_checkpointer, checkpoint_thread_id, delete_checkpoint
+from app.cancellation import cancellation_registry, TaskCancelled, DeadlineExceeded, CANCEL_REASON_DEADLINE
+from app.fair_scheduler import tenant_context, resolve_priority
+from app.token_usage import token_usage, usage_task
 from app.enums import TaskStatus, MessageType, ProcessingStep
 
 
-async def process_urls_batch(task_id: str, urls: List[str]):
+def resolve_batch_concurrency(total: int) -> int:
     """
-    批量异步处理多个TED URLs
+    计算批量处理的URL并发上限
+
+    规则：min(配置上限, 健康Key数 × 每Key并发URL数, URL总数)，至少为1
+
+    Args:
+        total: URL总数
+
+    Returns:
+        int: 并发上限
+    """
+    if utils.api_key_manager:
+        healthy_keys = utils.api_key_manager.get_healthy_key_count()
+    else:
+        healthy_keys = 1  # 单密钥模式
+
+    key_bound = max(1, healthy_keys) * max(1, settings.batch_urls_per_key)
+    return max(1, min(settings.batch_max_concurrency, key_bound, total))
 
-    流程：
-    1. 遍历每个URL
-    2. 提取transcript
-    3. 运行Shadow Writing工作流
-    4. 实时推送进度
-    5. 收集结果
+
+def url_error_prefix(url: str) -> str:
+    """单个URL处理失败时错误信息的前缀"""
+    return f"Error processing {url}: "
+
+
+async def _process_single_url(task_id: str, workflow, idx: int, total: int, url: str) -> None:
+    """
+    处理单个URL：提取字幕 → 运行工作流 → 保存结果 → 推送消息
+
+    异常在内部处理并记录到任务中，不向外抛出
 
     Args:
         task_id: 任务ID
-        urls: TED URL列表
+        workflow: 编译后的Shadow Writing工作流（异步版本）
+        idx: URL序号（从1开始）
+        total: URL总数
+        url: TED URL
     """
-    import time
-    start_time = time.time()
+    url_start_time = time.time()
+    thread_id = checkpoint_thread_id(task_id, url)
+    checkpointer = getattr(workflow, "checkpointer", None)
+    try:
+        print(f"\n[BATCH PROCESSOR] 处理 [{idx}/{total}]: {url} - 开始时间: {time.strftime('%H:%M:%S')}")
 
-    total = len(urls)
-    task_manager.update_status(task_id, TaskStatus.PROCESSING)
+        # ========== 步骤1: 提取Transcript ==========
+        await sse_manager.add_message(
+            task_id,
+            {
+                "type": MessageType.STEP.value,
+                "current": idx,
+                "total": total,
+                "step": ProcessingStep.EXTRACTING_TRANSCRIPT.value,
+                "url": url,
+                "message": f"正在提取字幕 ({idx}/{total})"
+            }
+        )
 
-    print(f"\n[BATCH PROCESSOR] 开始处理 {total} 个URLs - 开始时间: {time.strftime('%H:%M:%S')}")
+        # 网络爬取是阻塞操作，放到线程池执行
+        transcript_data = await asyncio.to_thread(extract_ted_transcript, url)
 
-    # 发送开始消息
-    print(f"[BATCH_PROCESSOR] [{task_id}] 准备发送started消息 - 时间: {time.strftime('%H:%M:%S')}")
-    await sse_manager.add_message(
-        task_id,
-        {
-            "type": MessageType.STARTED.value,
-            "total": total,
-            "message": f"开始处理 {total} 个TED演讲"
-        }
-    )
-    print(f"[BATCH_PROCESSOR] [{task_id}] started消息发送完成 - 时间: {time.strftime('%H:%M:%S')}")
-    
-    # 创建Shadow Writing工作流（并行版本）
-    workflow = create_parallel_shadow_writing_workflow()
-    # workflow = create_shadow_writing_workflow()  # 旧版串行（已弃用）
-    
-    # 遍历处理每个URL
-    for idx, url in enumerate(urls, 1):
-        url_start_time = time.time()
-        try:
-            print(f"\n[BATCH PROCESSOR] 处理 [{idx}/{total}]: {url} - 开始时间: {time.strftime('%H:%M:%S')}")
-            
-            # 更新进度
-            task_manager.update_progress(task_id, idx, url)
-            print(f"[BATCH_PROCESSOR] [{task_id}] 准备发送progress消息 - URL {idx}/{total} - 时间: {time.strftime('%H:%M:%S')}")
-            await sse_manager.add_message(
-                task_id,
-                {
-                    "type": MessageType.PROGRESS.value,
-                    "current": idx,
-                    "total": total,
-                    "url": url,
-                    "status": f"Processing {idx}/{total}"
-                }
-            )
-            print(f"[BATCH_PROCESSOR] [{task_id}] progress消息发送完成 - URL {idx}/{total} - 时间: {time.strftime('%H:%M:%S')}")
+        if not transcript_data or not transcript_data.transcript:
+            raise Exception("Failed to extract transcript")
 
-            # ========== 步骤1: 提取Transcript ==========
-            await sse_manager.add_message(
-                task_id,
-                {
-                    "type": MessageType.STEP.value,
-                    "current": idx,
-                    "total": total,
-                    "step": ProcessingStep.EXTRACTING_TRANSCRIPT.value,
-                    "url": url,
-                    "message": f"正在提取字幕 ({idx}/{total})"
-                }
-            )
-            
-            transcript_data = extract_ted_transcript(url)
-            
-            if not transcript_data or not transcript_data.transcript:
-                raise Exception("Failed to extract transcript")
-            
-            print(f"   提取字幕成功: {len(transcript_data.transcript)} 字符")
-            
-            # ========== 步骤2: 运行Shadow Writing工作流 ==========
-            await sse_manager.add_message(
-                task_id,
-                {
-                    "type": MessageType.STEP.value,
-                    "current": idx,
-                    "total": total,
-                    "step": ProcessingStep.SHADOW_WRITING.value,
-                    "url": url,
-                    "message": f"正在生成Shadow Writing ({idx}/{total})"
-                }
-            )
-            
+        print(f"   [{idx}/{total}] 提取字幕成功: {len(transcript_data.transcript)} 字符")
+
+        # ========== 步骤2: 运行Shadow Writing工作流 ==========
+        await sse_manager.add_message(
+            task_id,
+            {
+                "type": MessageType.STEP.value,
+                "current": idx,
+                "total": total,
+                "step": ProcessingStep.SHADOW_WRITING.value,
+                "url": url,
+                "message": f"正在生成Shadow Writing ({idx}/{total})"
+            }
+        )
+
+        # 相同transcript已处理过：直接使用缓存结果
+        # 节点未注入LLM，使用默认模型（create_llm_function_native），与 process_ted_text 的版本计算一致
+        cache_key, cached_results = await asyncio.to_thread(
+            lookup_talk_results, transcript_data.transcript, "", settings.model_name
+        )
+
+        if cached_results is not None:
+            processed_results = cached_results
+        else:
             # 准备工作流初始状态（并行版本简化）
             initial_state = {
                 "text": transcript_data.transcript,
@@ -115,94 +132,249 @@ async def process_urls_batch(task_id: str, urls: List[str]):
                 "current_node": "",
                 "error_message": None
             }
-            
-            # 运行并行工作流
-            print("   启动并行Shadow Writing工作流...")
-            result = workflow.invoke(initial_state)
-            
-            # 提取最终结果
-            final_chunks = result.get("final_shadow_chunks", [])
-            
-            # 处理返回值：可能是字典列表或对象列表
-            processed_results = []
-            for item in final_chunks:
-                if isinstance(item, dict):
-                    processed_results.append(item)
-                elif hasattr(item, 'dict'):
-                    processed_results.append(item.dict())
-                elif hasattr(item, 'model_dump'):
-                    processed_results.append(item.model_dump())
-                else:
-                    processed_results.append(str(item))
-            
-            url_end_time = time.time()
-            url_duration = url_end_time - url_start_time
-            print(f"   Shadow Writing完成: {len(processed_results)} 个结果 - 耗时: {url_duration:.2f}秒")
-
-            # ========== 步骤3: 保存结果 ==========
-            result_data = {
+
+            async def push_chunk_result(chunk_result, completed_chunks: int, total_chunks: int):
+                """语义块完成时立即推送结果（先投递该语义块此前发布的进度消息）"""
+                await progress_bus.flush()
+                await sse_manager.add_message(
+                    task_id,
+                    {
+                        "type": MessageType.CHUNK_COMPLETED.value,
+                        "current": idx,
+                        "total": total,
+                        "url": url,
+                        "completed_chunks": completed_chunks,
+                        "total_chunks": total_chunks,
+                        "result": chunk_result
+                    }
+                )
+
+            # 异步运行并行工作流（astream，语义块结果按完成顺序流式返回）
+            print(f"   [{idx}/{total}] 启动并行Shadow Writing工作流...")
+            with track_failovers() as failovers, track_lossy_results() as lossy:
+                processed_results, total_chunks = await astream_shadow_writing_with_total(
+                    workflow, initial_state, build_workflow_config(task_id=task_id, thread_id=thread_id),
+                    on_chunk=push_chunk_result
+                )
+            await asyncio.to_thread(
+                store_talk_results, cache_key, processed_results, total_chunks, failovers.count, lossy.count
+            )
+
+        url_duration = time.time() - url_start_time
+        print(f"   [{idx}/{total}] Shadow Writing完成: {len(processed_results)} 个结果 - 耗时: {url_duration:.2f}秒")
+
+        # ========== 步骤3: 保存结果 ==========
+        result_data = {
+            "url": url,
+            "ted_info": {
+                "title": transcript_data.title,
+                "speaker": transcript_data.speaker,
+                "url": url,
+                "transcript_length": len(transcript_data.transcript)
+            },
+            "results": processed_results,
+            "result_count": len(processed_results),
+            "cached": cached_results is not None
+        }
+
+        await task_manager.aadd_result(task_id, result_data)
+        await delete_checkpoint(checkpointer, thread_id)
+
+        # ========== 步骤4: 推送完成消息 ==========
+        await progress_bus.flush()
+        await sse_manager.add_message(
+            task_id,
+            {
+                "type": MessageType.URL_COMPLETED.value,
+                "current": idx,
+                "total": total,
+                "url": url,
+                "result_count": len(processed_results),
+                "message": f"完成 ({idx}/{total}): 生成 {len(processed_results)} 个结果"
+            }
+        )
+
+    except Exception as e:
+        error_msg = f"{url_error_prefix(url)}{str(e)}"
+        print(f"   [ERROR] {error_msg}")
+
+        await task_manager.aadd_error(task_id, error_msg)
+        await delete_checkpoint(checkpointer, thread_id)
+
+        await progress_bus.flush()
+        await sse_manager.add_message(
+            task_id,
+            {
+                "type": MessageType.ERROR.value,
+                "current": idx,
+                "total": total,
                 "url": url,
-                "ted_info": {
-                    "title": transcript_data.title,
-                    "speaker": transcript_data.speaker,
-                    "url": url,
-                    "transcript_length": len(transcript_data.transcript)
-                },
-                "results": processed_results,
-                "result_count": len(processed_results)
+                "error": error_msg
             }
-            
-            task_manager.add_result(task_id, result_data)
-            
-            # ========== 步骤4: 推送完成消息 ==========
-            await sse_manager.add_message(
-                task_id,
-                {
-                    "type": MessageType.URL_COMPLETED.value,
-                    "current": idx,
-                    "total": total,
-                    "url": url,
-                    "result_count": len(processed_results),
-                    "message": f"完成 ({idx}/{total}): 生成 {len(processed_results)} 个结果"
-                }
-            )
-            
-        except Exception as e:
-            error_msg = f"Error processing {url}: {str(e)}"
-            print(f"   [ERROR] {error_msg}")
-            
-            task_manager.add_error(task_id, error_msg)
-            
+        )
+
+
+async def _finish_cancelled(task_id: str, total: int, reason: str, start_time: float) -> None:
+    """
+    任务被取消：标记状态并推送取消消息（已完成URL的结果保留）
+
+    Args:
+        task_id: 任务ID
+        total: URL总数
+        reason: 取消原因（user / deadline）
+        start_time: 任务开始时间
+    """
+    await task_manager.acancel_task(task_id, reason)
+    task = task_manager.get_task(task_id)
+    successful = task.result_count if task else 0
+    reason_text = "已超过截止时间" if reason == CANCEL_REASON_DEADLINE else "已被用户取消"
+
+    await progress_bus.flush()
+    await sse_manager.add_message(
+        task_id,
+        {
+            "type": MessageType.CANCELLED.value,
+            "reason": reason,
+            "total": total,
+            "successful": successful,
+            "message": f"任务{reason_text}: 已完成 {successful}/{total}",
+            "duration": time.time() - start_time
+        }
+    )
+    print(f"\n[BATCH PROCESSOR] 任务 {task_id} {reason_text}: 已完成 {successful}/{total}")
+
+
+async def process_urls_batch(task_id: str, urls: List[str], max_concurrency: Optional[int] = None,
+                             resume: bool = False, timeout_seconds: Optional[float] = None,
+                             priority: Optional[str] = None):
+    """
+    批量异步处理多个TED URLs
+
+    流程：
+    1. 计算并发上限，最多N个URL同时处理
+    2. 每个URL：提取transcript（线程池中执行）→ 运行Shadow Writing工作流
+       （astream_shadow_writing_with_total，在事件循环中异步运行）
+    3. 实时推送进度（消息中的current为URL自身序号）
+    4. 按完成顺序收集结果
+
+    Args:
+        task_id: 任务ID
+        urls: TED URL列表
+        max_concurrency: 并发上限（可选，默认根据健康Key数量计算）
+        resume: 恢复中断的任务：跳过已有结果的URL，其余URL从检查点继续
+        timeout_seconds: 任务截止时间（秒，默认settings.batch_task_timeout_seconds，<=0表示不限）
+        priority: 调度优先级（interactive / bulk，默认按URL数自动判断）
+    """
+    start_time = time.time()
+
+    # 在存储中比较并设置：共享后端下其他worker可能已取消了排队中的任务，本进程的内存副本可能过期
+    if not await task_manager.aupdate_status_if(
+            task_id, [TaskStatus.PENDING, TaskStatus.INTERRUPTED], TaskStatus.PROCESSING):
+        task = task_manager.get_task(task_id)
+        status = task.status.value if task else "missing"
+        print(f"\n[BATCH PROCESSOR] 任务 {task_id} 在开始前状态已变为 {status}，跳过")
+        return
+    task = task_manager.get_task(task_id)
+
+    total = len(urls)
+    pending = list(enumerate(urls, 1))
+    if resume:
+        done_urls = {result.get("url") for result in task.results} if task else set()
+        pending = [(idx, url) for idx, url in pending if url not in done_urls]
+        # 重试的URL清除上次的错误，避免同一URL既有结果又有错误
+        await task_manager.aremove_errors(task_id, [url_error_prefix(url) for _, url in pending])
+        print(f"\n[BATCH PROCESSOR] 恢复任务 {task_id}: 已完成 {total - len(pending)}/{total}")
+
+    concurrency = max_concurrency or resolve_batch_concurrency(len(pending))
+    priority = resolve_priority(len(pending), priority)
+    user_id = task.user_id if task else None
+
+    # 工作流节点通过进度总线发布消息，投递在主事件循环中执行
+    progress_bus.bind_loop(asyncio.get_running_loop())
+
+    print(f"\n[BATCH PROCESSOR] 开始处理 {total} 个URLs（并发 {concurrency}，优先级 {priority.value}） - 开始时间: {time.strftime('%H:%M:%S')}")
+
+    # 发送开始消息
+    started_message = {
+        "type": MessageType.STARTED.value,
+        "total": total,
+        "concurrency": concurrency,
+        "message": f"开始处理 {total} 个TED演讲"
+    }
+    if resume:
+        started_message["resumed"] = total - len(pending)  # 恢复前已完成的URL数
+        started_message["message"] = f"恢复处理 {len(pending)}/{total} 个TED演讲"
+    await sse_manager.add_message(task_id, started_message)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started = total - len(pending)
+
+    async def worker(workflow, idx: int, url: str):
+        nonlocal started
+        async with semaphore:
+            started += 1
+            await task_manager.aupdate_progress(task_id, started, url)
             await sse_manager.add_message(
                 task_id,
                 {
-                    "type": MessageType.ERROR.value,
+                    "type": MessageType.PROGRESS.value,
                     "current": idx,
                     "total": total,
                     "url": url,
-                    "error": error_msg
+                    "status": f"Processing {idx}/{total}"
                 }
             )
-    
+            await _process_single_url(task_id, workflow, idx, total, url)
+
+    async def run_all():
+        # 检查点存储在本次批量处理期间打开，结束时关闭
+        async with open_checkpointer() as checkpointer:
+            # 获取共享的Shadow Writing工作流（异步并行版本，全局只编译一次），挂载检查点
+            workflow = get_async_parallel_shadow_writing_workflow(checkpointer)
+            # workflow = create_shadow_writing_workflow()  # 旧版串行（已弃用）
+            try:
+                await asyncio.gather(*(worker(workflow, idx, url) for idx, url in pending))
+            except asyncio.CancelledError:
+                # 用户取消/超时的任务不可恢复，删除检查点；服务关闭时保留，重启后可恢复
+                if cancellation_registry.cancel_reason(task_id):
+                    for _, url in pending:
+                        await delete_checkpoint(checkpointer, checkpoint_thread_id(task_id, url))
+                raise
+
+    if timeout_seconds is None:
+        timeout_seconds = settings.batch_task_timeout_seconds
+    try:
+        # 子任务继承用户和优先级（LLM调用按公平调度排队）以及task_id（token用量按任务归因）
+        with tenant_context(user_id, priority), usage_task(task_id):
+            await cancellation_registry.run_cancellable(task_id, run_all(), timeout_seconds)
+    except TaskCancelled as e:
+        await _finish_cancelled(task_id, total, e.reason, start_time)
+        return
+    except DeadlineExceeded:
+        # 剩余时间不足，任务在按截止时间取消生效前已结束
+        await _finish_cancelled(task_id, total, CANCEL_REASON_DEADLINE, start_time)
+        return
+
     # ========== 全部完成 ==========
-    task_manager.complete_task(task_id)
+    await task_manager.acomplete_task(task_id)
 
     task = task_manager.get_task(task_id)
-    end_time = time.time()
-    total_duration = end_time - start_time
+    total_duration = time.time() - start_time
 
+    await progress_bus.flush()
     await sse_manager.add_message(
         task_id,
         {
             "type": MessageType.COMPLETED.value,
             "total": total,
-            "successful": len(task.results) if task else 0,
+            "successful": task.result_count if task else 0,
             "failed": len(task.errors) if task else 0,
-            "message": f"全部完成: 成功 {len(task.results) if task else 0}/{total}",
-            "duration": total_duration
+            "message": f"全部完成: 成功 {task.result_count if task else 0}/{total}",
+            "duration": total_duration,
+            "token_usage": token_usage.get_task_usage(task_id)
         }
     )
 
-    print(f"\n[BATCH PROCESSOR] 批量处理完成: 成功 {len(task.results) if task else 0}/{total}")
+    print(f"\n[BATCH PROCESSOR] 批量处理完成: 成功 {task.result_count if task else 0}/{total}")
     print(f"[BATCH PROCESSOR] 总耗时: {total_duration:.2f} 秒")
     print(f"[BATCH PROCESSOR] 结束时间: {time.strftime('%H:%M:%S')}")
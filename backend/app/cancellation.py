@@ -0,0 +1,203 @@
+# cancellation.py
+# 作用：批量任务的协作式取消与截止时间
+# 功能：
+#   - 每个批量任务在独立的 asyncio.Task 中运行，注册到 CancellationRegistry
+#   - cancel(task_id) 取消该Task：CancelledError 沿 await 链传播到工作流的语义块流水线和 acall_llm，
+#     排队中/进行中的LLM请求立即放弃，并退还预约的速率额度
+#   - 截止时间到达时以同样方式取消（原因记为 deadline）
+#   - 截止时间通过 ContextVar 传给 acall_llm：排队等待额度超过剩余时间的请求直接放弃，不占用额度
+#   - 剩余时间不足时抛出 DeadlineExceeded（BaseException，节点的 except Exception 不会把它变成语义块失败），
+#     同时按截止时间取消整个任务，其余语义块和URL不再继续
+
+import asyncio
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+# 取消原因
+CANCEL_REASON_USER = "user"
+CANCEL_REASON_DEADLINE = "deadline"
+
+# 当前任务的截止时间（time.monotonic()），由 run_cancellable 设置，子任务自动继承
+_deadline: ContextVar[Optional[float]] = ContextVar("task_deadline", default=None)
+
+# 当前任务剩余时间不足时的取消回调，由 run_cancellable 设置（可在线程中调用）
+_on_deadline: ContextVar[Optional[Callable[[], None]]] = ContextVar("task_on_deadline", default=None)
+
+
+class DeadlineExceeded(BaseException):
+    """
+    剩余时间不足以完成操作（如排队等待LLM额度超过截止时间）
+
+    与 asyncio.CancelledError 一样继承 BaseException：工作流节点用 except Exception 把单个语义块的错误
+    转成失败结果，截止时间不是语义块的错误，必须穿过这些处理结束整个任务
+    """
+
+
+class TaskCancelled(Exception):
+    """任务被取消（用户取消或超过截止时间）"""
+
+    def __init__(self, task_id: str, reason: str):
+        self.task_id = task_id
+        self.reason = reason
+        super().__init__(f"任务 {task_id} 已取消: {reason}")
+
+
+def deadline_exceeded(message: str) -> DeadlineExceeded:
+    """
+    剩余时间不足：按截止时间取消当前任务（所有语义块和URL一并停止）
+
+    Args:
+        message: 异常信息
+
+    Returns:
+        DeadlineExceeded: 由调用方抛出
+    """
+    on_deadline = _on_deadline.get()
+    if on_deadline is not None:
+        on_deadline()
+    return DeadlineExceeded(message)
+
+
+def remaining_time() -> Optional[float]:
+    """
+    当前任务距截止时间的剩余秒数
+
+    Returns:
+        float | None: 剩余秒数（可能为负），未设置截止时间时为None
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+@dataclass
+class _RunningTask:
+    """正在运行的可取消任务"""
+    task: asyncio.Task
+    deadline: Optional[float] = None
+    reason: Optional[str] = None
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class CancellationRegistry:
+    """
+    可取消任务注册表（单进程，事件循环内使用）
+
+    使用方式：
+        try:
+            await cancellation_registry.run_cancellable(task_id, coro, timeout_seconds=600)
+        except TaskCancelled as e:
+            ...  # e.reason 为 "user" 或 "deadline"
+    """
+
+    def __init__(self):
+        self._running: Dict[str, _RunningTask] = {}
+        self.total_cancelled = 0
+        self.total_deadline_exceeded = 0
+
+    async def run_cancellable(self, task_id: str, coro: Awaitable, timeout_seconds: Optional[float] = None):
+        """
+        在独立的 asyncio.Task 中运行协程，运行期间可通过 cancel(task_id) 取消
+
+        Args:
+            task_id: 任务ID
+            coro: 要运行的协程
+            timeout_seconds: 截止时间（秒，None或<=0表示不限）
+
+        Returns:
+            协程的返回值
+
+        Raises:
+            TaskCancelled: 被 cancel() 取消或超过截止时间
+            DeadlineExceeded: 剩余时间不足，且任务在取消生效前已结束
+            asyncio.CancelledError: 调用方自身被取消（如服务关闭），不做转换
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout_seconds if timeout_seconds and timeout_seconds > 0 else None
+
+        # 子任务创建时复制当前上下文，截止时间随之传给工作流节点和LLM调用
+        token = _deadline.set(deadline)
+        on_deadline_token = _on_deadline.set(
+            lambda: loop.call_soon_threadsafe(self.cancel, task_id, CANCEL_REASON_DEADLINE)
+        )
+        try:
+            task = loop.create_task(coro)
+        finally:
+            _deadline.reset(token)
+            _on_deadline.reset(on_deadline_token)
+
+        running = _RunningTask(task=task, deadline=deadline)
+        if deadline is not None:
+            running.timer = loop.call_later(timeout_seconds, self.cancel, task_id, CANCEL_REASON_DEADLINE)
+        self._running[task_id] = running
+
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                # 调用方自身被取消：子任务一并取消
+                task.cancel()
+                raise
+            if running.reason is None or not task.cancelled():
+                raise
+            raise TaskCancelled(task_id, running.reason) from None
+        finally:
+            if running.timer is not None:
+                running.timer.cancel()
+            if self._running.get(task_id) is running:
+                del self._running[task_id]
+
+    def cancel(self, task_id: str, reason: str = CANCEL_REASON_USER) -> bool:
+        """
+        取消正在运行的任务
+
+        Args:
+            task_id: 任务ID
+            reason: 取消原因（user / deadline）
+
+        Returns:
+            bool: 任务是否在本进程中运行（且尚未取消）
+        """
+        running = self._running.get(task_id)
+        if running is None or running.reason is not None or running.task.done():
+            return False
+
+        running.reason = reason
+        running.task.cancel(f"{task_id}: {reason}")
+        if reason == CANCEL_REASON_DEADLINE:
+            self.total_deadline_exceeded += 1
+        else:
+            self.total_cancelled += 1
+        print(f"[CANCELLATION] 取消任务 {task_id}（原因: {reason}）")
+        return True
+
+    def cancel_reason(self, task_id: str) -> Optional[str]:
+        """正在运行的任务的取消原因（未被取消时为None）"""
+        running = self._running.get(task_id)
+        return running.reason if running else None
+
+    def is_running(self, task_id: str) -> bool:
+        """任务是否在本进程中运行"""
+        return task_id in self._running
+
+    def get_stats(self) -> dict:
+        """获取取消统计"""
+        now = time.monotonic()
+        return {
+            "running": len(self._running),
+            "with_deadline": sum(1 for r in self._running.values() if r.deadline is not None),
+            "nearest_deadline_seconds": min(
+                (round(r.deadline - now, 1) for r in self._running.values() if r.deadline is not None),
+                default=None
+            ),
+            "cancelled": self.total_cancelled,
+            "deadline_exceeded": self.total_deadline_exceeded
+        }
+
+
+# 全局取消注册表
+cancellation_registry = CancellationRegistry()
@@ -0,0 +1,99 @@
+# checkpointer.py
+# 作用：并行工作流的持久化检查点（断点续跑）
+# 功能：
+#   - 使用 langgraph-checkpoint-sqlite 的 AsyncSqliteSaver 把每个URL的工作流进度写入本地SQLite
+#   - 检查点按 (task_id, url) 区分线程，服务中途退出后恢复任务时跳过已完成的语义块流水线
+#   - 每次批量处理打开一个连接，处理结束时关闭
+#   - 依赖未安装或已关闭时返回None，工作流照常运行（只是不可续跑）
+#   - URL处理结束（成功或失败）后删除对应检查点，数据库只保留未完成的工作
+
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+from app.config import settings
+
+# 检查点中允许反序列化的自定义类型（语义块结果）
+CHECKPOINT_STATE_TYPES = [("app.models", "Ted_Shadows")]
+
+
+def checkpoint_thread_id(task_id: str, url: str) -> str:
+    """
+    计算检查点线程ID（同一任务的同一URL恢复时命中同一检查点）
+
+    Args:
+        task_id: 任务ID
+        url: TED URL
+
+    Returns:
+        str: 线程ID
+    """
+    return f"{task_id}:{url}"
+
+
+async def create_checkpointer(db_path: str):
+    """
+    创建SQLite检查点存储
+
+    Args:
+        db_path: 数据库文件路径（":memory:" 表示内存数据库）
+
+    Returns:
+        AsyncSqliteSaver
+
+    Raises:
+        ImportError: 未安装 langgraph-checkpoint-sqlite
+    """
+    import aiosqlite
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    if db_path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = await aiosqlite.connect(db_path)
+    saver = AsyncSqliteSaver(conn, serde=JsonPlusSerializer(allowed_msgpack_modules=CHECKPOINT_STATE_TYPES))
+    await saver.setup()
+    return saver
+
+
+@asynccontextmanager
+async def open_checkpointer(db_path: Optional[str] = None) -> AsyncIterator[Optional[Any]]:
+    """
+    打开检查点存储（用于一次批量处理，结束时关闭连接）
+
+    Args:
+        db_path: 数据库文件路径（默认settings.checkpoint_path）
+
+    Yields:
+        AsyncSqliteSaver，未启用、依赖缺失或初始化失败时为None（工作流照常运行，只是不可续跑）
+    """
+    saver = None
+    if settings.checkpoint_enabled:
+        try:
+            saver = await create_checkpointer(db_path or settings.checkpoint_path)
+        except ImportError as e:
+            print(f"[CHECKPOINT] [WARNING] 缺少依赖，任务不可断点续跑: {e}")
+            print("   安装: pip install langgraph-checkpoint-sqlite")
+        except Exception as e:
+            print(f"[CHECKPOINT] [WARNING] 检查点存储初始化失败: {e}")
+
+    try:
+        yield saver
+    finally:
+        if saver is not None:
+            await saver.conn.close()
+
+
+async def delete_checkpoint(checkpointer, thread_id: str) -> None:
+    """
+    删除线程的全部检查点（失败只打印警告）
+
+    Args:
+        checkpointer: 检查点存储（None时不做任何事）
+        thread_id: 线程ID
+    """
+    if checkpointer is None:
+        return
+    try:
+        await checkpointer.adelete_thread(thread_id)
+    except Exception as e:
+        print(f"[CHECKPOINT] [WARNING] 删除检查点失败: {thread_id}, {e}")
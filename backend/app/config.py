@@ -48,7 +48,110 @@ class Settings(BaseSettings):
     api_rotation_enabled: bool = False
     current_api_provider: str = "groq"
     api_providers: list[str] = ["groq", "openai", "deepseek"]
-    
+
+    # 多提供商路由（默认关闭）：按阶段的质量要求在配置了Key的提供商/模型中选择预期延迟最低的健康候选，
+    # 429或服务故障时立即切换，Groq所有Key冷却时不再等待
+    provider_router_enabled: bool = False
+    provider_models: dict[str, list[str]] = {
+        "groq": ["llama-3.3-70b-versatile", "llama-3.1-8b-instant"],
+        "openai": ["gpt-4o-mini"],
+        "deepseek": ["deepseek-chat"],
+    }
+    model_quality_tiers: dict[str, int] = {  # 模型质量等级（越大越强）
+        "llama-3.1-8b-instant": 1,
+        "llama-3.3-70b-versatile": 2,
+        "gpt-4o-mini": 2,
+        "deepseek-chat": 2,
+    }
+    # 各阶段的最低质量等级（未设置的阶段与请求的模型同级）
+    stage_min_quality_tier: dict[str, int] = {"search_optimizer": 1, "speaker_extractor": 1, "json_reask": 1}
+    provider_router_ewma_alpha: float = 0.3  # 延迟和错误率EWMA的平滑系数
+    provider_router_cooldown_seconds: float = 30.0  # 候选失败后的冷却时间
+    provider_router_default_latency: float = 5.0  # 没有延迟样本的候选的预估延迟（秒）
+
+    # 批量处理并发配置
+    batch_max_concurrency: int = 3  # 同时处理的URL数量上限
+    batch_urls_per_key: int = 1  # 每个健康API Key可分摊的并发URL数
+    batch_task_timeout_seconds: int = 3600  # 任务默认截止时间，超过后取消（<=0表示不限）
+
+    # LLM调用调度配置（令牌桶限速 + 全局并发）
+    llm_scheduler_enabled: bool = True  # 按Key的RPM/TPM预算排队，避免触发429
+    llm_max_concurrency: int = 4  # 同时进行的LLM请求数上限
+    llm_rpm_limit: int = 30  # 未知模型的默认每分钟请求数
+    llm_tpm_limit: int = 6000  # 未知模型的默认每分钟token数
+    llm_estimated_completion_tokens: int = 400  # 预约额度时预估的输出token数
+
+    # LLM对冲请求（仅异步调用，默认关闭）：超过近期响应时间分位数仍未返回时，
+    # 用另一个Key发送相同请求，先返回的结果生效，另一个请求取消
+    llm_hedge_enabled: bool = False
+    llm_hedge_percentile: float = 95.0  # 对冲等待时间取健康Key最近成功调用响应时间的该分位数
+    llm_hedge_min_samples: int = 20  # 样本不足时不对冲
+    llm_hedge_min_delay: float = 1.0  # 对冲等待时间下限（秒）
+    llm_hedge_max_ratio: float = 0.1  # 对冲请求数上限（占LLM调用数的比例），限制额外消耗
+
+    # 语义分块（按模型token数控制块大小，每个语义块对应一条Shadow Writing流水线）
+    chunk_target_tokens: int = 110  # 达到该大小后开始新块
+    chunk_min_tokens: int = 80  # 小于该大小的块继续合并后续句子
+    chunk_max_tokens: int = 150  # 块大小上限（超长句按从句切分）
+
+    # Shadow Writing批量模式（异步流水线中同时到达的K个语义块合并为一次LLM调用，1表示关闭）
+    shadow_batch_size: int = 1
+    shadow_batch_wait_ms: int = 50  # 收集批次的最长等待时间
+
+    # LLM返回的JSON本地无法修复时，用轻量模型把原始回复重新整理为JSON（不重发原prompt）
+    llm_json_reask_enabled: bool = True
+    llm_json_reask_model: str = "llama-3.1-8b-instant"
+
+    # 质量评估前的本地预检（明显合格/不合格的语义块跳过LLM评估）
+    pre_quality_enabled: bool = True
+
+    # 质量评估模型级联（未注入LLM时先用轻量模型评分，总分落在不确定区间内再用model_name重新评分）
+    quality_cascade_enabled: bool = False
+    cascade_light_model: str = "llama-3.1-8b-instant"
+    quality_cascade_low: float = 7.0  # 不确定区间下限（通过阈值为9分）
+    quality_cascade_high: float = 9.0  # 不确定区间上限
+
+    # 质量评估批量模式（同时到达的K个语义块合并评估，1表示关闭）
+    quality_batch_size: int = 1
+    quality_batch_wait_ms: int = 50
+
+    # 多用户公平调度（LLM请求按用户加权公平排队，交互式请求优先）
+    fair_scheduler_enabled: bool = True
+    fair_scheduler_max_inflight: int = 4  # 同时占用速率额度的LLM请求数（含等待额度中的请求）
+    fair_interactive_max_urls: int = 2  # URL数不超过该值的批量任务按交互式优先级调度
+    fair_interactive_weight: float = 8.0  # 交互式请求相对批量请求的权重
+    fair_user_weights: dict[str, float] = {}  # 按用户ID指定权重（默认1.0）
+
+    # LLM响应缓存（相同prompt直接返回缓存结果）
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = "./data/llm_cache.db"
+    llm_cache_ttl_seconds: int = 7 * 24 * 3600  # 7天，<=0表示永不过期
+    llm_cache_max_entries: int = 20000  # 超出后按最近最少使用淘汰
+
+    # 演讲结果缓存（相同transcript + 相同流水线版本直接返回结果）
+    result_cache_enabled: bool = True
+    result_cache_path: str = "./data/result_cache.db"
+    result_cache_ttl_seconds: int = 30 * 24 * 3600  # 30天
+    result_cache_max_entries: int = 2000
+
+    # SSE进度推送
+    sse_keepalive_seconds: int = 15  # 无新消息时发送心跳注释的间隔，防止代理断开空闲连接
+    sse_buffer_max_bytes: int = 2 * 1024 * 1024  # 每个任务缓存消息的最大字节数（断点续传窗口）
+    sse_shared_poll_seconds: float = 0.5  # 共享进度日志下订阅者检查其他worker写入的间隔
+
+    # 任务存储（任务状态和结果持久化，内存只保留最近访问的任务）
+    # memory：进程内；sqlite：任务持久化，进度日志在进程内；sqlite_shared：任务与进度日志都由多个worker共享
+    task_backend: str = "sqlite"
+    task_store_path: str = "./data/tasks.db"
+    task_memory_max_tasks: int = 100  # 内存中保留的最大任务数
+    task_memory_ttl_seconds: int = 600  # 已结束任务空闲超过该时间后移出内存
+    task_retention_hours: int = 7 * 24  # 磁盘上任务的保留时间
+    task_max_stored_tasks: int = 2000  # 磁盘上保留的最大任务数
+
+    # 工作流检查点（服务中途退出后恢复任务，跳过已完成的语义块）
+    checkpoint_enabled: bool = True
+    checkpoint_path: str = "./data/checkpoints.db"
+
     # TED文件管理（缓存、删除）
     ted_cache_dir: str = "./data/ted_cache"
     auto_delete_ted_files: bool = False
@@ -20,6 +20,8 @@ class TaskStatus(str, Enum):
     PROCESSING = "processing"     # 任务处理中
     COMPLETED = "completed"       # 任务已完成
     FAILED = "failed"            # 任务失败
+    INTERRUPTED = "interrupted"   # 服务重启导致中断，可通过恢复接口继续
+    CANCELLED = "cancelled"       # 被用户取消或超过截止时间
     
     def __str__(self) -> str:
         """返回枚举值字符串"""
@@ -35,16 +37,19 @@ class MessageType(str, Enum):
     """
     # 连接相关
     CONNECTED = "connected"                   # 客户端已连接
+    RESYNC = "resync"                         # 续传时部分消息已过期，需重新获取任务状态
     
     # 任务生命周期
     STARTED = "started"                       # 任务开始
     PROGRESS = "progress"                     # 进度更新
     COMPLETED = "completed"                   # 任务完成
     TASK_COMPLETED = "task_completed"         # 任务最终完成（含完整数据）
+    CANCELLED = "cancelled"                   # 任务被取消（用户取消或超过截止时间）
     
     # 处理步骤
     STEP = "step"                             # 处理步骤（如：提取transcript、shadow writing）
     URL_COMPLETED = "url_completed"           # 单个URL处理完成
+    CHUNK_COMPLETED = "chunk_completed"       # 单个语义块处理完成（含结果）
     
     # 错误处理
     ERROR = "error"                           # 错误消息
@@ -74,6 +79,21 @@ class ProcessingStep(str, Enum):
         return self.value
 
 
+# ==================== 任务优先级枚举 ====================
+
+class TaskPriority(str, Enum):
+    """任务优先级枚举
+    
+    用于公平调度器区分交互式请求和批量请求
+    """
+    INTERACTIVE = "interactive"   # 交互式（少量URL，用户在等待结果）
+    BULK = "bulk"                 # 批量（大量URL，后台运行）
+    
+    def __str__(self) -> str:
+        """返回枚举值字符串"""
+        return self.value
+
+
 # ==================== Memory命名空间类型枚举 ====================
 
 class MemoryNamespace(str, Enum):
@@ -19,6 +19,7 @@ class ErrorCode(str, Enum):
     NOT_FOUND = "NOT_FOUND"
     UNAUTHORIZED = "UNAUTHORIZED"
     FORBIDDEN = "FORBIDDEN"
+    CONFLICT = "CONFLICT"
 
     # 业务特定错误
     FILE_PROCESSING_ERROR = "FILE_PROCESSING_ERROR"
@@ -78,6 +79,18 @@ class NotFoundError(AppException):
         )
 
 
+class ConflictError(AppException):
+    """资源状态冲突错误"""
+
+    def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(
+            message=message,
+            error_code=ErrorCode.CONFLICT,
+            status_code=409,
+            details=details
+        )
+
+
 class ConfigurationError(AppException):
     """配置错误"""
 
@@ -0,0 +1,353 @@
+# fair_scheduler.py
+# 作用：多用户LLM请求公平调度
+# 功能：
+#   - 所有用户的批量任务共享同一组API Key，单个用户的大批量任务会用语义块请求占满速率额度
+#   - acall_llm 预约速率额度前先经过准入：同时预约和调用的请求数有上限，排队请求按加权公平队列（WFQ）放行
+#   - 流 = (用户ID, 优先级)，权重 = 用户权重 × 优先级权重；交互式请求权重更高，大批量任务运行时仍能很快拿到额度
+#   - 用户和优先级通过 ContextVar 从批量任务传到工作流节点和LLM调用
+#   - 请求等待速率额度或Key冷却期间交出名额（FairSlot.suspend），只在实际调用时占用
+#   - 统计每个流和每个优先级的排队深度、运行数、平均排队时间
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+from app.config import settings
+from app.enums import TaskPriority
+
+# 未指定用户时的用户ID（与 TaskManager.create_task 的默认值一致）
+DEFAULT_USER_ID = "default"
+
+# 当前请求所属的 (用户ID, 优先级)，批量任务中设置，工作流节点和LLM调用自动继承；
+# 不在批量任务中的调用（单次接口请求）按交互式处理
+_tenant: ContextVar[Tuple[str, str]] = ContextVar(
+    "llm_tenant", default=(DEFAULT_USER_ID, TaskPriority.INTERACTIVE.value)
+)
+
+
+@contextmanager
+def tenant_context(user_id: Optional[str], priority: str):
+    """
+    设置当前请求所属的用户和优先级（退出时恢复）
+
+    Args:
+        user_id: 用户ID（None时使用默认用户）
+        priority: 优先级（interactive / bulk）
+    """
+    token = _tenant.set((user_id or DEFAULT_USER_ID, TaskPriority(priority).value))
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def current_tenant() -> Tuple[str, str]:
+    """当前请求所属的 (用户ID, 优先级)"""
+    return _tenant.get()
+
+
+def resolve_priority(url_count: int, requested: Optional[str] = None) -> TaskPriority:
+    """
+    确定批量任务的优先级
+
+    Args:
+        url_count: 待处理的URL数
+        requested: 请求中指定的优先级（可选）
+
+    Returns:
+        TaskPriority: 指定时使用指定值，否则URL数不超过 fair_interactive_max_urls 为交互式，其余为批量
+    """
+    if requested:
+        return TaskPriority(requested)
+    if url_count <= settings.fair_interactive_max_urls:
+        return TaskPriority.INTERACTIVE
+    return TaskPriority.BULK
+
+
+@dataclass
+class _Flow:
+    """一个 (用户, 优先级) 的请求流"""
+    user_id: str
+    priority: str
+    weight: float
+    last_finish: float = 0.0  # 最后一个请求的虚拟完成时间
+    queued: int = 0
+    active: int = 0
+    dispatched: int = 0
+    total_wait: float = 0.0
+
+
+@dataclass(order=True)
+class _Waiter:
+    """排队中的请求（按虚拟完成时间排序，相同时先来先服务）"""
+    finish: float
+    seq: int
+    start: float = field(compare=False)
+    flow: _Flow = field(compare=False)
+    loop: Any = field(compare=False)
+    future: Any = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    dispatched: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class FairSlot:
+    """已放行的名额（slot() 返回），等待期间可以暂时交出"""
+
+    def __init__(self, scheduler: "FairScheduler", flow: _Flow):
+        self.scheduler = scheduler
+        self.flow: Optional[_Flow] = flow
+
+    async def suspend(self, awaitable: Awaitable) -> Any:
+        """
+        交出名额等待（速率额度排队、Key冷却），结束后重新排队取回名额
+
+        重新排队按最小成本计算（请求的成本在首次放行时已计入流的虚拟时间）
+
+        Args:
+            awaitable: 要等待的协程
+
+        Returns:
+            awaitable 的结果
+        """
+        if self.flow is not None:
+            self.scheduler.release(self.flow)
+            self.flow = None
+        result = await awaitable
+        self.flow = await self.scheduler.acquire(0)
+        return result
+
+    def release(self) -> None:
+        """释放名额（已交出时不重复释放）"""
+        if self.flow is not None:
+            self.scheduler.release(self.flow)
+            self.flow = None
+
+
+class FairScheduler:
+    """
+    加权公平队列（start-time fair queuing）
+
+    每个请求入队时打上虚拟开始/完成时间：
+        start  = max(虚拟时间, 本流上一个请求的完成时间)
+        finish = start + cost / 权重
+    有空闲名额时放行 finish 最小的请求，虚拟时间推进到被放行请求的 start。
+    积压很多请求的流 finish 越排越靠后，新来的其他用户/交互式请求因此插到前面；
+    空闲的流不会积攒额度，重新活跃时从当前虚拟时间开始。
+
+    使用方式：
+        with tenant_context(user_id, priority):
+            async with fair_scheduler.slot(estimated_tokens) as slot:
+                ... 预约速率额度 ...
+                await slot.suspend(asyncio.sleep(wait))  # 等待额度期间交出名额
+                ... 调用LLM ...
+    """
+
+    def __init__(self, max_inflight: int = 4, interactive_weight: float = 8.0,
+                 user_weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            max_inflight: 同时放行的请求数
+            interactive_weight: 交互式请求相对批量请求的权重
+            user_weights: 按用户ID指定的权重（默认1.0）
+        """
+        self.max_inflight = max(1, max_inflight)
+        self.interactive_weight = interactive_weight
+        self.user_weights = dict(user_weights or {})
+        self.virtual_time = 0.0
+        self.active = 0
+        self.queued = 0
+        self.total_queued = 0  # 需要排队的请求次数
+        self._flows: Dict[Tuple[str, str], _Flow] = {}
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._priority_totals: Dict[str, List[float]] = {p.value: [0, 0.0] for p in TaskPriority}
+        self._lock = threading.Lock()
+        print(f"[FAIR] 公平调度器已启动: 最多同时放行 {self.max_inflight} 个LLM请求")
+
+    def _weight(self, user_id: str, priority: str) -> float:
+        """流权重 = 用户权重 × 优先级权重"""
+        user_weight = max(self.user_weights.get(user_id, 1.0), 0.01)
+        if priority == TaskPriority.INTERACTIVE.value:
+            return user_weight * self.interactive_weight
+        return user_weight
+
+    def _get_flow(self, user_id: str, priority: str) -> _Flow:
+        """获取流，不存在时创建（需持有锁）"""
+        flow = self._flows.get((user_id, priority))
+        if flow is None:
+            flow = _Flow(user_id=user_id, priority=priority, weight=self._weight(user_id, priority))
+            self._flows[(user_id, priority)] = flow
+        return flow
+
+    def _dispatch(self, flow: _Flow, start: float, waited: float) -> None:
+        """放行一个请求（需持有锁，调用方负责 self.active 计数）"""
+        self.virtual_time = max(self.virtual_time, start)
+        flow.active += 1
+        flow.dispatched += 1
+        flow.total_wait += waited
+        totals = self._priority_totals[flow.priority]
+        totals[0] += 1
+        totals[1] += waited
+
+    def _pop_waiter(self) -> Optional[_Waiter]:
+        """取出虚拟完成时间最小的未取消请求（需持有锁）"""
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            if not waiter.cancelled:
+                return waiter
+        return None
+
+    def _forget_idle_flows(self) -> None:
+        """
+        完全空闲时清空流（需持有锁）
+
+        虚拟时间推进到所有流的最大完成时间，此后新到的请求从同一起点开始
+        """
+        if self.active or self.queued:
+            return
+        self.virtual_time = max([self.virtual_time] + [f.last_finish for f in self._flows.values()])
+        self._flows.clear()
+        self._queue.clear()
+
+    async def acquire(self, cost: float = 1.0) -> _Flow:
+        """
+        获取放行名额（按当前上下文的用户和优先级排队）
+
+        Args:
+            cost: 请求成本（预估token数）
+
+        Returns:
+            _Flow: 请求所属的流，释放时传给 release()
+        """
+        user_id, priority = current_tenant()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flow = self._get_flow(user_id, priority)
+            start = max(self.virtual_time, flow.last_finish)
+            flow.last_finish = start + max(cost, 1.0) / flow.weight
+
+            if self.active < self.max_inflight and not self.queued:
+                self.active += 1
+                self._dispatch(flow, start, 0.0)
+                return flow
+
+            waiter = _Waiter(
+                finish=flow.last_finish, seq=next(self._seq), start=start, flow=flow,
+                loop=loop, future=loop.create_future(), enqueued_at=time.monotonic()
+            )
+            heapq.heappush(self._queue, waiter)
+            flow.queued += 1
+            self.queued += 1
+            self.total_queued += 1
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                handed_off = waiter.dispatched
+                if not handed_off:
+                    waiter.cancelled = True
+                    flow.queued -= 1
+                    self.queued -= 1
+                    # 未被放行的请求不计入流的虚拟完成时间
+                    flow.last_finish -= waiter.finish - waiter.start
+            # 名额已交接给本请求但未被使用，继续交给下一个等待者
+            if handed_off and waiter.future.done() and not waiter.future.cancelled():
+                self.release(flow)
+            raise
+        return flow
+
+    def release(self, flow: _Flow) -> None:
+        """释放名额（有等待者时直接交接给虚拟完成时间最小的请求）"""
+        with self._lock:
+            flow.active -= 1
+            waiter = self._pop_waiter()
+            if waiter is None:
+                self.active -= 1
+                self._forget_idle_flows()
+            else:
+                waiter.dispatched = True
+                waiter.flow.queued -= 1
+                self.queued -= 1
+                self._dispatch(waiter.flow, waiter.start, time.monotonic() - waiter.enqueued_at)
+
+        if waiter is not None:
+            self._wake(waiter)
+
+    def _wake(self, waiter: _Waiter) -> None:
+        """唤醒等待者"""
+        def resolve():
+            if waiter.future.done():
+                # 等待者已取消，名额转交下一个
+                self.release(waiter.flow)
+            else:
+                waiter.future.set_result(True)
+
+        try:
+            waiter.loop.call_soon_threadsafe(resolve)
+        except RuntimeError:
+            # 事件循环已关闭
+            self.release(waiter.flow)
+
+    @asynccontextmanager
+    async def slot(self, cost: float = 1.0) -> AsyncIterator[FairSlot]:
+        """
+        获取放行名额的上下文管理器
+
+        Args:
+            cost: 请求成本（预估token数）
+
+        Yields:
+            FairSlot: 名额，等待额度或Key冷却时用 suspend() 暂时交出
+        """
+        slot = FairSlot(self, await self.acquire(cost))
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def get_stats(self) -> dict:
+        """获取调度统计（排队深度、运行数、平均排队时间）"""
+        with self._lock:
+            by_priority = {}
+            for priority, (dispatched, total_wait) in self._priority_totals.items():
+                flows = [f for f in self._flows.values() if f.priority == priority]
+                by_priority[priority] = {
+                    "queued": sum(f.queued for f in flows),
+                    "active": sum(f.active for f in flows),
+                    "dispatched": dispatched,
+                    "avg_wait_ms": round(total_wait / dispatched * 1000, 1) if dispatched else 0.0
+                }
+            flows = {
+                f"{flow.user_id}/{flow.priority}": {
+                    "weight": flow.weight,
+                    "queued": flow.queued,
+                    "active": flow.active,
+                    "dispatched": flow.dispatched,
+                    "avg_wait_ms": round(flow.total_wait / flow.dispatched * 1000, 1) if flow.dispatched else 0.0
+                }
+                for flow in self._flows.values()
+            }
+            return {
+                "enabled": settings.fair_scheduler_enabled,
+                "max_inflight": self.max_inflight,
+                "active": self.active,
+                "queued": self.queued,
+                "total_queued": self.total_queued,
+                "by_priority": by_priority,
+                "flows": flows
+            }
+
+
+# 全局公平调度器
+fair_scheduler = FairScheduler(
+    max_inflight=settings.fair_scheduler_max_inflight,
+    interactive_weight=settings.fair_interactive_weight,
+    user_weights=settings.fair_user_weights
+)
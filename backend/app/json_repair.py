@@ -0,0 +1,372 @@
+# json_repair.py
+# 作用：LLM返回内容的容错JSON解析与修复
+# 功能：
+#   - 直接解析失败时依次尝试：提取代码块/正文中的JSON → 修复常见格式错误 → 补全被截断的对象
+#   - 修复：单引号字符串、尾随逗号、Python字面量（True / False / None）
+#   - 截断：补全未闭合的括号，丢弃最后一个不完整的键值对（包括被截断的字符串值），尽量保留已生成的部分
+#   - 统计直接解析、各类修复、修复失败和重新请求（re-ask）的次数，用于衡量挽回的吞吐量
+#   - 只有直接解析和提取出的JSON与模型的回复一致（无损）；修复、截断补全和重新请求的结果不写入缓存，
+#     并通过 ContextVar 计入当前运行的有损结果数（整场演讲结果缓存据此跳过写入）
+
+import json
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, List, Optional, Tuple
+
+# 修复方式
+METHOD_DIRECT = "direct"          # 直接解析成功
+METHOD_EXTRACTED = "extracted"    # 去掉代码块/前后说明文字后解析成功
+METHOD_REPAIRED = "repaired"      # 修复单引号、尾随逗号、Python字面量后解析成功
+METHOD_TRUNCATED = "truncated"    # 补全被截断的对象后解析成功
+
+# 与模型回复内容一致的解析方式（可以缓存）
+LOSSLESS_METHODS = (METHOD_DIRECT, METHOD_EXTRACTED)
+
+# 截断修复时最多回退的逗号数
+MAX_TRUNCATION_CUTS = 20
+
+_CODE_FENCE = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)(?:```|$)", re.DOTALL)
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def extract_json_text(content: str) -> str:
+    """
+    从LLM返回内容中提取JSON文本
+
+    去掉 ```json 代码块标记和JSON前后的说明文字；JSON未结束（被截断）时保留到末尾
+
+    Args:
+        content: LLM返回内容
+
+    Returns:
+        str: 从第一个 { 或 [ 开始的JSON文本，找不到时返回去掉空白的原内容
+    """
+    text = content.strip()
+    fence = _CODE_FENCE.search(text)
+    if fence:
+        text = fence.group(1).strip()
+
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return text
+    text = text[min(starts):]
+
+    # 找到第一个完整值的结尾，丢弃后面的说明文字
+    depth, in_string, escaped = 0, False, False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[:index + 1]
+    return text
+
+
+def _read_string(text: str, start: int) -> Tuple[str, int, bool]:
+    """读取从 start 开始的字符串（单引号或双引号），返回双引号JSON字符串、结束位置和是否闭合；未闭合时补全"""
+    quote = text[start]
+    chars: List[str] = []
+    index = start + 1
+    while index < len(text):
+        char = text[index]
+        if char == "\\" and index + 1 < len(text):
+            following = text[index + 1]
+            # 单引号字符串中的 \' 在JSON中不需要转义
+            chars.append("'" if following == "'" else char + following)
+            index += 2
+            continue
+        if char == "\\":
+            # 截断在转义符处：丢弃
+            index += 1
+            continue
+        if char == quote:
+            return '"' + "".join(chars) + '"', index + 1, True
+        if char == '"':
+            chars.append('\\"')
+        elif char == "\n":
+            chars.append("\\n")
+        else:
+            chars.append(char)
+        index += 1
+    return '"' + "".join(chars) + '"', index, False
+
+
+def normalize_json_text(text: str) -> str:
+    """
+    修复常见的JSON格式错误
+
+    - 单引号字符串改为双引号（字符串内的双引号转义、裸换行改为 \\n）
+    - 删除 } 或 ] 前以及末尾的逗号
+    - True / False / None 改为 true / false / null
+    - 未闭合的字符串补上结束引号
+
+    Args:
+        text: JSON文本
+
+    Returns:
+        str: 修复后的文本（可能仍然缺少结束括号）
+    """
+    return _normalize(text)[0]
+
+
+def _normalize(text: str) -> Tuple[str, bool]:
+    """normalize_json_text 的实现，同时返回文本是否在字符串中间被截断"""
+    out: List[str] = []
+    truncated_string = False
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char in "\"'":
+            literal, index, closed = _read_string(text, index)
+            truncated_string = truncated_string or not closed
+            out.append(literal)
+            continue
+        if char == ",":
+            following = index + 1
+            while following < len(text) and text[following].isspace():
+                following += 1
+            if following >= len(text) or text[following] in "}]":
+                index += 1
+                continue
+        if char.isalpha():
+            end = index
+            while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[index:end]
+            out.append(_PYTHON_LITERALS.get(word, word))
+            index = end
+            continue
+        out.append(char)
+        index += 1
+    return "".join(out), truncated_string
+
+
+def _scan(text: str) -> Tuple[List[str], List[int]]:
+    """扫描修复后的文本，返回未闭合的括号栈和字符串外逗号的位置"""
+    stack: List[str] = []
+    commas: List[int] = []
+    in_string, escaped = False, False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            if stack:
+                stack.pop()
+        elif char == ",":
+            commas.append(index)
+    return stack, commas
+
+
+def _close(text: str) -> str:
+    """补全结束括号（并去掉末尾悬空的逗号/冒号）"""
+    text = text.rstrip().rstrip(",").rstrip()
+    stack, _ = _scan(text)
+    return text + "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+
+def _loads(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, ValueError):
+        return None
+
+
+def repair_json(content: str) -> Tuple[Any, str]:
+    """
+    容错解析LLM返回的JSON
+
+    Args:
+        content: LLM返回内容
+
+    Returns:
+        (解析结果, 修复方式)：修复方式为 direct / extracted / repaired / truncated
+
+    Raises:
+        json.JSONDecodeError: 无法修复
+    """
+    try:
+        return json.loads(content), METHOD_DIRECT
+    except (json.JSONDecodeError, TypeError) as e:
+        if not isinstance(content, str):
+            raise json.JSONDecodeError(f"非文本响应: {type(content).__name__}", "", 0) from e
+        error = e
+
+    text = extract_json_text(content)
+    result = _loads(text)
+    if result is not None:
+        return result, METHOD_EXTRACTED
+
+    text, truncated_string = _normalize(text)
+    result = _loads(text) if not truncated_string else None
+    if result is not None:
+        return result, METHOD_REPAIRED
+
+    # 截断：先直接补全括号，失败则逐个回退到前一个逗号（丢弃不完整的键值对）；
+    # 截断在字符串中间时补全的引号后是不完整的值，不能直接补全括号
+    if text[:1] in "{[":
+        candidates = [] if truncated_string else [text]
+        _, commas = _scan(text)
+        candidates += [text[:position] for position in reversed(commas[-MAX_TRUNCATION_CUTS:])]
+        for candidate in candidates:
+            result = _loads(_close(candidate))
+            if result is not None:
+                return result, METHOD_TRUNCATED
+
+    raise error
+
+
+class JSONRepairStats:
+    """JSON解析/修复统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """重置统计"""
+        self.total = 0
+        self.methods = {METHOD_DIRECT: 0, METHOD_EXTRACTED: 0, METHOD_REPAIRED: 0, METHOD_TRUNCATED: 0}
+        self.failed = 0
+        self.reasks = 0
+        self.reask_recovered = 0
+
+    def record(self, method: Optional[str]) -> None:
+        """记录一次解析（method为None表示修复失败）"""
+        with self._lock:
+            self.total += 1
+            if method is None:
+                self.failed += 1
+            else:
+                self.methods[method] += 1
+
+    def record_reask(self, recovered: bool) -> None:
+        """记录一次重新请求"""
+        with self._lock:
+            self.reasks += 1
+            if recovered:
+                self.reask_recovered += 1
+
+    def get_stats(self) -> dict:
+        """
+        获取统计
+
+        Returns:
+            dict: 各修复方式的次数；parse_failure_rate 为直接解析失败的比例，
+                  repair_rate 为其中通过本地修复挽回的比例，recovered 为本地修复与重新请求挽回的总数
+        """
+        with self._lock:
+            broken = self.total - self.methods[METHOD_DIRECT]
+            repaired = broken - self.failed
+            return {
+                "parsed": self.total,
+                **self.methods,
+                "failed": self.failed,
+                "reasks": self.reasks,
+                "reask_recovered": self.reask_recovered,
+                "recovered": repaired + self.reask_recovered,
+                "parse_failure_rate": round(broken / self.total * 100, 2) if self.total else 0.0,
+                "repair_rate": round(repaired / broken * 100, 2) if broken else 0.0
+            }
+
+
+# 全局统计
+json_repair_stats = JSONRepairStats()
+
+
+class LossyResultTracker:
+    """一次运行中有损结果（修复、截断补全、重新请求）的个数"""
+
+    def __init__(self):
+        self.count = 0
+
+
+# 当前运行的有损结果统计，子任务和LLM调用自动继承（同一个对象，子任务中的结果也计入）
+_lossy_tracker: ContextVar[Optional[LossyResultTracker]] = ContextVar("lossy_llm_results", default=None)
+
+
+@contextmanager
+def track_lossy_results():
+    """
+    统计代码块内（含其中创建的子任务）有损LLM结果的个数
+
+    Yields:
+        LossyResultTracker: 有损结果统计，退出后读取 count
+    """
+    tracker = LossyResultTracker()
+    token = _lossy_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _lossy_tracker.reset(token)
+
+
+def record_lossy_result() -> None:
+    """记录一个有损结果（计入当前运行的统计）"""
+    tracker = _lossy_tracker.get()
+    if tracker is not None:
+        tracker.count += 1
+
+
+def parse_llm_json_with_method(content: str) -> Tuple[Any, str]:
+    """
+    解析LLM返回的JSON（先直接解析，失败时修复），并计入统计
+
+    修复方式不在 LOSSLESS_METHODS 中时记为有损结果
+
+    Args:
+        content: LLM返回内容
+
+    Returns:
+        (解析结果, 修复方式)
+
+    Raises:
+        json.JSONDecodeError: 无法修复
+    """
+    try:
+        result, method = repair_json(content)
+    except json.JSONDecodeError:
+        json_repair_stats.record(None)
+        raise
+    json_repair_stats.record(method)
+    if method != METHOD_DIRECT:
+        print(f"[JSON REPAIR] LLM返回的JSON格式有误，已修复（{method}）")
+    if method not in LOSSLESS_METHODS:
+        record_lossy_result()
+    return result, method
+
+
+def parse_llm_json(content: str) -> Any:
+    """
+    解析LLM返回的JSON（先直接解析，失败时修复），并计入统计
+
+    Args:
+        content: LLM返回内容
+
+    Returns:
+        解析结果
+
+    Raises:
+        json.JSONDecodeError: 无法修复
+    """
+    return parse_llm_json_with_method(content)[0]
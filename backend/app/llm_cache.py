@@ -0,0 +1,253 @@
+# llm_cache.py
+# 作用：LLM响应缓存（内容寻址）
+# 功能：
+#   - SQLiteCache：通用的磁盘KV缓存（TTL过期 + LRU淘汰 + 命中统计）
+#   - LLMResponseCache：以 (模型, 温度, 系统提示词, 渲染后的prompt, 输出格式) 的哈希为键缓存LLM结果
+#   - 同一演讲重复处理时直接返回缓存结果，不消耗token
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from app.config import settings
+
+
+class SQLiteCache:
+    """
+    SQLite磁盘缓存（TTL + LRU）
+
+    - 读取时刷新访问时间，淘汰时优先删除最久未访问的条目
+    - 超过TTL的条目视为未命中并删除
+    - 单连接 + 锁，线程池与事件循环中均可安全调用
+    """
+
+    EVICT_EVERY = 100  # 每写入N次检查一次容量
+
+    def __init__(self, db_path: str, ttl_seconds: int = 7 * 24 * 3600,
+                 max_entries: int = 20000, table: str = "cache"):
+        """
+        Args:
+            db_path: 数据库文件路径（":memory:" 表示内存数据库）
+            ttl_seconds: 过期时间（秒），<=0 表示永不过期
+            max_entries: 最大条目数，超过后按LRU淘汰
+            table: 表名
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.table = table
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed ON {table}(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的值，未命中或已过期返回None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self._is_expired(created_at, now):
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        写入缓存（值需可JSON序列化）
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+        """
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now)
+            )
+            self._conn.commit()
+            self.writes += 1
+            should_evict = self.writes % self.EVICT_EVERY == 0
+
+        if should_evict:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        """删除单个条目"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def evict(self) -> int:
+        """
+        删除过期条目，并在超出容量时按LRU淘汰
+
+        Returns:
+            int: 删除的条目数
+        """
+        removed = 0
+        with self._lock:
+            if self.ttl_seconds > 0:
+                cursor = self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                )
+                removed += cursor.rowcount
+
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                cursor = self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+                removed += cursor.rowcount
+
+            self._conn.commit()
+            self.evictions += removed
+        return removed
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def size(self) -> int:
+        """当前条目数"""
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self.size(),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "db_path": self.db_path
+        }
+
+    def reset_stats(self) -> None:
+        """重置命中统计"""
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+
+class LLMResponseCache(SQLiteCache):
+    """LLM响应缓存：相同的模型、参数和prompt直接返回上次的结果"""
+
+    def __init__(self, db_path: str, ttl_seconds: int = 7 * 24 * 3600, max_entries: int = 20000):
+        super().__init__(db_path, ttl_seconds, max_entries, table="llm_responses")
+
+    @staticmethod
+    def make_key(model: str, temperature: float, system_prompt: Optional[str],
+                 prompt: str, output_format: Optional[Dict]) -> str:
+        """
+        生成内容寻址的缓存键
+
+        Args:
+            model: 模型名称
+            temperature: 温度参数（实际使用的值）
+            system_prompt: 系统提示词
+            prompt: 渲染后的用户提示词
+            output_format: 输出格式字典
+
+        Returns:
+            str: sha256十六进制摘要
+        """
+        material = json.dumps(
+            [model, temperature, system_prompt or "", prompt, output_format],
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+# 全局缓存实例（首次使用时创建，避免导入时创建数据库文件）
+llm_response_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    获取LLM响应缓存
+
+    Returns:
+        LLMResponseCache: 缓存实例；settings.llm_cache_enabled 为False或初始化失败时返回None
+    """
+    global llm_response_cache
+    if not settings.llm_cache_enabled:
+        return None
+
+    if llm_response_cache is None:
+        with _cache_lock:
+            if llm_response_cache is None:
+                try:
+                    llm_response_cache = LLMResponseCache(
+                        settings.llm_cache_path,
+                        ttl_seconds=settings.llm_cache_ttl_seconds,
+                        max_entries=settings.llm_cache_max_entries
+                    )
+                    print(f"[LLM CACHE] 响应缓存已启用: {settings.llm_cache_path}")
+                except Exception as e:
+                    print(f"[LLM CACHE] [WARNING] 缓存初始化失败，禁用缓存: {e}")
+                    settings.llm_cache_enabled = False
+                    return None
+
+    return llm_response_cache
@@ -0,0 +1,187 @@
+# llm_hedging.py
+# 作用：LLM对冲请求（hedged requests），降低长尾延迟
+# 功能：
+#   - 异步LLM调用超过近期响应时间的分位数（来自 APIKeyMonitor）仍未返回时，用另一个Key发送相同请求
+#   - 先成功返回的结果生效，另一个请求取消（由请求方退还未使用的额度）；主请求失败时等待对冲请求
+#   - 对冲请求数不超过调用数的 settings.llm_hedge_max_ratio，限制额外的速率额度消耗
+#   - 统计对冲次数、对冲请求胜出次数和跳过原因
+
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+from app.config import settings
+from app.monitoring.api_key_monitor import api_key_monitor
+
+
+async def _discard(task: "asyncio.Future") -> None:
+    """取消任务并等待其结束（任务自行处理取消时的额度结算）"""
+    if not task.done():
+        task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+class LLMHedger:
+    """
+    LLM对冲请求控制器
+
+    使用方式：
+        response, hedge_won = await llm_hedger.race(acompletion(**kwargs), start_hedge)
+        # start_hedge() 返回另一个Key上的相同请求（协程），没有可用Key时返回None
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.llm_hedge_enabled
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        对冲等待时间：健康Key最近成功调用响应时间的分位数（不低于下限）
+
+        Returns:
+            float | None: 等待秒数，样本不足时返回None（不对冲）
+        """
+        latency = api_key_monitor.get_latency_percentile(
+            settings.llm_hedge_percentile, settings.llm_hedge_min_samples
+        )
+        if latency is None:
+            return None
+        return max(latency, settings.llm_hedge_min_delay)
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _start_hedge(self, start_hedge: Callable[[], Optional[Awaitable]]) -> Optional[Awaitable]:
+        """在额外消耗上限内发起对冲请求（检查上限和占用名额在同一次加锁中完成，并发调用不会超出上限）"""
+        with self._lock:
+            if self.hedged >= settings.llm_hedge_max_ratio * self.calls:
+                self.skipped_budget += 1
+                return None
+            self.hedged += 1
+        hedge = start_hedge()
+        if hedge is None:
+            with self._lock:
+                self.hedged -= 1
+                self.skipped_no_key += 1
+            return None
+        return hedge
+
+    async def race(self, primary: Awaitable, start_hedge: Callable[[], Optional[Awaitable]]) -> Tuple[Any, bool]:
+        """
+        执行LLM请求，超过对冲等待时间仍未返回时发起对冲请求
+
+        - 主请求先成功返回：取消对冲请求
+        - 主请求先失败：等待对冲请求，对冲请求也失败时抛出主请求的异常
+        - 对冲请求先成功返回：取消主请求
+        - 对冲请求失败：继续等待主请求
+
+        Args:
+            primary: 主请求（协程）
+            start_hedge: 发起对冲请求的函数，返回协程；没有其他可用Key或额度时返回None
+
+        Returns:
+            (响应, 是否为对冲请求的响应)
+
+        Raises:
+            主请求的异常
+        """
+        if not self.enabled:
+            return await primary, False
+
+        self._count("calls")
+        delay = self.hedge_delay()
+        if delay is None:
+            self._count("skipped_no_samples")
+            return await primary, False
+
+        primary_task = asyncio.ensure_future(primary)
+        hedge_task = None
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=delay)
+            if done:
+                return primary_task.result(), False
+
+            hedge = self._start_hedge(start_hedge)
+            if hedge is None:
+                return await primary_task, False
+
+            print(f"[HEDGE] LLM请求超过 {delay:.2f}秒 未返回，使用另一个Key发送对冲请求")
+            hedge_task = asyncio.ensure_future(hedge)
+            started = time.perf_counter()
+            done, _ = await asyncio.wait({primary_task, hedge_task}, return_when=asyncio.FIRST_COMPLETED)
+
+            if primary_task in done and primary_task.exception() is None:
+                self._count("primary_wins")
+                await _discard(hedge_task)
+                return primary_task.result(), False
+
+            if primary_task.done():
+                # 主请求失败（如429）：对冲请求可能仍会成功，等它结束再决定
+                await asyncio.wait({hedge_task})
+
+            if hedge_task.exception() is None:
+                await _discard(primary_task)
+                with self._lock:
+                    self.hedge_wins += 1
+                    self.hedge_win_seconds += time.perf_counter() - started
+                return hedge_task.result(), True
+
+            self._count("hedge_failures")
+            return await primary_task, False
+        finally:
+            # 调用方被取消时同时取消两个请求
+            for task in (primary_task, hedge_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def reset_stats(self) -> None:
+        """重置统计"""
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.hedge_failures = 0
+        self.hedge_win_seconds = 0.0
+        self.skipped_budget = 0
+        self.skipped_no_key = 0
+        self.skipped_no_samples = 0
+
+    def get_stats(self) -> dict:
+        """
+        获取对冲统计
+
+        Returns:
+            dict: 当前对冲等待时间、调用数、对冲次数（占比即额外请求比例）、对冲/主请求胜出次数和对冲胜率、跳过原因
+        """
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "percentile": settings.llm_hedge_percentile,
+                "current_delay_seconds": round(delay, 3) if delay is not None else None,
+                "max_ratio": settings.llm_hedge_max_ratio,
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_ratio": round(self.hedged / self.calls * 100, 2) if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "primary_wins": self.primary_wins,
+                "hedge_failures": self.hedge_failures,
+                "hedge_win_rate": round(self.hedge_wins / self.hedged * 100, 2) if self.hedged else 0.0,
+                # 对冲请求胜出时从发起对冲到返回的平均耗时
+                "avg_hedge_win_seconds": round(self.hedge_win_seconds / self.hedge_wins, 3)
+                if self.hedge_wins else None,
+                "skipped": {
+                    "budget": self.skipped_budget,
+                    "no_key": self.skipped_no_key,
+                    "no_samples": self.skipped_no_samples
+                }
+            }
+
+
+# 全局对冲控制器
+llm_hedger = LLMHedger()
@@ -0,0 +1,347 @@
+# llm_scheduler.py
+# 作用：LLM请求速率调度器
+# 功能：
+#   - 按 (Key, 模型) 维护 RPM / TPM 令牌桶，请求前预约额度，不足时排队等待而不是触发429
+#   - 在多个可用Key之间选择等待时间最短的Key
+#   - 根据 x-ratelimit-* 响应头、实际token用量、429错误校准令牌桶
+#   - 预约未被使用（取消、失败）时退还额度
+
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+from app.config import settings
+
+
+# Groq 各模型的默认配额 (RPM, TPM)，响应头返回真实上限后会被覆盖
+DEFAULT_MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    "llama-3.3-70b-versatile": (30, 12000),
+    "llama-3.1-8b-instant": (30, 6000),
+}
+
+# 单Key模式下的Key标识
+DEFAULT_KEY_ID = "DEFAULT"
+
+
+def parse_reset_seconds(value) -> Optional[float]:
+    """
+    解析配额重置时间
+
+    支持纯数字秒数以及 Groq 的时长格式（如 "7.66s"、"2m59.56s"、"1h2m3s"、"120ms"）
+
+    Args:
+        value: 响应头中的重置时间
+
+    Returns:
+        float: 秒数，无法解析时返回None
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        return max(0.0, float(text))
+    except ValueError:
+        pass
+
+    matches = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", text)
+    if not matches:
+        return None
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * units[unit] for number, unit in matches)
+
+
+def parse_retry_after(error_message: str) -> Optional[float]:
+    """从429错误信息中提取建议等待时间（如 "Please try again in 7.5s"）"""
+    match = re.search(r"try again in\s+([\dhms.]+)", error_message, re.IGNORECASE)
+    return parse_reset_seconds(match.group(1)) if match else None
+
+
+def estimate_tokens(*texts: Optional[str]) -> int:
+    """粗略估算文本token数（约4个字符1个token）"""
+    return sum(len(text) // 4 + 1 for text in texts if text)
+
+
+class TokenBucket:
+    """
+    令牌桶（允许透支的预约语义）
+
+    reserve() 立即扣除额度并返回需要等待的秒数；余额为负表示后续请求需排队，
+    等待时间 = 欠额 / 补充速率，从而把突发请求均匀地摊到时间窗口内
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        """
+        Args:
+            capacity: 桶容量（每个周期的配额）
+            period: 周期（秒），默认60秒
+        """
+        self.capacity = float(capacity)
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0  # 服务端明确告知额度耗尽时，在此之前不发放额度
+
+    @property
+    def rate(self) -> float:
+        """每秒补充的额度"""
+        return self.capacity / self.period
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """不扣除额度，计算获取amount需要等待的秒数"""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # 单个请求超过容量时按满桶处理，避免永远等待
+        deficit = amount - self.tokens
+        wait = deficit / self.rate if deficit > 0 else 0.0
+        return max(wait, self.blocked_until - now, 0.0)
+
+    def reserve(self, amount: float, now: float) -> float:
+        """扣除额度并返回需要等待的秒数"""
+        wait = self.wait_time(amount, now)
+        self.tokens -= min(amount, self.capacity)
+        return wait
+
+    def refund(self, amount: float) -> None:
+        """退还额度"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def observe(self, limit: Optional[float], remaining: Optional[float],
+                reset_seconds: Optional[float], now: float) -> None:
+        """
+        根据服务端返回的配额信息校准
+
+        只向保守方向调整：服务端剩余额度少于本地估算时才下调
+        """
+        if limit and limit > 0:
+            self.capacity = float(limit)
+        self._refill(now)
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining <= 0 and reset_seconds:
+                self.blocked_until = max(self.blocked_until, now + reset_seconds)
+
+    def drain(self, retry_after: Optional[float], now: float) -> None:
+        """触发429时清空额度"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+@dataclass
+class Reservation:
+    """一次LLM调用的额度预约"""
+    key_id: str
+    model: str
+    tokens: int
+    wait: float
+    settled: bool = False
+
+
+class LLMScheduler:
+    """
+    LLM请求速率调度器（全局单例）
+
+    使用方式：
+        reservation = llm_scheduler.reserve(candidates, model, estimated_tokens)
+        sleep(reservation.wait)           # 同步路径 time.sleep / 异步路径 asyncio.sleep
+        ... 调用LLM ...
+        llm_scheduler.settle(reservation, actual_tokens, headers)   # 成功
+        llm_scheduler.cancel(reservation)                           # 未发出请求
+        llm_scheduler.on_rate_limited(key_id, model, error_message) # 429
+    """
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], Tuple[TokenBucket, TokenBucket]] = {}
+        self._lock = threading.Lock()
+        self.total_reservations = 0
+        self.total_delayed = 0
+        self.total_wait_seconds = 0.0
+        self.total_rate_limited = 0
+        print("[SCHEDULER] LLM速率调度器已启动")
+
+    def _limits_for(self, model: str) -> Tuple[int, int]:
+        """获取模型的默认 (RPM, TPM)"""
+        return DEFAULT_MODEL_LIMITS.get(model, (settings.llm_rpm_limit, settings.llm_tpm_limit))
+
+    def _get_buckets(self, key_id: str, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        """获取 (RPM桶, TPM桶)，不存在时创建（需持有锁）"""
+        buckets = self._buckets.get((key_id, model))
+        if buckets is None:
+            rpm, tpm = self._limits_for(model)
+            buckets = (TokenBucket(rpm), TokenBucket(tpm))
+            self._buckets[(key_id, model)] = buckets
+        return buckets
+
+    def reserve(self, key_ids: Iterable[str], model: str, tokens: int) -> Reservation:
+        """
+        在候选Key中选择等待时间最短的Key并预约额度
+
+        Args:
+            key_ids: 候选Key ID列表（应为当前不在冷却期的Key）
+            model: 模型名称（不含provider前缀）
+            tokens: 预估token数（prompt + completion）
+
+        Returns:
+            Reservation: 预约结果，调用方需等待 reservation.wait 秒后再发起请求
+        """
+        candidates = list(key_ids) or [DEFAULT_KEY_ID]
+        with self._lock:
+            now = time.monotonic()
+
+            def wait_for(key_id: str) -> float:
+                rpm_bucket, tpm_bucket = self._get_buckets(key_id, model)
+                return max(rpm_bucket.wait_time(1, now), tpm_bucket.wait_time(tokens, now))
+
+            key_id = min(candidates, key=wait_for)
+            rpm_bucket, tpm_bucket = self._get_buckets(key_id, model)
+            wait = max(rpm_bucket.reserve(1, now), tpm_bucket.reserve(tokens, now))
+
+            self.total_reservations += 1
+            if wait > 0:
+                self.total_delayed += 1
+                self.total_wait_seconds += wait
+
+        if wait > 0:
+            print(f"[SCHEDULER] {key_id}/{model} 额度不足，排队 {wait:.2f}秒")
+        return Reservation(key_id=key_id, model=model, tokens=tokens, wait=wait)
+
+    def cancel(self, reservation: Reservation) -> None:
+        """请求未发出（取消/等待中断），退还全部预约额度"""
+        if reservation.settled:
+            return
+        with self._lock:
+            rpm_bucket, tpm_bucket = self._get_buckets(reservation.key_id, reservation.model)
+            rpm_bucket.refund(1)
+            tpm_bucket.refund(reservation.tokens)
+            reservation.settled = True
+
+    def settle(self, reservation: Reservation, actual_tokens: Optional[int] = None,
+               headers: Optional[Dict] = None) -> None:
+        """
+        请求完成后结算：按实际用量修正TPM预约，并用响应头校准
+
+        Args:
+            reservation: 预约
+            actual_tokens: 实际消耗token数（response.usage.total_tokens）
+            headers: 已标准化的 x-ratelimit-* 响应头
+        """
+        if reservation.settled:
+            return
+        with self._lock:
+            now = time.monotonic()
+            rpm_bucket, tpm_bucket = self._get_buckets(reservation.key_id, reservation.model)
+            if actual_tokens is not None:
+                # 多预约的退还，少预约的补扣
+                tpm_bucket.refund(reservation.tokens - actual_tokens)
+            if headers:
+                rpm_bucket.observe(
+                    _to_float(headers.get("x-ratelimit-limit-requests")) if _is_minute_scoped(headers, "requests") else None,
+                    _to_float(headers.get("x-ratelimit-remaining-requests")),
+                    parse_reset_seconds(headers.get("x-ratelimit-reset-requests")),
+                    now
+                )
+                tpm_bucket.observe(
+                    _to_float(headers.get("x-ratelimit-limit-tokens")),
+                    _to_float(headers.get("x-ratelimit-remaining-tokens")),
+                    parse_reset_seconds(headers.get("x-ratelimit-reset-tokens")),
+                    now
+                )
+            reservation.settled = True
+
+    def on_rate_limited(self, key_id: Optional[str], model: str, error_message: str = "") -> None:
+        """收到429时清空该Key的额度，后续请求自动排队或换Key"""
+        retry_after = parse_retry_after(error_message)
+        with self._lock:
+            now = time.monotonic()
+            rpm_bucket, tpm_bucket = self._get_buckets(key_id or DEFAULT_KEY_ID, model)
+            rpm_bucket.drain(retry_after, now)
+            tpm_bucket.drain(retry_after, now)
+            self.total_rate_limited += 1
+
+    def get_stats(self) -> dict:
+        """获取调度统计（用于监控）"""
+        with self._lock:
+            now = time.monotonic()
+            buckets = {}
+            for (key_id, model), (rpm_bucket, tpm_bucket) in self._buckets.items():
+                rpm_bucket._refill(now)
+                tpm_bucket._refill(now)
+                blocked_until = max(rpm_bucket.blocked_until, tpm_bucket.blocked_until)
+                buckets[f"{key_id}/{model}"] = {
+                    "rpm_limit": rpm_bucket.capacity,
+                    "rpm_available": round(rpm_bucket.tokens, 2),
+                    "tpm_limit": tpm_bucket.capacity,
+                    "tpm_available": round(tpm_bucket.tokens, 2),
+                    "blocked_seconds": round(max(0.0, blocked_until - now), 2)
+                }
+            return {
+                "total_reservations": self.total_reservations,
+                "total_delayed": self.total_delayed,
+                "total_wait_seconds": round(self.total_wait_seconds, 2),
+                "total_rate_limited": self.total_rate_limited,
+                "buckets": buckets
+            }
+
+    def reset(self) -> None:
+        """清空所有令牌桶和统计"""
+        with self._lock:
+            self._buckets.clear()
+            self.total_reservations = 0
+            self.total_delayed = 0
+            self.total_wait_seconds = 0.0
+            self.total_rate_limited = 0
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_minute_scoped(headers: Dict, kind: str) -> bool:
+    """
+    判断请求数配额是否为分钟级
+
+    Groq 的 x-ratelimit-limit-requests 实际是每日上限（RPD），重置时间以小时计；
+    只有重置时间在一分钟内时才把limit当作RPM容量
+    """
+    reset = parse_reset_seconds(headers.get(f"x-ratelimit-reset-{kind}"))
+    return reset is not None and reset <= 60
+
+
+def normalize_rate_limit_headers(response) -> Optional[Dict]:
+    """
+    从 LiteLLM 响应中提取 x-ratelimit-* 响应头
+
+    LiteLLM 把provider原始响应头放在 _hidden_params["additional_headers"]，
+    键名带 "llm_provider-" 前缀；旧版本使用 response_headers
+
+    Returns:
+        dict: {"x-ratelimit-...": value}，没有时返回None
+    """
+    hidden = getattr(response, "_hidden_params", None)
+    if not isinstance(hidden, dict):
+        return None
+    raw = hidden.get("additional_headers") or hidden.get("response_headers") or {}
+    if not isinstance(raw, dict):
+        return None
+    headers = {}
+    for name, value in raw.items():
+        name = str(name).lower()
+        if name.startswith("llm_provider-"):
+            name = name[len("llm_provider-"):]
+        if name.startswith("x-ratelimit-"):
+            headers[name] = value
+    return headers or None
+
+
+# 全局单例
+llm_scheduler = LLMScheduler()
@@ -2,17 +2,17 @@
 # 作用：FastAPI应用入口
 # 功能：应用配置、路由注册、WebSocket端点、中间件配置
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException, Header
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 import json
 import time
 import uuid
-from app.config import ConfigProvider, validate_config
-from app.utils import initialize_key_manager
+from app.config import ConfigProvider, validate_config, settings
+from app.utils import initialize_key_manager, initialize_concurrency_limiter
 from app.sse_manager import sse_manager, start_cleanup_task
-from app.task_manager import task_manager
+from app.task_manager import task_manager, start_eviction_task
 from app.enums import TaskStatus, MessageType
 from app.routers.core import router as core_router
 from app.routers.memory import router as memory_router
@@ -147,9 +147,15 @@ async def startup_event():
     # 初始化 API Key 管理器
     initialize_key_manager(cooldown_seconds=60)
 
+    # 初始化全局LLM并发限制器（所有LLM调用共享）
+    initialize_concurrency_limiter(max_concurrent=settings.llm_max_concurrency)
+
     # 启动SSE消息清理任务
     start_cleanup_task()
 
+    # 启动任务淘汰循环（内存空闲任务 + 磁盘过期任务）
+    start_eviction_task()
+
     print("[OK] TED Agent API 启动成功！")
     print("[INFO] 访问文档：http://localhost:8000/docs")
     print("[INFO] API v1 端点：http://localhost:8000/api/v1/...")
@@ -157,12 +163,20 @@ async def startup_event():
 
 # ============ SSE处理 ============
 
+# 任务结束的消息类型（收到后关闭SSE流）
+FINAL_MESSAGE_TYPES = (MessageType.COMPLETED.value, MessageType.CANCELLED.value)
+
+
 # SSE端点 - 替换WebSocket，使用流式响应推送进度消息
 @app.get("/api/v1/progress/{task_id}")
-async def progress_stream(task_id: str, last_event_id: str | None = None):
+async def progress_stream(task_id: str, last_event_id: str | None = None,
+                          last_event_id_header: str | None = Header(None, alias="Last-Event-ID")):
     """
     SSE端点，实时推送处理进度，支持断点续传
 
+    连接阻塞等待新消息（无轮询），同一时间到达的多条消息全部发送；
+    空闲时每隔 settings.sse_keepalive_seconds 发送一次心跳注释
+
     使用方法：
         const eventSource = new EventSource('/api/v1/progress/task_123');
         eventSource.onmessage = (event) => {
@@ -176,58 +190,73 @@ async def progress_stream(task_id: str, last_event_id: str | None = None):
         });
 
     消息格式：
-        id: message_id
+        id: {task_id}_{seq}
         data: {"type": "started|progress|step|url_completed|completed", ...}
 
         例如：
-        id: task_123_1640995200000
-        data: {"type": "started", "timestamp": 1640995200.123}
+        id: task_123_1
+        data: {"type": "started", "id": "task_123_1", "seq": 1, "timestamp": 1640995200.123}
+
+    connected和resync通知不带id，不影响客户端记录的Last-Event-ID
     """
+    # 浏览器EventSource自动重连时通过请求头携带Last-Event-ID
+    last_event_id = last_event_id or last_event_id_header
+
+    def format_event(message: dict) -> str:
+        """序列化单条SSE事件（没有ID的通知不输出id行）"""
+        if 'id' in message:
+            return f"id: {message['id']}\ndata: {json.dumps(message)}\n\n"
+        return f"data: {json.dumps(message)}\n\n"
 
     async def generate():
         """生成SSE消息流"""
         try:
-            # 获取缓存的消息，支持断点续传
+            # 获取缓存的消息，支持断点续传（只返回客户端缺失的消息）
             messages = await sse_manager.get_messages(task_id, last_event_id)
+            # 从已发送的消息中取序号：读取之后才写入的消息留给下面的等待循环，不会遗漏
+            sent_seqs = [message['seq'] for message in messages if 'seq' in message]
+            last_seq = sent_seqs[-1] if sent_seqs else sse_manager.parse_event_id(task_id, last_event_id)
 
             print(f"[SSE] [{task_id}] 发送 {len(messages)} 条缓存消息")
 
             # 发送缓存的消息
             for message in messages:
-                event_data = f"id: {message['id']}\ndata: {json.dumps(message)}\n\n"
-                yield event_data
+                yield format_event(message)
 
             # 如果没有断点续传，发送连接确认消息
             if not last_event_id:
                 connected_message = {
-                    "id": f"{task_id}_connected_{int(time.time() * 1000)}",
                     "type": "connected",
                     "task_id": task_id,
                     "message": f"Connected to progress stream for task {task_id}",
                     "timestamp": time.time()
                 }
-                event_data = f"id: {connected_message['id']}\ndata: {json.dumps(connected_message)}\n\n"
-                yield event_data
+                yield format_event(connected_message)
 
-            # 持续监听新消息（保持连接活跃）
-            last_sent_id = messages[-1]['id'] if messages else (last_event_id or "0")
+            # 任务已结束（重连时缓存中已有完成/取消消息）
+            if any(message.get('type') in FINAL_MESSAGE_TYPES for message in messages):
+                return
 
+            # 持续监听新消息：阻塞等待，直到有新消息或需要发送心跳
             while True:
                 try:
-                    # 检查是否有新消息
-                    latest_message = await sse_manager.get_latest_message(task_id)
-                    if latest_message and latest_message['id'] != last_sent_id:
-                        # 发送新消息
-                        event_data = f"id: {latest_message['id']}\ndata: {json.dumps(latest_message)}\n\n"
-                        yield event_data
-                        last_sent_id = latest_message['id']
-                        print(f"[SSE] [{task_id}] 发送新消息: {latest_message['type']}")
+                    new_messages = await sse_manager.wait_for_messages(
+                        task_id, last_seq, timeout=settings.sse_keepalive_seconds
+                    )
+
+                    if not new_messages:
+                        yield ": keepalive\n\n"
+                        continue
 
-                        # 如果是完成消息，结束流
-                        if latest_message.get('type') == 'completed':
-                            break
+                    for message in new_messages:
+                        yield format_event(message)
+                        last_seq = message.get('seq', last_seq)
 
-                    await asyncio.sleep(0.1)  # 短暂延迟，避免CPU占用过高
+                    print(f"[SSE] [{task_id}] 发送 {len(new_messages)} 条新消息，最新: {new_messages[-1]['type']}")
+
+                    # 如果是完成/取消消息，结束流
+                    if any(message.get('type') in FINAL_MESSAGE_TYPES for message in new_messages):
+                        break
 
                 except Exception as e:
                     print(f"[SSE] [{task_id}] 流式响应错误: {e}")
@@ -236,12 +265,11 @@ async def progress_stream(task_id: str, last_event_id: str | None = None):
         except Exception as e:
             print(f"[SSE] [{task_id}] SSE端点错误: {e}")
             error_message = {
-                "id": f"{task_id}_error_{int(time.time() * 1000)}",
                 "type": "error",
                 "message": f"SSE stream error: {str(e)}",
                 "timestamp": time.time()
             }
-            yield f"id: {error_message['id']}\ndata: {json.dumps(error_message)}\n\n"
+            yield format_event(error_message)
 
     # 返回SSE流式响应
     return StreamingResponse(
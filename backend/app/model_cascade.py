@@ -0,0 +1,229 @@
+# model_cascade.py
+# 作用：评分类LLM调用的模型级联（轻量模型优先，不确定时升级）
+# 功能：
+#   - 先用轻量模型（默认 llama-3.1-8b-instant）评分，响应快、速率额度大
+#   - 总分落在不确定区间（接近通过阈值）或结果无效时，再用默认模型（settings.model_name）重新评分
+#   - 级联封装为与普通LLM函数相同签名的函数（同步版本带 async_version），节点无需感知
+#   - 批量评估时轻量模型的结果来自批处理器，逐项按同一策略决定是否升级（arefine）
+#   - 按阶段统计升级率、两种模型的耗时和估算token数，以及节省的默认模型耗时和token
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from app.config import settings
+from app.llm_scheduler import estimate_tokens
+
+
+class ModelCascade:
+    """
+    单个阶段的模型级联
+
+    使用方式：
+        llm = quality_cascade.create_llm_function()
+        result = llm(prompt, EVALUATION_FORMAT)  # 或 await llm.async_version(...)
+    """
+
+    def __init__(self, stage: str, score_key: str = "total_score",
+                 light_llm: Optional[Callable] = None, advanced_llm: Optional[Callable] = None):
+        """
+        Args:
+            stage: 阶段名（统计用）
+            score_key: 结果中的总分字段
+            light_llm: 轻量模型LLM函数（默认按 settings.cascade_light_model 创建）
+            advanced_llm: 升级使用的LLM函数（默认 settings.model_name）
+        """
+        self.stage = stage
+        self.score_key = score_key
+        self._light_llm = light_llm
+        self._advanced_llm = advanced_llm
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    # ==================== 策略 ====================
+
+    @property
+    def band(self) -> tuple:
+        """不确定区间 [low, high]：轻量模型总分落在区间内时升级"""
+        return settings.quality_cascade_low, settings.quality_cascade_high
+
+    def escalation_reason(self, result: Any) -> Optional[str]:
+        """
+        判断轻量模型的结果是否需要升级
+
+        Args:
+            result: 轻量模型的返回值
+
+        Returns:
+            str | None: 升级原因，不需要升级时返回None
+        """
+        if not isinstance(result, dict):
+            return "invalid"
+        try:
+            score = float(result.get(self.score_key))
+        except (TypeError, ValueError):
+            return "invalid"
+        low, high = self.band
+        if low <= score <= high:
+            return "borderline"
+        return None
+
+    # ==================== LLM函数 ====================
+
+    def _llm_pair(self) -> tuple:
+        """获取 (轻量, 默认) 同步LLM函数"""
+        from app.utils import create_llm_function
+        if self._light_llm is None:
+            self._light_llm = create_llm_function(system_prompt=settings.system_prompt,
+                                                  model=settings.cascade_light_model)
+        if self._advanced_llm is None:
+            self._advanced_llm = create_llm_function(system_prompt=settings.system_prompt)
+        return self._light_llm, self._advanced_llm
+
+    def create_llm_function(self) -> Callable:
+        """
+        创建级联LLM函数
+
+        Returns:
+            callable: 同步LLM函数，async_version 为对应的异步版本
+        """
+
+        def call_cascade(user_prompt: str, output_format: Optional[Dict] = None,
+                         temperature: Optional[float] = None) -> Any:
+            light, advanced = self._llm_pair()
+            started = time.perf_counter()
+            result = light(user_prompt, output_format, temperature)
+            light_seconds = time.perf_counter() - started
+
+            reason = self.escalation_reason(result)
+            if reason is None:
+                self._record(user_prompt, result, light_seconds)
+                return result
+
+            started = time.perf_counter()
+            escalated = advanced(user_prompt, output_format, temperature)
+            self._record(user_prompt, result, light_seconds, reason, escalated, time.perf_counter() - started)
+            return escalated if escalated is not None else result
+
+        async def acall_cascade(user_prompt: str, output_format: Optional[Dict] = None,
+                                temperature: Optional[float] = None) -> Any:
+            light = self.light_async_llm()
+            started = time.perf_counter()
+            result = await light(user_prompt, output_format, temperature)
+            return await self.arefine(user_prompt, result, time.perf_counter() - started,
+                                      output_format, temperature)
+
+        call_cascade.async_version = acall_cascade
+        call_cascade.model_name = settings.model_name  # 结果缓存按默认模型计算流水线版本
+        return call_cascade
+
+    def light_async_llm(self) -> Callable:
+        """轻量模型的异步LLM函数（多次调用返回同一个函数，批处理器可以合并请求）"""
+        from app.utils import as_async_llm_function
+        return as_async_llm_function(self._llm_pair()[0])
+
+    async def arefine(self, user_prompt: str, light_result: Any, light_seconds: float,
+                      output_format: Optional[Dict] = None, temperature: Optional[float] = None) -> Any:
+        """
+        对轻量模型已给出的结果按级联策略处理：不确定或无效时用默认模型重新评分
+
+        Args:
+            user_prompt: 单块prompt（升级时使用）
+            light_result: 轻量模型的结果（单块调用或批量评估中的一项）
+            light_seconds: 获得轻量模型结果的耗时
+
+        Returns:
+            Any: 不需要升级时为轻量模型的结果，否则为默认模型的结果（调用失败时保留轻量模型的结果）
+        """
+        from app.utils import as_async_llm_function
+
+        reason = self.escalation_reason(light_result)
+        if reason is None:
+            self._record(user_prompt, light_result, light_seconds)
+            return light_result
+
+        advanced = as_async_llm_function(self._llm_pair()[1])
+        started = time.perf_counter()
+        escalated = await advanced(user_prompt, output_format, temperature)
+        self._record(user_prompt, light_result, light_seconds, reason, escalated, time.perf_counter() - started)
+        return escalated if escalated is not None else light_result
+
+    # ==================== 统计 ====================
+
+    @staticmethod
+    def _tokens(prompt: str, result: Any) -> int:
+        """估算一次调用的token数（prompt + 输出）"""
+        output = json.dumps(result, ensure_ascii=False) if isinstance(result, (dict, list)) else str(result or "")
+        return estimate_tokens(settings.system_prompt, prompt, output)
+
+    def _record(self, prompt: str, light_result: Any, light_seconds: float, reason: Optional[str] = None,
+                advanced_result: Any = None, advanced_seconds: float = 0.0) -> None:
+        light_tokens = self._tokens(prompt, light_result)
+        with self._lock:
+            self.calls += 1
+            self.light_seconds += light_seconds
+            self.light_tokens += light_tokens
+            if reason is None:
+                self.accepted += 1
+                self.accepted_tokens += light_tokens
+                self.accepted_light_seconds += light_seconds
+                return
+            self.escalations[reason] = self.escalations.get(reason, 0) + 1
+            self.advanced_calls += 1
+            self.advanced_seconds += advanced_seconds
+            self.advanced_tokens += self._tokens(prompt, advanced_result)
+
+    def reset_stats(self) -> None:
+        """重置统计"""
+        self.calls = 0
+        self.accepted = 0
+        self.escalations: Dict[str, int] = {}
+        self.advanced_calls = 0
+        self.light_seconds = 0.0
+        self.advanced_seconds = 0.0
+        self.light_tokens = 0
+        self.advanced_tokens = 0
+        self.accepted_tokens = 0
+        self.accepted_light_seconds = 0.0
+
+    def get_stats(self) -> dict:
+        """
+        获取级联统计
+
+        Returns:
+            dict: 升级率、两种模型的平均耗时和token数；节省量按升级调用中默认模型的平均耗时估算
+                  （未发生升级时为None）
+        """
+        avg_advanced = self.advanced_seconds / self.advanced_calls if self.advanced_calls else None
+        return {
+            "stage": self.stage,
+            "enabled": settings.quality_cascade_enabled,
+            "light_model": settings.cascade_light_model,
+            "advanced_model": settings.model_name,
+            "band": list(self.band),
+            "calls": self.calls,
+            "accepted_light": self.accepted,
+            "escalated": self.advanced_calls,
+            "escalation_reasons": dict(self.escalations),
+            "escalation_rate": round(self.advanced_calls / self.calls * 100, 2) if self.calls else 0.0,
+            "avg_light_seconds": round(self.light_seconds / self.calls, 3) if self.calls else None,
+            "avg_advanced_seconds": round(avg_advanced, 3) if avg_advanced is not None else None,
+            "light_tokens": self.light_tokens,
+            "advanced_tokens": self.advanced_tokens,
+            # 轻量模型直接给出结论的调用不再占用默认模型的速率额度
+            "advanced_tokens_saved": self.accepted_tokens,
+            "seconds_saved": round(self.accepted * avg_advanced - self.accepted_light_seconds, 3)
+            if avg_advanced is not None else None
+        }
+
+
+# 全局质量评估级联
+quality_cascade = ModelCascade("quality")
+
+# 各阶段的级联
+cascades: Dict[str, ModelCascade] = {quality_cascade.stage: quality_cascade}
+
+
+def get_cascade_stats() -> Dict[str, dict]:
+    """获取所有阶段的级联统计"""
+    return {stage: cascade.get_stats() for stage, cascade in cascades.items()}
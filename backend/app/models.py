@@ -3,6 +3,7 @@
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict
 from dataclasses import dataclass
+from app.enums import TaskPriority
 
 @dataclass
 class TedTxt:
@@ -121,6 +122,14 @@ class BatchProcessRequest(BaseModel):
     """批量处理请求 / Batch Process Request"""
     urls: List[str] = Field(description="TED URL列表（1-10个） / TED URLs (1-10)")
     user_id: Optional[str] = Field(default="default", description="用户ID / User ID")
+    timeout_seconds: Optional[int] = Field(
+        default=None,
+        description="任务截止时间（秒，默认使用服务端配置），超过后自动取消 / Task deadline in seconds"
+    )
+    priority: Optional[TaskPriority] = Field(
+        default=None,
+        description="调度优先级 interactive / bulk（默认按URL数自动判断） / Scheduling priority"
+    )
 
 
 class BatchProcessResponse(BaseModel):
@@ -141,3 +150,29 @@ class TaskStatusResponse(BaseModel):
     results: List[Dict]
     errors: List[str]
     current_url: Optional[str] = None
+
+
+class TaskProgressResponse(BaseModel):
+    """任务进度响应（不含结果，轮询状态用） / Task Progress Response"""
+    task_id: str
+    status: str
+    total: int
+    current: int
+    current_url: Optional[str] = None
+    result_count: int = Field(..., description="已有结果数 / Results so far")
+    error_count: int = Field(..., description="已有错误数 / Errors so far")
+
+
+class TaskDeltaResponse(TaskProgressResponse):
+    """任务增量响应：只包含游标之后新增的结果和错误 / Task Delta Response"""
+    results: List[Dict] = Field(default_factory=list, description="游标之后新增的结果 / New results")
+    errors: List[str] = Field(default_factory=list, description="游标之后新增的错误 / New errors")
+    cursor: str = Field(..., description="下次请求使用的游标 / Cursor for the next poll")
+    finished: bool = Field(..., description="任务是否已结束（结束后无需继续轮询） / Whether polling can stop")
+
+
+class TaskCancelResponse(BaseModel):
+    """任务取消响应 / Task Cancel Response"""
+    task_id: str = Field(..., description="任务ID / Task ID")
+    status: str = Field(..., description="取消后的任务状态 / Task status after cancel")
+    message: str = Field(..., description="提示信息 / Message")
@@ -104,6 +104,253 @@ async def get_key_stats(key_id: str):
     return stat
 
 
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    """
+    获取LLM调度器状态
+
+    Returns:
+        {"scheduler": dict, "concurrency": dict | None}
+        scheduler: 各Key/模型的RPM、TPM剩余额度及排队统计
+        concurrency: 全局并发限制器的活跃/排队请求数（未初始化时为None）
+    """
+    from app import utils
+    from app.llm_scheduler import llm_scheduler
+
+    limiter = utils.concurrency_limiter
+    return {
+        "scheduler": llm_scheduler.get_stats(),
+        "concurrency": limiter.get_stats() if limiter else None
+    }
+
+
+@router.get("/progress-bus")
+async def get_progress_bus_stats():
+    """
+    获取进度事件总线统计
+
+    Returns:
+        dict: 已发布/已投递/已合并/投递失败/待投递的消息数
+    """
+    from app.progress_bus import progress_bus
+
+    return progress_bus.get_stats()
+
+
+@router.get("/sse")
+async def get_sse_stats():
+    """
+    获取SSE连接统计
+
+    Returns:
+        {"active_tasks": int, "subscribers": int}
+        subscribers: 正在阻塞等待新消息的进度流数量
+    """
+    from app.sse_manager import sse_manager
+
+    return {
+        "active_tasks": sse_manager.get_active_tasks_count(),
+        "subscribers": sse_manager.get_subscriber_count()
+    }
+
+
+@router.get("/tasks")
+async def get_task_stats():
+    """
+    获取任务管理器统计
+
+    Returns:
+        dict: 内存/存储中的任务数、从磁盘加载次数、内存淘汰次数
+    """
+    from app.task_manager import task_manager
+
+    return task_manager.get_stats()
+
+
+@router.get("/cancellation")
+async def get_cancellation_stats():
+    """
+    获取任务取消统计
+
+    Returns:
+        dict: 可取消的运行中任务数、最近的截止时间、用户取消/超时取消次数
+    """
+    from app.cancellation import cancellation_registry
+
+    return cancellation_registry.get_stats()
+
+
+@router.get("/fair-scheduler")
+async def get_fair_scheduler_stats():
+    """
+    获取多用户公平调度统计
+
+    Returns:
+        dict: 放行上限、运行/排队请求数、按优先级和按 (用户, 优先级) 流的排队深度与平均排队时间
+    """
+    from app.fair_scheduler import fair_scheduler
+
+    return fair_scheduler.get_stats()
+
+
+@router.get("/shadow-batch")
+async def get_shadow_batch_stats():
+    """
+    获取Shadow Writing批量模式统计
+
+    Returns:
+        dict: 是否开启、批次上限K、批次数、平均每批语义块数、单独重试的语义块数
+    """
+    from app.agents.parallel.shadow_batcher import shadow_batcher
+
+    return shadow_batcher.get_stats()
+
+
+@router.get("/pre-quality")
+async def get_pre_quality_stats():
+    """
+    获取质量评估本地预检统计
+
+    Returns:
+        dict: 预检数量、直接通过/拒绝的数量、交给LLM评估的数量、节省的评估调用数
+    """
+    from app.agents.parallel.pre_quality_agent import pre_quality_gate
+
+    return pre_quality_gate.get_stats()
+
+
+@router.get("/token-usage")
+async def get_token_usage():
+    """
+    获取LLM token用量（按阶段、模型、用户汇总）
+
+    Returns:
+        dict: 总用量，按阶段/模型/用户的 prompt / completion / total tokens 及占比
+    """
+    from app.token_usage import token_usage
+
+    return token_usage.get_stats()
+
+
+@router.get("/token-usage/{task_id}")
+async def get_task_token_usage(task_id: str):
+    """
+    获取单个批量任务的token用量
+
+    Args:
+        task_id: 任务ID
+
+    Returns:
+        dict: 任务的总用量和按阶段的用量
+    """
+    from app.token_usage import token_usage
+
+    usage = token_usage.get_task_usage(task_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail=f"没有任务 {task_id} 的token用量记录")
+    return {"task_id": task_id, **usage}
+
+
+@router.get("/providers")
+async def get_provider_router_stats():
+    """
+    获取多提供商路由统计
+
+    Returns:
+        dict: 每个 提供商/模型 的质量等级、EWMA延迟和错误率、冷却状态、选中次数，以及切换次数
+    """
+    from app.provider_router import provider_router
+
+    return provider_router.get_stats()
+
+
+@router.get("/hedging")
+async def get_hedging_stats():
+    """
+    获取LLM对冲请求统计
+
+    Returns:
+        dict: 当前对冲等待时间、对冲次数和比例、对冲请求胜出次数和胜率、跳过原因
+    """
+    from app.llm_hedging import llm_hedger
+
+    return llm_hedger.get_stats()
+
+
+@router.get("/json-repair")
+async def get_json_repair_stats():
+    """
+    获取LLM返回JSON的解析/修复统计
+
+    Returns:
+        dict: 直接解析、各类本地修复、修复失败、重新请求的次数，解析失败率和修复率
+    """
+    from app.json_repair import json_repair_stats
+
+    return json_repair_stats.get_stats()
+
+
+@router.get("/model-cascade")
+async def get_model_cascade_stats():
+    """
+    获取模型级联统计（按阶段）
+
+    Returns:
+        dict: 每个阶段的升级率、轻量/默认模型的平均耗时和token数、节省的耗时和默认模型token
+    """
+    from app.model_cascade import get_cascade_stats
+
+    return get_cascade_stats()
+
+
+@router.get("/quality-batch")
+async def get_quality_batch_stats():
+    """
+    获取质量评估批量模式统计
+
+    Returns:
+        dict: 是否开启、批次上限K、批次数、平均每批语义块数、单独重新评估的语义块数
+    """
+    from app.agents.parallel.quality_batcher import quality_batcher
+
+    return quality_batcher.get_stats()
+
+
+@router.get("/llm-cache")
+async def get_llm_cache_stats():
+    """
+    获取LLM响应缓存统计
+
+    Returns:
+        {"enabled": bool, "stats": dict | None}
+        stats: 条目数、命中/未命中次数、命中率、淘汰次数
+    """
+    from app.llm_cache import get_llm_cache
+
+    cache = get_llm_cache()
+    return {
+        "enabled": cache is not None,
+        "stats": cache.get_stats() if cache else None
+    }
+
+
+@router.post("/llm-cache/clear")
+async def clear_llm_cache():
+    """
+    清空LLM响应缓存
+
+    Returns:
+        {"message": str}
+    """
+    from app.llm_cache import get_llm_cache
+
+    cache = get_llm_cache()
+    if cache:
+        cache.clear()
+        cache.reset_stats()
+    return {"message": "LLM cache cleared"}
+
+
 @router.post("/reset")
 async def reset_monitoring():
     """
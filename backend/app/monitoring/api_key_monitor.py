@@ -99,6 +99,12 @@ class APIKeyMonitor:
         if len(stat.failure_rate_window) > 50:
             stat.failure_rate_window.pop(0)
         
+        # 最近成功调用的响应时间（用于对冲请求的延迟分位数）
+        if success:
+            stat.response_time_window.append(response_time)
+            if len(stat.response_time_window) > 50:
+                stat.response_time_window.pop(0)
+        
         # 【失效检测】连续失败检测
         if success:
             stat.consecutive_failures = 0
@@ -198,6 +204,27 @@ class APIKeyMonitor:
             uptime_seconds=uptime
         )
     
+    def get_latency_percentile(self, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """
+        获取健康Key最近成功调用响应时间的分位数
+        
+        Args:
+            percentile: 分位数（0-100）
+            min_samples: 最少样本数，不足时返回None
+            
+        Returns:
+            响应时间（秒）或None
+        """
+        samples = sorted(
+            response_time
+            for stat in self.get_healthy_keys().values()
+            for response_time in stat.response_time_window
+        )
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(percentile / 100 * len(samples))) - 1))
+        return samples[index]
+    
     def reset_stats(self):
         """重置所有统计数据"""
         self.stats.clear()
@@ -43,6 +43,7 @@ class APIKeyStats(BaseModel):
     # 失效检测
     consecutive_failures: int = Field(default=0, description="连续失败次数")
     failure_rate_window: List[bool] = Field(default_factory=list, description="最近50次调用的成功/失败记录")
+    response_time_window: List[float] = Field(default_factory=list, description="最近50次成功调用的响应时间（秒）")
     invalidation_reason: Optional[str] = Field(default=None, description="失效原因")
     invalidated_at: Optional[datetime] = Field(default=None, description="失效时间")
     
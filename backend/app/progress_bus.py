@@ -0,0 +1,183 @@
+# progress_bus.py
+# 作用：线程安全的进度事件总线
+# 功能：
+#   - 工作流节点（线程池或事件循环中）通过 publish() 发布进度消息，不依赖运行中的事件循环
+#   - 消息先进入 queue.SimpleQueue，由主事件循环中的单一消费者按发布顺序投递到SSE管理器
+#   - 同一批次内同一任务同一阶段的 chunk_progress 消息合并为一条，避免大量并行语义块刷屏
+#   - 未绑定事件循环时消息暂存在队列中，绑定后补发，不丢消息
+#   - flush() 等待已发布的消息全部投递，用于保证与直接推送的消息（完成/错误）之间的顺序
+
+import asyncio
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.sse_manager import sse_manager
+
+
+class ProgressBus:
+    """
+    进度事件总线
+
+    - publish() 可在任意线程调用，只做入队和调度，不阻塞
+    - 投递在事件循环中串行执行（异步锁保护），保证全局FIFO顺序
+    """
+
+    COALESCE_TYPES = {"chunk_progress"}  # 可合并的消息类型
+    MAX_BATCH = 256  # 单次从队列取出的最大消息数
+
+    def __init__(self):
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._drain_lock: Optional[asyncio.Lock] = None
+        self._scheduled = False
+        self._state_lock = threading.Lock()
+
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        绑定主事件循环（投递在该循环中执行），并补发绑定前暂存的消息
+
+        Args:
+            loop: 主事件循环
+        """
+        if loop is not self._loop:
+            self._loop = loop
+            self._drain_lock = asyncio.Lock()
+            with self._state_lock:
+                self._scheduled = False
+        self._schedule()
+
+    def publish(self, task_id: str, message: dict) -> None:
+        """
+        发布进度消息（任意线程可调用，不等待投递）
+
+        Args:
+            task_id: 任务ID
+            message: 消息内容（timestamp在发布时记录）
+        """
+        message.setdefault("timestamp", time.time())
+        self._queue.put((task_id, message))
+        with self._state_lock:
+            self.published += 1
+        self._schedule()
+
+    def _schedule(self) -> None:
+        """在事件循环中调度一次投递（已有待执行的投递时不重复调度）"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return  # 暂存，绑定事件循环后投递
+
+        with self._state_lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+
+        try:
+            loop.call_soon_threadsafe(self._start_drain)
+        except RuntimeError:
+            # 事件循环已关闭
+            with self._state_lock:
+                self._scheduled = False
+
+    def _start_drain(self) -> None:
+        """事件循环回调：创建投递任务"""
+        with self._state_lock:
+            self._scheduled = False
+        asyncio.get_running_loop().create_task(self.flush())
+
+    def _take_batch(self) -> List[Tuple[str, dict]]:
+        """从队列取出一批消息"""
+        batch = []
+        while len(batch) < self.MAX_BATCH:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _coalesce(self, batch: List[Tuple[str, dict]]) -> List[Tuple[str, dict]]:
+        """
+        合并同一批次内的进度消息
+
+        同一任务、同一类型、同一阶段的消息只保留最后一条（位置也取最后一条），
+        并在 chunks 字段中记录被合并的语义块编号，其余消息保持原顺序
+
+        Args:
+            batch: 按发布顺序排列的 (task_id, message) 列表
+
+        Returns:
+            合并后的消息列表
+        """
+        last_index: Dict[Tuple, int] = {}
+        merged_chunks: Dict[Tuple, List[Any]] = {}
+
+        for index, (task_id, message) in enumerate(batch):
+            if message.get("type") not in self.COALESCE_TYPES:
+                continue
+            key = (task_id, message.get("type"), message.get("stage"))
+            last_index[key] = index
+            merged_chunks.setdefault(key, []).append(message.get("current_chunk"))
+
+        result = []
+        for index, (task_id, message) in enumerate(batch):
+            if message.get("type") not in self.COALESCE_TYPES:
+                result.append((task_id, message))
+                continue
+            key = (task_id, message.get("type"), message.get("stage"))
+            if last_index[key] != index:
+                continue
+            chunks = merged_chunks[key]
+            if len(chunks) > 1:
+                message = {**message, "chunks": chunks}
+                self.coalesced += len(chunks) - 1
+            result.append((task_id, message))
+
+        return result
+
+    async def flush(self) -> None:
+        """
+        投递队列中所有已发布的消息（在事件循环中调用）
+
+        直接推送完成/错误等消息前调用，保证它们排在此前发布的进度消息之后
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self.bind_loop(loop)
+
+        async with self._drain_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+
+                for task_id, message in self._coalesce(batch):
+                    try:
+                        await sse_manager.add_message(task_id, message)
+                        self.delivered += 1
+                    except Exception as e:
+                        self.failed += 1
+                        print(f"[PROGRESS BUS] [WARNING] 消息投递失败: task_id={task_id}, type={message.get('type')}, {e}")
+
+    def pending(self) -> int:
+        """待投递的消息数"""
+        return self._queue.qsize()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取总线统计"""
+        return {
+            "published": self.published,
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "pending": self.pending(),
+            "loop_bound": self._loop is not None and not self._loop.is_closed()
+        }
+
+
+# 全局进度总线实例
+progress_bus = ProgressBus()
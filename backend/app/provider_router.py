@@ -0,0 +1,263 @@
+# provider_router.py
+# 作用：多提供商LLM路由（按健康度和延迟选择提供商与模型）
+# 功能：
+#   - 维护每个 提供商/模型 的EWMA延迟和EWMA错误率，429或服务故障时立即进入冷却
+#   - 每次调用按阶段的质量要求（模型质量等级）筛选候选，选择预期延迟最低的健康候选
+#   - Groq的所有Key都在冷却时视为不可用，直接切换到其他提供商，不再等待冷却结束
+#   - 只使用配置了API Key的提供商（settings.get_available_api_providers()）
+#   - 通过 ContextVar 统计一次工作流运行中切换到非请求模型的次数（结果缓存据此跳过写入）
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from app.config import settings
+from app.token_usage import current_stage
+
+# 默认提供商（使用 APIKeyManager 的多Key轮换和RPM/TPM调度）
+DEFAULT_PROVIDER = "groq"
+
+# 错误率折算预期延迟时的上限（避免除以0）
+MAX_ERROR_PENALTY = 0.9
+
+
+@dataclass(frozen=True)
+class Route:
+    """一次LLM调用的路由结果"""
+    provider: str
+    model: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+
+class FailoverTracker:
+    """一次工作流运行中路由切换到非请求 提供商/模型 的次数"""
+
+    def __init__(self):
+        self.count = 0
+
+
+# 当前运行的切换统计，子任务和LLM调用自动继承（同一个对象，子任务中的切换也计入）
+_failover_tracker: ContextVar[Optional[FailoverTracker]] = ContextVar("provider_failovers", default=None)
+
+
+@contextmanager
+def track_failovers():
+    """
+    统计代码块内（含其中创建的子任务）路由切换到非请求 提供商/模型 的次数
+
+    Yields:
+        FailoverTracker: 切换统计，退出后读取 count
+    """
+    tracker = FailoverTracker()
+    token = _failover_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _failover_tracker.reset(token)
+
+
+class RouteHealth:
+    """单个 提供商/模型 的健康度"""
+
+    def __init__(self):
+        self.latency: Optional[float] = None  # 成功调用延迟的EWMA（秒）
+        self.error_rate = 0.0  # 调用失败的EWMA（0-1）
+        self.cooling_until = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.rate_limits = 0
+        self.selected = 0
+
+    def record(self, success: bool, latency: Optional[float], alpha: float) -> None:
+        self.calls += 1
+        self.error_rate += alpha * ((0.0 if success else 1.0) - self.error_rate)
+        if success and latency is not None:
+            self.latency = latency if self.latency is None else self.latency + alpha * (latency - self.latency)
+        if not success:
+            self.failures += 1
+
+    def expected_latency(self) -> float:
+        """预期延迟：EWMA延迟按错误率折算（失败需要重试），没有样本时使用默认值"""
+        latency = self.latency if self.latency is not None else settings.provider_router_default_latency
+        return latency / (1 - min(self.error_rate, MAX_ERROR_PENALTY))
+
+
+class ProviderRouter:
+    """
+    多提供商LLM路由器
+
+    使用方式：
+        route = provider_router.route(model_name)  # 未启用或没有健康候选时返回None（使用默认Groq路径）
+        ...
+        provider_router.record_success(route, latency) / provider_router.record_failure(route, rate_limited)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.health: Dict[Route, RouteHealth] = {}
+        self.failovers = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.provider_router_enabled
+
+    # ==================== 候选 ====================
+
+    @staticmethod
+    def api_key(provider: str) -> str:
+        """非Groq提供商的API Key"""
+        return {"openai": settings.openai_api_key, "deepseek": settings.deepseek_api_key}.get(provider, "")
+
+    def options(self) -> List[Route]:
+        """所有配置了API Key的 提供商/模型 候选（按 settings.provider_models 的顺序）"""
+        available = settings.get_available_api_providers()
+        return [
+            Route(provider, model)
+            for provider, models in settings.provider_models.items()
+            if provider in available
+            for model in models
+        ]
+
+    @staticmethod
+    def required_tier(model: str, stage: str) -> Optional[int]:
+        """
+        阶段的质量要求：settings.stage_min_quality_tier 中的阶段设置，默认与请求的模型同级
+
+        Returns:
+            int | None: 最低质量等级，请求的模型没有等级时返回None（只能使用该模型本身）
+        """
+        tier = settings.stage_min_quality_tier.get(stage)
+        return tier if tier is not None else settings.model_quality_tiers.get(model)
+
+    def candidates(self, model: str, stage: Optional[str] = None) -> List[Route]:
+        """满足质量要求的候选，请求的模型（Groq）排在最前"""
+        required = self.required_tier(model, stage or current_stage())
+        requested = Route(DEFAULT_PROVIDER, model)
+        routes = [requested] + [route for route in self.options() if route != requested]
+        return [
+            route for route in routes
+            if route.model == model
+            or (required is not None and settings.model_quality_tiers.get(route.model, -1) >= required)
+        ]
+
+    @staticmethod
+    def _has_key_manager() -> bool:
+        from app import utils
+        return utils.api_key_manager is not None
+
+    def _available(self, route: Route, now: float) -> bool:
+        """候选当前是否可用：未冷却，且提供商有可立即使用的Key"""
+        health = self.health.get(route)
+        if health and health.cooling_until > now:
+            return False
+        if route.provider == DEFAULT_PROVIDER:
+            from app import utils
+            manager = utils.api_key_manager
+            return bool(manager.get_available_keys()) if manager else bool(settings.groq_api_key)
+        return bool(self.api_key(route.provider))
+
+    # ==================== 路由 ====================
+
+    def route(self, model: str, stage: Optional[str] = None) -> Optional[Route]:
+        """
+        为一次LLM调用选择 提供商/模型
+
+        Args:
+            model: 请求的模型（Groq模型名）
+            stage: 阶段（默认取当前上下文）
+
+        Returns:
+            Route | None: 预期延迟最低的健康候选；未启用或没有健康候选时返回None
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            healthy = [route for route in self.candidates(model, stage) if self._available(route, now)]
+            if not healthy:
+                return None
+            # 预期延迟相同时保持候选顺序（优先请求的模型）
+            best = min(healthy, key=lambda route: self.health.setdefault(route, RouteHealth()).expected_latency())
+            self.health.setdefault(best, RouteHealth()).selected += 1
+            if best != Route(DEFAULT_PROVIDER, model):
+                self.failovers += 1
+                tracker = _failover_tracker.get()
+                if tracker is not None:
+                    tracker.count += 1
+        return best
+
+    def record_success(self, route: Optional[Route], latency: float) -> None:
+        """记录一次成功调用"""
+        if route is None:
+            return
+        with self._lock:
+            self.health.setdefault(route, RouteHealth()).record(True, latency, settings.provider_router_ewma_alpha)
+
+    def record_failure(self, route: Optional[Route], rate_limited: bool = False) -> None:
+        """记录一次失败调用（429、服务故障、超时或连接错误），候选立即进入冷却
+
+        客户端错误（400、上下文超长）不是候选的故障，调用方不应记录（见 utils._is_failover_error）
+        """
+        if route is None:
+            return
+        with self._lock:
+            health = self.health.setdefault(route, RouteHealth())
+            health.record(False, None, settings.provider_router_ewma_alpha)
+            if rate_limited:
+                health.rate_limits += 1
+            if rate_limited and route.provider == DEFAULT_PROVIDER and self._has_key_manager():
+                # Groq的429由 APIKeyManager 按Key冷却，全部Key冷却时该提供商自动视为不可用
+                return
+            health.cooling_until = time.time() + settings.provider_router_cooldown_seconds
+        print(f"[ROUTER] {route.name} 调用失败（{'429' if rate_limited else '服务错误'}），"
+              f"冷却 {settings.provider_router_cooldown_seconds}秒")
+
+    def max_failovers(self) -> int:
+        """一次调用中最多切换的候选数"""
+        return len(self.options()) + 1 if self.enabled else 0
+
+    def reset(self) -> None:
+        """清空健康度统计"""
+        with self._lock:
+            self.health.clear()
+            self.failovers = 0
+
+    def get_stats(self) -> dict:
+        """
+        获取路由统计
+
+        Returns:
+            dict: 每个 提供商/模型 的质量等级、EWMA延迟、EWMA错误率、预期延迟、冷却剩余时间和调用次数，
+                  以及切换到非请求模型的次数
+        """
+        now = time.time()
+        with self._lock:
+            routes = {}
+            for route in self.options():
+                health = self.health.get(route, RouteHealth())
+                routes[route.name] = {
+                    "tier": settings.model_quality_tiers.get(route.model),
+                    "latency_ewma": round(health.latency, 3) if health.latency is not None else None,
+                    "error_rate_ewma": round(health.error_rate, 3),
+                    "expected_latency": round(health.expected_latency(), 3),
+                    "cooling_seconds": round(max(health.cooling_until - now, 0.0), 1),
+                    "selected": health.selected,
+                    "calls": health.calls,
+                    "failures": health.failures,
+                    "rate_limits": health.rate_limits
+                }
+            return {
+                "enabled": self.enabled,
+                "stage_min_quality_tier": dict(settings.stage_min_quality_tier),
+                "failovers": self.failovers,
+                "routes": routes
+            }
+
+
+# 全局路由器
+provider_router = ProviderRouter()
@@ -0,0 +1,216 @@
+# result_cache.py
+# 作用：整场演讲的处理结果缓存
+# 功能：
+#   - 以 (transcript内容哈希, 目标话题, 流水线版本) 为键缓存 final_shadow_chunks
+#   - 流水线版本 = prompt模板内容 + 模型 + 分块参数 + 影响结果的流水线开关的哈希，模板修改后旧缓存自动失效
+#   - 只缓存每个语义块都产出了结果的运行（部分语义块失败的结果不缓存）
+#   - 多提供商路由切换到其他 提供商/模型 的运行不缓存（版本号按请求的模型计算）
+#   - 命中时跳过整个工作流（分块、Shadow Writing、质量评估、修正）
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.llm_cache import SQLiteCache
+
+
+# 流水线结构变化（节点、结果格式）时手动递增，使旧缓存失效
+PIPELINE_SCHEMA_VERSION = "2"
+
+TEMPLATES_DIR = Path(__file__).parent / "prompts" / "templates"
+
+_version_memo: Dict[Tuple, str] = {}
+
+
+def _template_signature() -> Tuple:
+    """模板文件的 (路径, 修改时间, 大小) 签名，用于判断是否需要重新计算版本"""
+    return tuple(
+        (str(path.relative_to(TEMPLATES_DIR)), path.stat().st_mtime_ns, path.stat().st_size)
+        for path in sorted(TEMPLATES_DIR.rglob("*.txt"))
+    )
+
+
+def _chunker_params() -> Dict[str, Any]:
+    """语义分块参数（影响分块结果，进而影响最终结果）"""
+    return {
+        "unit": "tokens",
+        "target": settings.chunk_target_tokens,
+        "min": settings.chunk_min_tokens,
+        "max": settings.chunk_max_tokens,
+    }
+
+
+def _pipeline_options() -> Dict[str, Any]:
+    """影响最终结果的流水线开关（本地预检、质量评估级联、批量模式）"""
+    return {
+        "pre_quality": settings.pre_quality_enabled,
+        "quality_cascade": settings.quality_cascade_enabled,
+        "cascade_light_model": settings.cascade_light_model,
+        "cascade_band": [settings.quality_cascade_low, settings.quality_cascade_high],
+        "shadow_batch_size": settings.shadow_batch_size,
+        "quality_batch_size": settings.quality_batch_size,
+    }
+
+
+def compute_pipeline_version(model_name: Optional[str] = None) -> str:
+    """
+    计算流水线版本号
+
+    Args:
+        model_name: 工作流使用的模型（默认settings.model_name）
+
+    Returns:
+        str: 16位十六进制版本号
+    """
+    model_name = model_name or settings.model_name
+    signature = _template_signature()
+    chunker = _chunker_params()
+    options = _pipeline_options()
+    memo_key = (model_name, settings.temperature, tuple(chunker.values()),
+                json.dumps(options, sort_keys=True), signature)
+
+    version = _version_memo.get(memo_key)
+    if version is None:
+        digest = hashlib.sha256()
+        digest.update(PIPELINE_SCHEMA_VERSION.encode())
+        digest.update(json.dumps(
+            {"model": model_name, "temperature": settings.temperature, "chunker": chunker, "options": options},
+            sort_keys=True
+        ).encode())
+        for relative_path, _, _ in signature:
+            digest.update(relative_path.encode())
+            digest.update((TEMPLATES_DIR / relative_path).read_bytes())
+        version = digest.hexdigest()[:16]
+        _version_memo[memo_key] = version
+
+    return version
+
+
+class TalkResultCache(SQLiteCache):
+    """整场演讲结果缓存"""
+
+    def __init__(self, db_path: str, ttl_seconds: int = 30 * 24 * 3600, max_entries: int = 2000):
+        super().__init__(db_path, ttl_seconds, max_entries, table="talk_results")
+
+    @staticmethod
+    def make_key(text: str, target_topic: Optional[str], pipeline_version: str) -> str:
+        """
+        生成缓存键
+
+        Args:
+            text: 演讲transcript
+            target_topic: 目标话题
+            pipeline_version: 流水线版本号
+
+        Returns:
+            str: sha256十六进制摘要
+        """
+        digest = hashlib.sha256()
+        digest.update(pipeline_version.encode())
+        digest.update(b"\0")
+        digest.update((target_topic or "").encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+
+# 全局缓存实例（首次使用时创建）
+talk_result_cache: Optional[TalkResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[TalkResultCache]:
+    """
+    获取演讲结果缓存
+
+    Returns:
+        TalkResultCache: 缓存实例；settings.result_cache_enabled 为False或初始化失败时返回None
+    """
+    global talk_result_cache
+    if not settings.result_cache_enabled:
+        return None
+
+    if talk_result_cache is None:
+        with _cache_lock:
+            if talk_result_cache is None:
+                try:
+                    talk_result_cache = TalkResultCache(
+                        settings.result_cache_path,
+                        ttl_seconds=settings.result_cache_ttl_seconds,
+                        max_entries=settings.result_cache_max_entries
+                    )
+                    print(f"[RESULT CACHE] 演讲结果缓存已启用: {settings.result_cache_path}")
+                except Exception as e:
+                    print(f"[RESULT CACHE] [WARNING] 缓存初始化失败，禁用缓存: {e}")
+                    settings.result_cache_enabled = False
+                    return None
+
+    return talk_result_cache
+
+
+def lookup_talk_results(text: str, target_topic: Optional[str] = "",
+                        model_name: Optional[str] = None) -> Tuple[Optional[str], Optional[List[Any]]]:
+    """
+    查询演讲结果缓存
+
+    Args:
+        text: 演讲transcript
+        target_topic: 目标话题
+        model_name: 工作流使用的模型
+
+    Returns:
+        tuple: (缓存键, 缓存的final_shadow_chunks)；未启用缓存时键为None，未命中时结果为None
+    """
+    cache = get_result_cache()
+    if cache is None or not text:
+        return None, None
+
+    try:
+        cache_key = cache.make_key(text, target_topic, compute_pipeline_version(model_name))
+        cached = cache.get(cache_key)
+    except Exception as e:
+        print(f"[RESULT CACHE] [WARNING] 查询缓存失败: {e}")
+        return None, None
+
+    if cached is not None:
+        print(f"[RESULT CACHE] 命中缓存 {cache_key[:12]}，直接返回 {len(cached)} 个结果")
+    return cache_key, cached
+
+
+def store_talk_results(cache_key: Optional[str], results: List[Any], expected_chunks: int,
+                       failovers: int = 0, lossy_results: int = 0) -> None:
+    """
+    保存演讲结果
+
+    只缓存每个语义块都产出了结果的运行：部分语义块因429、超时、JSON无法修复或质量不合格而没有结果时，
+    缓存会把这次不完整的运行固化下来，在TTL内返回给后续所有请求
+
+    Args:
+        cache_key: lookup_talk_results 返回的缓存键
+        results: 已转换为dict的final_shadow_chunks
+        expected_chunks: 语义块数
+        failovers: 运行中路由切换到非请求 提供商/模型 的次数（见 provider_router.track_failovers），
+                   大于0时不缓存：部分回复来自其他模型，不能按请求的模型的版本号保存
+        lossy_results: 运行中有损LLM结果（修复、截断补全、重新请求）的个数（见 json_repair.track_lossy_results），
+                       大于0时不缓存：部分语义块的结果与模型的回复不一致
+    """
+    if cache_key is None or not results:
+        return
+    if len(results) < expected_chunks:
+        print(f"[RESULT CACHE] 只有 {len(results)}/{expected_chunks} 个语义块产出结果，不缓存")
+        return
+    if failovers:
+        print(f"[RESULT CACHE] 运行中 {failovers} 次LLM调用切换到其他提供商/模型，不缓存")
+        return
+    if lossy_results:
+        print(f"[RESULT CACHE] 运行中 {lossy_results} 个LLM结果经过修复或重新整理，不缓存")
+        return
+    cache = get_result_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(cache_key, results)
+    except Exception as e:
+        print(f"[RESULT CACHE] [WARNING] 写入缓存失败: {e}")
@@ -2,15 +2,16 @@
 # 核心业务路由 - TED处理、搜索、任务管理
 
 from fastapi import APIRouter, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect, BackgroundTasks, Depends
-from app.exceptions import ConfigurationError, NotFoundError, FileProcessingError
+from app.exceptions import ConfigurationError, ConflictError, NotFoundError, FileProcessingError, ValidationError
 from app.models import (
     SearchRequest, SearchResponse, TEDCandidate,
     BatchProcessRequest, BatchProcessResponse,
-    TaskStatusResponse
+    TaskStatusResponse, TaskProgressResponse, TaskDeltaResponse, TaskCancelResponse
 )
 from app.task_manager import task_manager
 from app.sse_manager import sse_manager
 from app.batch_processor import process_urls_batch
+from app.cancellation import cancellation_registry
 from app.enums import TaskStatus, MessageType
 from app.utils import (
     get_settings, get_task_manager, get_sse_manager,
@@ -141,7 +142,9 @@ async def process_batch(
                 "https://www.ted.com/talks/...",
                 ...
             ],
-            "user_id": "user123"  // 可选
+            "user_id": "user123",  // 可选
+            "timeout_seconds": 600,  // 可选，任务截止时间，超过后自动取消
+            "priority": "bulk"  // 可选，interactive / bulk，默认URL数少的任务按交互式调度
         }
 
     返回格式：
@@ -155,13 +158,17 @@ async def process_batch(
     说明：
         - 返回task_id后立即返回
         - 使用WebSocket连接 /ws/progress/{task_id} 获取实时进度
+        - 同一用户的LLM请求共享一份公平调度权重，大批量任务不会饿死其他用户的交互式任务
     """
     # 创建批量任务
     response = await service.create_batch_task(request.urls, request.user_id)
 
     # 启动异步处理
     if response.success:
-        await service.start_async_batch_processing(response.task_id, request.urls, background_tasks)
+        await service.start_async_batch_processing(
+            response.task_id, request.urls, background_tasks,
+            timeout_seconds=request.timeout_seconds, priority=request.priority
+        )
 
     return response
 
@@ -203,6 +210,187 @@ async def get_task_status(
     )
 
 
+def _parse_task_cursor(cursor: str) -> tuple:
+    """
+    解析任务增量游标
+
+    游标格式为 "{结果数}.{错误数}"，即客户端已收到的结果/错误条数
+    （两个列表都只追加，位置即序号）
+
+    Args:
+        cursor: 游标字符串
+
+    Returns:
+        tuple: (结果起始位置, 错误起始位置)
+    """
+    parts = cursor.split(".")
+    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+        raise ValidationError("Invalid cursor, expected '<results>.<errors>'", details={"cursor": cursor})
+    return int(parts[0]), int(parts[1])
+
+
+# 7. 查询任务进度（只返回状态和计数，不含结果）
+@router.get("/task/{task_id}/status", response_model=TaskProgressResponse)
+async def get_task_progress(
+    task_id: str,
+    task_mgr = Depends(get_task_manager)
+):
+    """
+    查询任务进度（轻量轮询）
+
+    返回格式：
+        {"task_id": "uuid", "status": "processing", "total": 3, "current": 1,
+         "current_url": "https://...", "result_count": 1, "error_count": 0}
+    """
+    task = task_mgr.get_task(task_id)
+    if not task:
+        raise NotFoundError(resource="task", resource_id=task_id)
+
+    return TaskProgressResponse(
+        task_id=task.task_id,
+        status=task.status.value,
+        total=task.total,
+        current=task.current,
+        current_url=task.current_url,
+        result_count=task.result_count,
+        error_count=len(task.errors)
+    )
+
+
+# 8. 增量查询任务结果（只返回游标之后新增的结果和错误）
+@router.get("/task/{task_id}/delta", response_model=TaskDeltaResponse)
+async def get_task_delta(
+    task_id: str,
+    cursor: str = "0.0",
+    task_mgr = Depends(get_task_manager)
+):
+    """
+    增量查询任务结果（游标轮询）
+
+    首次请求不带cursor（或cursor=0.0），之后每次使用上次响应中的cursor，
+    响应只包含期间新增的结果和错误，轮询开销与新增数据量成正比
+
+    返回格式：
+        {"task_id": "uuid", "status": "processing", ..., "results": [新增结果],
+         "errors": [新增错误], "cursor": "2.0", "finished": false}
+    """
+    results_from, errors_from = _parse_task_cursor(cursor)
+
+    task = task_mgr.get_task(task_id)
+    if not task:
+        raise NotFoundError(resource="task", resource_id=task_id)
+
+    result_count = task.result_count
+    error_count = len(task.errors)
+    # 游标超出当前长度（如任务被重新创建）时视为已读到末尾
+    results_from = min(results_from, result_count)
+    errors_from = min(errors_from, error_count)
+
+    return TaskDeltaResponse(
+        task_id=task.task_id,
+        status=task.status.value,
+        total=task.total,
+        current=task.current,
+        current_url=task.current_url,
+        result_count=result_count,
+        error_count=error_count,
+        results=task.load_results(results_from),
+        errors=task.errors[errors_from:],
+        cursor=f"{result_count}.{error_count}",
+        finished=task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.INTERRUPTED, TaskStatus.CANCELLED)
+    )
+
+
+# 9. 恢复中断的任务（服务重启后继续处理）
+@router.post("/task/{task_id}/resume", response_model=BatchProcessResponse)
+async def resume_task(
+    task_id: str,
+    background_tasks: BackgroundTasks,
+    task_mgr = Depends(get_task_manager),
+    service: TEDBatchService = Depends(get_ted_batch_service)
+):
+    """
+    恢复因服务重启而中断的任务
+
+    已有结果的URL不再处理；处理到一半的URL从工作流检查点继续，
+    已完成的语义块不会再次调用LLM。进度通过原task_id的SSE流推送
+
+    返回格式：
+        {"success": true, "task_id": "uuid", "total": 3, "message": "Resuming 2/3 URLs."}
+    """
+    task = task_mgr.get_task(task_id)
+    if not task:
+        raise NotFoundError(resource="task", resource_id=task_id)
+    if task.status != TaskStatus.INTERRUPTED:
+        raise ValidationError(
+            "Only interrupted tasks can be resumed",
+            details={"task_id": task_id, "status": task.status.value}
+        )
+
+    # 先改为等待中，防止重复恢复（在存储中比较并设置，多个worker同时恢复时只有一个成功）
+    if not task_mgr.update_status_if(task_id, [TaskStatus.INTERRUPTED], TaskStatus.PENDING):
+        raise ConflictError(
+            "Task state changed, retry later",
+            details={"task_id": task_id}
+        )
+    await service.start_async_batch_processing(task_id, task.urls, background_tasks, resume=True)
+
+    done_urls = {result.get("url") for result in task.results}
+    remaining = sum(1 for url in task.urls if url not in done_urls)
+    return BatchProcessResponse(
+        success=True,
+        task_id=task_id,
+        total=task.total,
+        message=f"Resuming {remaining}/{task.total} URLs."
+    )
+
+
+# 10. 取消任务
+@router.post("/task/{task_id}/cancel", response_model=TaskCancelResponse)
+async def cancel_task(
+    task_id: str,
+    task_mgr = Depends(get_task_manager)
+):
+    """
+    取消正在运行或等待中的任务
+
+    正在运行的任务立即停止：进行中和排队中的LLM请求被放弃，预约的速率额度退还给其他任务，
+    已完成URL的结果保留。SSE流最后收到 type=cancelled 的消息
+
+    返回格式：
+        {"task_id": "uuid", "status": "cancelling", "message": "..."}
+        status: cancelling（正在停止，稍后变为cancelled）或 cancelled
+        运行中但不在本进程取消注册表中的任务，或在此期间已被其他worker开始运行的任务返回409
+    """
+    task = task_mgr.get_task(task_id)
+    if not task:
+        raise NotFoundError(resource="task", resource_id=task_id)
+    if task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED):
+        raise ValidationError(
+            "Task already finished",
+            details={"task_id": task_id, "status": task.status.value}
+        )
+
+    if cancellation_registry.cancel(task_id):
+        return TaskCancelResponse(task_id=task_id, status="cancelling", message="Cancellation requested.")
+
+    if task.status == TaskStatus.PROCESSING:
+        # 任务在其他进程中运行，或尚未注册到本进程的取消注册表：直接标记会被运行中的任务覆盖
+        raise ConflictError(
+            "Task is running in another worker and cannot be cancelled here, retry later",
+            details={"task_id": task_id, "status": task.status.value}
+        )
+
+    # 尚未开始（或已中断）的任务直接标记为已取消
+    # 在存储中比较并设置：任务可能正在其他worker中开始运行，不能覆盖其状态
+    if not task_mgr.update_status_if(task_id, [TaskStatus.PENDING, TaskStatus.INTERRUPTED], TaskStatus.CANCELLED):
+        raise ConflictError(
+            "Task started or finished in the meantime, retry later",
+            details={"task_id": task_id}
+        )
+    return TaskCancelResponse(task_id=task_id, status=TaskStatus.CANCELLED.value, message="Task cancelled.")
+
+
 # ============ WebSocket处理 ============
 
 # 全局WebSocket路由（需要在main.py中特殊处理）
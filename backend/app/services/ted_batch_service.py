@@ -77,15 +77,29 @@ class TEDBatchService:
             current_url=task.current_url
         )
 
-    async def start_async_batch_processing(self, task_id: str, urls: List[str], background_tasks):
+    async def start_async_batch_processing(self, task_id: str, urls: List[str], background_tasks,
+                                           resume: bool = False, timeout_seconds: Optional[int] = None,
+                                           priority: Optional[str] = None):
         """启动异步批量处理
 
         Args:
             task_id: 任务ID
             urls: TED URLs列表
             background_tasks: FastAPI BackgroundTasks实例
+            resume: 是否为恢复中断的任务（跳过已完成的URL和语义块）
+            timeout_seconds: 任务截止时间（秒，None使用默认配置）
+            priority: 调度优先级（interactive / bulk，None时按URL数自动判断）
         """
-        print(f"[TEDBatchService] 启动异步批量处理: {task_id}")
+        print(f"[TEDBatchService] {'恢复' if resume else '启动'}异步批量处理: {task_id}")
+
+        # 只传入非默认选项
+        options = {}
+        if resume:
+            options["resume"] = True
+        if timeout_seconds is not None:
+            options["timeout_seconds"] = timeout_seconds
+        if priority is not None:
+            options["priority"] = priority
 
         # 后台异步处理
-        background_tasks.add_task(process_urls_batch, task_id, urls)
\ No newline at end of file
+        background_tasks.add_task(process_urls_batch, task_id, urls, **options)
\ No newline at end of file
@@ -77,7 +77,7 @@ class TEDProcessingService:
                 )
 
             # 6. 调用 process_ted_text() 处理（传递 TED 元数据和注入的LLM）
-            result = process_ted_text(
+            result = await process_ted_text(
                 text=transcript,
                 llm=self.llm,  # 传递注入的LLM
                 target_topic="",
@@ -2,32 +2,37 @@
 # 作用：管理SSE消息队列，实现消息缓存和断点续传
 # 功能：
 #   - 消息队列管理（每个task_id一个队列）
-#   - 消息缓存（支持断点续传）
+#   - 消息缓存（支持断点续传）：存放在ProgressLog中（进程内环形缓冲区，或多worker共享的SQLite日志）
+#   - 消息ID为 "{task_id}_{seq}"，seq为任务内单调递增的整数，续传时二分查找定位
+#   - 日志已淘汰客户端缺失的消息时，先发送resync通知
 #   - 自动清理过期消息
+#   - 订阅等待：每个任务一个asyncio.Condition，新消息到达时唤醒订阅者（空闲时不占CPU）；
+#     共享日志下另按间隔检查其他worker写入的消息
 
 import asyncio
 import time
-from collections import deque
 from typing import Dict, List, Any, Optional
 from datetime import datetime
+from app.task_backend import ProgressLog, InMemoryProgressLog, create_progress_log
+
 
 class SSEManager:
     """
     SSE管理器，负责消息缓存和分发
     """
 
-    def __init__(self, max_messages_per_task: int = 100, message_ttl: int = 300):
+    def __init__(self, log: Optional[ProgressLog] = None, message_ttl: int = 300):
         """
         初始化SSE管理器
 
         Args:
-            max_messages_per_task: 每个任务最大消息数
+            log: 进度日志（默认进程内日志）
             message_ttl: 消息存活时间（秒）
         """
-        self.max_messages_per_task = max_messages_per_task
+        self.log = log if log is not None else InMemoryProgressLog()
         self.message_ttl = message_ttl
-        self.message_queues: Dict[str, deque] = {}
-        self.task_timestamps: Dict[str, float] = {}  # 任务最后活动时间
+        self._conditions: Dict[str, asyncio.Condition] = {}  # 新消息通知
+        self._subscribers: Dict[str, int] = {}  # 每个任务的等待中订阅者数
 
     async def add_message(self, task_id: str, message: dict) -> None:
         """
@@ -35,20 +40,20 @@ class SSEManager:
 
         Args:
             task_id: 任务ID
-            message: 消息内容，必须包含 'id', 'type', 'timestamp' 字段
+            message: 消息内容，必须包含 'type' 字段；'id' 和 'seq' 由管理器分配
         """
-        if task_id not in self.message_queues:
-            self.message_queues[task_id] = deque(maxlen=self.max_messages_per_task)
-
-        # 确保消息有ID和时间戳
-        if 'id' not in message:
-            message['id'] = f"{task_id}_{int(time.time() * 1000)}"
-
         if 'timestamp' not in message:
             message['timestamp'] = time.time()
 
-        self.message_queues[task_id].append(message)
-        self.task_timestamps[task_id] = time.time()
+        # 日志分配序号和ID（ID带task_id前缀，前端跨任务去重时不会冲突）
+        # 共享日志在写线程中写入，等待跨进程写锁时不阻塞事件循环
+        await self.log.aappend(task_id, message)
+
+        # 唤醒等待该任务消息的订阅者
+        condition = self._conditions.get(task_id)
+        if condition is not None:
+            async with condition:
+                condition.notify_all()
 
         print(f"[SSE] 消息已缓存: task_id={task_id}, type={message.get('type')}, id={message['id']}")
 
@@ -63,20 +68,96 @@ class SSEManager:
         Returns:
             消息列表
         """
-        if task_id not in self.message_queues:
-            return []
+        return await self.log.amessages_after(task_id, self.parse_event_id(task_id, last_event_id))
+
+    @staticmethod
+    def parse_event_id(task_id: str, last_event_id: Optional[str]) -> int:
+        """
+        从事件ID中解析序号
+
+        Args:
+            task_id: 任务ID
+            last_event_id: 形如 "{task_id}_{seq}" 的事件ID
+
+        Returns:
+            int: 序号；ID为空或格式不符（如其他任务、旧格式）时返回0，即从头发送
+        """
+        if not last_event_id:
+            return 0
+        prefix = f"{task_id}_"
+        suffix = last_event_id[len(prefix):] if last_event_id.startswith(prefix) else ""
+        return int(suffix) if suffix.isdigit() else 0
+
+    def messages_after(self, task_id: str, after_seq: int) -> List[dict]:
+        """
+        返回序号大于after_seq的消息（缺失部分已被淘汰时开头为resync通知）
+
+        Args:
+            task_id: 任务ID
+            after_seq: 客户端已收到的最大序号
+
+        Returns:
+            消息列表
+        """
+        return self.log.messages_after(task_id, after_seq)
+
+    def get_last_seq(self, task_id: str) -> int:
+        """
+        获取任务最新消息的序号
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            int: 最新序号，没有消息时为0
+        """
+        return self.log.last_seq(task_id)
+
+    async def wait_for_messages(self, task_id: str, after_seq: int,
+                                timeout: Optional[float] = None) -> List[dict]:
+        """
+        等待并返回序号大于after_seq的所有消息
 
-        messages = list(self.message_queues[task_id])
+        已有新消息时立即返回；否则阻塞到新消息到达或超时，
+        一次返回期间到达的全部消息（不会只拿到最新一条）
 
-        if last_event_id:
-            # 过滤出last_event_id之后的消息
-            filtered_messages = []
-            for msg in messages:
-                if msg.get('id', '') > last_event_id:
-                    filtered_messages.append(msg)
-            return filtered_messages
+        Args:
+            task_id: 任务ID
+            after_seq: 订阅者已收到的最大序号
+            timeout: 最长等待时间（秒），None表示一直等待
 
-        return messages
+        Returns:
+            新消息列表，超时或任务被清除时返回空列表
+        """
+        # 共享日志在线程中读取，数据库读取不阻塞事件循环
+        if await self.log.alast_seq(task_id) <= after_seq:
+            condition = self._conditions.setdefault(task_id, asyncio.Condition())
+            self._subscribers[task_id] = self._subscribers.get(task_id, 0) + 1
+            loop = asyncio.get_running_loop()
+            deadline = None if timeout is None else loop.time() + timeout
+            try:
+                async with condition:
+                    while (await self.log.alast_seq(task_id) <= after_seq
+                           and self._conditions.get(task_id) is condition):
+                        # 进程内写入通过condition唤醒；共享日志下还需按间隔检查其他worker的写入
+                        remaining = None if deadline is None else deadline - loop.time()
+                        if remaining is not None and remaining <= 0:
+                            return []
+                        step = self.log.poll_interval
+                        if step is None or (remaining is not None and remaining < step):
+                            step = remaining
+                        try:
+                            await asyncio.wait_for(condition.wait(), step)
+                        except asyncio.TimeoutError:
+                            pass
+            finally:
+                remaining = self._subscribers.get(task_id, 1) - 1
+                if remaining > 0:
+                    self._subscribers[task_id] = remaining
+                else:
+                    self._subscribers.pop(task_id, None)
+
+        return await self.log.amessages_after(task_id, after_seq)
 
     async def get_latest_message(self, task_id: str) -> Optional[dict]:
         """
@@ -88,10 +169,7 @@ class SSEManager:
         Returns:
             最新消息或None
         """
-        if task_id not in self.message_queues or not self.message_queues[task_id]:
-            return None
-
-        return self.message_queues[task_id][-1]
+        return self.log.latest(task_id)
 
     async def clear_task_messages(self, task_id: str) -> None:
         """
@@ -100,53 +178,60 @@ class SSEManager:
         Args:
             task_id: 任务ID
         """
-        if task_id in self.message_queues:
-            del self.message_queues[task_id]
+        self.log.clear(task_id)
 
-        if task_id in self.task_timestamps:
-            del self.task_timestamps[task_id]
+        # 唤醒仍在等待的订阅者（它们会收到空列表）
+        condition = self._conditions.pop(task_id, None)
+        if condition is not None:
+            async with condition:
+                condition.notify_all()
 
         print(f"[SSE] 清除任务消息: task_id={task_id}")
 
-    def cleanup_expired_messages(self) -> None:
+    async def cleanup_expired_messages(self) -> None:
         """
         清理过期消息（定期调用）
         """
-        current_time = time.time()
-        expired_tasks = []
-
-        for task_id, timestamp in self.task_timestamps.items():
-            if current_time - timestamp > self.message_ttl:
-                expired_tasks.append(task_id)
+        expired_tasks = self.log.idle_task_ids(time.time() - self.message_ttl)
 
         for task_id in expired_tasks:
-            self.clear_task_messages(task_id)
+            await self.clear_task_messages(task_id)
             print(f"[SSE] 清理过期任务: task_id={task_id}")
 
     def get_active_tasks_count(self) -> int:
         """
         获取活跃任务数量
         """
-        return len(self.message_queues)
+        return self.log.task_count()
+
+    def get_subscriber_count(self) -> int:
+        """
+        获取正在等待新消息的订阅者数量
+        """
+        return sum(self._subscribers.values())
 
     def get_task_message_count(self, task_id: str) -> int:
         """
         获取任务的消息数量
         """
-        return len(self.message_queues.get(task_id, []))
+        return self.log.message_count(task_id)
 
 # 创建全局SSE管理器实例
-sse_manager = SSEManager()
+sse_manager = SSEManager(log=create_progress_log())
 
 # 定期清理过期消息
 async def cleanup_task():
     """后台清理任务"""
     while True:
-        sse_manager.cleanup_expired_messages()
+        await sse_manager.cleanup_expired_messages()
         await asyncio.sleep(60)  # 每分钟清理一次
 
 # 启动清理任务
 def start_cleanup_task():
     """启动后台清理任务"""
+    from app.progress_bus import progress_bus
+
+    # 工作流节点通过进度总线发布消息，投递在主事件循环中执行
+    progress_bus.bind_loop(asyncio.get_running_loop())
     asyncio.create_task(cleanup_task())
     print("[SSE] 消息清理任务已启动")
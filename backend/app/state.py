@@ -48,10 +48,12 @@ class ChunkProcessState(TypedDict):
     # 输入
     chunk_text: str                        # 当前语义块文本
     chunk_id: int                          # 块ID（用于日志追踪）
+    total_chunks: int                      # 语义块总数（用于进度推送）
     
     # 处理流程中间状态
     raw_shadow: Optional[dict]             # Shadow Writing原始结果
     validated_shadow: Optional[Ted_Shadows] # 验证通过的结果
+    pre_quality: Optional[dict]            # 本地预检结果（decision: pass / reject / llm + 指标）
     quality_passed: bool                   # 质量检查是否通过
     quality_score: float                   # 质量分数
     quality_detail: Optional[dict]         # 质量评估详情
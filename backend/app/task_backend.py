@@ -0,0 +1,879 @@
+# task_backend.py
+# 作用：任务状态与进度日志的存储后端
+# 功能：
+#   - TaskBackend：任务元数据和每个URL处理结果的存储接口
+#       - InMemoryTaskBackend：进程内字典（单进程、重启丢失）
+#       - SQLiteTaskBackend：SQLite（WAL模式），重启后可查询；多个worker进程可共享同一文件
+#   - ProgressLog：SSE进度消息日志接口（按任务分配单调递增序号，支持续传）
+#       - InMemoryProgressLog：进程内环形缓冲区（按字节数限制）
+#       - SQLiteProgressLog：SQLite日志表，多个worker进程共享（订阅者轮询新消息）
+#   - settings.task_backend 选择后端：
+#       - "memory"：任务与进度均在进程内
+#       - "sqlite"：任务持久化到SQLite，进度日志在进程内（单worker默认）
+#       - "sqlite_shared"：任务与进度日志都在SQLite中（uvicorn --workers N 时使用）
+
+import asyncio
+import bisect
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """打开SQLite连接（WAL模式，多进程写入时等待锁而不是立即失败）"""
+    if db_path != ":memory:":
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _connect_reader(db_path: str, conn: sqlite3.Connection,
+                    lock: threading.Lock) -> Tuple[sqlite3.Connection, threading.Lock]:
+    """
+    打开只读连接（带独立的锁）
+
+    WAL模式下读取不等待写锁：写事务等待跨进程锁（busy_timeout）时，事件循环中的读取不被阻塞。
+    内存数据库无法共享，沿用写连接和锁
+
+    Args:
+        db_path: 数据库文件路径
+        conn: 写连接
+        lock: 写连接的锁
+
+    Returns:
+        (读连接, 读连接的锁)
+    """
+    if db_path == ":memory:":
+        return conn, lock
+    reader = _connect(db_path)
+    reader.execute("PRAGMA query_only=ON")
+    return reader, threading.Lock()
+
+
+# ============ 任务状态 ============
+
+class TaskBackend(ABC):
+    """任务状态存储接口"""
+
+    shared = False  # True 表示多个进程共享同一份数据（内存中的副本可能过期）
+
+    @abstractmethod
+    def save_task(self, meta: Dict[str, Any]) -> None:
+        """
+        写入任务元数据（不含结果）
+
+        状态只在任务首次写入时保存，之后的状态变化只通过 update_status_if() 写入：
+        本进程内存副本中的旧状态不会覆盖其他worker比较并设置的状态
+
+        Args:
+            meta: Task.to_meta() 的输出，results字段被忽略
+        """
+
+    @abstractmethod
+    def add_result(self, task_id: str, seq: int, result: dict) -> None:
+        """
+        追加一条任务结果
+
+        Args:
+            task_id: 任务ID
+            seq: 结果序号（从0开始）
+            result: 结果字典
+        """
+
+    async def asave_task(self, meta: Dict[str, Any]) -> None:
+        """写入任务元数据（事件循环内调用，默认直接写入）"""
+        self.save_task(meta)
+
+    async def aadd_result(self, task_id: str, seq: int, result: dict) -> None:
+        """追加一条任务结果（事件循环内调用，默认直接写入）"""
+        self.add_result(task_id, seq, result)
+
+    @abstractmethod
+    def update_status_if(self, task_id: str, expected: List[str], status: str) -> bool:
+        """
+        比较并设置任务状态（多个worker同时修改状态时只有一个成功）
+
+        Args:
+            task_id: 任务ID
+            expected: 允许的当前状态值
+            status: 新状态值
+
+        Returns:
+            bool: 当前状态在expected中并已更新时为True（任务不存在时为False）
+        """
+
+    async def aupdate_status_if(self, task_id: str, expected: List[str], status: str) -> bool:
+        """比较并设置任务状态（事件循环内调用，默认直接写入）"""
+        return self.update_status_if(task_id, expected, status)
+
+    @abstractmethod
+    def touch_tasks(self, task_ids: List[str], statuses: List[str]) -> None:
+        """
+        刷新任务的最后更新时间（心跳：运行中的任务不会被重启的worker判定为遗留任务）
+
+        Args:
+            task_ids: 任务ID列表
+            statuses: 只刷新状态在其中的任务
+        """
+
+    async def atouch_tasks(self, task_ids: List[str], statuses: List[str]) -> None:
+        """刷新任务的最后更新时间（事件循环内调用，默认直接写入）"""
+        self.touch_tasks(task_ids, statuses)
+
+    @abstractmethod
+    def load_task(self, task_id: str, with_results: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        读取任务
+
+        Args:
+            task_id: 任务ID
+            with_results: True时包含全部结果（results），False时只包含结果数（result_count）
+
+        Returns:
+            任务字典（created_at为时间戳），不存在时返回None
+        """
+
+    @abstractmethod
+    def load_results(self, task_id: str, start: int = 0) -> List[dict]:
+        """
+        读取任务结果
+
+        Args:
+            task_id: 任务ID
+            start: 起始序号
+
+        Returns:
+            序号不小于start的结果（按序号排列）
+        """
+
+    @abstractmethod
+    def delete_tasks(self, task_ids: List[str]) -> None:
+        """删除任务及其结果"""
+
+    @abstractmethod
+    def expired_task_ids(self, created_before: float, max_tasks: int) -> List[str]:
+        """
+        查找需要清理的任务：创建时间早于created_before，或超出数量上限的最旧任务
+
+        Args:
+            created_before: 创建时间阈值（时间戳）
+            max_tasks: 保留的最大任务数
+
+        Returns:
+            任务ID列表
+        """
+
+    @abstractmethod
+    def mark_unfinished(self, unfinished_statuses: List[str], status: str,
+                        updated_before: Optional[float] = None) -> int:
+        """
+        将遗留的未完成任务标记为指定状态（如已中断）
+
+        Args:
+            unfinished_statuses: 未完成状态列表
+            status: 新状态值
+            updated_before: 只处理最后更新时间早于该时间戳的任务（None表示全部）
+
+        Returns:
+            int: 更新的任务数
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """任务数"""
+
+
+class InMemoryTaskBackend(TaskBackend):
+    """进程内任务存储"""
+
+    def __init__(self):
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._results: Dict[str, Dict[int, dict]] = {}
+        self._lock = threading.Lock()
+
+    def save_task(self, meta: Dict[str, Any]) -> None:
+        with self._lock:
+            stored = {k: v for k, v in meta.items() if k != "results"}
+            stored["updated_at"] = time.time()
+            existing = self._tasks.get(meta["task_id"])
+            if existing is not None:
+                stored["status"] = existing["status"]
+            self._tasks[meta["task_id"]] = stored
+
+    def add_result(self, task_id: str, seq: int, result: dict) -> None:
+        with self._lock:
+            self._results.setdefault(task_id, {})[seq] = result
+
+    def update_status_if(self, task_id: str, expected: List[str], status: str) -> bool:
+        with self._lock:
+            meta = self._tasks.get(task_id)
+            if meta is None or meta["status"] not in expected:
+                return False
+            meta["status"] = status
+            meta["updated_at"] = time.time()
+            return True
+
+    def touch_tasks(self, task_ids: List[str], statuses: List[str]) -> None:
+        now = time.time()
+        with self._lock:
+            for task_id in task_ids:
+                meta = self._tasks.get(task_id)
+                if meta is not None and meta["status"] in statuses:
+                    meta["updated_at"] = now
+
+    def load_task(self, task_id: str, with_results: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            meta = self._tasks.get(task_id)
+            if meta is None:
+                return None
+            results = self._results.get(task_id, {})
+            if not with_results:
+                return {**meta, "result_count": len(results)}
+            return {**meta, "results": [results[seq] for seq in sorted(results)]}
+
+    def load_results(self, task_id: str, start: int = 0) -> List[dict]:
+        with self._lock:
+            results = self._results.get(task_id, {})
+            return [results[seq] for seq in sorted(results) if seq >= start]
+
+    def delete_tasks(self, task_ids: List[str]) -> None:
+        with self._lock:
+            for task_id in task_ids:
+                self._tasks.pop(task_id, None)
+                self._results.pop(task_id, None)
+
+    def expired_task_ids(self, created_before: float, max_tasks: int) -> List[str]:
+        with self._lock:
+            ordered = sorted(self._tasks.values(), key=lambda meta: meta["created_at"])
+        expired = [meta["task_id"] for meta in ordered if meta["created_at"] < created_before]
+        remaining = [meta["task_id"] for meta in ordered if meta["created_at"] >= created_before]
+        overflow = len(remaining) - max_tasks
+        return expired + (remaining[:overflow] if overflow > 0 else [])
+
+    def mark_unfinished(self, unfinished_statuses: List[str], status: str,
+                        updated_before: Optional[float] = None) -> int:
+        count = 0
+        with self._lock:
+            for meta in self._tasks.values():
+                if meta["status"] in unfinished_statuses and (
+                        updated_before is None or meta["updated_at"] < updated_before):
+                    meta["status"] = status
+                    meta["updated_at"] = time.time()
+                    count += 1
+        return count
+
+    def count(self) -> int:
+        return len(self._tasks)
+
+
+class SQLiteTaskBackend(TaskBackend):
+    """
+    SQLite任务存储
+
+    - tasks 表：任务元数据（状态、进度、URL列表、错误列表）
+    - task_results 表：任务结果，按 (task_id, seq) 存储
+    - 写连接 + 锁，读连接 + 锁（读取不等待写入），线程池与事件循环中均可安全调用
+    - asave_task() / aadd_result() / aupdate_status_if() / atouch_tasks() 在单个写线程中按提交顺序写入，
+      跨进程锁等待不阻塞事件循环
+    - update_status_if() 是单条带条件的UPDATE，多个worker同时修改状态时只有一个成功；
+      save_task() 更新已有任务时不写status列
+    """
+
+    def __init__(self, db_path: str, shared: bool = False):
+        """
+        Args:
+            db_path: 数据库文件路径（":memory:" 表示内存数据库）
+            shared: 是否与其他worker进程共享（共享时不信任内存中的任务副本）
+        """
+        self.db_path = db_path
+        self.shared = shared
+
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-writer")
+        self._conn = _connect(db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                current INTEGER NOT NULL,
+                urls TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                errors TEXT NOT NULL,
+                current_url TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS task_results (
+                task_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (task_id, seq)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks(created_at)")
+        self._read_conn, self._read_lock = _connect_reader(db_path, self._conn, self._lock)
+
+    def save_task(self, meta: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tasks "
+                "(task_id, status, total, current, urls, user_id, errors, current_url, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(task_id) DO UPDATE SET total = excluded.total, current = excluded.current, "
+                "urls = excluded.urls, user_id = excluded.user_id, errors = excluded.errors, "
+                "current_url = excluded.current_url, created_at = excluded.created_at, "
+                "updated_at = excluded.updated_at",
+                (
+                    meta["task_id"], meta["status"], meta["total"], meta["current"],
+                    json.dumps(meta["urls"], ensure_ascii=False), meta["user_id"],
+                    json.dumps(meta["errors"], ensure_ascii=False), meta.get("current_url"),
+                    meta["created_at"], time.time()
+                )
+            )
+
+    def add_result(self, task_id: str, seq: int, result: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO task_results (task_id, seq, payload) VALUES (?, ?, ?)",
+                (task_id, seq, json.dumps(result, ensure_ascii=False))
+            )
+
+    async def asave_task(self, meta: Dict[str, Any]) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._writer, self.save_task, meta)
+
+    async def aadd_result(self, task_id: str, seq: int, result: dict) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._writer, self.add_result, task_id, seq, result)
+
+    def update_status_if(self, task_id: str, expected: List[str], status: str) -> bool:
+        placeholders = ",".join("?" * len(expected))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE tasks SET status = ?, updated_at = ? WHERE task_id = ? AND status IN ({placeholders})",
+                [status, time.time(), task_id, *expected]
+            )
+        return cursor.rowcount > 0
+
+    async def aupdate_status_if(self, task_id: str, expected: List[str], status: str) -> bool:
+        # 与 asave_task 使用同一个写线程：此前提交的元数据写入先完成
+        return await asyncio.get_running_loop().run_in_executor(
+            self._writer, self.update_status_if, task_id, expected, status
+        )
+
+    def touch_tasks(self, task_ids: List[str], statuses: List[str]) -> None:
+        if not task_ids:
+            return
+        id_placeholders = ",".join("?" * len(task_ids))
+        status_placeholders = ",".join("?" * len(statuses))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE tasks SET updated_at = ? WHERE task_id IN ({id_placeholders}) "
+                f"AND status IN ({status_placeholders})",
+                [time.time(), *task_ids, *statuses]
+            )
+
+    async def atouch_tasks(self, task_ids: List[str], statuses: List[str]) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._writer, self.touch_tasks, task_ids, statuses)
+
+    def load_task(self, task_id: str, with_results: bool = True) -> Optional[Dict[str, Any]]:
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT task_id, status, total, current, urls, user_id, errors, current_url, created_at "
+                "FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            result_count = self._read_conn.execute(
+                "SELECT COUNT(*) FROM task_results WHERE task_id = ?", (task_id,)
+            ).fetchone()[0]
+
+        task = {
+            "task_id": row[0],
+            "status": row[1],
+            "total": row[2],
+            "current": row[3],
+            "urls": json.loads(row[4]),
+            "user_id": row[5],
+            "errors": json.loads(row[6]),
+            "current_url": row[7],
+            "created_at": row[8],
+            "result_count": result_count
+        }
+        if with_results:
+            task["results"] = self.load_results(task_id)
+        return task
+
+    def load_results(self, task_id: str, start: int = 0) -> List[dict]:
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT payload FROM task_results WHERE task_id = ? AND seq >= ? ORDER BY seq", (task_id, start)
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def delete_tasks(self, task_ids: List[str]) -> None:
+        if not task_ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM task_results WHERE task_id = ?", [(t,) for t in task_ids])
+            self._conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(t,) for t in task_ids])
+            self._conn.execute("COMMIT")
+
+    def expired_task_ids(self, created_before: float, max_tasks: int) -> List[str]:
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT task_id FROM tasks WHERE created_at < ?", (created_before,)
+            )]
+            overflow = self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] - len(expired) - max_tasks
+            if overflow > 0:
+                expired += [row[0] for row in self._conn.execute(
+                    "SELECT task_id FROM tasks WHERE created_at >= ? ORDER BY created_at ASC LIMIT ?",
+                    (created_before, overflow)
+                )]
+        return expired
+
+    def mark_unfinished(self, unfinished_statuses: List[str], status: str,
+                        updated_before: Optional[float] = None) -> int:
+        placeholders = ",".join("?" * len(unfinished_statuses))
+        cutoff = updated_before if updated_before is not None else float("inf")
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE tasks SET status = ?, updated_at = ? WHERE status IN ({placeholders}) AND updated_at < ?",
+                [status, time.time(), *unfinished_statuses, cutoff]
+            )
+        return cursor.rowcount
+
+    def count(self) -> int:
+        with self._read_lock:
+            return self._read_conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+
+# ============ 进度日志 ============
+
+class ProgressLog(ABC):
+    """
+    SSE进度消息日志接口
+
+    - append() 为消息分配任务内单调递增的 seq，ID为 "{task_id}_{seq}"
+    - messages_after() 返回客户端缺失的消息；缺失部分已被淘汰时在开头插入resync通知
+    """
+
+    poll_interval: Optional[float] = None  # 订阅者轮询新消息的间隔（None表示只需进程内通知）
+
+    @abstractmethod
+    def append(self, task_id: str, message: dict) -> int:
+        """
+        追加消息（就地写入 seq 和 id）
+
+        Returns:
+            int: 分配的序号
+        """
+
+    async def aappend(self, task_id: str, message: dict) -> int:
+        """
+        追加消息（事件循环内调用，默认直接写入）
+
+        Returns:
+            int: 分配的序号
+        """
+        return self.append(task_id, message)
+
+    @abstractmethod
+    def last_seq(self, task_id: str) -> int:
+        """任务最新消息的序号，没有消息时为0"""
+
+    @abstractmethod
+    def first_seq(self, task_id: str) -> int:
+        """日志中最旧消息的序号（为空时为下一条消息的序号）"""
+
+    @abstractmethod
+    def after(self, task_id: str, seq: int) -> List[dict]:
+        """序号大于seq的消息（按序号升序）"""
+
+    @abstractmethod
+    def latest(self, task_id: str) -> Optional[dict]:
+        """最新一条消息"""
+
+    @abstractmethod
+    def clear(self, task_id: str) -> None:
+        """删除任务的全部消息"""
+
+    @abstractmethod
+    def idle_task_ids(self, idle_before: float) -> List[str]:
+        """最后一条消息早于idle_before的任务"""
+
+    @abstractmethod
+    def task_count(self) -> int:
+        """有消息的任务数"""
+
+    @abstractmethod
+    def message_count(self, task_id: str) -> int:
+        """任务的消息数"""
+
+    def has_task(self, task_id: str) -> bool:
+        """任务是否有消息"""
+        return self.last_seq(task_id) > 0
+
+    async def alast_seq(self, task_id: str) -> int:
+        """任务最新消息的序号（事件循环内调用，默认直接读取）"""
+        return self.last_seq(task_id)
+
+    async def amessages_after(self, task_id: str, after_seq: int) -> List[dict]:
+        """返回序号大于after_seq的消息（事件循环内调用，默认直接读取）"""
+        return self.messages_after(task_id, after_seq)
+
+    def messages_after(self, task_id: str, after_seq: int) -> List[dict]:
+        """
+        返回序号大于after_seq的消息
+
+        若期间的消息已被淘汰，在列表开头插入一条resync通知（不带ID，不占用序号），
+        客户端据此得知有消息缺失，应通过任务状态接口重新同步
+
+        Args:
+            task_id: 任务ID
+            after_seq: 客户端已收到的最大序号
+
+        Returns:
+            消息列表
+        """
+        last_seq = self.last_seq(task_id)
+        if last_seq == 0:
+            return []
+
+        if after_seq > last_seq:
+            # 序号来自被清除的旧日志，无法判断缺失范围，从头发送
+            after_seq = 0
+
+        messages = self.after(task_id, after_seq)
+        first_seq = messages[0]['seq'] if messages else self.first_seq(task_id)
+        if after_seq + 1 < first_seq:
+            messages.insert(0, {
+                "type": "resync",
+                "task_id": task_id,
+                "missed_from": after_seq + 1,
+                "missed_to": first_seq - 1,
+                "message": f"消息 {after_seq + 1}-{first_seq - 1} 已过期，请重新获取任务状态",
+                "timestamp": time.time()
+            })
+        return messages
+
+
+class MessageBuffer:
+    """
+    单个任务的消息环形缓冲区
+
+    - 按序号递增追加，总字节数超过上限时从最旧的消息开始淘汰（至少保留最新一条）
+    - 淘汰只移动起始下标，定期压缩底层列表
+    """
+
+    COMPACT_THRESHOLD = 256  # 起始下标超过该值且超过一半时压缩列表
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.messages: List[Optional[dict]] = []
+        self.sizes: List[int] = []
+        self.start = 0
+        self.total_bytes = 0
+        self.last_seq = 0
+        self.evicted = 0
+        self.updated_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.messages) - self.start
+
+    @property
+    def first_seq(self) -> int:
+        """缓冲区中最旧消息的序号（为空时为下一条消息的序号）"""
+        if self.start < len(self.messages):
+            return self.messages[self.start]['seq']
+        return self.last_seq + 1
+
+    def append(self, message: dict, size: int) -> None:
+        """
+        追加消息并按字节上限淘汰旧消息
+
+        Args:
+            message: 已分配seq的消息
+            size: 消息序列化后的字节数
+        """
+        self.messages.append(message)
+        self.sizes.append(size)
+        self.total_bytes += size
+        self.last_seq = message['seq']
+        self.updated_at = time.time()
+
+        while self.total_bytes > self.max_bytes and len(self) > 1:
+            self.total_bytes -= self.sizes[self.start]
+            self.messages[self.start] = None
+            self.start += 1
+            self.evicted += 1
+
+        if self.start > self.COMPACT_THRESHOLD and self.start * 2 > len(self.messages):
+            del self.messages[:self.start]
+            del self.sizes[:self.start]
+            self.start = 0
+
+    def after(self, seq: int) -> List[dict]:
+        """
+        返回序号大于seq的消息（二分查找，O(log n)）
+
+        Args:
+            seq: 已收到的最大序号
+
+        Returns:
+            消息列表
+        """
+        index = bisect.bisect_right(self.messages, seq, lo=self.start, key=lambda message: message['seq'])
+        return self.messages[index:]
+
+    def latest(self) -> Optional[dict]:
+        """最新一条消息"""
+        return self.messages[-1] if len(self) else None
+
+
+class InMemoryProgressLog(ProgressLog):
+    """进程内进度日志（每个任务一个按字节数限制的环形缓冲区）"""
+
+    def __init__(self, max_bytes_per_task: int = 2 * 1024 * 1024):
+        """
+        Args:
+            max_bytes_per_task: 每个任务缓存消息的最大字节数（JSON序列化后）
+        """
+        self.max_bytes_per_task = max_bytes_per_task
+        self.buffers: Dict[str, MessageBuffer] = {}
+
+    def append(self, task_id: str, message: dict) -> int:
+        buffer = self.buffers.get(task_id)
+        if buffer is None:
+            buffer = self.buffers[task_id] = MessageBuffer(self.max_bytes_per_task)
+
+        seq = buffer.last_seq + 1
+        message['seq'] = seq
+        message['id'] = f"{task_id}_{seq}"
+        buffer.append(message, len(json.dumps(message)))
+        return seq
+
+    def last_seq(self, task_id: str) -> int:
+        buffer = self.buffers.get(task_id)
+        return buffer.last_seq if buffer else 0
+
+    def first_seq(self, task_id: str) -> int:
+        buffer = self.buffers.get(task_id)
+        return buffer.first_seq if buffer else 1
+
+    def after(self, task_id: str, seq: int) -> List[dict]:
+        buffer = self.buffers.get(task_id)
+        return buffer.after(seq) if buffer else []
+
+    def latest(self, task_id: str) -> Optional[dict]:
+        buffer = self.buffers.get(task_id)
+        return buffer.latest() if buffer else None
+
+    def clear(self, task_id: str) -> None:
+        self.buffers.pop(task_id, None)
+
+    def idle_task_ids(self, idle_before: float) -> List[str]:
+        return [task_id for task_id, buffer in self.buffers.items() if buffer.updated_at < idle_before]
+
+    def task_count(self) -> int:
+        return len(self.buffers)
+
+    def message_count(self, task_id: str) -> int:
+        return len(self.buffers.get(task_id, ()))
+
+
+class SQLiteProgressLog(ProgressLog):
+    """
+    SQLite进度日志（多个worker进程共享）
+
+    - 序号在写事务（BEGIN IMMEDIATE）内分配，多进程并发写入时仍单调递增且不重复
+    - 每个任务超过字节上限时删除最旧的消息
+    - 其他进程写入的消息无法通知本进程，订阅者按 poll_interval 轮询
+    - aappend() 在单个写线程中按提交顺序写入，跨进程锁等待不阻塞事件循环
+    - 读取使用单独的连接和锁，不等待写事务（BEGIN IMMEDIATE）；订阅者轮询（alast_seq / amessages_after）在线程中读取
+    """
+
+    TRIM_EVERY = 50  # 每个任务每写入N条检查一次字节上限
+
+    def __init__(self, db_path: str, max_bytes_per_task: int = 2 * 1024 * 1024, poll_interval: float = 0.5):
+        """
+        Args:
+            db_path: 数据库文件路径
+            max_bytes_per_task: 每个任务保留消息的最大字节数
+            poll_interval: 订阅者轮询间隔（秒）
+        """
+        self.db_path = db_path
+        self.max_bytes_per_task = max_bytes_per_task
+        self.poll_interval = poll_interval
+        self._appends: Dict[str, int] = {}
+
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progress-log")
+        self._conn = _connect(db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS progress_log (
+                task_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (task_id, seq)
+            )
+        """)
+        self._read_conn, self._read_lock = _connect_reader(db_path, self._conn, self._lock)
+
+    def append(self, task_id: str, message: dict) -> int:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT MAX(seq) FROM progress_log WHERE task_id = ?", (task_id,)
+                ).fetchone()
+                seq = (row[0] or 0) + 1
+                message['seq'] = seq
+                message['id'] = f"{task_id}_{seq}"
+                payload = json.dumps(message)
+                self._conn.execute(
+                    "INSERT INTO progress_log (task_id, seq, payload, size, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (task_id, seq, payload, len(payload), time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            appends = self._appends.get(task_id, 0) + 1
+            self._appends[task_id] = appends
+            if appends % self.TRIM_EVERY == 0:
+                self._trim(task_id)
+        return seq
+
+    async def aappend(self, task_id: str, message: dict) -> int:
+        # 单个写线程保证同一进程内的消息按提交顺序分配序号
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self.append, task_id, message)
+
+    async def alast_seq(self, task_id: str) -> int:
+        return await asyncio.to_thread(self.last_seq, task_id)
+
+    async def amessages_after(self, task_id: str, after_seq: int) -> List[dict]:
+        return await asyncio.to_thread(self.messages_after, task_id, after_seq)
+
+    def _trim(self, task_id: str) -> None:
+        """删除超出字节上限的最旧消息（至少保留最新一条，调用方持有锁）"""
+        total = 0
+        cutoff = None
+        for seq, size in self._conn.execute(
+            "SELECT seq, size FROM progress_log WHERE task_id = ? ORDER BY seq DESC", (task_id,)
+        ):
+            total += size
+            if total > self.max_bytes_per_task and cutoff is not None:
+                break
+            cutoff = seq
+        else:
+            return
+        self._conn.execute("DELETE FROM progress_log WHERE task_id = ? AND seq < ?", (task_id, cutoff))
+
+    def _scalar(self, sql: str, params: Tuple) -> Any:
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchone()[0]
+
+    def last_seq(self, task_id: str) -> int:
+        return self._scalar("SELECT COALESCE(MAX(seq), 0) FROM progress_log WHERE task_id = ?", (task_id,))
+
+    def first_seq(self, task_id: str) -> int:
+        first = self._scalar("SELECT MIN(seq) FROM progress_log WHERE task_id = ?", (task_id,))
+        return first if first is not None else self.last_seq(task_id) + 1
+
+    def after(self, task_id: str, seq: int) -> List[dict]:
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT payload FROM progress_log WHERE task_id = ? AND seq > ? ORDER BY seq", (task_id, seq)
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def latest(self, task_id: str) -> Optional[dict]:
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT payload FROM progress_log WHERE task_id = ? ORDER BY seq DESC LIMIT 1", (task_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def clear(self, task_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM progress_log WHERE task_id = ?", (task_id,))
+            self._appends.pop(task_id, None)
+
+    def idle_task_ids(self, idle_before: float) -> List[str]:
+        with self._read_lock:
+            return [row[0] for row in self._read_conn.execute(
+                "SELECT task_id FROM progress_log GROUP BY task_id HAVING MAX(created_at) < ?", (idle_before,)
+            )]
+
+    def task_count(self) -> int:
+        return self._scalar("SELECT COUNT(DISTINCT task_id) FROM progress_log", ())
+
+    def message_count(self, task_id: str) -> int:
+        return self._scalar("SELECT COUNT(*) FROM progress_log WHERE task_id = ?", (task_id,))
+
+
+# ============ 全局后端 ============
+
+# 全局后端实例（首次使用时创建，避免导入时创建数据库文件）
+task_backend: Optional[TaskBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_task_backend() -> TaskBackend:
+    """
+    获取任务状态后端（由 settings.task_backend 决定）
+
+    Returns:
+        TaskBackend: SQLite后端；配置为 "memory" 或SQLite初始化失败时为进程内后端
+    """
+    global task_backend
+    if task_backend is None:
+        with _backend_lock:
+            if task_backend is None:
+                task_backend = InMemoryTaskBackend()
+                if settings.task_backend != "memory":
+                    try:
+                        task_backend = SQLiteTaskBackend(
+                            settings.task_store_path, shared=settings.task_backend == "sqlite_shared"
+                        )
+                        print(f"[TASK BACKEND] 任务持久化已启用: {settings.task_store_path} ({settings.task_backend})")
+                    except Exception as e:
+                        print(f"[TASK BACKEND] [WARNING] 存储初始化失败，任务仅保存在内存中: {e}")
+
+    return task_backend
+
+
+def create_progress_log() -> ProgressLog:
+    """
+    创建进度日志（由 settings.task_backend 决定）
+
+    Returns:
+        ProgressLog: "sqlite_shared" 时为SQLite共享日志，否则为进程内日志
+    """
+    if settings.task_backend == "sqlite_shared":
+        try:
+            log = SQLiteProgressLog(
+                settings.task_store_path,
+                max_bytes_per_task=settings.sse_buffer_max_bytes,
+                poll_interval=settings.sse_shared_poll_seconds
+            )
+            print(f"[TASK BACKEND] 进度日志跨进程共享: {settings.task_store_path}")
+            return log
+        except Exception as e:
+            print(f"[TASK BACKEND] [WARNING] 共享进度日志初始化失败，使用进程内日志: {e}")
+
+    return InMemoryProgressLog(settings.sse_buffer_max_bytes)
@@ -1,11 +1,38 @@
 # task_manager.py
 # 作用：管理批量处理任务的状态和进度
+# 功能：
+#   - 任务状态写穿到 TaskBackend（默认SQLite），进程重启后已完成任务的结果仍可查询
+#   - 内存中只保留最近访问的任务（LRU，数量上限 + 空闲时间），其余按需从存储加载
+#   - 任务结果不常驻内存：逐条追加写入存储，读取 task.results 时从存储加载
+#   - 批量处理在事件循环中使用异步版本的状态更新（aupdate_progress / aadd_result 等），存储写入不阻塞事件循环
+#   - 后台循环定期淘汰内存中的空闲任务，并按保留时间/数量上限清理存储
+#   - 共享后端（多worker）下只缓存本进程创建或修改的任务，其他任务每次从存储读取
+#   - 启动时把上次运行遗留的未完成任务标记为已中断（INTERRUPTED），可通过恢复接口继续
+#   - 状态变化只通过比较并设置写入存储；后台循环为本进程运行中的任务刷新最后更新时间（心跳）
 
+import asyncio
+import time
 import uuid
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
 from dataclasses import dataclass, field
+from app.config import settings
 from app.enums import TaskStatus
+from app.task_backend import TaskBackend, get_task_backend
+
+# 已结束的任务状态（可以从内存中淘汰）
+FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.INTERRUPTED, TaskStatus.CANCELLED)
+
+# 未结束的任务状态（完成、失败、取消只能从这些状态转换，其他worker已中断/取消的任务不会被覆盖）
+UNFINISHED_STATUSES = [TaskStatus.PENDING, TaskStatus.PROCESSING]
+
+# 后台循环刷新本进程运行中任务的最后更新时间的间隔（心跳，秒）
+HEARTBEAT_INTERVAL_SECONDS = 60
+
+# 共享后端下，超过该时间未更新的未完成任务才视为上次运行遗留（运行中的任务每个心跳间隔刷新一次，
+# 连续错过多次心跳才会被其他worker判定为遗留）
+STALE_TASK_SECONDS = 10 * HEARTBEAT_INTERVAL_SECONDS
 
 @dataclass
 class Task:
@@ -16,11 +43,31 @@ class Task:
     current: int
     urls: List[str]
     user_id: str
-    results: List[dict] = field(default_factory=list)
     errors: List[str] = field(default_factory=list)
     current_url: Optional[str] = None
     created_at: datetime = field(default_factory=datetime.now)
-    
+    result_count: int = 0  # 结果数（结果本身在存储中，按需读取）
+    results_loader: Optional[Callable[[int], List[dict]]] = field(default=None, repr=False, compare=False)
+
+    @property
+    def results(self) -> List[dict]:
+        """全部处理结果（每次从存储读取）"""
+        return self.load_results()
+
+    def load_results(self, start: int = 0) -> List[dict]:
+        """
+        从存储读取结果
+
+        Args:
+            start: 起始序号（增量查询时跳过已读取的结果）
+
+        Returns:
+            list: 第start条及之后的结果
+        """
+        if self.results_loader is None or start >= self.result_count:
+            return []
+        return self.results_loader(start)
+
     def to_dict(self):
         """转换为字典"""
         return {
@@ -36,13 +83,109 @@ class Task:
             "created_at": self.created_at.isoformat()
         }
 
+    def to_meta(self) -> dict:
+        """转换为存储用的元数据字典（不含结果，created_at为时间戳）"""
+        return {
+            "task_id": self.task_id,
+            "status": self.status.value,
+            "total": self.total,
+            "current": self.current,
+            "urls": self.urls,
+            "user_id": self.user_id,
+            "errors": self.errors,
+            "current_url": self.current_url,
+            "created_at": self.created_at.timestamp()
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Task":
+        """从存储读取的字典恢复任务"""
+        return cls(
+            task_id=data["task_id"],
+            status=TaskStatus(data["status"]),
+            total=data["total"],
+            current=data["current"],
+            urls=data["urls"],
+            user_id=data["user_id"],
+            errors=data.get("errors", []),
+            current_url=data.get("current_url"),
+            created_at=datetime.fromtimestamp(data["created_at"]),
+            result_count=data.get("result_count", len(data.get("results", [])))
+        )
+
 
 class TaskManager:
     """任务管理器 - 管理所有后台处理任务"""
-    
-    def __init__(self):
-        self.tasks: Dict[str, Task] = {}
-    
+
+    def __init__(self, backend: Optional[TaskBackend] = None, max_memory_tasks: Optional[int] = None,
+                 memory_ttl_seconds: Optional[int] = None):
+        """
+        Args:
+            backend: 任务存储后端（默认使用全局 get_task_backend()）
+            max_memory_tasks: 内存中保留的最大任务数（默认settings.task_memory_max_tasks）
+            memory_ttl_seconds: 已结束任务在内存中的最长空闲时间（默认settings.task_memory_ttl_seconds）
+        """
+        self.tasks: "OrderedDict[str, Task]" = OrderedDict()  # 热任务（按最近访问排序）
+        self.backend = backend
+        self.max_memory_tasks = max_memory_tasks or settings.task_memory_max_tasks
+        self.memory_ttl_seconds = memory_ttl_seconds or settings.task_memory_ttl_seconds
+        self._last_access: Dict[str, float] = {}
+        self._owned = set()  # 本进程创建或修改过的任务（共享后端下内存副本可信）
+        self._result_locks: Dict[str, asyncio.Lock] = {}  # 每个任务的结果写入锁（aadd_result）
+        self.disk_loads = 0
+        self.memory_evictions = 0
+
+    def _get_backend(self) -> TaskBackend:
+        return self.backend if self.backend is not None else get_task_backend()
+
+    def _bind(self, task: Task) -> Task:
+        """结果按需从存储读取"""
+        task_id = task.task_id
+        task.results_loader = lambda start: self._get_backend().load_results(task_id, start)
+        return task
+
+    def _remember(self, task: Task) -> None:
+        """放入内存（最近访问），超出数量上限时淘汰最久未访问的已结束任务"""
+        self.tasks[task.task_id] = task
+        self.tasks.move_to_end(task.task_id)
+        self._last_access[task.task_id] = time.time()
+
+        if len(self.tasks) > self.max_memory_tasks:
+            for task_id in [t for t, old in self.tasks.items() if old.status in FINISHED_STATUSES]:
+                if len(self.tasks) <= self.max_memory_tasks:
+                    break
+                self._forget(task_id)
+
+    def _forget(self, task_id: str) -> None:
+        """从内存中移除任务（磁盘上的数据保留）"""
+        self.tasks.pop(task_id, None)
+        self._last_access.pop(task_id, None)
+        self._owned.discard(task_id)
+        self._result_locks.pop(task_id, None)
+        self.memory_evictions += 1
+
+    def _own(self, task: Task) -> None:
+        """修改过的任务由本进程持有（内存副本可信）"""
+        self._owned.add(task.task_id)
+        if task.task_id not in self.tasks:
+            self._remember(task)
+
+    def _persist(self, task: Task) -> None:
+        """写穿任务元数据到存储（修改过的任务由本进程持有）"""
+        self._own(task)
+        try:
+            self._get_backend().save_task(task.to_meta())
+        except Exception as e:
+            print(f"[TASK MANAGER] [WARNING] 任务写入存储失败: {task.task_id}, {e}")
+
+    async def _apersist(self, task: Task) -> None:
+        """写穿任务元数据到存储（异步版本，存储在写线程中写入，不阻塞事件循环）"""
+        self._own(task)
+        try:
+            await self._get_backend().asave_task(task.to_meta())
+        except Exception as e:
+            print(f"[TASK MANAGER] [WARNING] 任务写入存储失败: {task.task_id}, {e}")
+
     def create_task(self, urls: List[str], user_id: str = "default") -> str:
         """
         创建新任务
@@ -55,76 +198,420 @@ class TaskManager:
             task_id: 任务ID
         """
         task_id = str(uuid.uuid4())
-        task = Task(
+        task = self._bind(Task(
             task_id=task_id,
             status=TaskStatus.PENDING,
             total=len(urls),
             current=0,
             urls=urls,
             user_id=user_id
-        )
-        self.tasks[task_id] = task
+        ))
+        self._persist(task)
         
         print(f"[TASK MANAGER] 创建任务: {task_id}, URLs: {len(urls)}")
         return task_id
     
     def get_task(self, task_id: str) -> Optional[Task]:
-        """获取任务"""
-        return self.tasks.get(task_id)
+        """
+        获取任务
+
+        内存命中为O(1)；未命中时从存储按主键加载一次并放回内存。
+        共享后端下其他worker的任务不缓存，每次从存储读取最新状态
+        """
+        backend = self._get_backend()
+        task = self.tasks.get(task_id)
+        if task is not None and (not backend.shared or task_id in self._owned):
+            self.tasks.move_to_end(task_id)
+            self._last_access[task_id] = time.time()
+            return task
+
+        try:
+            data = backend.load_task(task_id, with_results=False)
+        except Exception as e:
+            print(f"[TASK MANAGER] [WARNING] 读取任务失败: {task_id}, {e}")
+            return None
+        if data is None:
+            return None
+
+        task = self._bind(Task.from_dict(data))
+        self.disk_loads += 1
+        if not backend.shared:
+            self._remember(task)
+        return task
     
+    # ==================== 状态更新 ====================
+    # 同步方法直接写入存储；事件循环中（批量处理）使用 a 开头的异步版本，存储写入不阻塞事件循环
+    # 元数据写入（save_task）不含状态，状态变化都通过 update_status_if 比较并设置
+
     def update_status(self, task_id: str, status: TaskStatus):
-        """更新任务状态"""
-        if task_id in self.tasks:
-            self.tasks[task_id].status = status
+        """更新任务状态（不限当前状态）"""
+        self.update_status_if(task_id, list(TaskStatus), status)
+
+    async def aupdate_status(self, task_id: str, status: TaskStatus):
+        """更新任务状态（异步版本）"""
+        await self.aupdate_status_if(task_id, list(TaskStatus), status)
+
+    def _apply_status_if(self, task_id: str, status: TaskStatus, updated: bool) -> bool:
+        """比较并设置的结果同步到内存：成功时更新内存副本，失败时丢弃（状态已被其他worker修改）"""
+        task = self.tasks.get(task_id)
+        if updated:
+            if task is not None:
+                task.status = status
+                self._own(task)
             print(f"[TASK MANAGER] 任务 {task_id} 状态: {status.value}")
-    
+        elif task is not None:
+            # 下次读取时从存储加载最新状态
+            self.tasks.pop(task_id, None)
+            self._last_access.pop(task_id, None)
+            self._owned.discard(task_id)
+        return updated
+
+    def update_status_if(self, task_id: str, expected: List[TaskStatus], status: TaskStatus) -> bool:
+        """
+        当前状态在expected中时才更新任务状态（开始、取消、恢复等状态转换使用）
+
+        直接在存储中比较并设置，不信任内存副本：共享后端下其他worker可能已修改了状态
+
+        Args:
+            task_id: 任务ID
+            expected: 允许的当前状态
+            status: 新状态
+
+        Returns:
+            bool: 是否更新
+        """
+        try:
+            updated = self._get_backend().update_status_if(task_id, [s.value for s in expected], status.value)
+        except Exception as e:
+            print(f"[TASK MANAGER] [WARNING] 任务状态更新失败: {task_id}, {e}")
+            return False
+        return self._apply_status_if(task_id, status, updated)
+
+    async def aupdate_status_if(self, task_id: str, expected: List[TaskStatus], status: TaskStatus) -> bool:
+        """当前状态在expected中时才更新任务状态（异步版本）"""
+        try:
+            updated = await self._get_backend().aupdate_status_if(
+                task_id, [s.value for s in expected], status.value
+            )
+        except Exception as e:
+            print(f"[TASK MANAGER] [WARNING] 任务状态更新失败: {task_id}, {e}")
+            return False
+        return self._apply_status_if(task_id, status, updated)
+
+    def _set_progress(self, task_id: str, current: int, current_url: Optional[str]) -> Optional[Task]:
+        task = self.get_task(task_id)
+        if task:
+            task.current = current
+            task.current_url = current_url
+            print(f"[TASK MANAGER] 任务 {task_id} 进度: {current}/{task.total}")
+        return task
+
     def update_progress(self, task_id: str, current: int, current_url: str = None):
-        """更新任务进度"""
-        if task_id in self.tasks:
-            self.tasks[task_id].current = current
-            self.tasks[task_id].current_url = current_url
-            self.tasks[task_id].status = TaskStatus.PROCESSING
-            print(f"[TASK MANAGER] 任务 {task_id} 进度: {current}/{self.tasks[task_id].total}")
-    
+        """更新任务进度（排队中的任务变为处理中）"""
+        task = self._set_progress(task_id, current, current_url)
+        if task:
+            self._persist(task)
+            if task.status != TaskStatus.PROCESSING:
+                self.update_status_if(task_id, UNFINISHED_STATUSES, TaskStatus.PROCESSING)
+
+    async def aupdate_progress(self, task_id: str, current: int, current_url: str = None):
+        """更新任务进度（异步版本）"""
+        task = self._set_progress(task_id, current, current_url)
+        if task:
+            await self._apersist(task)
+            if task.status != TaskStatus.PROCESSING:
+                await self.aupdate_status_if(task_id, UNFINISHED_STATUSES, TaskStatus.PROCESSING)
+
     def add_result(self, task_id: str, result: dict):
-        """添加处理结果"""
-        if task_id in self.tasks:
-            self.tasks[task_id].results.append(result)
-            print(f"[TASK MANAGER] 任务 {task_id} 添加结果，总数: {len(self.tasks[task_id].results)}")
-    
+        """添加处理结果（结果只追加写入存储，内存中只记录结果数）"""
+        task = self.get_task(task_id)
+        if task:
+            try:
+                self._get_backend().add_result(task_id, task.result_count, result)
+            except Exception as e:
+                print(f"[TASK MANAGER] [WARNING] 结果写入存储失败: {task_id}, {e}")
+                return
+            task.result_count += 1
+            self._persist(task)
+            print(f"[TASK MANAGER] 任务 {task_id} 添加结果，总数: {task.result_count}")
+
+    async def aadd_result(self, task_id: str, result: dict):
+        """添加处理结果（异步版本）"""
+        task = self.get_task(task_id)
+        if task:
+            # 同一任务的结果逐条写入：写入成功后才计数，失败的写入不会留下空缺的序号
+            async with self._result_locks.setdefault(task_id, asyncio.Lock()):
+                seq = task.result_count
+                try:
+                    await self._get_backend().aadd_result(task_id, seq, result)
+                except Exception as e:
+                    print(f"[TASK MANAGER] [WARNING] 结果写入存储失败: {task_id}, {e}")
+                    return
+                task.result_count = seq + 1
+            await self._apersist(task)
+            print(f"[TASK MANAGER] 任务 {task_id} 添加结果，总数: {task.result_count}")
+
+    def _append_error(self, task_id: str, error: str) -> Optional[Task]:
+        task = self.get_task(task_id)
+        if task:
+            task.errors.append(error)
+            print(f"[TASK MANAGER] 任务 {task_id} 添加错误: {error}")
+        return task
+
     def add_error(self, task_id: str, error: str):
         """添加错误信息"""
-        if task_id in self.tasks:
-            self.tasks[task_id].errors.append(error)
-            print(f"[TASK MANAGER] 任务 {task_id} 添加错误: {error}")
-    
+        task = self._append_error(task_id, error)
+        if task:
+            self._persist(task)
+
+    async def aadd_error(self, task_id: str, error: str):
+        """添加错误信息（异步版本）"""
+        task = self._append_error(task_id, error)
+        if task:
+            await self._apersist(task)
+
+    def _drop_errors(self, task_id: str, prefixes: List[str]) -> Optional[Task]:
+        """删除以指定前缀开头的错误信息，返回有错误被删除的任务"""
+        task = self.get_task(task_id)
+        if not task or not prefixes:
+            return None
+        prefixes = tuple(prefixes)
+        kept = [error for error in task.errors if not error.startswith(prefixes)]
+        removed = len(task.errors) - len(kept)
+        if not removed:
+            return None
+        task.errors = kept
+        print(f"[TASK MANAGER] 任务 {task_id} 清除 {removed} 条重试URL的旧错误")
+        return task
+
+    def remove_errors(self, task_id: str, prefixes: List[str]) -> None:
+        """删除以指定前缀开头的错误信息（恢复任务时清除将要重试的URL的旧错误）"""
+        task = self._drop_errors(task_id, prefixes)
+        if task:
+            self._persist(task)
+
+    async def aremove_errors(self, task_id: str, prefixes: List[str]) -> None:
+        """删除以指定前缀开头的错误信息（异步版本）"""
+        task = self._drop_errors(task_id, prefixes)
+        if task:
+            await self._apersist(task)
+
     def complete_task(self, task_id: str):
         """完成任务"""
-        if task_id in self.tasks:
-            self.tasks[task_id].status = TaskStatus.COMPLETED
-            print(f"[TASK MANAGER] 任务 {task_id} 完成")
-    
+        task = self.get_task(task_id)
+        if task:
+            self._persist(task)
+            if self.update_status_if(task_id, UNFINISHED_STATUSES, TaskStatus.COMPLETED):
+                print(f"[TASK MANAGER] 任务 {task_id} 完成")
+
+    async def acomplete_task(self, task_id: str):
+        """完成任务（异步版本）"""
+        task = self.get_task(task_id)
+        if task:
+            await self._apersist(task)
+            if await self.aupdate_status_if(task_id, UNFINISHED_STATUSES, TaskStatus.COMPLETED):
+                print(f"[TASK MANAGER] 任务 {task_id} 完成")
+
     def fail_task(self, task_id: str, error: str):
         """任务失败"""
-        if task_id in self.tasks:
-            self.tasks[task_id].status = TaskStatus.FAILED
-            self.tasks[task_id].errors.append(error)
-            print(f"[TASK MANAGER] 任务 {task_id} 失败: {error}")
-    
-    def cleanup_old_tasks(self, max_age_hours: int = 24):
-        """清理旧任务（可选）"""
+        task = self._append_error(task_id, error)
+        if task:
+            self._persist(task)
+            if self.update_status_if(task_id, UNFINISHED_STATUSES, TaskStatus.FAILED):
+                print(f"[TASK MANAGER] 任务 {task_id} 失败: {error}")
+
+    def _clear_current_url(self, task_id: str) -> Optional[Task]:
+        task = self.get_task(task_id)
+        if task:
+            task.current_url = None
+        return task
+
+    def cancel_task(self, task_id: str, reason: str):
+        """任务取消（已完成URL的结果保留）"""
+        task = self._clear_current_url(task_id)
+        if task:
+            self._persist(task)
+            if self.update_status_if(task_id, UNFINISHED_STATUSES, TaskStatus.CANCELLED):
+                print(f"[TASK MANAGER] 任务 {task_id} 已取消: {reason}")
+
+    async def acancel_task(self, task_id: str, reason: str):
+        """任务取消（异步版本）"""
+        task = self._clear_current_url(task_id)
+        if task:
+            await self._apersist(task)
+            if await self.aupdate_status_if(task_id, UNFINISHED_STATUSES, TaskStatus.CANCELLED):
+                print(f"[TASK MANAGER] 任务 {task_id} 已取消: {reason}")
+
+    def _running_task_ids(self) -> List[str]:
+        """本进程持有的未结束任务（心跳刷新）"""
+        return [
+            task_id for task_id in self._owned
+            if task_id in self.tasks and self.tasks[task_id].status in UNFINISHED_STATUSES
+        ]
+
+    async def aheartbeat(self) -> int:
+        """
+        刷新本进程运行中任务的最后更新时间（心跳）
+
+        共享后端下重启的worker据此区分遗留任务和其他worker正在处理的任务
+
+        Returns:
+            int: 刷新的任务数
+        """
+        task_ids = self._running_task_ids()
+        if task_ids:
+            try:
+                await self._get_backend().atouch_tasks(task_ids, [s.value for s in UNFINISHED_STATUSES])
+            except Exception as e:
+                print(f"[TASK MANAGER] [WARNING] 任务心跳写入失败: {e}")
+                return 0
+        return len(task_ids)
+
+    def evict_idle_tasks(self) -> int:
+        """
+        从内存中淘汰空闲超时的已结束任务（存储中的数据保留）
+
+        Returns:
+            int: 淘汰的任务数
+        """
+        cutoff = time.time() - self.memory_ttl_seconds
+        idle = [
+            task_id for task_id, task in self.tasks.items()
+            if task.status in FINISHED_STATUSES and self._last_access.get(task_id, 0) < cutoff
+        ]
+        for task_id in idle:
+            self._forget(task_id)
+        return len(idle)
+
+    def _expired_in_memory(self, max_age_hours: int) -> List[str]:
+        """内存中超过保留时间的已结束任务（在事件循环中调用）"""
         now = datetime.now()
-        to_delete = []
-        
-        for task_id, task in self.tasks.items():
-            age = (now - task.created_at).total_seconds() / 3600
-            if age > max_age_hours:
-                to_delete.append(task_id)
-        
+        return [
+            task_id for task_id, task in self.tasks.items()
+            if (now - task.created_at).total_seconds() / 3600 > max_age_hours and task.status in FINISHED_STATUSES
+        ]
+
+    def _active_task_ids(self) -> set:
+        """内存中仍在处理的任务（不清理）"""
+        return {task_id for task_id, task in self.tasks.items() if task.status not in FINISHED_STATUSES}
+
+    def _expire_stored(self, max_age_hours: int, max_stored_tasks: int, active: set) -> List[str]:
+        """
+        按保留时间和数量上限删除存储中的任务
+
+        只访问存储，不读写 self.tasks，可以放到线程中执行
+
+        Returns:
+            list: 删除的任务ID
+        """
+        backend = self._get_backend()
+        try:
+            expired = backend.expired_task_ids(time.time() - max_age_hours * 3600, max_stored_tasks)
+            expired = [task_id for task_id in expired if task_id not in active]
+            backend.delete_tasks(expired)
+            return expired
+        except Exception as e:
+            print(f"[TASK MANAGER] [WARNING] 清理存储失败: {e}")
+            return []
+
+    def _forget_expired(self, task_ids: List[str]) -> int:
+        """从内存中移除已清理的任务（在事件循环中调用）"""
+        to_delete = list(dict.fromkeys(task_ids))
         for task_id in to_delete:
-            del self.tasks[task_id]
+            if task_id in self.tasks:
+                self._forget(task_id)
             print(f"[TASK MANAGER] 清理旧任务: {task_id}")
+        return len(to_delete)
+
+    def cleanup_old_tasks(self, max_age_hours: Optional[int] = None, max_stored_tasks: Optional[int] = None) -> int:
+        """
+        清理旧任务（内存和存储）
+
+        Args:
+            max_age_hours: 保留时间（小时，默认settings.task_retention_hours）
+            max_stored_tasks: 存储中保留的最大任务数（默认settings.task_max_stored_tasks）
+
+        Returns:
+            int: 清理的任务数
+        """
+        max_age_hours = max_age_hours or settings.task_retention_hours
+        max_stored_tasks = max_stored_tasks or settings.task_max_stored_tasks
+        to_delete = self._expired_in_memory(max_age_hours)
+        to_delete += self._expire_stored(max_age_hours, max_stored_tasks, self._active_task_ids())
+        return self._forget_expired(to_delete)
+
+    async def acleanup_old_tasks(self, max_age_hours: Optional[int] = None,
+                                 max_stored_tasks: Optional[int] = None) -> int:
+        """
+        清理旧任务（异步版本）
+
+        内存中的任务表只在事件循环中读写，只有存储的查询和删除放到线程中执行
+
+        Returns:
+            int: 清理的任务数
+        """
+        max_age_hours = max_age_hours or settings.task_retention_hours
+        max_stored_tasks = max_stored_tasks or settings.task_max_stored_tasks
+        to_delete = self._expired_in_memory(max_age_hours)
+        to_delete += await asyncio.to_thread(
+            self._expire_stored, max_age_hours, max_stored_tasks, self._active_task_ids()
+        )
+        return self._forget_expired(to_delete)
+
+    def recover_unfinished_tasks(self) -> int:
+        """
+        启动时将上次运行遗留的未完成任务标记为已中断（可通过恢复接口继续）
+
+        共享后端下其他worker可能正在处理任务（每 HEARTBEAT_INTERVAL_SECONDS 刷新一次最后更新时间），
+        只标记超过 STALE_TASK_SECONDS 未更新的任务
+
+        Returns:
+            int: 标记的任务数
+        """
+        backend = self._get_backend()
+        count = backend.mark_unfinished(
+            [s.value for s in UNFINISHED_STATUSES],
+            TaskStatus.INTERRUPTED.value,
+            updated_before=time.time() - STALE_TASK_SECONDS if backend.shared else None
+        )
+        if count:
+            print(f"[TASK MANAGER] 上次运行遗留 {count} 个未完成任务，已标记为中断（可恢复）")
+        return count
+
+    def get_stats(self) -> dict:
+        """获取任务管理器统计"""
+        backend = self._get_backend()
+        return {
+            "backend": type(backend).__name__,
+            "shared": backend.shared,
+            "memory_tasks": len(self.tasks),
+            "max_memory_tasks": self.max_memory_tasks,
+            "stored_tasks": backend.count(),
+            "disk_loads": self.disk_loads,
+            "memory_evictions": self.memory_evictions
+        }
 
 
 # 全局任务管理器实例
 task_manager = TaskManager()
+
+
+async def eviction_loop(interval_seconds: int = HEARTBEAT_INTERVAL_SECONDS):
+    """后台淘汰任务：刷新运行中任务的心跳，释放内存中的空闲任务，清理过期任务"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await task_manager.aheartbeat()
+            evicted = task_manager.evict_idle_tasks()
+            removed = await task_manager.acleanup_old_tasks()
+            if evicted or removed:
+                print(f"[TASK MANAGER] 内存淘汰 {evicted} 个任务，清理 {removed} 个过期任务")
+        except Exception as e:
+            print(f"[TASK MANAGER] [WARNING] 淘汰任务失败: {e}")
+
+
+def start_eviction_task():
+    """启动后台淘汰任务（应用启动时调用）"""
+    task_manager.recover_unfinished_tasks()
+    asyncio.create_task(eviction_loop())
+    print("[TASK MANAGER] 任务淘汰循环已启动")
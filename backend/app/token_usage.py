@@ -0,0 +1,205 @@
+# token_usage.py
+# 作用：LLM调用的token用量统计与归因
+# 功能：
+#   - 每次LLM调用成功后记录 response.usage 中的 prompt / completion / total tokens
+#   - 每条记录带有阶段（shadow_writing / quality / correction / search_optimizer / speaker_extractor）、
+#     task_id、用户ID和模型，按各维度在内存中汇总
+#   - 阶段和task_id通过 ContextVar 传给LLM调用（与用户/优先级、截止时间的传递方式相同）
+#   - 各维度附带占总token的比例，用于判断哪个阶段/用户消耗了TPM额度
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from app.fair_scheduler import current_tenant
+
+# 未标注阶段的调用
+UNKNOWN_STAGE = "other"
+
+# 最多保留的任务数（超过后丢弃最早的任务）
+MAX_TRACKED_TASKS = 1000
+
+# 当前LLM调用所属的阶段和任务，子任务和LLM调用自动继承
+_stage: ContextVar[Optional[str]] = ContextVar("llm_stage", default=None)
+_task_id: ContextVar[Optional[str]] = ContextVar("llm_task_id", default=None)
+
+
+@contextmanager
+def llm_stage(stage: Optional[str]):
+    """
+    设置当前LLM调用所属的阶段（退出时恢复）
+
+    Args:
+        stage: 阶段名（None时不改变）
+    """
+    if stage is None:
+        yield
+        return
+    token = _stage.set(stage)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+@contextmanager
+def usage_task(task_id: Optional[str]):
+    """
+    设置当前LLM调用所属的任务（退出时恢复）
+
+    Args:
+        task_id: 任务ID（None时不改变）
+    """
+    if task_id is None:
+        yield
+        return
+    token = _task_id.set(task_id)
+    try:
+        yield
+    finally:
+        _task_id.reset(token)
+
+
+def current_stage() -> str:
+    """当前LLM调用所属的阶段"""
+    return _stage.get() or UNKNOWN_STAGE
+
+
+def current_task_id() -> Optional[str]:
+    """当前LLM调用所属的任务（未设置时为None）"""
+    return _task_id.get()
+
+
+def _as_int(value: Any) -> int:
+    """usage 字段转为整数（缺失或类型不对时为0）"""
+    return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def _empty_usage() -> Dict[str, int]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+
+def _add(bucket: Dict[str, int], prompt_tokens: int, completion_tokens: int, total_tokens: int) -> None:
+    bucket["calls"] += 1
+    bucket["prompt_tokens"] += prompt_tokens
+    bucket["completion_tokens"] += completion_tokens
+    bucket["total_tokens"] += total_tokens
+
+
+class TokenUsageTracker:
+    """token用量汇总（线程安全）"""
+
+    def __init__(self, max_tasks: int = MAX_TRACKED_TASKS):
+        self.max_tasks = max_tasks
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """清空统计"""
+        with self._lock:
+            self.totals = _empty_usage()
+            self.by_stage: Dict[str, Dict[str, int]] = {}
+            self.by_model: Dict[str, Dict[str, int]] = {}
+            self.by_user: Dict[str, Dict[str, int]] = {}
+            self.by_stage_model: Dict[str, Dict[str, Dict[str, int]]] = {}
+            self.tasks: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, total_tokens: Optional[int] = None,
+               stage: Optional[str] = None, task_id: Optional[str] = None, user_id: Optional[str] = None) -> None:
+        """
+        记录一次LLM调用的token用量
+
+        Args:
+            model: 模型名称
+            prompt_tokens: 输入token数
+            completion_tokens: 输出token数
+            total_tokens: 总token数（默认两者之和）
+            stage: 阶段（默认取当前上下文）
+            task_id: 任务ID（默认取当前上下文）
+            user_id: 用户ID（默认取当前上下文）
+        """
+        stage = stage or current_stage()
+        task_id = task_id if task_id is not None else _task_id.get()
+        user_id = user_id or current_tenant()[0]
+        if total_tokens is None:
+            total_tokens = prompt_tokens + completion_tokens
+        counts = (prompt_tokens, completion_tokens, total_tokens)
+
+        with self._lock:
+            _add(self.totals, *counts)
+            _add(self.by_stage.setdefault(stage, _empty_usage()), *counts)
+            _add(self.by_model.setdefault(model, _empty_usage()), *counts)
+            _add(self.by_user.setdefault(user_id, _empty_usage()), *counts)
+            _add(self.by_stage_model.setdefault(stage, {}).setdefault(model, _empty_usage()), *counts)
+
+            if task_id:
+                task = self.tasks.get(task_id)
+                if task is None:
+                    task = self.tasks[task_id] = {"user_id": user_id, **_empty_usage(), "by_stage": {}}
+                    while len(self.tasks) > self.max_tasks:
+                        self.tasks.popitem(last=False)
+                _add(task, *counts)
+                _add(task["by_stage"].setdefault(stage, _empty_usage()), *counts)
+
+    def record_response(self, model: str, response: Any) -> None:
+        """
+        从litellm响应中读取 usage 并记录（没有 usage 或没有token数时忽略）
+
+        Args:
+            model: 模型名称
+            response: litellm completion/acompletion 的返回值
+        """
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        prompt_tokens = _as_int(getattr(usage, "prompt_tokens", None))
+        completion_tokens = _as_int(getattr(usage, "completion_tokens", None))
+        total_tokens = _as_int(getattr(usage, "total_tokens", None)) or prompt_tokens + completion_tokens
+        if total_tokens:
+            self.record(model, prompt_tokens, completion_tokens, total_tokens)
+
+    def get_task_usage(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取单个任务的token用量
+
+        Returns:
+            dict | None: 总用量和按阶段的用量，没有记录时返回None
+        """
+        with self._lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return None
+            return {**task, "by_stage": {stage: dict(usage) for stage, usage in task["by_stage"].items()}}
+
+    def _with_share(self, buckets: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, Any]]:
+        """为每个维度附加占总token的百分比"""
+        total = self.totals["total_tokens"]
+        return {
+            name: {**usage, "share": round(usage["total_tokens"] / total * 100, 2) if total else 0.0}
+            for name, usage in sorted(buckets.items(), key=lambda item: -item[1]["total_tokens"])
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取token用量汇总
+
+        Returns:
+            dict: 总用量，按阶段/模型/用户的用量（含占比），按阶段×模型的用量，最近任务数
+        """
+        with self._lock:
+            return {
+                "totals": dict(self.totals),
+                "by_stage": self._with_share(self.by_stage),
+                "by_model": self._with_share(self.by_model),
+                "by_user": self._with_share(self.by_user),
+                "by_stage_model": {
+                    stage: {model: dict(usage) for model, usage in models.items()}
+                    for stage, models in self.by_stage_model.items()
+                },
+                "tracked_tasks": len(self.tasks)
+            }
+
+
+# 全局token用量统计
+token_usage = TokenUsageTracker()
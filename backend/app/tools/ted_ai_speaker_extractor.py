@@ -5,6 +5,7 @@ TED AI演讲者提取工具
 """
 
 from app.utils import create_llm_function_light
+from app.token_usage import llm_stage
 import re
 import json
 
@@ -57,11 +58,12 @@ class TedAISpeakerExtractor:
             user_prompt = self._build_prompt(title, url, content, speaker_from_url)
             
             # 调用AI提取演讲者
-            response = self.llm(
-                user_prompt=user_prompt,
-                output_format={"speaker": "str"},
-                temperature=0.1
-            )
+            with llm_stage("speaker_extractor"):
+                response = self.llm(
+                    user_prompt=user_prompt,
+                    output_format={"speaker": "str"},
+                    temperature=0.1
+                )
             
             if response and "speaker" in response:
                 speaker = response["speaker"].strip()
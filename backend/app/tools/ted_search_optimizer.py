@@ -7,6 +7,7 @@
 
 from typing import List
 from app.utils import create_llm_function_light
+from app.token_usage import llm_stage
 
 
 def optimize_search_query(user_topic: str) -> str:
@@ -50,7 +51,8 @@ Output the optimized keywords as a string in JSON format.
     
     try:
         llm = create_llm_function_light()
-        result = llm(prompt, {"keywords": "Optimized search keywords as space-separated string, str"}, temperature=0.1)
+        with llm_stage("search_optimizer"):
+            result = llm(prompt, {"keywords": "Optimized search keywords as space-separated string, str"}, temperature=0.1)
         
         if result and isinstance(result, dict):
             keywords = result.get("keywords", user_topic)
@@ -110,7 +112,8 @@ Output in JSON format with the key "alternatives".
     
     try:
         llm = create_llm_function_light()
-        result = llm(prompt, {"alternatives": "List of 3 alternative query strings, list[str]"}, temperature=0.2)
+        with llm_stage("search_optimizer"):
+            result = llm(prompt, {"alternatives": "List of 3 alternative query strings, list[str]"}, temperature=0.2)
         
         if result and isinstance(result, dict):
             # 尝试多个可能的key名称（LLM可能使用不同的命名）
@@ -1,11 +1,26 @@
-from litellm import completion
+from litellm import completion, acompletion
 from app.config import settings, get_config_provider, Settings
 import json
 import time
 import asyncio
+import threading
 from collections import deque
-from typing import Callable, Optional, Dict, Any
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Optional, Dict, Any, List, Tuple
 from app.monitoring.api_key_monitor import api_key_monitor
+from app.llm_scheduler import (
+    llm_scheduler, Reservation, DEFAULT_KEY_ID,
+    estimate_tokens, normalize_rate_limit_headers
+)
+from app.llm_cache import get_llm_cache
+from app.cancellation import remaining_time, deadline_exceeded
+from app.fair_scheduler import FairSlot, fair_scheduler
+from app.token_usage import token_usage, llm_stage
+from app.json_repair import (
+    parse_llm_json_with_method, json_repair_stats, record_lossy_result, LOSSLESS_METHODS, METHOD_DIRECT
+)
+from app.llm_hedging import llm_hedger
+from app.provider_router import provider_router, DEFAULT_PROVIDER, Route
 from fastapi import Depends
 
 def ensure_dependencies():
@@ -42,52 +57,78 @@ class APIKeyManager:
         self.key_cooldown = {}  # 记录每个 Key 的冷却结束时间戳
         self.total_calls = 0  # 总调用次数
         self.total_switches = 0  # 总切换次数
+        self._lock = threading.Lock()  # 多线程/协程共享时保护轮换状态
+        # Key ID 在初始化时固定，不随轮换顺序变化
+        self.key_ids = {key: f"KEY_{i+1}" for i, key in enumerate(keys)}
         
         # 【监控集成】注册所有Key到监控器
-        for i, key in enumerate(keys):
-            key_id = f"KEY_{i+1}"
+        for key, key_id in self.key_ids.items():
             api_key_monitor.register_key(key_id, key)
         
         print(f"API Key 管理器初始化: {len(keys)} 个 Key, 冷却时间 {cooldown_seconds}秒")
     
+    def _select_key(self) -> tuple[str, float]:
+        """选择当前可用的 Key（不等待）
+
+        Returns:
+            tuple: (API Key, 需要等待的秒数)，有可用 Key 时等待时间为0
+        """
+        with self._lock:
+            current_time = time.time()
+
+            # 尝试找到一个不在冷却期的 Key
+            for _ in range(len(self.keys)):
+                key = self.keys[0]
+                cooldown_until = self.key_cooldown.get(key, 0)
+
+                if current_time >= cooldown_until:
+                    # 找到可用的 Key
+                    return key, 0.0
+
+                # 当前 Key 还在冷却，尝试下一个
+                remaining_time = int(cooldown_until - current_time)
+                print(f"Key ***{key[-8:]} 冷却中，剩余 {remaining_time}秒")
+                self.keys.rotate(-1)
+
+            # 所有 Key 都在冷却，返回冷却最早结束的 Key
+            key = min(self.keys, key=lambda k: self.key_cooldown.get(k, 0))
+            wait_time = max(0.0, self.key_cooldown.get(key, 0) - current_time)
+            return key, wait_time
+
     def get_key(self) -> str:
-        """获取当前可用的 Key
-        
+        """获取当前可用的 Key（同步版本，所有 Key 冷却时阻塞当前线程）
+
         Returns:
             str: 当前可用的 API Key
         """
-        current_time = time.time()
-        
-        # 尝试找到一个不在冷却期的 Key
-        for _ in range(len(self.keys)):
-            key = self.keys[0]
-            cooldown_until = self.key_cooldown.get(key, 0)
-            
-            if current_time >= cooldown_until:
-                # 找到可用的 Key
-                return key
-            
-            # 当前 Key 还在冷却，尝试下一个
-            remaining_time = int(cooldown_until - current_time)
-            print(f"Key ***{key[-8:]} 冷却中，剩余 {remaining_time}秒")
-            self.keys.rotate(-1)
-        
-        # 所有 Key 都在冷却，返回第一个并等待
-        key = self.keys[0]
-        cooldown_until = self.key_cooldown.get(key, 0)
-        wait_time = max(0, cooldown_until - current_time)
-        
+        key, wait_time = self._select_key()
+
         if wait_time > 0:
             print(f"所有 Key 都在冷却中，等待 {int(wait_time)}秒...")
             time.sleep(wait_time)
-        
+
         return key
-    
+
+    async def aget_key(self) -> str:
+        """获取当前可用的 Key（异步版本，冷却期间让出事件循环）
+
+        Returns:
+            str: 当前可用的 API Key
+        """
+        key, wait_time = self._select_key()
+
+        if wait_time > 0:
+            print(f"所有 Key 都在冷却中，异步等待 {int(wait_time)}秒...")
+            await asyncio.sleep(wait_time)
+
+        return key
+
     def rotate_key(self):
         """切换到下一个 Key"""
-        self.keys.rotate(-1)
-        self.total_switches += 1
-        new_key = self.keys[0]
+        with self._lock:
+            self.keys.rotate(-1)
+            self.total_switches += 1
+            new_key = self.keys[0]
         print(f"切换到下一个 API Key: ***{new_key[-8:]}")
     
     def mark_failure(self, key: str, error_message: str):
@@ -136,6 +177,24 @@ class APIKeyManager:
         else:
             print(f"[ERROR] Key ***{key[-8:]} 调用失败（非速率限制）: {error_message[:100]}")
     
+    def get_available_keys(self) -> List[str]:
+        """获取当前不在冷却期的 Key 列表（按轮换顺序）
+
+        Returns:
+            list: 可立即使用的 API Key
+        """
+        with self._lock:
+            current_time = time.time()
+            return [key for key in self.keys if self.key_cooldown.get(key, 0) <= current_time]
+
+    def get_healthy_key_count(self) -> int:
+        """获取当前不在冷却期的 Key 数量
+
+        Returns:
+            int: 可立即使用的 Key 数量
+        """
+        return len(self.get_available_keys())
+
     def _get_key_id(self, key: str) -> Optional[str]:
         """根据Key值获取Key ID
         
@@ -145,10 +204,7 @@ class APIKeyManager:
         Returns:
             str: Key ID (如: KEY_1) 或 None
         """
-        for i, k in enumerate(self.keys):
-            if k == key:
-                return f"KEY_{i+1}"
-        return None
+        return self.key_ids.get(key)
     
     def get_stats(self) -> dict:
         """获取统计信息
@@ -170,7 +226,10 @@ class APIKeyManager:
 class ConcurrencyLimiter:
     """并发请求限制器
 
-    使用信号量控制同时进行的API请求数量，避免过载
+    限制同时进行的API请求数量，避免过载
+
+    同时支持同步调用（线程中的 call_llm）和异步调用（事件循环中的 acall_llm），
+    两类调用方共享同一组许可，按先来先服务的顺序交接
     """
 
     def __init__(self, max_concurrent: int = 3):
@@ -180,21 +239,108 @@ class ConcurrencyLimiter:
             max_concurrent: 最大并发请求数，默认3个
         """
         self.max_concurrent = max_concurrent
-        self.semaphore = asyncio.Semaphore(max_concurrent)
         self.active_requests = 0
+        self.total_waits = 0  # 需要排队的请求次数
+        self._lock = threading.Lock()
+        # 等待者：threading.Event（同步）或 (loop, future)（异步）
+        self._waiters: deque = deque()
         print(f"并发限制器初始化: 最大并发 {max_concurrent} 个请求")
 
+    @property
+    def waiting_requests(self) -> int:
+        """当前排队等待的请求数"""
+        return len(self._waiters)
+
+    def _try_acquire(self, waiter) -> bool:
+        """有空闲许可且无人排队时直接获取，否则加入等待队列"""
+        with self._lock:
+            if self.active_requests < self.max_concurrent and not self._waiters:
+                self.active_requests += 1
+                return True
+            self._waiters.append(waiter)
+            self.total_waits += 1
+            return False
+
+    def acquire_sync(self) -> None:
+        """获取并发许可（同步版本，阻塞当前线程）"""
+        event = threading.Event()
+        if not self._try_acquire(event):
+            event.wait()
+        print(f"[并发控制] 请求开始，当前活跃: {self.active_requests}/{self.max_concurrent}")
+
     async def acquire(self) -> None:
-        """获取并发许可"""
-        await self.semaphore.acquire()
-        self.active_requests += 1
+        """获取并发许可（异步版本）"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+
+        if not self._try_acquire(waiter):
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    try:
+                        self._waiters.remove(waiter)
+                        handed_off = False
+                    except ValueError:
+                        handed_off = True
+                # 许可已交接给本请求但未被使用，继续交给下一个等待者
+                if handed_off and future.done() and not future.cancelled():
+                    self.release()
+                raise
+
         print(f"[并发控制] 请求开始，当前活跃: {self.active_requests}/{self.max_concurrent}")
 
     def release(self) -> None:
-        """释放并发许可"""
-        self.semaphore.release()
-        self.active_requests -= 1
-        print(f"[并发控制] 请求完成，当前活跃: {self.active_requests}/{self.max_concurrent}")
+        """释放并发许可（有等待者时直接交接，不减少活跃数）"""
+        with self._lock:
+            if not self._waiters:
+                self.active_requests -= 1
+                waiter = None
+            else:
+                waiter = self._waiters.popleft()
+
+        if waiter is None:
+            print(f"[并发控制] 请求完成，当前活跃: {self.active_requests}/{self.max_concurrent}")
+        else:
+            self._wake(waiter)
+
+    def _wake(self, waiter) -> None:
+        """唤醒等待者"""
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+
+        loop, future = waiter
+
+        def resolve():
+            if future.done():
+                # 等待者已取消，许可转交下一个
+                self.release()
+            else:
+                future.set_result(True)
+
+        try:
+            loop.call_soon_threadsafe(resolve)
+        except RuntimeError:
+            # 事件循环已关闭
+            self.release()
+
+    def get_stats(self) -> dict:
+        """获取并发统计"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active_requests": self.active_requests,
+            "waiting_requests": self.waiting_requests,
+            "total_waits": self.total_waits
+        }
+
+    def __enter__(self):
+        self.acquire_sync()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
 
     async def __aenter__(self):
         await self.acquire()
@@ -218,6 +364,23 @@ def initialize_concurrency_limiter(max_concurrent: int = 3):
     concurrency_limiter = ConcurrencyLimiter(max_concurrent)
 
 
+def _llm_slot():
+    """获取LLM并发许可的上下文管理器（未初始化限制器时不限制）"""
+    return concurrency_limiter if concurrency_limiter else nullcontext()
+
+
+def _fair_slot(cost: float):
+    """获取公平调度名额的异步上下文管理器（未启用公平调度时不限制）"""
+    return fair_scheduler.slot(cost) if settings.fair_scheduler_enabled else nullcontext()
+
+
+async def _outside_fair_slot(slot: Optional[FairSlot], awaitable: Awaitable) -> Any:
+    """等待速率额度或Key冷却期间交出公平调度名额，让其他请求（如交互式请求）先调用（未启用时直接等待）"""
+    if slot is None:
+        return await awaitable
+    return await slot.suspend(awaitable)
+
+
 # 全局 API Key 管理器实例
 api_key_manager: Optional[APIKeyManager] = None
 
@@ -327,132 +490,590 @@ def initialize_key_manager(cooldown_seconds: int = 60):
 
 # ==================== LLM 调用函数 ====================
 
-def create_llm_function(system_prompt: Optional[str] = None, model: Optional[str] = None) -> Callable:
+RATE_LIMIT_KEYWORDS = ['rate', 'limit', 'quota', 'exceeded', 'too many']
+
+
+def _is_rate_limit_error(error_msg: str) -> bool:
+    """判断错误信息是否为速率限制错误"""
+    error_lower = error_msg.lower()
+    return any(keyword in error_lower for keyword in RATE_LIMIT_KEYWORDS)
+
+
+# 没有HTTP状态码时按错误信息判断服务端故障
+SERVICE_ERROR_KEYWORDS = ['timeout', 'timed out', 'connection', 'unavailable', 'overloaded',
+                          'internal server error', 'bad gateway']
+
+
+def _is_failover_error(error: Exception, is_rate_limit: bool) -> bool:
+    """判断错误是否应切换到其他候选：429、5xx、超时或连接错误
+
+    400（请求格式错误、上下文超长）等客户端错误换提供商也无法解决，不能让候选进入冷却
+    """
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in (408, 429) or status_code >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    error_lower = str(error).lower()
+    return is_rate_limit or any(keyword in error_lower for keyword in SERVICE_ERROR_KEYWORDS)
+
+
+def _build_completion_kwargs(
+    system_prompt: Optional[str],
+    model: Optional[str],
+    user_prompt: str,
+    output_format: Optional[Dict],
+    temperature: Optional[float],
+    api_key: str,
+    provider: str = DEFAULT_PROVIDER
+) -> Dict[str, Any]:
+    """构建 LiteLLM completion/acompletion 的调用参数"""
+    # 构建消息列表
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": user_prompt})
+
+    kwargs = {
+        "model": f"{provider}/{model or settings.model_name}",  # 使用传入的model或默认值
+        "messages": messages,
+        "temperature": temperature if temperature is not None else settings.temperature,
+        "api_key": api_key,  # 使用当前 Key
+    }
+
+    # 如果需要 JSON 输出
+    if output_format:
+        kwargs["response_format"] = {"type": "json_object"}
+
+    return kwargs
+
+
+def _record_llm_call(key_id: Optional[str], start_time: float, success: bool,
+                     rate_limited: bool = False, response: Any = None) -> None:
+    """【监控集成】记录一次 LLM 调用"""
+    if not key_id:
+        return
+
+    response_headers = None
+    if response is not None:
+        # 从response中获取x-ratelimit-*响应头（LiteLLM可能不提供）
+        response_headers = normalize_rate_limit_headers(response)
+
+    api_key_monitor.record_call(
+        key_id=key_id,
+        success=success,
+        response_time=time.time() - start_time,
+        rate_limited=rate_limited,
+        response_headers=response_headers
+    )
+
+
+def _reserve_llm_call(model_name: str, tokens: int, keys: List[str]) -> Tuple[str, Optional[str], Optional[Reservation]]:
+    """在候选 Key 中预约 RPM/TPM 额度
+
+    Args:
+        model_name: 模型名称
+        tokens: 预估token数
+        keys: 候选 API Key（不在冷却期）
+
+    Returns:
+        tuple: (选中的 API Key, 监控用 Key ID, 额度预约)，未启用调度时预约为None
+    """
+    def monitor_key_id(key: str) -> Optional[str]:
+        return api_key_manager._get_key_id(key) if api_key_manager else None
+
+    if not settings.llm_scheduler_enabled:
+        return keys[0], monitor_key_id(keys[0]), None
+
+    keys_by_id = {monitor_key_id(key) or DEFAULT_KEY_ID: key for key in keys}
+    reservation = llm_scheduler.reserve(keys_by_id.keys(), model_name, tokens)
+    key = keys_by_id[reservation.key_id]
+    return key, monitor_key_id(key), reservation
+
+
+def _settle_llm_call(reservation: Optional[Reservation], response: Any = None,
+                     rate_limited: bool = False, error_msg: str = "") -> None:
+    """结算额度预约：成功时按实际用量修正，429时清空该Key额度"""
+    if reservation is None:
+        return
+
+    if rate_limited:
+        llm_scheduler.on_rate_limited(reservation.key_id, reservation.model, error_msg)
+
+    actual_tokens = None
+    headers = None
+    if response is not None:
+        usage = getattr(response, "usage", None)
+        actual_tokens = getattr(usage, "total_tokens", None) if usage else None
+        if not isinstance(actual_tokens, int):
+            actual_tokens = None
+        headers = normalize_rate_limit_headers(response)
+    llm_scheduler.settle(reservation, actual_tokens, headers)
+
+
+def _refund_llm_call(reservation: Optional[Reservation], sent: bool) -> None:
+    """请求被取消：未发出的请求退还全部额度，已发出的请求按只消耗了prompt结算，退还预估的输出token"""
+    if reservation is None:
+        return
+    if sent:
+        llm_scheduler.settle(reservation, reservation.tokens - settings.llm_estimated_completion_tokens)
+    else:
+        llm_scheduler.cancel(reservation)
+
+
+def _start_hedge_call(kwargs: Dict[str, Any], model_name: str, estimated_tokens: int,
+                      primary_key: str) -> Optional[Any]:
+    """用主请求以外的Key发起对冲请求
+
+    只使用当前有额度的Key（需要排队等额度时不对冲）
+
+    Returns:
+        协程或None（没有其他可用Key或额度）
+    """
+    if not api_key_manager:
+        return None
+    candidates = [key for key in api_key_manager.get_available_keys() if key != primary_key]
+    if not candidates:
+        return None
+    key, key_id, reservation = _reserve_llm_call(model_name, estimated_tokens, candidates)
+    if reservation and reservation.wait > 0:
+        llm_scheduler.cancel(reservation)
+        return None
+    return _ahedge_call({**kwargs, "api_key": key}, key_id, reservation)
+
+
+async def _ahedge_call(kwargs: Dict[str, Any], key_id: Optional[str], reservation: Optional[Reservation]) -> Any:
+    """执行对冲请求，自行结算额度和记录监控（与主请求共用并发许可）"""
+    start_time = time.time()
+    try:
+        response = await acompletion(**kwargs)
+    except asyncio.CancelledError:
+        _refund_llm_call(reservation, sent=True)
+        raise
+    except Exception as e:
+        error_msg = str(e)
+        is_rate_limit = _is_rate_limit_error(error_msg)
+        _settle_llm_call(reservation, rate_limited=is_rate_limit, error_msg=error_msg)
+        _record_llm_call(key_id, start_time, success=False, rate_limited=is_rate_limit)
+        if is_rate_limit and api_key_manager:
+            api_key_manager.mark_failure(kwargs["api_key"], error_msg)
+        print(f"[HEDGE] 对冲请求失败: {e}")
+        raise
+
+    _settle_llm_call(reservation, response)
+    _record_llm_call(key_id, start_time, success=True, response=response)
+    return response
+
+
+def _check_deadline(reservation: Optional[Reservation]) -> None:
+    """任务截止前等不到额度（或已超时）：立即放弃并退还额度，留给其他任务
+
+    Raises:
+        DeadlineExceeded: 剩余时间不足
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return
+    if remaining <= 0 or (reservation and reservation.wait >= remaining):
+        if reservation:
+            llm_scheduler.cancel(reservation)
+        raise deadline_exceeded(f"任务剩余 {max(remaining, 0):.1f}秒，不足以等待LLM额度")
+
+
+def _estimate_call_tokens(system_prompt: Optional[str], user_prompt: str) -> int:
+    """预估一次调用的token数（prompt + 预估输出）"""
+    return estimate_tokens(system_prompt, user_prompt) + settings.llm_estimated_completion_tokens
+
+
+def _lookup_llm_cache(use_cache: bool, model_name: str, temperature: Optional[float],
+                      system_prompt: Optional[str], user_prompt: str,
+                      output_format: Optional[Dict]) -> Tuple[Optional[str], Any]:
+    """查询LLM响应缓存
+
+    Returns:
+        tuple: (缓存键, 缓存结果)；未启用缓存时键为None，未命中时结果为None
+    """
+    cache = get_llm_cache() if use_cache else None
+    if cache is None:
+        return None, None
+
+    effective_temperature = temperature if temperature is not None else settings.temperature
+    cache_key = cache.make_key(model_name, effective_temperature, system_prompt, user_prompt, output_format)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        print(f"[LLM CACHE] 命中缓存 {cache_key[:12]}（{model_name}），跳过API调用")
+    return cache_key, cached
+
+
+def _store_llm_cache(cache_key: Optional[str], result: Any) -> None:
+    """保存成功的LLM结果到缓存"""
+    if cache_key is None or result is None:
+        return
+    cache = get_llm_cache()
+    if cache is not None:
+        try:
+            cache.set(cache_key, result)
+        except Exception as e:
+            print(f"[LLM CACHE] [WARNING] 写入缓存失败: {e}")
+
+
+def _routed_cache_key(cache_key: Optional[str], route: Optional[Route], model_name: str) -> Optional[str]:
+    """路由切换到其他 提供商/模型 时不写入缓存（缓存键按请求的模型计算，不能把其他模型的回复当作该模型的）"""
+    if route is not None and route != Route(DEFAULT_PROVIDER, model_name):
+        return None
+    return cache_key
+
+
+def _lossless_cache_key(cache_key: Optional[str], method: str) -> Optional[str]:
+    """本地修复（修复格式、截断补全）的结果不写入缓存：一次有缺陷的回复不能成为该prompt长期的答案"""
+    return cache_key if method in LOSSLESS_METHODS else None
+
+
+def _max_llm_attempts() -> int:
+    """最大尝试次数：首次调用 + 每个 Key 重试一次（启用多提供商路由时再加上每个候选一次）"""
+    return 1 + (len(api_key_manager.keys) if api_key_manager else 0) + provider_router.max_failovers()
+
+
+_reask_llm: Optional[Callable] = None
+
+
+def _get_reask_llm() -> Callable:
+    """JSON重新请求使用的轻量LLM函数（不缓存、不再嵌套重新请求）"""
+    global _reask_llm
+    if _reask_llm is None:
+        _reask_llm = create_llm_function(model=settings.llm_json_reask_model, use_cache=False, json_reask=False)
+    return _reask_llm
+
+
+def _render_reask_prompt(content: str, output_format: Dict) -> str:
+    """渲染JSON重新请求的prompt：只发送无法修复的回复和期望字段，不重发原prompt"""
+    from app.prompts import prompt_manager
+    return prompt_manager.render_prompt(
+        "json_repair.reask",
+        output_format=json.dumps(output_format, ensure_ascii=False, indent=2),
+        content=content
+    )
+
+
+def _reask_json(content: Optional[str], output_format: Dict) -> Any:
+    """本地无法修复时，用轻量模型把原始回复整理为JSON（settings.llm_json_reask_enabled）"""
+    if not settings.llm_json_reask_enabled or not content:
+        return None
+    print(f"[JSON REPAIR] 本地修复失败，使用 {settings.llm_json_reask_model} 重新整理")
+    with llm_stage("json_reask"):
+        result = _get_reask_llm()(_render_reask_prompt(content, output_format), output_format, temperature=0)
+    json_repair_stats.record_reask(result is not None)
+    if result is not None:
+        record_lossy_result()
+    return result
+
+
+async def _areask_json(content: Optional[str], output_format: Dict) -> Any:
+    """_reask_json 的异步版本"""
+    if not settings.llm_json_reask_enabled or not content:
+        return None
+    print(f"[JSON REPAIR] 本地修复失败，使用 {settings.llm_json_reask_model} 重新整理")
+    with llm_stage("json_reask"):
+        result = await _get_reask_llm().async_version(
+            _render_reask_prompt(content, output_format), output_format, temperature=0
+        )
+    json_repair_stats.record_reask(result is not None)
+    if result is not None:
+        record_lossy_result()
+    return result
+
+
+def create_llm_function(system_prompt: Optional[str] = None, model: Optional[str] = None,
+                        use_cache: bool = True, json_reask: bool = True) -> Callable:
     """创建 LLM 调用函数
 
     Args:
         system_prompt: 系统提示词（可选）
         model: 模型名称（可选，默认使用settings.model_name）
+        use_cache: 是否使用LLM响应缓存（默认True，全局开关为settings.llm_cache_enabled）
+        json_reask: JSON无法修复时是否用轻量模型重新整理（默认True，全局开关为settings.llm_json_reask_enabled）
 
     Returns:
         callable: LLM 调用函数
     """
 
-    def call_llm(user_prompt: str, output_format: Optional[Dict] = None, temperature: Optional[float] = None, _retry_count: int = 0) -> Any:
-        """调用 LLM（支持自动 Key 切换）
+    def call_llm(user_prompt: str, output_format: Optional[Dict] = None, temperature: Optional[float] = None,
+                 bypass_cache: bool = False) -> Any:
+        """调用 LLM（支持自动 Key 切换、响应缓存）
 
         Args:
             user_prompt: 用户提示词
             output_format: 输出格式字典（如果指定，则返回 JSON）
             temperature: 温度参数（可选）
-            _retry_count: 重试计数（内部使用）
+            bypass_cache: 为True时跳过缓存，强制调用API
 
         Returns:
-            str or dict: LLM 响应内容
+            str or dict: LLM 响应内容，失败返回 None
         """
-        # 获取当前可用的 API Key
-        if api_key_manager:
-            current_key = api_key_manager.get_key()
-            api_key_manager.total_calls += 1
-            key_id = api_key_manager._get_key_id(current_key)
-        else:
-            current_key = settings.groq_api_key
-            key_id = None
+        model_name = model or settings.model_name
+        cache_key, cached = _lookup_llm_cache(
+            use_cache and not bypass_cache, model_name, temperature, system_prompt, user_prompt, output_format
+        )
+        if cached is not None:
+            return cached
 
-        start_time = time.time()  # 【监控集成】记录开始时间
+        max_attempts = _max_llm_attempts()
+        estimated_tokens = _estimate_call_tokens(system_prompt, user_prompt)
 
-        try:
-            # 构建消息列表
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            messages.append({"role": "user", "content": user_prompt})
-
-            # 调用参数
-            kwargs = {
-                "model": f"groq/{model or settings.model_name}",  # 使用传入的model或默认值
-                "messages": messages,
-                "temperature": temperature if temperature is not None else settings.temperature,
-                "api_key": current_key,  # 使用当前 Key
-            }
-
-            # 如果需要 JSON 输出
-            if output_format:
-                kwargs["response_format"] = {"type": "json_object"}
-
-            # 调用 LiteLLM
-            response = completion(**kwargs)
-            content = response.choices[0].message.content
-
-            # 【监控集成】记录成功调用
-            if key_id:
-                response_time = time.time() - start_time
-                # 尝试从response中获取响应头（LiteLLM可能不提供）
-                response_headers = getattr(response, '_hidden_params', {}).get('response_headers', None)
-                api_key_monitor.record_call(
-                    key_id=key_id,
-                    success=True,
-                    response_time=response_time,
-                    rate_limited=False,
-                    response_headers=response_headers
-                )
+        for attempt in range(max_attempts):
+            # 多提供商路由（settings.provider_router_enabled）：选择满足阶段质量要求、预期延迟最低的健康候选
+            route = provider_router.route(model_name)
+            provider, call_model = (route.provider, route.model) if route else (DEFAULT_PROVIDER, model_name)
 
-            # 解析 JSON
-            if output_format:
-                return json.loads(content)
+            if provider != DEFAULT_PROVIDER:
+                # 其他提供商使用单个Key，不经过Groq的Key轮换和额度调度
+                current_key, key_id, reservation = provider_router.api_key(provider), None, None
+            else:
+                # 获取当前可用的 API Key（全部冷却时阻塞等待）
+                if api_key_manager:
+                    candidates = api_key_manager.get_available_keys() or [api_key_manager.get_key()]
+                    api_key_manager.total_calls += 1
+                else:
+                    candidates = [settings.groq_api_key]
 
-            return content
+                # 预约 RPM/TPM 额度，不足时排队等待，避免触发429
+                current_key, key_id, reservation = _reserve_llm_call(call_model, estimated_tokens, candidates)
+            _check_deadline(reservation)
+            if reservation and reservation.wait > 0:
+                time.sleep(reservation.wait)
 
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing failed: {e}")
-            # 【监控集成】记录失败（JSON解析错误也算失败）
-            if key_id:
-                response_time = time.time() - start_time
-                api_key_monitor.record_call(
-                    key_id=key_id,
-                    success=False,
-                    response_time=response_time,
-                    rate_limited=False
+            response = None
+            start_time = time.time()  # 【监控集成】记录开始时间
+
+            try:
+                kwargs = _build_completion_kwargs(
+                    system_prompt, call_model, user_prompt, output_format, temperature, current_key, provider
                 )
-            return None
 
-        except Exception as e:
-            error_msg = str(e)
+                # 调用 LiteLLM（受全局并发限制）
+                with _llm_slot():
+                    response = completion(**kwargs)
+                content = response.choices[0].message.content
+
+                _settle_llm_call(reservation, response)
+                _record_llm_call(key_id, start_time, success=True, response=response)
+                provider_router.record_success(route, time.time() - start_time)
+                token_usage.record_response(call_model, response)
+
+                # 解析 JSON（格式有误时先在本地修复）
+                result, method = parse_llm_json_with_method(content) if output_format else (content, METHOD_DIRECT)
+                _store_llm_cache(_lossless_cache_key(_routed_cache_key(cache_key, route, model_name), method), result)
+                return result
+
+            except json.JSONDecodeError as e:
+                print(f"JSON parsing failed: {e}")
+                # 【监控集成】记录失败（JSON解析错误也算失败）
+                _record_llm_call(key_id, start_time, success=False)
+                # 重新整理的结果不写入缓存
+                return _reask_json(content, output_format) if json_reask else None
+
+            except Exception as e:
+                error_msg = str(e)
+                is_rate_limit = _is_rate_limit_error(error_msg)
+                _settle_llm_call(reservation, response, rate_limited=is_rate_limit, error_msg=error_msg)
+                _record_llm_call(key_id, start_time, success=False, rate_limited=is_rate_limit)
+
+                # 启用路由时429、服务故障、超时和连接错误都立即切换到其他候选；客户端错误直接放弃
+                if route is not None and _is_failover_error(e, is_rate_limit):
+                    provider_router.record_failure(route, rate_limited=is_rate_limit)
+                elif route is not None or not (is_rate_limit and api_key_manager):
+                    # 客户端错误、非速率限制错误或没有管理器
+                    print(f"LLM call failed: {e}")
+                    return None
 
-            # 检测是否是速率限制错误
-            is_rate_limit = any(keyword in error_msg.lower() for keyword in [
-                'rate', 'limit', 'quota', 'exceeded', 'too many'
-            ])
+                # 标记当前 Key 失败（进入冷却并切换到下一个 Key）
+                if is_rate_limit and api_key_manager and provider == DEFAULT_PROVIDER:
+                    api_key_manager.mark_failure(current_key, error_msg)
+                if attempt + 1 < max_attempts:
+                    print(f"[RETRY] 重试中... ({attempt + 1}/{max_attempts - 1})")
 
-            # 【监控集成】记录失败调用
-            if key_id:
-                response_time = time.time() - start_time
-                api_key_monitor.record_call(
-                    key_id=key_id,
-                    success=False,
-                    response_time=response_time,
-                    rate_limited=is_rate_limit
-                )
+        print("[ERROR] 所有 API Key 都已尝试，仍然失败")
+        return None
+
+    call_llm.model_name = model or settings.model_name  # 供结果缓存计算流水线版本
+    # 相同配置的异步版本，异步节点拿到同步LLM时优先使用（见 as_async_llm_function）
+    call_llm.async_version = create_async_llm_function(system_prompt, model, use_cache, json_reask)
+    return call_llm
 
-            if is_rate_limit and api_key_manager:
-                # 标记当前 Key 失败
-                api_key_manager.mark_failure(current_key, error_msg)
 
-                # 限制重试次数（最多重试 Key 数量次）
-                max_retries = len(api_key_manager.keys)
-                if _retry_count < max_retries:
-                    print(f"[RETRY] 重试中... ({_retry_count + 1}/{max_retries})")
-                    # 递归重试（会自动使用下一个 Key）
-                    return call_llm(user_prompt, output_format, temperature, _retry_count + 1)
+def create_async_llm_function(system_prompt: Optional[str] = None, model: Optional[str] = None,
+                              use_cache: bool = True, json_reask: bool = True) -> Callable:
+    """创建异步 LLM 调用函数（基于 litellm.acompletion）
+
+    与 create_llm_function 行为一致，但：
+    - 使用 acompletion，不占用线程
+    - 所有 Key 冷却时通过 asyncio.sleep 等待，不阻塞事件循环
+    - 预约速率额度前按用户和优先级公平排队（见 app/fair_scheduler.py）
+
+    Args:
+        system_prompt: 系统提示词（可选）
+        model: 模型名称（可选，默认使用settings.model_name）
+        use_cache: 是否使用LLM响应缓存（默认True）
+        json_reask: JSON无法修复时是否用轻量模型重新整理（默认True）
+
+    Returns:
+        callable: 异步 LLM 调用函数（协程函数）
+
+    Example:
+        >>> llm = create_async_llm_function()
+        >>> result = await llm(prompt, {"answer": "str"})
+    """
+
+    async def acall_llm(user_prompt: str, output_format: Optional[Dict] = None, temperature: Optional[float] = None,
+                        bypass_cache: bool = False) -> Any:
+        """异步调用 LLM（支持自动 Key 切换、响应缓存）
+
+        Args:
+            user_prompt: 用户提示词
+            output_format: 输出格式字典（如果指定，则返回 JSON）
+            temperature: 温度参数（可选）
+            bypass_cache: 为True时跳过缓存，强制调用API
+
+        Returns:
+            str or dict: LLM 响应内容，失败返回 None
+        """
+        model_name = model or settings.model_name
+        cache_key, cached = _lookup_llm_cache(
+            use_cache and not bypass_cache, model_name, temperature, system_prompt, user_prompt, output_format
+        )
+        if cached is not None:
+            return cached
+
+        max_attempts = _max_llm_attempts()
+        estimated_tokens = _estimate_call_tokens(system_prompt, user_prompt)
+
+        unparsed = None  # 本地无法修复的JSON回复
+
+        # 按用户和优先级公平排队，放行后再预约速率额度；等待额度或Key冷却时交出名额，调用期间占用
+        async with _fair_slot(estimated_tokens) as slot:
+            for attempt in range(max_attempts):
+                route = provider_router.route(model_name)
+                provider, call_model = (route.provider, route.model) if route else (DEFAULT_PROVIDER, model_name)
+
+                if provider != DEFAULT_PROVIDER:
+                    current_key, key_id, reservation = provider_router.api_key(provider), None, None
                 else:
-                    print("[ERROR] 所有 API Key 都已尝试，仍然失败")
-                    return None
-            else:
-                # 非速率限制错误或没有管理器
-                print(f"LLM call failed: {e}")
-                return None
+                    # 获取当前可用的 API Key（全部冷却时异步等待）
+                    if api_key_manager:
+                        candidates = api_key_manager.get_available_keys() or [
+                            await _outside_fair_slot(slot, api_key_manager.aget_key())
+                        ]
+                        api_key_manager.total_calls += 1
+                    else:
+                        candidates = [settings.groq_api_key]
+
+                    current_key, key_id, reservation = _reserve_llm_call(call_model, estimated_tokens, candidates)
+
+                _check_deadline(reservation)
+
+                response = None
+                sent = False
+                start_time = time.time()
+
+                try:
+                    if reservation and reservation.wait > 0:
+                        await _outside_fair_slot(slot, asyncio.sleep(reservation.wait))
+
+                    kwargs = _build_completion_kwargs(
+                        system_prompt, call_model, user_prompt, output_format, temperature, current_key, provider
+                    )
+
+                    async with _llm_slot():
+                        sent = True
+                        # 超过近期响应时间分位数仍未返回时用另一个Groq Key对冲（settings.llm_hedge_enabled）
+                        response, hedge_won = await llm_hedger.race(
+                            acompletion(**kwargs),
+                            lambda: _start_hedge_call(kwargs, call_model, estimated_tokens, current_key)
+                            if provider == DEFAULT_PROVIDER else None
+                        )
+                    content = response.choices[0].message.content
+
+                    if hedge_won:
+                        # 对冲请求已自行结算；主请求已取消
+                        _refund_llm_call(reservation, sent=True)
+                    else:
+                        _settle_llm_call(reservation, response)
+                        _record_llm_call(key_id, start_time, success=True, response=response)
+                    provider_router.record_success(route, time.time() - start_time)
+                    token_usage.record_response(call_model, response)
+
+                    result, method = (
+                        parse_llm_json_with_method(content) if output_format else (content, METHOD_DIRECT)
+                    )
+                    _store_llm_cache(
+                        _lossless_cache_key(_routed_cache_key(cache_key, route, model_name), method), result
+                    )
+                    return result
+
+                except json.JSONDecodeError as e:
+                    print(f"JSON parsing failed: {e}")
+                    _record_llm_call(key_id, start_time, success=False)
+                    unparsed = content
+                    break
+
+                except asyncio.CancelledError:
+                    # 请求被取消（任务取消/超时）：退还未使用的额度
+                    if response is None:
+                        _refund_llm_call(reservation, sent)
+                    raise
+
+                except Exception as e:
+                    error_msg = str(e)
+                    is_rate_limit = _is_rate_limit_error(error_msg)
+                    _settle_llm_call(reservation, response, rate_limited=is_rate_limit, error_msg=error_msg)
+                    _record_llm_call(key_id, start_time, success=False, rate_limited=is_rate_limit)
+
+                    if route is not None and _is_failover_error(e, is_rate_limit):
+                        provider_router.record_failure(route, rate_limited=is_rate_limit)
+                    elif route is not None or not (is_rate_limit and api_key_manager):
+                        print(f"LLM call failed: {e}")
+                        return None
+
+                    if is_rate_limit and api_key_manager and provider == DEFAULT_PROVIDER:
+                        api_key_manager.mark_failure(current_key, error_msg)
+                    if attempt + 1 < max_attempts:
+                        print(f"[RETRY] 重试中... ({attempt + 1}/{max_attempts - 1})")
+
+        if unparsed is not None:
+            # 重新请求在公平调度名额释放后进行，避免占着名额等待新名额；重新整理的结果不写入缓存
+            return await _areask_json(unparsed, output_format) if json_reask else None
+
+        print("[ERROR] 所有 API Key 都已尝试，仍然失败")
+        return None
+
+    acall_llm.model_name = model or settings.model_name
+    return acall_llm
 
-    return call_llm
+
+def as_async_llm_function(llm: Callable) -> Callable:
+    """把 LLM 函数统一为协程函数
+
+    - 已经是协程函数：原样返回
+    - create_llm_function 创建的同步函数：使用其异步版本（acompletion）
+    - 其他同步函数：在线程池中执行
+
+    Args:
+        llm: 同步或异步 LLM 调用函数
+
+    Returns:
+        callable: 异步 LLM 调用函数
+    """
+    if asyncio.iscoroutinefunction(llm):
+        return llm
+
+    async_version = getattr(llm, "async_version", None)
+    if asyncio.iscoroutinefunction(async_version):
+        return async_version
+
+    async def acall_sync_llm(*args, **kwargs) -> Any:
+        return await asyncio.to_thread(llm, *args, **kwargs)
+
+    return acall_sync_llm
 
 
 def create_llm_function_native() -> Callable:
@@ -520,6 +1141,39 @@ def create_llm_function_advanced(system_prompt: Optional[str] = None) -> Callabl
     return create_llm_function(system_prompt=system_prompt, model="llama-3.3-70b-versatile")
 
 
+def create_async_llm_function_native() -> Callable:
+    """创建异步原生 LLM 函数（settings.model_name）
+
+    Returns:
+        callable: 异步 LLM 调用函数
+    """
+    return create_async_llm_function(system_prompt=settings.system_prompt)
+
+
+def create_async_llm_function_light(system_prompt: Optional[str] = None) -> Callable:
+    """创建异步轻量级 LLM 调用函数（llama-3.1-8b-instant）
+
+    Args:
+        system_prompt: 系统提示词（可选）
+
+    Returns:
+        callable: 异步 LLM 调用函数
+    """
+    return create_async_llm_function(system_prompt=system_prompt, model="llama-3.1-8b-instant")
+
+
+def create_async_llm_function_advanced(system_prompt: Optional[str] = None) -> Callable:
+    """创建异步高级 LLM 调用函数（llama-3.3-70b-versatile）
+
+    Args:
+        system_prompt: 系统提示词（可选）
+
+    Returns:
+        callable: 异步 LLM 调用函数
+    """
+    return create_async_llm_function(system_prompt=system_prompt, model="llama-3.3-70b-versatile")
+
+
 # ==================== 依赖注入函数 ====================
 
 def get_settings(provider = Depends(get_config_provider)):
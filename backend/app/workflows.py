@@ -1,8 +1,18 @@
 # 作用：定义所有LangGraph工作流
+# 功能：
+#   - create_* 函数构建并编译工作流
+#   - WorkflowRegistry 缓存编译结果，每种工作流只编译一次，所有请求共享
+#   - 运行时依赖（LLM函数、task_id）通过 config["configurable"] 传入，不参与图的构建
 
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END, START
 from langgraph.types import Send
 from app.state import Shadow_Writing_State, ChunkProcessState
+from app.token_usage import llm_stage, usage_task
 # 共用组件
 from app.agents.shared.semantic_chunking import Semantic_Chunking_Agent
 """ ----------------------------------------------------------- """
@@ -175,40 +185,137 @@ def create_full_workflow():
     return builder.compile()
 
 
+# ============================================================
+# 运行时依赖注入（config["configurable"] → 节点state）
+# ============================================================
+
+# 可通过config注入到节点state的运行时依赖
+RUNTIME_KEYS = ("llm_function", "async_llm_function", "task_id")
+
+
+def build_workflow_config(llm: Optional[Callable] = None, task_id: Optional[str] = None,
+                          **configurable: Any) -> RunnableConfig:
+    """
+    构建工作流运行配置
+
+    Args:
+        llm: 注入的LLM函数（None时节点使用默认LLM）
+        task_id: 任务ID（用于SSE进度推送）
+        **configurable: 其他运行时参数
+
+    Returns:
+        RunnableConfig: 传给 invoke/ainvoke/astream 的config
+
+    Example:
+        >>> workflow = get_parallel_shadow_writing_workflow()
+        >>> workflow.invoke(initial_state, config=build_workflow_config(llm=llm, task_id=task_id))
+    """
+    values = {"llm_function": llm, "task_id": task_id, **configurable}
+    return {"configurable": {key: value for key, value in values.items() if value is not None}}
+
+
+def _runtime_state(state: Dict[str, Any], config: Optional[RunnableConfig]) -> Dict[str, Any]:
+    """把config中的运行时依赖合并到state（state中已有的值优先）"""
+    configurable = (config or {}).get("configurable", {})
+    extras = {
+        key: configurable[key]
+        for key in RUNTIME_KEYS
+        if configurable.get(key) is not None and state.get(key) is None
+    }
+    return {**state, **extras} if extras else state
+
+
+def bind_runtime(node: Callable, stage: Optional[str] = None) -> Callable:
+    """
+    包装节点：运行前从config注入LLM函数、task_id
+
+    Send分发到子图的payload只保留ChunkProcessState声明的字段，
+    函数对象和task_id因此改为通过config传递（子图会继承父图的config）
+
+    Args:
+        node: 节点函数
+        stage: 节点中LLM调用计入的token统计阶段（见 app/token_usage.py）
+    """
+    if asyncio.iscoroutinefunction(node):
+        async def arun(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+            state = _runtime_state(state, config)
+            with llm_stage(stage), usage_task(state.get("task_id")):
+                return await node(state)
+
+        arun.__name__ = getattr(node, "__name__", node.__class__.__name__)
+        return arun
+
+    def run(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        state = _runtime_state(state, config)
+        with llm_stage(stage), usage_task(state.get("task_id")):
+            return node(state)
+
+    run.__name__ = getattr(node, "__name__", node.__class__.__name__)
+    return run
+
+
+def inline_async(node: Callable) -> Callable:
+    """
+    把轻量的同步节点（纯CPU、耗时极短）包装为协程
+
+    异步图中的同步节点默认会被放到线程池执行；验证、汇总这类节点
+    直接在事件循环中运行更省开销
+    """
+    async def arun(state: Dict[str, Any]) -> Dict[str, Any]:
+        return node(state)
+
+    arun.__name__ = getattr(node, "__name__", node.__class__.__name__)
+    return arun
+
+
 # ============================================================
 # 并行处理工作流（使用Send API + operator.add）
 # ============================================================
 
-def create_chunk_pipeline(llm=None):
+def create_chunk_pipeline(async_nodes: bool = False):
     """
     创建单个Chunk的处理流水线子图
 
+    LLM函数和task_id在运行时通过 config["configurable"] 注入（见 bind_runtime）
+
     Args:
-        llm: 注入的LLM函数
+        async_nodes: 为True时使用异步节点（await异步LLM），需通过 ainvoke/astream 运行
 
     功能：处理单个语义块，完成完整的Shadow Writing流程
 
     流程：
-    START → shadow_writing → validation → quality → [correction] → finalize_chunk → END
+    START → shadow_writing → validation → pre_quality → [quality] → [correction] → finalize_chunk → END
+    （pre_quality 本地预检明显合格直接 finalize_chunk，明显不合格直接 correction，其余进入 quality）
 
     Returns:
         编译后的子图工作流
     """
     # 并行工作流agents（当前使用）
-    from app.agents.parallel.shadow_writing_agent import shadow_writing_single_chunk
+    from app.agents.parallel.shadow_writing_agent import shadow_writing_single_chunk, ashadow_writing_single_chunk
     from app.agents.parallel.validation_agent import validation_single_chunk
-    from app.agents.parallel.quality_agent import quality_single_chunk
-    from app.agents.parallel.correction_agent import correction_single_chunk
+    from app.agents.parallel.pre_quality_agent import pre_quality_single_chunk
+    from app.agents.parallel.quality_agent import quality_single_chunk, aquality_single_chunk
+    from app.agents.parallel.correction_agent import correction_single_chunk, acorrection_single_chunk
     from app.agents.parallel.finalize_agent import finalize_single_chunk
     
     pipeline = StateGraph(ChunkProcessState)
     
-    # 添加所有处理节点
-    pipeline.add_node("shadow_writing", shadow_writing_single_chunk)
-    pipeline.add_node("validation", validation_single_chunk)
-    pipeline.add_node("quality", quality_single_chunk)
-    pipeline.add_node("correction", correction_single_chunk)
-    pipeline.add_node("finalize_chunk", finalize_single_chunk)
+    # 添加所有处理节点（运行时从config注入LLM函数和task_id）
+    if async_nodes:
+        # LLM节点await异步LLM；验证、汇总是纯CPU操作，直接在事件循环中执行
+        pipeline.add_node("shadow_writing", bind_runtime(ashadow_writing_single_chunk, stage="shadow_writing"))
+        pipeline.add_node("validation", inline_async(validation_single_chunk))
+        pipeline.add_node("pre_quality", inline_async(pre_quality_single_chunk))
+        pipeline.add_node("quality", bind_runtime(aquality_single_chunk, stage="quality"))
+        pipeline.add_node("correction", bind_runtime(acorrection_single_chunk, stage="correction"))
+        pipeline.add_node("finalize_chunk", inline_async(finalize_single_chunk))
+    else:
+        pipeline.add_node("shadow_writing", bind_runtime(shadow_writing_single_chunk, stage="shadow_writing"))
+        pipeline.add_node("validation", bind_runtime(validation_single_chunk))
+        pipeline.add_node("pre_quality", bind_runtime(pre_quality_single_chunk))
+        pipeline.add_node("quality", bind_runtime(quality_single_chunk, stage="quality"))
+        pipeline.add_node("correction", bind_runtime(correction_single_chunk, stage="correction"))
+        pipeline.add_node("finalize_chunk", bind_runtime(finalize_single_chunk))
     
     # 条件路由函数
     def should_correct(state: ChunkProcessState) -> str:
@@ -217,11 +324,29 @@ def create_chunk_pipeline(llm=None):
             return "correction"
         else:
             return "finalize_chunk"
+
+    def route_pre_quality(state: ChunkProcessState) -> str:
+        """本地预检有明确结论时跳过LLM评估"""
+        decision = (state.get("pre_quality") or {}).get("decision")
+        if decision in ("pass", "reject"):
+            return should_correct(state)
+        return "quality"
     
     # 设置流水线路径
     pipeline.add_edge(START, "shadow_writing")
     pipeline.add_edge("shadow_writing", "validation")
-    pipeline.add_edge("validation", "quality")
+    pipeline.add_edge("validation", "pre_quality")
+
+    # 条件路由：pre_quality → quality（边界情况）、correction 或 finalize_chunk
+    pipeline.add_conditional_edges(
+        "pre_quality",
+        route_pre_quality,
+        {
+            "quality": "quality",
+            "correction": "correction",
+            "finalize_chunk": "finalize_chunk"
+        }
+    )
     
     # 条件路由：quality → correction 或 finalize_chunk
     pipeline.add_conditional_edges(
@@ -239,14 +364,18 @@ def create_chunk_pipeline(llm=None):
     return pipeline.compile()
 
 
-def create_parallel_shadow_writing_workflow(llm=None):
+def create_parallel_shadow_writing_workflow(llm=None, async_nodes: bool = False, checkpointer=None):
     """
     创建并行Shadow Writing工作流（使用Send API）
 
     功能：处理TED文本，为每个语义块创建独立的处理流水线
 
     Args:
-        llm: 注入的LLM函数，如果为None则使用默认创建
+        llm: 注入的LLM函数（向后兼容）。推荐使用 get_parallel_shadow_writing_workflow()
+             获取共享的编译结果，并通过 build_workflow_config(llm=...) 在运行时传入
+        async_nodes: 为True时chunk流水线使用异步节点，需通过 ainvoke/astream 运行
+        checkpointer: 检查点存储（可选）。启用后运行config需带thread_id，
+                      中途退出后以相同thread_id恢复时跳过已完成的chunk_pipeline
 
     流程：
     START → semantic_chunking → [动态分发到多个chunk_pipeline] → aggregate_results → END
@@ -254,30 +383,30 @@ def create_parallel_shadow_writing_workflow(llm=None):
     关键技术：
     1. 使用Send API动态为每个chunk创建独立流水线
     2. 使用operator.add自动汇总所有结果
-    3. 每个chunk独立运行完整的 shadow_writing→validation→quality→correction→finalize 流程
+    3. 每个chunk独立运行完整的 shadow_writing→validation→pre_quality→quality→correction→finalize 流程
 
     Returns:
         编译后的并行工作流
     """
     builder = StateGraph(Shadow_Writing_State)
     
-    # 1. 语义分块节点（保持不变）
-    builder.add_node("semantic_chunking", Semantic_Chunking_Agent())
+    # 1. 语义分块节点（task_id可来自state或config）
+    builder.add_node("semantic_chunking", bind_runtime(Semantic_Chunking_Agent()))
     
     # 2. Chunk处理流水线（子图）
     # 因为子图的final_shadow_chunks使用operator.add，结果会自动合并到主State
-    chunk_pipeline = create_chunk_pipeline(llm=llm)
+    chunk_pipeline = create_chunk_pipeline(async_nodes=async_nodes)
     builder.add_node("chunk_pipeline", chunk_pipeline)
     
     # 4. 动态分发函数（关键）
-    def continue_to_pipelines(state: Shadow_Writing_State):
+    def continue_to_pipelines(state: Shadow_Writing_State, config: RunnableConfig):
         """
         为每个语义块创建独立的处理流水线
 
         使用Send API动态分发，LangGraph会自动并行处理
         """
         semantic_chunks = state.get("semantic_chunks", [])
-        task_id = state.get("task_id")
+        task_id = _runtime_state(state, config).get("task_id")
 
         print(f"\n[PARALLEL WORKFLOW] 准备并行处理 {len(semantic_chunks)} 个语义块")
         print(f"[PARALLEL WORKFLOW] task_id: {task_id}")
@@ -285,19 +414,17 @@ def create_parallel_shadow_writing_workflow(llm=None):
 
         # 推送并行处理开始消息
         if task_id:
-            import asyncio
-            from app.sse_manager import sse_manager
-            asyncio.create_task(
-                sse_manager.add_message(task_id, {
-                    "type": "chunks_processing_started",
-                    "total_chunks": len(semantic_chunks),
-                    "message": f"开始并行处理 {len(semantic_chunks)} 个语义块"
-                })
-            )
+            from app.progress_bus import progress_bus
+            progress_bus.publish(task_id, {
+                "type": "chunks_processing_started",
+                "total_chunks": len(semantic_chunks),
+                "message": f"开始并行处理 {len(semantic_chunks)} 个语义块"
+            })
             print(f"[PARALLEL WORKFLOW] 推送并行处理开始消息到task_id: {task_id}")
 
         # 为每个chunk创建一个Send指令
         # 【重要】ChunkProcessState与主State共享final_shadow_chunks字段，使用operator.add自动合并
+        # LLM函数和task_id不放入payload（未在ChunkProcessState中声明会被丢弃），由config传递
         total_chunks = len(semantic_chunks)
         return [
             Send(
@@ -305,12 +432,11 @@ def create_parallel_shadow_writing_workflow(llm=None):
                 {
                     "chunk_text": chunk,
                     "chunk_id": i,
-                    "task_id": task_id,  # 传递task_id用于进度推送
                     "total_chunks": total_chunks,  # 传递总数用于进度计算
-                    "llm_function": llm,  # 传递注入的LLM函数
                     # 初始化ChunkProcessState字段
                     "raw_shadow": None,
                     "validated_shadow": None,
+                    "pre_quality": None,
                     "quality_passed": False,
                     "quality_score": 0.0,
                     "quality_detail": None,
@@ -335,4 +461,131 @@ def create_parallel_shadow_writing_workflow(llm=None):
     # 所有chunk_pipeline完成后，operator.add自动合并结果到final_shadow_chunks，直接结束
     builder.add_edge("chunk_pipeline", END)
     
-    return builder.compile()
+    compiled = builder.compile(checkpointer=checkpointer)
+    if llm is not None:
+        # 向后兼容：把LLM绑定到默认config
+        return compiled.with_config(build_workflow_config(llm=llm))
+    return compiled
+
+
+# ============================================================
+# 工作流注册表（编译一次，全局复用）
+# ============================================================
+
+class WorkflowRegistry:
+    """
+    编译后工作流的注册表
+
+    - 每种工作流首次使用时编译，之后所有请求共享同一个编译结果
+    - 编译后的图是无状态的，可在多个线程/协程中并发 invoke
+    - 运行时依赖通过 build_workflow_config() 传入，因此不需要按LLM配置分别编译
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._compiled: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.compile_count = 0
+        self.compile_seconds = 0.0
+        self.hits = 0
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """
+        注册工作流构建函数
+
+        Args:
+            name: 工作流名称
+            factory: 无参构建函数，返回编译后的工作流
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._compiled.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        """
+        获取编译后的工作流（首次调用时编译）
+
+        Args:
+            name: 工作流名称
+
+        Returns:
+            编译后的工作流
+
+        Raises:
+            KeyError: 未注册的工作流
+        """
+        compiled = self._compiled.get(name)
+        if compiled is not None:
+            self.hits += 1
+            return compiled
+
+        with self._lock:
+            compiled = self._compiled.get(name)
+            if compiled is None:
+                if name not in self._factories:
+                    raise KeyError(f"未注册的工作流: {name}")
+                start_time = time.perf_counter()
+                compiled = self._factories[name]()
+                duration = time.perf_counter() - start_time
+                self._compiled[name] = compiled
+                self.compile_count += 1
+                self.compile_seconds += duration
+                print(f"[WORKFLOW REGISTRY] 编译工作流 {name}: {duration * 1000:.1f}ms")
+            else:
+                self.hits += 1
+        return compiled
+
+    def clear(self) -> None:
+        """清空编译缓存（下次获取时重新编译）"""
+        with self._lock:
+            self._compiled.clear()
+
+    def get_stats(self) -> dict:
+        """获取注册表统计"""
+        return {
+            "registered": sorted(self._factories),
+            "compiled": sorted(self._compiled),
+            "compile_count": self.compile_count,
+            "compile_seconds": round(self.compile_seconds, 4),
+            "hits": self.hits
+        }
+
+
+# 全局注册表
+workflow_registry = WorkflowRegistry()
+workflow_registry.register("search", create_search_workflow)
+workflow_registry.register("parallel_shadow_writing", create_parallel_shadow_writing_workflow)
+workflow_registry.register(
+    "parallel_shadow_writing_async",
+    lambda: create_parallel_shadow_writing_workflow(async_nodes=True)
+)
+
+
+def get_parallel_shadow_writing_workflow():
+    """
+    获取共享的并行Shadow Writing工作流（只编译一次）
+
+    Returns:
+        编译后的并行工作流，调用时通过 build_workflow_config() 传入LLM和task_id
+    """
+    return workflow_registry.get("parallel_shadow_writing")
+
+
+def get_async_parallel_shadow_writing_workflow(checkpointer=None):
+    """
+    获取共享的异步并行Shadow Writing工作流（只编译一次）
+
+    LLM节点为协程，通过 ainvoke/astream 运行，所有语义块在同一事件循环中并发，
+    不占用线程池
+
+    Args:
+        checkpointer: 检查点存储（可选）。传入时返回共享编译结果的副本并挂载检查点，
+                      不重新编译（子图自动继承父图的检查点）
+
+    Returns:
+        编译后的异步并行工作流
+    """
+    workflow = workflow_registry.get("parallel_shadow_writing_async")
+    if checkpointer is not None:
+        return workflow.copy(update={"checkpointer": checkpointer})
+    return workflow
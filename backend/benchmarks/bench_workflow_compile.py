@@ -0,0 +1,71 @@
+# bench_workflow_compile.py
+# 作用：对比每次请求重新编译工作流 与 注册表复用编译结果 的开销
+# 用法：cd backend && python -m benchmarks.bench_workflow_compile [请求次数]
+
+import statistics
+import sys
+import time
+
+from app.workflows import (
+    create_parallel_shadow_writing_workflow, build_workflow_config,
+    workflow_registry, get_parallel_shadow_writing_workflow
+)
+
+
+SHADOW_RESULT = {
+    "original": "This is the original sentence from the talk today.",
+    "imitation": "This is the imitation sentence for a brand new topic today.",
+    "map": {"original": ["initial"], "talk": ["speech"]}
+}
+
+QUALITY_RESULT = {
+    "step1_grammar": 3, "step2_content": 2, "step3_logic": 3, "step3_issues": [],
+    "step4_topic": 2, "step5_learning": 1, "total_score": 11, "pass": True, "reasoning": "ok"
+}
+
+
+def fake_llm(prompt, output_format=None, temperature=None):
+    """不访问网络的LLM，只衡量图构建/调度开销"""
+    return QUALITY_RESULT if output_format and "total_score" in output_format else SHADOW_RESULT
+
+
+def initial_state(text: str) -> dict:
+    return {"text": text, "task_id": None, "semantic_chunks": [], "final_shadow_chunks": [],
+            "current_node": "", "error_message": None}
+
+
+def measure(label: str, requests: int, get_workflow) -> list:
+    """执行N次请求，返回每次耗时（毫秒）"""
+    text = " ".join(f"This is sentence number {i} of the talk, and it is long enough." for i in range(12))
+    config = build_workflow_config(llm=fake_llm)
+    durations = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        get_workflow().invoke(initial_state(text), config=config)
+        durations.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<28} mean {statistics.mean(durations):8.2f}ms  "
+          f"median {statistics.median(durations):8.2f}ms  total {sum(durations):9.1f}ms")
+    return durations
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    compile_times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        create_parallel_shadow_writing_workflow()
+        compile_times.append((time.perf_counter() - start) * 1000)
+    print(f"{'compile only':<28} mean {statistics.mean(compile_times):8.2f}ms")
+
+    workflow_registry.clear()
+    rebuilt = measure("rebuild per request", requests, create_parallel_shadow_writing_workflow)
+    shared = measure("registry (compile once)", requests, get_parallel_shadow_writing_workflow)
+
+    saving = statistics.mean(rebuilt) - statistics.mean(shared)
+    print(f"\n每次请求节省: {saving:.2f}ms ({saving / statistics.mean(rebuilt) * 100:.1f}%)")
+    print(f"注册表统计: {workflow_registry.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
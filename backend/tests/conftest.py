@@ -0,0 +1,30 @@
+# tests/conftest.py
+# 测试共用的fixture
+
+import pytest
+from types import SimpleNamespace
+from typing import Optional, Tuple
+from unittest.mock import Mock
+
+
+@pytest.fixture
+def llm_response():
+    """
+    litellm响应的模拟对象工厂
+
+    用法：llm_response(content, usage=(prompt_tokens, completion_tokens))，usage=None 表示响应不带用量
+    """
+    def make(content: str, usage: Optional[Tuple[int, int]] = (1, 1)):
+        response = Mock()
+        response.choices = [Mock()]
+        response.choices[0].message.content = content
+        if usage is None:
+            response.usage = None
+        else:
+            prompt_tokens, completion_tokens = usage
+            response.usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                             total_tokens=prompt_tokens + completion_tokens)
+        response._hidden_params = {}
+        return response
+
+    return make
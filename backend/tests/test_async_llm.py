@@ -0,0 +1,96 @@
+# tests/test_async_llm.py
+# 异步LLM调用路径测试
+
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from app.utils import APIKeyManager, as_async_llm_function
+from app.agents.parallel.quality_agent import QualityChunkAgent
+from app.models import Ted_Shadows
+
+
+class TestAsyncKeyRotation:
+    """APIKeyManager 异步取Key测试"""
+
+    @pytest.mark.asyncio
+    async def test_aget_key_does_not_block_event_loop(self):
+        """测试所有Key冷却时，异步等待不阻塞事件循环"""
+        manager = APIKeyManager(["gsk_async_test_key_1"])
+        manager.key_cooldown["gsk_async_test_key_1"] = time.time() + 0.2
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker_task = asyncio.create_task(ticker())
+        key = await manager.aget_key()
+        ticker_task.cancel()
+
+        assert key == "gsk_async_test_key_1"
+        assert ticks > 5  # 等待期间事件循环仍在运行
+
+    def test_select_key_skips_cooling_keys(self):
+        """测试选择Key时跳过冷却中的Key"""
+        manager = APIKeyManager(["gsk_key_aaaaaaaa", "gsk_key_bbbbbbbb"])
+        manager.key_cooldown["gsk_key_aaaaaaaa"] = time.time() + 60
+
+        key, wait_time = manager._select_key()
+        assert key == "gsk_key_bbbbbbbb"
+        assert wait_time == 0.0
+
+
+class TestAsyncLLMAdapter:
+    """as_async_llm_function 适配测试"""
+
+    @pytest.mark.asyncio
+    async def test_sync_function_wrapped(self):
+        """测试同步LLM函数被包装为可await的函数"""
+        sync_llm = Mock(return_value={"ok": True})
+        async_llm = as_async_llm_function(sync_llm)
+
+        assert asyncio.iscoroutinefunction(async_llm)
+        assert await async_llm("prompt", {"ok": "bool"}) == {"ok": True}
+        sync_llm.assert_called_once_with("prompt", {"ok": "bool"})
+
+    def test_async_function_returned_as_is(self):
+        """测试异步LLM函数原样返回"""
+        async def native(prompt, output_format=None):
+            return {}
+
+        assert as_async_llm_function(native) is native
+
+
+class TestAsyncAgent:
+    """Agent 异步入口测试"""
+
+    @pytest.mark.asyncio
+    async def test_quality_agent_acall_awaits_async_llm(self):
+        """测试质量评估Agent通过acall调用异步LLM"""
+        async_llm = AsyncMock(return_value={
+            "step1_grammar": 3, "step2_content": 2, "step3_logic": 3,
+            "step3_issues": [], "step4_topic": 2, "step5_learning": 1,
+            "total_score": 11, "pass": True, "reasoning": "good"
+        })
+        shadow = Ted_Shadows(
+            original="The original sentence is here for testing purposes.",
+            imitation="The imitation sentence is created for a brand new topic today.",
+            map={"original": ["initial"], "sentence": ["phrase"]},
+            paragraph="Paragraph text."
+        )
+
+        result = await QualityChunkAgent().acall({
+            "chunk_id": 0,
+            "chunk_text": "Paragraph text.",
+            "validated_shadow": shadow,
+            "async_llm_function": async_llm
+        })
+
+        async_llm.assert_awaited_once()
+        assert result["quality_passed"] is True
+        assert result["quality_score"] == 11.0
@@ -0,0 +1,184 @@
+# tests/test_batch_processor.py
+# 批量处理并发测试
+
+import threading
+import time
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.batch_processor import process_urls_batch, resolve_batch_concurrency
+from app.models import TedTxt
+from app.task_manager import task_manager
+from app.task_backend import InMemoryTaskBackend
+from app.enums import TaskStatus
+
+
+class FakeWorkflow:
+    """模拟异步工作流：astream 依次产出分块结果和每个语义块的结果"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.runs = 0
+
+    async def astream(self, initial_state, config=None, stream_mode="updates"):
+        self.runs += 1
+        yield {"semantic_chunking": {"semantic_chunks": [f"chunk {i}" for i in range(len(self.chunks))]}}
+        for chunk in self.chunks:
+            yield {"chunk_pipeline": {"final_shadow_chunks": [chunk]}}
+
+
+@pytest.fixture(autouse=True)
+def memory_only_tasks():
+    """任务只保存在内存中，不写入磁盘（也不创建工作流检查点）"""
+    with patch.object(task_manager, 'backend', InMemoryTaskBackend()), \
+         patch('app.checkpointer.settings.checkpoint_enabled', False):
+        yield
+
+
+def _fake_transcript(url):
+    return TedTxt(
+        title=f"Talk {url}",
+        speaker="Speaker",
+        url=url,
+        duration="10:00",
+        views=0,
+        transcript="This is a transcript long enough for the workflow."
+    )
+
+
+class TestBatchConcurrency:
+    """process_urls_batch 有界并发测试"""
+
+    @pytest.mark.asyncio
+    async def test_urls_processed_concurrently_with_bound(self):
+        """测试同时处理的URL数量不超过并发上限"""
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def slow_extract(url):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.05)
+            with lock:
+                state["active"] -= 1
+            return _fake_transcript(url)
+
+        workflow = FakeWorkflow([{"original": "o"}])
+
+        urls = [f"https://ted.com/talks/{i}" for i in range(6)]
+        task_id = task_manager.create_task(urls, "test_user")
+
+        with patch('app.batch_processor.extract_ted_transcript', side_effect=slow_extract), \
+             patch('app.batch_processor.get_async_parallel_shadow_writing_workflow', return_value=workflow), \
+             patch('app.batch_processor.sse_manager.add_message', new_callable=AsyncMock), \
+             patch('app.result_cache.settings.result_cache_enabled', False):
+            await process_urls_batch(task_id, urls, max_concurrency=2)
+
+        task = task_manager.get_task(task_id)
+        assert task.status == TaskStatus.COMPLETED
+        assert len(task.results) == 6
+        assert {r["url"] for r in task.results} == set(urls)
+        assert 1 < state["peak"] <= 2
+
+    @pytest.mark.asyncio
+    async def test_failed_url_does_not_stop_others(self):
+        """测试单个URL失败不影响其他URL"""
+        def extract(url):
+            return None if url.endswith("bad") else _fake_transcript(url)
+
+        workflow = FakeWorkflow([])
+
+        urls = ["https://ted.com/talks/ok", "https://ted.com/talks/bad"]
+        task_id = task_manager.create_task(urls, "test_user")
+
+        with patch('app.batch_processor.extract_ted_transcript', side_effect=extract), \
+             patch('app.batch_processor.get_async_parallel_shadow_writing_workflow', return_value=workflow), \
+             patch('app.batch_processor.sse_manager.add_message', new_callable=AsyncMock) as mock_add, \
+             patch('app.result_cache.settings.result_cache_enabled', False):
+            await process_urls_batch(task_id, urls, max_concurrency=2)
+
+        task = task_manager.get_task(task_id)
+        assert len(task.results) == 1
+        assert len(task.errors) == 1
+
+        # 每个URL的消息都携带自身序号
+        error_messages = [c.args[1] for c in mock_add.call_args_list if c.args[1]["type"] == "error"]
+        assert error_messages[0]["current"] == 2
+
+    @pytest.mark.asyncio
+    async def test_chunk_results_streamed_before_url_completed(self):
+        """测试每个语义块完成时立即推送chunk_completed消息"""
+        workflow = FakeWorkflow([{"original": "a"}, {"original": "b"}])
+        urls = ["https://ted.com/talks/stream"]
+        task_id = task_manager.create_task(urls, "test_user")
+
+        with patch('app.batch_processor.extract_ted_transcript', side_effect=_fake_transcript), \
+             patch('app.batch_processor.get_async_parallel_shadow_writing_workflow', return_value=workflow), \
+             patch('app.batch_processor.sse_manager.add_message', new_callable=AsyncMock) as mock_add, \
+             patch('app.result_cache.settings.result_cache_enabled', False):
+            await process_urls_batch(task_id, urls, max_concurrency=1)
+
+        types = [c.args[1]["type"] for c in mock_add.call_args_list]
+        chunk_messages = [c.args[1] for c in mock_add.call_args_list if c.args[1]["type"] == "chunk_completed"]
+
+        assert [m["result"]["original"] for m in chunk_messages] == ["a", "b"]
+        assert chunk_messages[-1]["completed_chunks"] == 2
+        assert chunk_messages[-1]["total_chunks"] == 2
+        assert types.index("chunk_completed") < types.index("url_completed")
+
+    @pytest.mark.asyncio
+    async def test_resume_skips_urls_with_results(self):
+        """测试恢复中断的任务时只处理没有结果的URL，消息保留原序号"""
+        workflow = FakeWorkflow([{"original": "a"}])
+        urls = ["https://ted.com/talks/done", "https://ted.com/talks/todo"]
+        task_id = task_manager.create_task(urls, "test_user")
+        task_manager.add_result(task_id, {"url": urls[0], "results": []})
+        task_manager.update_status(task_id, TaskStatus.INTERRUPTED)
+
+        with patch('app.batch_processor.extract_ted_transcript', side_effect=_fake_transcript) as mock_extract, \
+             patch('app.batch_processor.get_async_parallel_shadow_writing_workflow', return_value=workflow), \
+             patch('app.batch_processor.sse_manager.add_message', new_callable=AsyncMock) as mock_add, \
+             patch('app.result_cache.settings.result_cache_enabled', False):
+            await process_urls_batch(task_id, urls, max_concurrency=1, resume=True)
+
+        mock_extract.assert_called_once_with(urls[1])
+        task = task_manager.get_task(task_id)
+        assert task.status == TaskStatus.COMPLETED
+        assert [r["url"] for r in task.results] == urls
+
+        messages = [c.args[1] for c in mock_add.call_args_list]
+        assert messages[0]["resumed"] == 1
+        assert [m["current"] for m in messages if m["type"] == "url_completed"] == [2]
+
+    @pytest.mark.asyncio
+    async def test_resume_clears_errors_of_retried_urls(self):
+        """测试恢复任务时重试的URL清除上次的错误，完成消息的成功+失败数不超过总数"""
+        workflow = FakeWorkflow([{"original": "a"}])
+        urls = ["https://ted.com/talks/done", "https://ted.com/talks/retry"]
+        task_id = task_manager.create_task(urls, "test_user")
+        task_manager.add_result(task_id, {"url": urls[0], "results": []})
+        task_manager.add_error(task_id, f"Error processing {urls[1]}: 429")
+        task_manager.update_status(task_id, TaskStatus.INTERRUPTED)
+
+        with patch('app.batch_processor.extract_ted_transcript', side_effect=_fake_transcript), \
+             patch('app.batch_processor.get_async_parallel_shadow_writing_workflow', return_value=workflow), \
+             patch('app.batch_processor.sse_manager.add_message', new_callable=AsyncMock) as mock_add, \
+             patch('app.result_cache.settings.result_cache_enabled', False):
+            await process_urls_batch(task_id, urls, max_concurrency=1, resume=True)
+
+        task = task_manager.get_task(task_id)
+        assert task.errors == []
+        completed = [c.args[1] for c in mock_add.call_args_list if c.args[1]["type"] == "completed"][0]
+        assert completed["successful"] == 2 and completed["failed"] == 0
+
+    def test_resolve_concurrency_bounded_by_healthy_keys(self):
+        """测试并发上限受健康Key数量约束"""
+        manager = Mock()
+        manager.get_healthy_key_count.return_value = 2
+
+        with patch('app.batch_processor.utils.api_key_manager', manager), \
+             patch('app.batch_processor.settings.batch_max_concurrency', 8), \
+             patch('app.batch_processor.settings.batch_urls_per_key', 1):
+            assert resolve_batch_concurrency(10) == 2
+            assert resolve_batch_concurrency(1) == 1
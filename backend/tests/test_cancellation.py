@@ -0,0 +1,270 @@
+# tests/test_cancellation.py
+# 任务取消与截止时间测试
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+from app.cancellation import CancellationRegistry, TaskCancelled, remaining_time, DeadlineExceeded, deadline_exceeded
+from app.llm_scheduler import LLMScheduler, DEFAULT_KEY_ID
+from app.utils import create_async_llm_function
+from app.config import settings
+from app.task_backend import InMemoryTaskBackend
+from app.enums import TaskStatus
+
+
+async def _forever():
+    await asyncio.Event().wait()
+
+
+class TestCancellationRegistry:
+    """取消注册表测试"""
+
+    @pytest.mark.asyncio
+    async def test_cancel_stops_running_task(self):
+        """测试取消正在运行的任务，调用方收到TaskCancelled"""
+        registry = CancellationRegistry()
+        run = asyncio.create_task(registry.run_cancellable("task", _forever()))
+        await asyncio.sleep(0)
+
+        assert registry.cancel("task") is True
+        with pytest.raises(TaskCancelled) as exc_info:
+            await run
+
+        assert exc_info.value.reason == "user"
+        assert not registry.is_running("task")
+        assert registry.cancel("task") is False
+
+    @pytest.mark.asyncio
+    async def test_deadline_cancels_and_propagates_to_children(self):
+        """测试截止时间到达时取消任务，剩余时间可在子任务中读取"""
+        registry = CancellationRegistry()
+        seen = []
+
+        async def body():
+            async def child():
+                seen.append(remaining_time())
+                await _forever()
+            await asyncio.gather(child(), child())
+
+        with pytest.raises(TaskCancelled) as exc_info:
+            await registry.run_cancellable("task", body(), timeout_seconds=0.05)
+
+        assert exc_info.value.reason == "deadline"
+        assert len(seen) == 2 and all(0 < r <= 0.05 for r in seen)
+        assert remaining_time() is None
+        assert registry.get_stats()["deadline_exceeded"] == 1
+
+    @pytest.mark.asyncio
+    async def test_caller_cancellation_not_converted(self):
+        """测试调用方自身被取消（如服务关闭）时原样抛出CancelledError，子任务一并取消"""
+        registry = CancellationRegistry()
+        run = asyncio.create_task(registry.run_cancellable("task", _forever()))
+        await asyncio.sleep(0)
+
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        assert not registry.is_running("task")
+
+
+@pytest.fixture
+def scheduled_llm():
+    """启用调度器（每分钟1个请求）的异步LLM函数，不使用缓存和Key管理器"""
+    scheduler = LLMScheduler()
+    with patch('app.utils.llm_scheduler', scheduler), \
+         patch('app.utils.api_key_manager', None), \
+         patch('app.utils.settings.llm_scheduler_enabled', True), \
+         patch.dict('app.llm_scheduler.DEFAULT_MODEL_LIMITS', {settings.model_name: (1, 100000)}):
+        yield scheduler, create_async_llm_function(use_cache=False)
+
+
+class TestLLMDeadline:
+    """截止时间传到LLM调用测试"""
+
+    @pytest.mark.asyncio
+    async def test_queued_call_dropped_when_deadline_too_close(self, scheduled_llm):
+        """测试排队等待额度超过剩余时间的请求立即放弃，并退还额度"""
+        scheduler, llm = scheduled_llm
+        scheduler.reserve([DEFAULT_KEY_ID], settings.model_name, 10)
+
+        with patch('app.utils.acompletion', new_callable=AsyncMock) as mock_completion:
+            with pytest.raises(DeadlineExceeded):
+                await CancellationRegistry().run_cancellable("task", llm("prompt"), timeout_seconds=5)
+
+        mock_completion.assert_not_called()
+        assert scheduler.get_stats()["total_reservations"] == 2
+        # 额度已退还：下一个请求只需等待第一次预约占用的时间
+        assert scheduler.reserve([DEFAULT_KEY_ID], settings.model_name, 10).wait <= 61
+
+    @pytest.mark.asyncio
+    async def test_deadline_not_swallowed_by_node_handlers(self):
+        """测试剩余时间不足穿过节点的 except Exception，并按截止时间取消整个任务（其他语义块一并停止）"""
+        registry = CancellationRegistry()
+        sibling_cancelled = asyncio.Event()
+
+        async def node():
+            try:
+                raise deadline_exceeded("no time left")
+            except Exception:
+                return "chunk failed"
+
+        async def sibling():
+            try:
+                await _forever()
+            except asyncio.CancelledError:
+                sibling_cancelled.set()
+                raise
+
+        async def pipeline():
+            await asyncio.gather(sibling(), node())
+
+        with pytest.raises((DeadlineExceeded, TaskCancelled)):
+            await asyncio.wait_for(registry.run_cancellable("task", pipeline(), timeout_seconds=60), 1)
+
+        assert sibling_cancelled.is_set()
+        assert registry.get_stats()["deadline_exceeded"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cancel_in_flight_call_refunds_unused_budget(self, scheduled_llm):
+        """测试进行中的请求被取消时立即返回，退还预估的输出token"""
+        scheduler, llm = scheduled_llm
+        registry = CancellationRegistry()
+
+        async def hang(**kwargs):
+            await _forever()
+
+        with patch('app.utils.acompletion', side_effect=hang), \
+             patch.object(scheduler, 'settle', wraps=scheduler.settle) as mock_settle:
+            run = asyncio.create_task(registry.run_cancellable("task", llm("prompt")))
+            await asyncio.sleep(0.01)
+            registry.cancel("task")
+            with pytest.raises(TaskCancelled):
+                await asyncio.wait_for(run, 1)
+
+        reservation, actual_tokens = mock_settle.call_args.args
+        assert actual_tokens == reservation.tokens - settings.llm_estimated_completion_tokens
+
+
+class TestBatchCancellation:
+    """批量任务取消测试"""
+
+    @pytest.fixture(autouse=True)
+    def memory_only_tasks(self):
+        """任务只保存在内存中，不创建检查点，不使用结果缓存"""
+        from app.task_manager import task_manager
+        with patch.object(task_manager, 'backend', InMemoryTaskBackend()), \
+             patch('app.checkpointer.settings.checkpoint_enabled', False), \
+             patch('app.result_cache.settings.result_cache_enabled', False):
+            yield task_manager
+
+    @staticmethod
+    def _patches(workflow_started: asyncio.Event):
+        from app.models import TedTxt
+
+        class HangingWorkflow:
+            async def astream(self, initial_state, config=None, stream_mode="updates"):
+                workflow_started.set()
+                await _forever()
+                yield {}
+
+        transcript = TedTxt(title="t", speaker="s", url="u", duration="1:00", views=0,
+                            transcript="This is a transcript long enough for the workflow.")
+        return (
+            patch('app.batch_processor.extract_ted_transcript', return_value=transcript),
+            patch('app.batch_processor.get_async_parallel_shadow_writing_workflow', return_value=HangingWorkflow()),
+            patch('app.batch_processor.sse_manager.add_message', new_callable=AsyncMock),
+        )
+
+    @pytest.mark.asyncio
+    async def test_cancel_running_batch(self, memory_only_tasks):
+        """测试取消运行中的批量任务：状态变为cancelled，最后推送cancelled消息"""
+        from app.batch_processor import process_urls_batch
+        from app.cancellation import cancellation_registry
+
+        task_id = memory_only_tasks.create_task(["https://ted.com/a", "https://ted.com/b"])
+        started = asyncio.Event()
+        extract_patch, workflow_patch, sse_patch = self._patches(started)
+
+        with extract_patch, workflow_patch, sse_patch as mock_add:
+            run = asyncio.create_task(process_urls_batch(task_id, ["https://ted.com/a", "https://ted.com/b"]))
+            await asyncio.wait_for(started.wait(), 1)
+            assert cancellation_registry.cancel(task_id) is True
+            await asyncio.wait_for(run, 1)
+
+        task = memory_only_tasks.get_task(task_id)
+        assert task.status == TaskStatus.CANCELLED
+        assert task.errors == []
+        last = mock_add.call_args_list[-1].args[1]
+        assert last["type"] == "cancelled" and last["reason"] == "user"
+
+    @pytest.mark.asyncio
+    async def test_batch_deadline(self, memory_only_tasks):
+        """测试超过截止时间的批量任务被取消"""
+        from app.batch_processor import process_urls_batch
+
+        task_id = memory_only_tasks.create_task(["https://ted.com/a"])
+        extract_patch, workflow_patch, sse_patch = self._patches(asyncio.Event())
+
+        with extract_patch, workflow_patch, sse_patch as mock_add:
+            await asyncio.wait_for(process_urls_batch(task_id, ["https://ted.com/a"], timeout_seconds=0.05), 1)
+
+        assert memory_only_tasks.get_task(task_id).status == TaskStatus.CANCELLED
+        assert mock_add.call_args_list[-1].args[1]["reason"] == "deadline"
+
+
+class TestCancelEndpoint:
+    """取消接口测试"""
+
+    @pytest.fixture
+    def manager(self):
+        """测试客户端 + 内存任务管理器"""
+        from app.main import app
+        from app.utils import get_task_manager
+        from app.task_manager import TaskManager
+
+        manager = TaskManager(backend=InMemoryTaskBackend())
+        app.dependency_overrides[get_task_manager] = lambda: manager
+        yield TestClient(app), manager
+        app.dependency_overrides.pop(get_task_manager, None)
+
+    def test_cancel_pending_task(self, manager):
+        """测试未开始的任务直接标记为已取消"""
+        client, task_mgr = manager
+        task_id = task_mgr.create_task(["https://ted.com/a"])
+
+        response = client.post(f"/api/v1/task/{task_id}/cancel")
+        assert response.status_code == 200
+        assert response.json()["status"] == "cancelled"
+        assert task_mgr.get_task(task_id).status == TaskStatus.CANCELLED
+
+    def test_finished_task_cannot_be_cancelled(self, manager):
+        """测试已结束的任务不能取消，不存在的任务返回404"""
+        client, task_mgr = manager
+        task_id = task_mgr.create_task(["https://ted.com/a"])
+        task_mgr.complete_task(task_id)
+
+        assert client.post(f"/api/v1/task/{task_id}/cancel").status_code == 400
+        assert client.post("/api/v1/task/missing/cancel").status_code == 404
+
+    def test_running_task_outside_registry_returns_conflict(self, manager):
+        """测试运行中但不在本进程取消注册表中的任务返回409，状态保持不变"""
+        client, task_mgr = manager
+        task_id = task_mgr.create_task(["https://ted.com/a"])
+        task_mgr.update_status(task_id, TaskStatus.PROCESSING)
+
+        response = client.post(f"/api/v1/task/{task_id}/cancel")
+        assert response.status_code == 409
+        assert task_mgr.get_task(task_id).status == TaskStatus.PROCESSING
+
+    def test_pending_task_started_elsewhere_returns_conflict(self, manager):
+        """测试读取后已被其他worker开始运行的排队任务返回409，不覆盖其状态"""
+        client, task_mgr = manager
+        task_id = task_mgr.create_task(["https://ted.com/a"])
+        # 模拟其他worker在存储中开始了任务（本进程的内存副本仍为pending）
+        task_mgr.backend.update_status_if(task_id, [TaskStatus.PENDING.value], TaskStatus.PROCESSING.value)
+
+        response = client.post(f"/api/v1/task/{task_id}/cancel")
+        assert response.status_code == 409
+        assert task_mgr.get_task(task_id).status == TaskStatus.PROCESSING
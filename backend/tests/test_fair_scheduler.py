@@ -0,0 +1,188 @@
+# tests/test_fair_scheduler.py
+# 多用户公平调度测试
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.fair_scheduler import FairScheduler, tenant_context, current_tenant, resolve_priority
+from app.enums import TaskPriority
+from app.task_backend import InMemoryTaskBackend
+
+
+async def _dispatch_order(scheduler: FairScheduler, requests):
+    """
+    第一个请求占住唯一名额，其余请求依次入队后再放行，返回放行顺序
+
+    Args:
+        scheduler: 调度器（max_inflight=1）
+        requests: [(用户ID, 优先级, 名称)]
+    """
+    order = []
+    gate = asyncio.Event()
+
+    async def hold():
+        with tenant_context("holder", "bulk"):
+            async with scheduler.slot(100):
+                await gate.wait()
+
+    async def request(user_id, priority, name):
+        with tenant_context(user_id, priority):
+            async with scheduler.slot(100):
+                order.append(name)
+                await asyncio.sleep(0)
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiters = []
+    for user_id, priority, name in requests:
+        waiters.append(asyncio.create_task(request(user_id, priority, name)))
+        await asyncio.sleep(0)
+
+    gate.set()
+    await asyncio.wait_for(asyncio.gather(holder, *waiters), 1)
+    return order
+
+
+class TestFairScheduler:
+    """加权公平队列测试"""
+
+    @pytest.mark.asyncio
+    async def test_interactive_request_overtakes_bulk_backlog(self):
+        """测试交互式请求插到大批量任务积压的请求前面"""
+        scheduler = FairScheduler(max_inflight=1, interactive_weight=8.0)
+        requests = [("alice", "bulk", f"alice-{i}") for i in range(20)] + [("bob", "interactive", "bob")]
+
+        order = await _dispatch_order(scheduler, requests)
+
+        assert order.index("bob") <= 1
+        assert len(order) == 21
+
+    @pytest.mark.asyncio
+    async def test_users_share_slots_evenly(self):
+        """测试后到的用户不必等前一个用户的请求全部完成，两个用户交替放行"""
+        scheduler = FairScheduler(max_inflight=1)
+        requests = [("alice", "bulk", "alice")] * 10 + [("carol", "bulk", "carol")] * 10
+
+        order = await _dispatch_order(scheduler, requests)
+
+        assert order[:10].count("carol") >= 4
+
+    @pytest.mark.asyncio
+    async def test_user_weight(self):
+        """测试权重高的用户获得更多名额"""
+        scheduler = FairScheduler(max_inflight=1, user_weights={"vip": 3.0})
+        requests = [("alice", "bulk", "alice")] * 10 + [("vip", "bulk", "vip")] * 10
+
+        order = await _dispatch_order(scheduler, requests)
+
+        assert order[:8].count("vip") >= 5
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        """测试排队中被取消的请求不占用名额，统计中的排队数随之减少"""
+        scheduler = FairScheduler(max_inflight=1)
+        first = await scheduler.acquire()
+
+        with tenant_context("alice", "bulk"):
+            queued = asyncio.create_task(scheduler.acquire())
+            await asyncio.sleep(0)
+        stats = scheduler.get_stats()
+        assert stats["queued"] == 1
+        assert stats["by_priority"]["bulk"]["queued"] == 1
+        assert stats["flows"]["alice/bulk"]["queued"] == 1
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        scheduler.release(first)
+
+        stats = scheduler.get_stats()
+        assert stats["active"] == 0 and stats["queued"] == 0
+        await asyncio.wait_for(scheduler.acquire(), 1)
+
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_not_charged(self):
+        """测试排队中被取消的请求不计入流的虚拟完成时间"""
+        scheduler = FairScheduler(max_inflight=1)
+        first = await scheduler.acquire()
+
+        with tenant_context("alice", "bulk"):
+            queued = asyncio.create_task(scheduler.acquire(1000))
+            await asyncio.sleep(0)
+        flow = scheduler._flows[("alice", "bulk")]
+        assert flow.last_finish == 1000
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert flow.last_finish == 0
+        scheduler.release(first)
+
+    @pytest.mark.asyncio
+    async def test_suspended_slot_lets_others_run(self):
+        """测试等待额度期间交出名额：其他请求先运行，等待结束后重新取回名额"""
+        scheduler = FairScheduler(max_inflight=1)
+        waiting = asyncio.Event()
+        done = asyncio.Event()
+
+        async def sleeper():
+            async with scheduler.slot(100) as slot:
+                await slot.suspend(waiting.wait())
+                assert scheduler.active == 1
+
+        async def other():
+            async with scheduler.slot(100):
+                done.set()
+
+        task = asyncio.create_task(sleeper())
+        await asyncio.sleep(0)
+        await asyncio.wait_for(other(), 1)
+        assert done.is_set()
+
+        waiting.set()
+        await asyncio.wait_for(task, 1)
+        assert scheduler.active == 0 and scheduler.queued == 0
+
+
+class TestTenantContext:
+    """用户/优先级上下文测试"""
+
+    def test_resolve_priority(self):
+        """测试未指定时按URL数判断优先级"""
+        with patch('app.fair_scheduler.settings.fair_interactive_max_urls', 2):
+            assert resolve_priority(1) == TaskPriority.INTERACTIVE
+            assert resolve_priority(5) == TaskPriority.BULK
+            assert resolve_priority(1, "bulk") == TaskPriority.BULK
+
+    @pytest.mark.asyncio
+    async def test_batch_runs_with_task_user_and_priority(self):
+        """测试批量任务中的工作流在任务用户和优先级的上下文中运行"""
+        from app.batch_processor import process_urls_batch
+        from app.task_manager import task_manager
+        from app.models import TedTxt
+
+        seen = []
+
+        class RecordingWorkflow:
+            async def astream(self, initial_state, config=None, stream_mode="updates"):
+                seen.append(current_tenant())
+                return
+                yield
+
+        transcript = TedTxt(title="t", speaker="s", url="u", duration="1:00", views=0,
+                            transcript="This is a transcript long enough for the workflow.")
+        urls = [f"https://ted.com/{i}" for i in range(5)]
+
+        with patch.object(task_manager, 'backend', InMemoryTaskBackend()), \
+             patch('app.checkpointer.settings.checkpoint_enabled', False), \
+             patch('app.result_cache.settings.result_cache_enabled', False), \
+             patch('app.batch_processor.extract_ted_transcript', return_value=transcript), \
+             patch('app.batch_processor.get_async_parallel_shadow_writing_workflow', return_value=RecordingWorkflow()), \
+             patch('app.batch_processor.sse_manager.add_message', new_callable=AsyncMock):
+            task_id = task_manager.create_task(urls, "alice")
+            await asyncio.wait_for(process_urls_batch(task_id, urls), 5)
+
+        assert seen and set(seen) == {("alice", "bulk")}
+        assert current_tenant() == ("default", "interactive")
@@ -0,0 +1,114 @@
+# tests/test_json_repair.py
+# LLM返回JSON的修复与重新请求测试
+
+import json
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.json_repair import repair_json, JSONRepairStats, track_lossy_results
+from app.utils import create_llm_function, create_async_llm_function
+
+
+class TestRepairJSON:
+    """本地修复测试"""
+
+    def test_common_format_errors_repaired(self):
+        """测试代码块、说明文字、尾随逗号、单引号和Python字面量"""
+        assert repair_json('{"a": 1}') == ({"a": 1}, "direct")
+        assert repair_json('Here you go:\n```json\n{"a": 1}\n```\nDone.') == ({"a": 1}, "extracted")
+        assert repair_json('{"a": [1, 2,], "b": 2,}') == ({"a": [1, 2], "b": 2}, "repaired")
+        assert repair_json("{'imitation': \"it's \\\"fine\\\"\", 'pass': True, 'x': None}") == (
+            {"imitation": 'it\'s "fine"', "pass": True, "x": None}, "repaired"
+        )
+
+    def test_truncated_object_keeps_completed_fields(self):
+        """测试被截断的对象补全括号，丢弃最后一个不完整的键值对"""
+        result, method = repair_json('{"original": "a b", "map": {"three": ["two"], "phones": ["bi')
+        assert method == "truncated"
+        # 被截断的字符串值 "bi 不完整，连同所在的键值对一起丢弃
+        assert result == {"original": "a b", "map": {"three": ["two"]}}
+
+        result, _ = repair_json('{"original": "a b", "map": {"three": ["two"]}, "paragraph":')
+        assert result == {"original": "a b", "map": {"three": ["two"]}}
+
+    def test_truncated_string_value_not_accepted(self):
+        """测试截断在字符串值中间时不把补全引号后的半截值当作完整结果"""
+        assert repair_json('{"a": [1, 2, {"b": "x') == ({"a": [1, 2]}, "truncated")
+        assert repair_json('{"original": "a b", "imitation": "We spent two hou') == (
+            {"original": "a b"}, "truncated"
+        )
+        with pytest.raises(json.JSONDecodeError):
+            repair_json('{"imitation": "We spent two hou')
+
+    def test_text_without_json_fails(self):
+        """测试没有JSON的内容无法修复"""
+        with pytest.raises(json.JSONDecodeError):
+            repair_json("Sorry, I cannot help with that.")
+
+
+class TestLLMFunctionRepair:
+    """LLM调用函数的修复与重新请求测试"""
+
+    def test_broken_json_repaired_without_reask(self, llm_response):
+        """测试可修复的回复直接返回，不触发重新请求"""
+        stats = JSONRepairStats()
+        with patch('app.json_repair.json_repair_stats', stats), \
+             patch('app.utils._reask_json') as reask, \
+             patch('app.utils.completion', return_value=llm_response('```json\n{"score": 9,}\n```', usage=(10, 10))):
+            result = create_llm_function(use_cache=False)("prompt", {"score": "int"})
+
+        assert result == {"score": 9}
+        reask.assert_not_called()
+        assert stats.get_stats()["repaired"] == 1 and stats.get_stats()["repair_rate"] == 100.0
+
+    def test_unrepairable_output_reasked_with_light_model(self, llm_response):
+        """测试无法修复时只把原始回复发给轻量模型重新整理"""
+        stats = JSONRepairStats()
+        reask_llm = Mock(return_value={"score": 7})
+        with patch('app.utils.json_repair_stats', stats), \
+             patch('app.json_repair.json_repair_stats', stats), \
+             patch('app.utils._reask_llm', reask_llm), \
+             patch('app.utils.completion', return_value=llm_response("score is seven", usage=(10, 10))):
+            result = create_llm_function(use_cache=False)("original prompt", {"score": "int"})
+
+        assert result == {"score": 7}
+        reask_prompt = reask_llm.call_args[0][0]
+        assert "score is seven" in reask_prompt and "original prompt" not in reask_prompt
+        assert stats.get_stats()["failed"] == 1
+        assert stats.get_stats()["reask_recovered"] == 1 and stats.get_stats()["recovered"] == 1
+
+    @pytest.mark.asyncio
+    async def test_async_reask_can_be_disabled(self, llm_response):
+        """测试异步版本同样重新请求，关闭后返回None"""
+        reask_llm = Mock()
+        reask_llm.async_version = AsyncMock(return_value={"score": 5})
+        with patch('app.utils._reask_llm', reask_llm), \
+             patch('app.utils.acompletion', new_callable=AsyncMock, return_value=llm_response("no json here", usage=(10, 10))):
+            assert await create_async_llm_function(use_cache=False)("q", {"score": "int"}) == {"score": 5}
+            with patch('app.utils.settings.llm_json_reask_enabled', False):
+                assert await create_async_llm_function(use_cache=False)("q", {"score": "int"}) is None
+
+        assert reask_llm.async_version.await_count == 1
+
+    def test_only_lossless_results_cached(self, llm_response):
+        """测试只缓存直接解析/提取的结果，截断补全和重新请求的结果不缓存并计为有损"""
+        cache = Mock()
+        cache.make_key.return_value = "key"
+        cache.get.return_value = None
+        reask_llm = Mock(return_value={"score": 7})
+        with patch('app.utils.get_llm_cache', return_value=cache), \
+             patch('app.utils._reask_llm', reask_llm), \
+             patch('app.utils.completion') as completion, \
+             track_lossy_results() as lossy:
+            llm = create_llm_function()
+            completion.return_value = llm_response('{"score": 9, "text": "cut', usage=(10, 10))
+            assert llm("truncated", {"score": "int"}) == {"score": 9}
+            completion.return_value = llm_response("score is seven", usage=(10, 10))
+            assert llm("reask", {"score": "int"}) == {"score": 7}
+            cache.set.assert_not_called()
+
+            completion.return_value = llm_response('Result: {"score": 8}', usage=(10, 10))
+            assert llm("extracted", {"score": "int"}) == {"score": 8}
+
+        cache.set.assert_called_once_with("key", {"score": 8})
+        assert lossy.count == 2
@@ -0,0 +1,114 @@
+# tests/test_llm_cache.py
+# LLM响应缓存测试
+
+import time
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.llm_cache import SQLiteCache, LLMResponseCache
+from app.utils import create_llm_function, create_async_llm_function
+
+
+class TestSQLiteCache:
+    """SQLite缓存测试"""
+
+    def test_hit_miss_counters(self, tmp_path):
+        """测试命中/未命中统计"""
+        cache = SQLiteCache(str(tmp_path / "cache.db"))
+
+        assert cache.get("k") is None
+        cache.set("k", {"a": [1, 2]})
+        assert cache.get("k") == {"a": [1, 2]}
+
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+
+    def test_ttl_expiry(self, tmp_path):
+        """测试过期条目视为未命中"""
+        cache = SQLiteCache(str(tmp_path / "cache.db"), ttl_seconds=1)
+        cache.set("k", "v")
+
+        with patch('app.llm_cache.time.time', return_value=time.time() + 5):
+            assert cache.get("k") is None
+        assert cache.size() == 0
+
+    def test_lru_eviction(self, tmp_path):
+        """测试超出容量时淘汰最久未访问的条目"""
+        cache = SQLiteCache(str(tmp_path / "cache.db"), max_entries=2)
+        cache.set("a", 1)
+        time.sleep(0.01)
+        cache.set("b", 2)
+        time.sleep(0.01)
+        cache.get("a")  # a 变为最近访问
+        cache.set("c", 3)
+
+        cache.evict()
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_key_depends_on_all_inputs(self):
+        """测试缓存键包含模型、温度、系统提示词、prompt和输出格式"""
+        base = LLMResponseCache.make_key("m", 0.1, "sys", "prompt", {"a": "str"})
+
+        assert base == LLMResponseCache.make_key("m", 0.1, "sys", "prompt", {"a": "str"})
+        assert base != LLMResponseCache.make_key("m2", 0.1, "sys", "prompt", {"a": "str"})
+        assert base != LLMResponseCache.make_key("m", 0.2, "sys", "prompt", {"a": "str"})
+        assert base != LLMResponseCache.make_key("m", 0.1, "other", "prompt", {"a": "str"})
+        assert base != LLMResponseCache.make_key("m", 0.1, "sys", "prompt2", {"a": "str"})
+        assert base != LLMResponseCache.make_key("m", 0.1, "sys", "prompt", None)
+
+
+class TestLLMFunctionCache:
+    """LLM调用函数缓存集成测试"""
+
+    def test_repeated_prompt_served_from_cache(self, tmp_path, llm_response):
+        """测试相同prompt第二次调用不请求API"""
+        cache = LLMResponseCache(str(tmp_path / "llm.db"))
+
+        with patch('app.utils.get_llm_cache', return_value=cache), \
+             patch('app.utils.completion', return_value=llm_response('{"answer": 42}', usage=None)) as mock_completion:
+            llm = create_llm_function()
+            assert llm("question", {"answer": "int"}) == {"answer": 42}
+            assert llm("question", {"answer": "int"}) == {"answer": 42}
+
+        assert mock_completion.call_count == 1
+        assert cache.hits == 1
+
+    def test_bypass_cache(self, tmp_path, llm_response):
+        """测试bypass_cache强制调用API"""
+        cache = LLMResponseCache(str(tmp_path / "llm.db"))
+
+        with patch('app.utils.get_llm_cache', return_value=cache), \
+             patch('app.utils.completion', return_value=llm_response("text", usage=None)) as mock_completion:
+            llm = create_llm_function()
+            llm("question")
+            llm("question", bypass_cache=True)
+
+        assert mock_completion.call_count == 2
+
+    def test_failed_result_not_cached(self, tmp_path, llm_response):
+        """测试失败结果不写入缓存"""
+        cache = LLMResponseCache(str(tmp_path / "llm.db"))
+
+        with patch('app.utils.get_llm_cache', return_value=cache), \
+             patch('app.utils.completion', return_value=llm_response("not json", usage=None)):
+            assert create_llm_function()("question", {"answer": "int"}) is None
+
+        assert cache.size() == 0
+
+    @pytest.mark.asyncio
+    async def test_async_function_shares_cache(self, tmp_path, llm_response):
+        """测试异步调用与同步调用共享缓存"""
+        cache = LLMResponseCache(str(tmp_path / "llm.db"))
+
+        with patch('app.utils.get_llm_cache', return_value=cache), \
+             patch('app.utils.completion', return_value=llm_response('{"x": 1}', usage=None)), \
+             patch('app.utils.acompletion', new_callable=AsyncMock) as mock_acompletion:
+            create_llm_function()("same prompt", {"x": "int"})
+            result = await create_async_llm_function()("same prompt", {"x": "int"})
+
+        assert result == {"x": 1}
+        mock_acompletion.assert_not_called()
@@ -0,0 +1,161 @@
+# tests/test_llm_hedging.py
+# LLM对冲请求测试
+
+import asyncio
+import pytest
+from unittest.mock import Mock, patch
+
+from app.llm_hedging import LLMHedger
+from app.monitoring.api_key_monitor import api_key_monitor
+from app.monitoring.api_key_stats import APIKeyStats
+from app.utils import APIKeyManager, create_async_llm_function
+
+
+async def _reply(value, delay: float = 0.0, error: Exception = None):
+    await asyncio.sleep(delay)
+    if error:
+        raise error
+    return value
+
+
+def _hedger(delay: float = 0.02) -> LLMHedger:
+    hedger = LLMHedger()
+    hedger.hedge_delay = Mock(return_value=delay)
+    return hedger
+
+
+class TestLatencyPercentile:
+    """延迟分位数测试"""
+
+    def test_percentile_from_healthy_keys(self):
+        """测试分位数只使用健康Key的响应时间，样本不足时返回None"""
+        healthy = APIKeyStats(key_id="KEY_1", key_suffix="aaaa", response_time_window=[0.1 * i for i in range(1, 11)])
+        cooling = APIKeyStats(key_id="KEY_2", key_suffix="bbbb", response_time_window=[30.0] * 10, is_cooling=True)
+
+        with patch.object(api_key_monitor, 'stats', {"KEY_1": healthy, "KEY_2": cooling}):
+            assert api_key_monitor.get_latency_percentile(90) == pytest.approx(0.9)
+            assert api_key_monitor.get_latency_percentile(50) == pytest.approx(0.5)
+            assert api_key_monitor.get_latency_percentile(90, min_samples=20) is None
+
+
+class TestHedgeRace:
+    """对冲竞速测试"""
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_loses_to_hedge(self):
+        """测试主请求超过等待时间时发起对冲，对冲先返回则取消主请求"""
+        hedger = _hedger()
+        primary = asyncio.ensure_future(_reply("primary", delay=1))
+
+        with patch('app.llm_hedging.settings.llm_hedge_enabled', True):
+            result = await hedger.race(primary, lambda: _reply("hedge"))
+
+        assert result == ("hedge", True)
+        assert primary.cancelled()
+        stats = hedger.get_stats()
+        assert stats["hedged"] == 1 and stats["hedge_wins"] == 1 and stats["hedge_win_rate"] == 100.0
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_not_hedged(self):
+        """测试主请求在等待时间内返回时不发起对冲；关闭时直接等待主请求"""
+        hedger = _hedger(delay=1)
+        start_hedge = Mock()
+
+        with patch('app.llm_hedging.settings.llm_hedge_enabled', True):
+            assert await hedger.race(_reply("primary"), start_hedge) == ("primary", False)
+        assert await hedger.race(_reply("primary"), start_hedge) == ("primary", False)
+
+        start_hedge.assert_not_called()
+        assert hedger.get_stats()["calls"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_hedge_falls_back_to_primary(self):
+        """测试对冲请求失败时继续等待主请求"""
+        hedger = _hedger()
+
+        with patch('app.llm_hedging.settings.llm_hedge_enabled', True):
+            result = await hedger.race(_reply("primary", delay=0.1), lambda: _reply(None, error=RuntimeError("x")))
+
+        assert result == ("primary", False)
+        assert hedger.get_stats()["hedge_failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_primary_waits_for_hedge(self):
+        """测试主请求先失败（如429）时等待仍在进行的对冲请求；两个都失败时抛出主请求的异常"""
+        hedger = _hedger()
+
+        with patch('app.llm_hedging.settings.llm_hedge_enabled', True), \
+             patch('app.llm_hedging.settings.llm_hedge_max_ratio', 1.0):
+            result = await hedger.race(
+                _reply(None, delay=0.05, error=RuntimeError("429")), lambda: _reply("hedge", delay=0.1)
+            )
+            assert result == ("hedge", True)
+
+            with pytest.raises(RuntimeError, match="429"):
+                await hedger.race(
+                    _reply(None, delay=0.05, error=RuntimeError("429")),
+                    lambda: _reply(None, delay=0.1, error=RuntimeError("503"))
+                )
+
+        stats = hedger.get_stats()
+        assert stats["hedge_wins"] == 1 and stats["hedge_failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_respect_cap(self):
+        """测试并发调用同时到达对冲时间时，对冲请求数仍不超过上限"""
+        hedger = _hedger(delay=0.001)
+
+        with patch('app.llm_hedging.settings.llm_hedge_enabled', True), \
+             patch('app.llm_hedging.settings.llm_hedge_max_ratio', 0.25):
+            await asyncio.gather(*(
+                hedger.race(_reply("primary", delay=0.05), lambda: _reply("hedge", delay=1)) for _ in range(8)
+            ))
+
+        assert hedger.get_stats()["hedged"] <= 2
+
+    @pytest.mark.asyncio
+    async def test_extra_requests_capped(self):
+        """测试对冲请求数不超过调用数的上限比例"""
+        hedger = _hedger(delay=0.001)
+        started = []
+
+        def start_hedge():
+            started.append(1)
+            return _reply("hedge")
+
+        with patch('app.llm_hedging.settings.llm_hedge_enabled', True), \
+             patch('app.llm_hedging.settings.llm_hedge_max_ratio', 0.25):
+            for _ in range(8):
+                await hedger.race(_reply("primary", delay=0.05), start_hedge)
+
+        stats = hedger.get_stats()
+        assert len(started) == stats["hedged"] == 2
+        assert stats["skipped"]["budget"] == 6
+
+
+class TestHedgedLLMCall:
+    """异步LLM调用的对冲测试"""
+
+    @pytest.mark.asyncio
+    async def test_hedge_sent_with_another_key(self, llm_response):
+        """测试对冲请求使用另一个Key，先返回的响应生效"""
+        manager = APIKeyManager(["gsk_hedge_key_aaaa", "gsk_hedge_key_bbbb"])
+        hedger = _hedger()
+        calls = []
+
+        async def fake_acompletion(**kwargs):
+            calls.append(kwargs["api_key"])
+            delay = 1 if len(calls) == 1 else 0
+            await asyncio.sleep(delay)
+            return llm_response(kwargs["api_key"])
+
+        with patch('app.utils.api_key_manager', manager), \
+             patch('app.utils.llm_hedger', hedger), \
+             patch('app.utils.acompletion', fake_acompletion), \
+             patch('app.utils.settings.llm_scheduler_enabled', False), \
+             patch('app.llm_hedging.settings.llm_hedge_enabled', True):
+            result = await create_async_llm_function(use_cache=False)("prompt")
+
+        assert len(calls) == 2 and calls[0] != calls[1]
+        assert result == calls[1]
+        assert hedger.get_stats()["hedge_wins"] == 1
@@ -0,0 +1,160 @@
+# tests/test_llm_scheduler.py
+# LLM速率调度器与并发限制器测试
+
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from app.llm_scheduler import LLMScheduler, TokenBucket, parse_reset_seconds, parse_retry_after
+from app.utils import APIKeyManager, ConcurrencyLimiter
+
+
+class TestTokenBucket:
+    """令牌桶测试"""
+
+    def test_reservations_are_paced_instead_of_rejected(self):
+        """测试额度耗尽后的请求被排队，等待时间按补充速率递增"""
+        bucket = TokenBucket(capacity=2, period=60)
+        now = time.monotonic()
+
+        assert bucket.reserve(1, now) == 0
+        assert bucket.reserve(1, now) == 0
+        # 每30秒补充1个额度
+        assert bucket.reserve(1, now) == pytest.approx(30, abs=0.1)
+        assert bucket.reserve(1, now) == pytest.approx(60, abs=0.1)
+
+    def test_observe_only_lowers_available_tokens(self):
+        """测试响应头只向保守方向校准"""
+        bucket = TokenBucket(capacity=100)
+        now = time.monotonic()
+
+        bucket.observe(limit=None, remaining=500, reset_seconds=None, now=now)
+        assert bucket.tokens == 100
+
+        bucket.observe(limit=None, remaining=0, reset_seconds=5, now=now)
+        assert bucket.wait_time(1, now) >= 5
+
+    def test_parse_groq_durations(self):
+        """测试解析Groq的时长格式"""
+        assert parse_reset_seconds("7.66s") == pytest.approx(7.66)
+        assert parse_reset_seconds("2m59.56s") == pytest.approx(179.56)
+        assert parse_reset_seconds("120ms") == pytest.approx(0.12)
+        assert parse_reset_seconds("1.5") == 1.5
+        assert parse_retry_after("Rate limit reached. Please try again in 7.5s.") == pytest.approx(7.5)
+
+
+class TestLLMScheduler:
+    """调度器测试"""
+
+    def test_reserve_picks_key_with_budget(self):
+        """测试预约时选择仍有额度的Key"""
+        scheduler = LLMScheduler()
+        with patch.dict('app.llm_scheduler.DEFAULT_MODEL_LIMITS', {"m": (1, 1000)}):
+            first = scheduler.reserve(["KEY_1", "KEY_2"], "m", 100)
+            second = scheduler.reserve(["KEY_1", "KEY_2"], "m", 100)
+
+        assert first.wait == 0 and second.wait == 0
+        assert {first.key_id, second.key_id} == {"KEY_1", "KEY_2"}
+
+    def test_cancel_refunds_budget(self):
+        """测试取消预约后额度退还"""
+        scheduler = LLMScheduler()
+        with patch.dict('app.llm_scheduler.DEFAULT_MODEL_LIMITS', {"m": (1, 1000)}):
+            reservation = scheduler.reserve(["KEY_1"], "m", 100)
+            scheduler.cancel(reservation)
+            again = scheduler.reserve(["KEY_1"], "m", 100)
+
+        assert again.wait == 0
+
+    def test_settle_uses_headers_and_usage(self):
+        """测试结算时按实际用量与响应头校准TPM"""
+        scheduler = LLMScheduler()
+        with patch.dict('app.llm_scheduler.DEFAULT_MODEL_LIMITS', {"m": (30, 1000)}):
+            reservation = scheduler.reserve(["KEY_1"], "m", 500)
+            scheduler.settle(reservation, actual_tokens=100, headers={
+                "x-ratelimit-limit-tokens": "6000",
+                "x-ratelimit-remaining-tokens": "50",
+                "x-ratelimit-reset-tokens": "0.5s"
+            })
+
+        bucket = scheduler.get_stats()["buckets"]["KEY_1/m"]
+        assert bucket["tpm_limit"] == 6000
+        assert bucket["tpm_available"] <= 60
+
+    def test_rate_limited_blocks_key(self):
+        """测试429后该Key在建议时间内不再发放额度"""
+        scheduler = LLMScheduler()
+        scheduler.on_rate_limited("KEY_1", "m", "Please try again in 10s")
+
+        reservation = scheduler.reserve(["KEY_1"], "m", 10)
+        assert reservation.wait >= 9
+
+
+class TestStableKeyIds:
+    """Key ID稳定性测试"""
+
+    def test_key_id_survives_rotation(self):
+        """测试轮换后Key ID不变"""
+        manager = APIKeyManager(["gsk_stable_key_a", "gsk_stable_key_b"])
+        manager.rotate_key()
+
+        assert manager._get_key_id("gsk_stable_key_a") == "KEY_1"
+        assert manager._get_key_id("gsk_stable_key_b") == "KEY_2"
+
+
+class TestConcurrencyLimiter:
+    """同步/异步共享的并发限制器测试"""
+
+    @pytest.mark.asyncio
+    async def test_async_and_thread_callers_share_limit(self):
+        """测试线程与协程共享同一并发上限"""
+        limiter = ConcurrencyLimiter(max_concurrent=2)
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def enter():
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+
+        def leave():
+            with lock:
+                state["active"] -= 1
+
+        def sync_call():
+            with limiter:
+                enter()
+                time.sleep(0.05)
+                leave()
+
+        async def async_call():
+            async with limiter:
+                enter()
+                await asyncio.sleep(0.05)
+                leave()
+
+        await asyncio.gather(
+            *(asyncio.to_thread(sync_call) for _ in range(3)),
+            *(async_call() for _ in range(3))
+        )
+
+        assert state["peak"] <= 2
+        assert limiter.active_requests == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        """测试排队中被取消的请求不占用许可"""
+        limiter = ConcurrencyLimiter(max_concurrent=1)
+        await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        limiter.release()
+        assert limiter.active_requests == 0
+        assert limiter.waiting_requests == 0
@@ -0,0 +1,98 @@
+# tests/test_model_cascade.py
+# 质量评估模型级联测试
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.model_cascade import ModelCascade
+from app.agents.parallel.quality_agent import QualityChunkAgent
+
+
+def _evaluation(score) -> dict:
+    return {"step3_logic": 3, "step3_issues": [], "total_score": score, "pass": score >= 9, "reasoning": str(score)}
+
+
+class FakeLLM:
+    """按顺序返回预设结果的LLM，记录调用次数"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self, prompt, output_format=None, temperature=None):
+        self.calls += 1
+        return self.results.pop(0)
+
+
+class TestEscalationPolicy:
+    """升级策略测试"""
+
+    def test_borderline_and_invalid_results_escalate(self):
+        """测试总分在不确定区间内或结果无效时升级，明确的高分/低分不升级"""
+        cascade = ModelCascade("test")
+        with patch('app.model_cascade.settings.quality_cascade_low', 7.0), \
+             patch('app.model_cascade.settings.quality_cascade_high', 9.0):
+            assert cascade.escalation_reason(_evaluation(11)) is None
+            assert cascade.escalation_reason(_evaluation(4)) is None
+            assert cascade.escalation_reason(_evaluation(7)) == "borderline"
+            assert cascade.escalation_reason(_evaluation(9)) == "borderline"
+            assert cascade.escalation_reason({"total_score": "n/a"}) == "invalid"
+            assert cascade.escalation_reason(None) == "invalid"
+
+
+class TestCascadeCalls:
+    """级联调用测试"""
+
+    def test_light_result_kept_unless_borderline(self):
+        """测试轻量模型结论明确时不调用默认模型，不确定时返回默认模型的结果"""
+        light, advanced = FakeLLM(_evaluation(11), _evaluation(8)), FakeLLM(_evaluation(6))
+        cascade = ModelCascade("test", light_llm=light, advanced_llm=advanced)
+        llm = cascade.create_llm_function()
+
+        assert llm("prompt one", {"total_score": "int"})["total_score"] == 11
+        assert advanced.calls == 0
+        assert llm("prompt two", {"total_score": "int"})["total_score"] == 6
+        assert advanced.calls == 1
+
+        stats = cascade.get_stats()
+        assert stats["calls"] == 2 and stats["accepted_light"] == 1
+        assert stats["escalation_rate"] == 50.0
+        assert stats["escalation_reasons"] == {"borderline": 1}
+        assert stats["advanced_tokens_saved"] > 0
+        assert stats["seconds_saved"] is not None
+
+    def test_failed_escalation_keeps_light_result(self):
+        """测试默认模型调用失败时保留轻量模型的结果"""
+        cascade = ModelCascade("test", light_llm=FakeLLM(_evaluation(8)), advanced_llm=FakeLLM(None))
+        assert cascade.create_llm_function()("prompt", {})["total_score"] == 8
+
+    @pytest.mark.asyncio
+    async def test_async_version(self):
+        """测试异步版本与同步版本策略一致"""
+        light, advanced = FakeLLM(_evaluation(8)), FakeLLM(_evaluation(10))
+        cascade = ModelCascade("test", light_llm=light, advanced_llm=advanced)
+
+        result = await cascade.create_llm_function().async_version("prompt", {})
+        assert result["total_score"] == 10
+        assert cascade.get_stats()["escalated"] == 1
+
+
+class TestQualityAgentCascade:
+    """质量评估节点使用级联测试"""
+
+    def test_cascade_used_when_no_llm_injected(self):
+        """测试开启级联且未注入LLM时，质量评估先使用轻量模型"""
+        light, advanced = FakeLLM(_evaluation(11)), FakeLLM()
+        cascade = ModelCascade("quality", light_llm=light, advanced_llm=advanced)
+        validated = SimpleNamespace(original="original sentence", imitation="imitation sentence",
+                                    map={"a": ["b"]}, paragraph="paragraph text")
+        state = {"chunk_id": 0, "chunk_text": "text", "validated_shadow": validated}
+
+        with patch('app.agents.parallel.quality_agent.settings.quality_cascade_enabled', True), \
+             patch('app.agents.parallel.quality_agent.quality_cascade', cascade), \
+             patch('app.agents.parallel.quality_agent.ensure_dependencies'):
+            result = QualityChunkAgent()(state)
+
+        assert result["quality_passed"] is True and result["quality_score"] == 11.0
+        assert light.calls == 1 and advanced.calls == 0
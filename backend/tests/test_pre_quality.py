@@ -0,0 +1,98 @@
+# tests/test_pre_quality.py
+# 质量评估本地预检测试
+
+from unittest.mock import patch
+
+from app.agents.parallel.pre_quality_agent import (
+    compute_pre_quality_metrics, classify_pre_quality, local_quality_score, pre_quality_gate
+)
+from app.workflows import create_chunk_pipeline, build_workflow_config
+
+
+ORIGINAL = "We spent about three hours a day on our phones, and most of it was scrolling."
+GOOD_IMITATION = "We spent about two hours a day on our bikes, and most of it was climbing."
+GOOD_MAP = {"three": ["two"], "phones": ["bikes"], "scrolling": ["climbing"]}
+
+
+def _decide(original, imitation, word_map):
+    return classify_pre_quality(compute_pre_quality_metrics(original, imitation, word_map))
+
+
+class TestPreQualityClassification:
+    """预检判定测试"""
+
+    def test_obvious_failures_rejected(self):
+        """测试复述原句、映射词不在原句中、替换太少直接拒绝"""
+        decision, issues = _decide(ORIGINAL, ORIGINAL, GOOD_MAP)
+        assert decision == "reject"
+        assert "Imitation repeats the original sentence" in issues
+
+        decision, issues = _decide(ORIGINAL, GOOD_IMITATION, {"cats": ["dogs"], "rain": ["snow"]})
+        assert decision == "reject"
+        assert "Word map keys do not appear in the original sentence" in issues
+
+        decision, _ = _decide(ORIGINAL, ORIGINAL.replace("phones", "bikes"), {"phones": ["bikes"]})
+        assert decision == "reject"
+
+    def test_clean_structural_imitation_passes(self):
+        """测试骨架一致、映射完整、替换充分的迁移句直接通过"""
+        metrics = compute_pre_quality_metrics(ORIGINAL, GOOD_IMITATION, GOOD_MAP)
+
+        assert metrics["map_coverage"] == 1.0
+        assert metrics["replaced_words"] == 3
+        assert metrics["structure_similarity"] == 1.0
+        assert classify_pre_quality(metrics) == ("pass", [])
+        assert 9.0 <= local_quality_score(metrics) <= 11.0
+
+    def test_borderline_goes_to_llm(self):
+        """测试句子结构改动较大的迁移句交给LLM评估"""
+        imitation = "Most of our evenings went to climbing, since we rode bikes for two hours daily."
+        assert _decide(ORIGINAL, imitation, GOOD_MAP)[0] == "llm"
+
+
+class TestPreQualityPipeline:
+    """流水线中的预检路由测试"""
+
+    def _run(self, shadow):
+        calls = []
+        self.prompts = []
+
+        def llm(prompt, output_format=None, temperature=None):
+            kind = "quality" if "total_score" in output_format else "correction" if "Improved" in str(output_format) else "shadow"
+            calls.append(kind)
+            self.prompts.append(prompt)
+            if kind == "quality":
+                return {"step3_logic": 3, "step3_issues": [], "total_score": 10, "pass": True, "reasoning": "ok"}
+            if kind == "correction":
+                return {"original": ORIGINAL, "imitation": GOOD_IMITATION, "map": GOOD_MAP}
+            return shadow
+
+        state = {"chunk_text": ORIGINAL, "chunk_id": 0, "total_chunks": 1, "final_shadow_chunks": []}
+        result = create_chunk_pipeline().invoke(state, config=build_workflow_config(llm=llm))
+        return result, calls
+
+    def test_confident_decisions_skip_llm_evaluation(self):
+        """测试明显合格跳过评估，明显不合格跳过评估直接修正，并计入节省的调用数"""
+        pre_quality_gate.reset_stats()
+
+        result, calls = self._run({"original": ORIGINAL, "imitation": GOOD_IMITATION, "map": GOOD_MAP})
+        assert calls == ["shadow"]
+        assert result["pre_quality"]["decision"] == "pass"
+        assert result["quality_passed"] is True and result["quality_score"] >= 9.0
+        assert len(result["final_shadow_chunks"]) == 1
+
+        result, calls = self._run({"original": ORIGINAL, "imitation": ORIGINAL, "map": GOOD_MAP})
+        assert calls == ["shadow", "correction"]
+        assert result["quality_detail"]["source"] == "pre_quality"
+        # 修正prompt描述预检的拒绝原因，而不是全为0的LLM步骤分数
+        assert "Imitation repeats the original sentence" in self.prompts[-1]
+        assert "Grammar Structure: 0/3" not in self.prompts[-1]
+
+        stats = pre_quality_gate.get_stats()
+        assert stats["passed"] == 1 and stats["rejected"] == 1 and stats["llm_calls_saved"] == 2
+
+    def test_disabled_gate_always_calls_llm(self):
+        """测试关闭预检时所有语义块都调用LLM评估"""
+        with patch('app.agents.parallel.pre_quality_agent.settings.pre_quality_enabled', False):
+            _, calls = self._run({"original": ORIGINAL, "imitation": GOOD_IMITATION, "map": GOOD_MAP})
+        assert calls == ["shadow", "quality"]
@@ -0,0 +1,92 @@
+# tests/test_progress_bus.py
+# 进度事件总线测试
+
+import asyncio
+import threading
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.progress_bus import ProgressBus
+
+
+def _progress(chunk: int, total: int = 50) -> dict:
+    return {"type": "chunk_progress", "current_chunk": chunk, "total_chunks": total, "stage": "shadow_writing"}
+
+
+class TestProgressBus:
+    """进度事件总线测试"""
+
+    @pytest.mark.asyncio
+    async def test_messages_from_threads_are_delivered(self):
+        """测试工作线程中发布的消息（无运行中的事件循环）全部投递"""
+        bus = ProgressBus()
+        bus.bind_loop(asyncio.get_running_loop())
+
+        def node(i):
+            bus.publish("task", {"type": "chunking_started", "n": i})
+
+        with patch('app.progress_bus.sse_manager.add_message', new_callable=AsyncMock) as mock_add:
+            threads = [threading.Thread(target=node, args=(i,)) for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            await bus.flush()
+
+        assert sorted(c.args[1]["n"] for c in mock_add.call_args_list) == list(range(20))
+        assert bus.pending() == 0
+
+    @pytest.mark.asyncio
+    async def test_buffered_until_loop_bound(self):
+        """测试绑定事件循环前发布的消息暂存，绑定后补发"""
+        bus = ProgressBus()
+        bus.publish("task", {"type": "chunking_started"})
+
+        with patch('app.progress_bus.sse_manager.add_message', new_callable=AsyncMock) as mock_add:
+            bus.bind_loop(asyncio.get_running_loop())
+            await asyncio.sleep(0.01)
+
+        mock_add.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_chunk_progress_coalesced_and_order_kept(self):
+        """测试同一批次的chunk_progress合并为一条，其余消息保持顺序"""
+        bus = ProgressBus()
+        bus.bind_loop(asyncio.get_running_loop())
+
+        with patch('app.progress_bus.sse_manager.add_message', new_callable=AsyncMock) as mock_add:
+            bus.publish("task", {"type": "chunking_completed"})
+            bus.publish("task", {"type": "chunks_processing_started"})
+            for chunk in range(1, 31):
+                bus.publish("task", _progress(chunk))
+            bus.publish("other", _progress(1))
+            await bus.flush()
+
+        delivered = [(c.args[0], c.args[1]["type"]) for c in mock_add.call_args_list]
+        assert delivered == [
+            ("task", "chunking_completed"),
+            ("task", "chunks_processing_started"),
+            ("task", "chunk_progress"),
+            ("other", "chunk_progress"),
+        ]
+        merged = mock_add.call_args_list[2].args[1]
+        assert merged["current_chunk"] == 30
+        assert merged["chunks"] == list(range(1, 31))
+        assert bus.get_stats()["coalesced"] == 29
+
+    @pytest.mark.asyncio
+    async def test_flush_orders_before_direct_messages(self):
+        """测试flush后直接推送的消息排在此前发布的进度消息之后"""
+        bus = ProgressBus()
+        bus.bind_loop(asyncio.get_running_loop())
+        delivered = []
+
+        async def record(task_id, message):
+            delivered.append(message["type"])
+
+        with patch('app.progress_bus.sse_manager.add_message', side_effect=record):
+            await asyncio.to_thread(bus.publish, "task", _progress(1))
+            await bus.flush()
+            await record("task", {"type": "url_completed"})
+
+        assert delivered == ["chunk_progress", "url_completed"]
@@ -0,0 +1,142 @@
+# tests/test_provider_router.py
+# 多提供商路由测试
+
+import time
+import pytest
+from unittest.mock import Mock, patch
+
+from app.provider_router import ProviderRouter, Route, track_failovers
+from app.utils import APIKeyManager, create_llm_function
+
+GROQ_70B = Route("groq", "llama-3.3-70b-versatile")
+GROQ_8B = Route("groq", "llama-3.1-8b-instant")
+OPENAI = Route("openai", "gpt-4o-mini")
+DEEPSEEK = Route("deepseek", "deepseek-chat")
+
+
+@pytest.fixture
+def providers():
+    """配置三个提供商的Key，启用路由"""
+    with patch('app.provider_router.settings.provider_router_enabled', True), \
+         patch('app.provider_router.settings.groq_api_key', "gsk_router_test"), \
+         patch('app.provider_router.settings.openai_api_key', "sk-router-test"), \
+         patch('app.provider_router.settings.deepseek_api_key', "ds-router-test"), \
+         patch('app.utils.api_key_manager', None):
+        yield
+
+
+class TestRouteSelection:
+    """候选选择测试"""
+
+    def test_fastest_option_meeting_stage_tier(self, providers):
+        """测试按EWMA延迟选择满足阶段质量要求的候选"""
+        router = ProviderRouter()
+        for route, latency in ((GROQ_70B, 4.0), (GROQ_8B, 0.5), (OPENAI, 2.0), (DEEPSEEK, 3.0)):
+            router.record_success(route, latency)
+
+        assert router.route(GROQ_70B.model, stage="shadow_writing") == OPENAI
+        assert router.route(GROQ_70B.model, stage="search_optimizer") == GROQ_8B
+        assert router.get_stats()["failovers"] == 2
+
+    def test_requested_model_preferred_without_samples(self, providers):
+        """测试没有延迟样本时优先请求的模型；关闭时不路由"""
+        router = ProviderRouter()
+        assert router.route(GROQ_70B.model, stage="quality") == GROQ_70B
+
+        with patch('app.provider_router.settings.provider_router_enabled', False):
+            assert router.route(GROQ_70B.model) is None
+
+    def test_failures_cool_down_and_raise_expected_latency(self, providers):
+        """测试服务故障后候选立即冷却，错误率EWMA提高其预期延迟"""
+        router = ProviderRouter()
+        router.record_success(OPENAI, 1.0)
+        router.record_success(DEEPSEEK, 1.2)
+        router.record_failure(OPENAI)
+
+        assert router.route(GROQ_70B.model, stage="quality") == DEEPSEEK
+
+        router.health[OPENAI].cooling_until = 0
+        assert router.health[OPENAI].expected_latency() > router.health[DEEPSEEK].expected_latency()
+        assert router.route(GROQ_70B.model, stage="quality") == DEEPSEEK
+
+    def test_track_failovers_counts_non_requested_routes(self, providers):
+        """测试只有代码块内切换到非请求模型的路由计入切换统计"""
+        router = ProviderRouter()
+        router.record_success(OPENAI, 1.0)
+
+        with track_failovers() as failovers:
+            assert router.route(GROQ_70B.model, stage="quality") == OPENAI
+        assert router.route(GROQ_70B.model, stage="quality") == OPENAI
+
+        assert failovers.count == 1
+
+    def test_cooling_groq_keys_fail_over(self, providers):
+        """测试Groq所有Key冷却时直接切换到其他提供商"""
+        router = ProviderRouter()
+        manager = APIKeyManager(["gsk_router_key_aaaa"])
+        manager.key_cooldown["gsk_router_key_aaaa"] = time.time() + 60
+
+        with patch('app.utils.api_key_manager', manager):
+            assert router.route(GROQ_70B.model, stage="quality") == OPENAI
+
+
+class TestRoutedLLMCall:
+    """LLM调用的路由与切换测试"""
+
+    def test_outage_fails_over_to_another_provider(self, providers, llm_response):
+        """测试默认提供商故障时立即切换到其他提供商，并使用其Key"""
+        router = ProviderRouter()
+        calls = []
+
+        def fake_completion(**kwargs):
+            calls.append((kwargs["model"], kwargs["api_key"]))
+            if kwargs["model"].startswith("groq/"):
+                raise Exception("503 Service Unavailable")
+            return llm_response('{"ok": true}')
+
+        with patch('app.utils.provider_router', router), \
+             patch('app.utils.completion', side_effect=fake_completion):
+            result = create_llm_function(use_cache=False)("prompt", {"ok": "bool"})
+
+        assert result == {"ok": True}
+        assert calls[0][0] == "groq/llama-3.3-70b-versatile"
+        assert calls[1] == ("openai/gpt-4o-mini", "sk-router-test")
+        assert router.get_stats()["routes"]["groq/llama-3.3-70b-versatile"]["cooling_seconds"] > 0
+
+    def test_client_error_does_not_cool_or_fail_over(self, providers):
+        """测试400等客户端错误（含上下文超长）直接放弃，不让候选冷却，也不切换到其他提供商"""
+        router = ProviderRouter()
+        error = Exception("This model's maximum context length is exceeded")
+        error.status_code = 400
+
+        with patch('app.utils.provider_router', router), \
+             patch('app.utils.completion', side_effect=error) as completion:
+            assert create_llm_function(use_cache=False)("prompt") is None
+
+        assert completion.call_count == 1
+        assert router.get_stats()["routes"]["groq/llama-3.3-70b-versatile"]["cooling_seconds"] == 0
+
+    def test_failover_response_not_cached_as_requested_model(self, providers, llm_response):
+        """测试切换到其他提供商的回复不写入按请求模型计算的缓存，请求的模型的回复正常写入"""
+        cache = Mock()
+        cache.make_key.return_value = "key"
+        cache.get.return_value = None
+        groq_down = {"value": True}
+
+        def fake_completion(**kwargs):
+            if kwargs["model"].startswith("groq/") and groq_down["value"]:
+                raise Exception("503 Service Unavailable")
+            return llm_response('{"ok": true}')
+
+        with patch('app.utils.provider_router', ProviderRouter()), \
+             patch('app.utils.get_llm_cache', return_value=cache), \
+             patch('app.utils.completion', side_effect=fake_completion):
+            assert create_llm_function()("prompt", {"ok": "bool"}) == {"ok": True}
+            cache.set.assert_not_called()
+
+        groq_down["value"] = False
+        with patch('app.utils.provider_router', ProviderRouter()), \
+             patch('app.utils.get_llm_cache', return_value=cache), \
+             patch('app.utils.completion', side_effect=fake_completion):
+            assert create_llm_function()("prompt", {"ok": "bool"}) == {"ok": True}
+            cache.set.assert_called_once_with("key", {"ok": True})
@@ -0,0 +1,140 @@
+# tests/test_quality_batcher.py
+# 质量评估批量模式测试
+
+import asyncio
+import re
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.agents.parallel.quality_agent import QualityChunkAgent
+from app.agents.parallel.quality_batcher import QualityBatcher, parse_evaluation_item
+
+
+def _evaluation(score, passed=True) -> dict:
+    return {
+        "step1_grammar": 3, "step2_content": 2, "step3_logic": 3, "step3_issues": [],
+        "step4_topic": 2, "step5_learning": 1, "total_score": score, "pass": passed, "reasoning": f"score {score}"
+    }
+
+
+def _validated(i):
+    return SimpleNamespace(
+        original=f"This is the original sentence number {i} from the talk.",
+        imitation=f"This is the imitation sentence number {i} on a new topic.",
+        map={"original": ["initial"], "talk": ["speech"]},
+        paragraph=f"Paragraph {i} of the talk with enough text."
+    )
+
+
+class RecordingLLM:
+    """记录调用的异步LLM；批量评估时第i块得分为 8+i，bad_ids 中的块返回缺少分数的项"""
+
+    def __init__(self, bad_ids=()):
+        self.batch_calls = []
+        self.single_prompts = []
+        self.bad_ids = set(bad_ids)
+        self.async_version = self.acall  # as_async_llm_function 使用该协程函数
+
+    def __call__(self, prompt, output_format=None, temperature=None):
+        raise AssertionError("异步路径不应调用同步版本")
+
+    async def acall(self, prompt, output_format=None, temperature=None):
+        await asyncio.sleep(0)
+        if "results" in output_format:
+            count = len(re.findall(r"^\[Chunk \d+\]$", prompt, re.M))
+            self.batch_calls.append(count)
+            return {"results": [
+                {"chunk_id": i, "reasoning": "no score"} if i in self.bad_ids else {"chunk_id": i, **_evaluation(8 + i)}
+                for i in range(1, count + 1)
+            ]}
+        self.single_prompts.append(prompt)
+        return _evaluation(5, passed=False)
+
+
+class TestParseEvaluationItem:
+    """批量评估结果校验测试"""
+
+    def test_valid_item_keeps_single_call_format(self):
+        """测试有效项去掉块编号后与单块评估格式相同"""
+        assert parse_evaluation_item({"chunk_id": 2, **_evaluation(10)}) == _evaluation(10)
+
+    def test_malformed_items_rejected(self):
+        """测试缺少分数、分数不是数字、pass不是布尔值的项无效"""
+        assert parse_evaluation_item({"chunk_id": 1, "pass": True}) is None
+        assert parse_evaluation_item({**_evaluation(10), "total_score": "high"}) is None
+        assert parse_evaluation_item({**_evaluation(10), "pass": "yes"}) is None
+
+
+class TestQualityBatcher:
+    """质量评估批处理器测试"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_chunks_share_one_evaluation(self):
+        """测试同时提交的K个语义块合并评估，各自拿到自己的分数"""
+        batcher = QualityBatcher(max_batch_size=3, max_wait_ms=1000)
+        llm = RecordingLLM()
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(llm, _validated(i)) for i in range(3))), 1
+        )
+
+        assert llm.batch_calls == [3] and llm.single_prompts == []
+        assert [r["total_score"] for r in results] == [9, 10, 11]
+
+    @pytest.mark.asyncio
+    async def test_malformed_items_evaluated_individually(self):
+        """测试格式错误的项用单块评估prompt重新评估"""
+        batcher = QualityBatcher(max_batch_size=3, max_wait_ms=1000)
+        llm = RecordingLLM(bad_ids=[2])
+
+        results = await asyncio.gather(*(batcher.submit(llm, _validated(i)) for i in range(3)))
+
+        assert [r["total_score"] for r in results] == [9, 5, 11]
+        assert len(llm.single_prompts) == 1
+        assert "number 1 from the talk" in llm.single_prompts[0]
+        assert batcher.get_stats()["fallback_chunks"] == 1
+
+
+class TestQualityAgentBatchMode:
+    """质量评估节点批量模式测试"""
+
+    @pytest.mark.asyncio
+    async def test_results_routed_to_each_chunk(self):
+        """测试开启批量模式后每个语义块仍写入自己的 quality_passed / quality_detail"""
+        llm = RecordingLLM()
+        agent = QualityChunkAgent()
+        states = [
+            {"chunk_id": i, "chunk_text": "text", "validated_shadow": _validated(i), "async_llm_function": llm}
+            for i in range(3)
+        ]
+
+        with patch('app.agents.parallel.quality_agent.settings.quality_batch_size', 3):
+            results = await asyncio.wait_for(asyncio.gather(*(agent.acall(state) for state in states)), 1)
+
+        assert llm.batch_calls == [3]
+        assert [r["quality_score"] for r in results] == [9.0, 10.0, 11.0]
+        assert all(r["quality_passed"] for r in results)
+        assert results[1]["quality_detail"]["reasoning"] == "score 10"
+
+    @pytest.mark.asyncio
+    async def test_cascade_combined_with_batching(self):
+        """测试同时开启级联时批量评估使用轻量模型，不确定的语义块由默认模型单独评分"""
+        from app.model_cascade import ModelCascade
+
+        light, advanced = RecordingLLM(), RecordingLLM()
+        cascade = ModelCascade("quality", light_llm=light, advanced_llm=advanced)
+        agent = QualityChunkAgent()
+        states = [{"chunk_id": i, "chunk_text": "text", "validated_shadow": _validated(i)} for i in range(3)]
+
+        with patch('app.agents.parallel.quality_agent.settings.quality_batch_size', 3), \
+             patch('app.agents.parallel.quality_agent.settings.quality_cascade_enabled', True), \
+             patch('app.agents.parallel.quality_agent.quality_cascade', cascade), \
+             patch('app.agents.parallel.quality_agent.ensure_dependencies'):
+            results = await asyncio.wait_for(asyncio.gather(*(agent.acall(state) for state in states)), 1)
+
+        # 第1块得分9落在不确定区间，升级后由默认模型评分
+        assert light.batch_calls == [3] and light.single_prompts == []
+        assert advanced.batch_calls == [] and len(advanced.single_prompts) == 1
+        assert [r["quality_score"] for r in results] == [5.0, 10.0, 11.0]
+        assert cascade.get_stats()["escalated"] == 1
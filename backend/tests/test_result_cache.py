@@ -0,0 +1,153 @@
+# tests/test_result_cache.py
+# 演讲结果缓存测试
+
+import pytest
+from unittest.mock import Mock, patch
+
+from app import result_cache
+from app.result_cache import TalkResultCache, compute_pipeline_version
+from app.agent import process_ted_text
+from app.provider_router import _failover_tracker
+from app.json_repair import record_lossy_result
+
+
+class FakeWorkflow:
+    """模拟异步工作流"""
+
+    def __init__(self, chunks, total_chunks=None):
+        self.chunks = chunks
+        self.total_chunks = len(chunks) if total_chunks is None else total_chunks
+        self.runs = 0
+
+    async def astream(self, initial_state, config=None, stream_mode="updates"):
+        self.runs += 1
+        yield {"semantic_chunking": {"semantic_chunks": ["chunk"] * self.total_chunks}}
+        for chunk in self.chunks:
+            yield {"chunk_pipeline": {"final_shadow_chunks": [chunk]}}
+
+
+@pytest.fixture
+def talk_cache(tmp_path):
+    """使用临时数据库的结果缓存"""
+    cache = TalkResultCache(str(tmp_path / "results.db"))
+    with patch('app.result_cache.get_result_cache', return_value=cache):
+        yield cache
+
+
+class TestPipelineVersion:
+    """流水线版本测试"""
+
+    def test_version_follows_template_changes(self, tmp_path):
+        """测试修改prompt模板后版本号变化"""
+        (tmp_path / "shadow_writing").mkdir()
+        template = tmp_path / "shadow_writing" / "main.txt"
+        template.write_text("v1 {chunk_text}", encoding="utf-8")
+
+        with patch('app.result_cache.TEMPLATES_DIR', tmp_path):
+            before = compute_pipeline_version("model-a")
+            template.write_text("v2 with more words {chunk_text}", encoding="utf-8")
+            after = compute_pipeline_version("model-a")
+
+        assert before != after
+
+    def test_version_follows_model(self):
+        """测试不同模型的版本号不同"""
+        assert compute_pipeline_version("model-a") != compute_pipeline_version("model-b")
+
+    def test_version_follows_pipeline_options(self):
+        """测试改变结果的流水线开关（本地预检、级联、批量大小）改变版本号"""
+        base = compute_pipeline_version("model-a")
+        for option, value in (("pre_quality_enabled", False), ("quality_cascade_enabled", True),
+                              ("shadow_batch_size", 4), ("quality_batch_size", 4)):
+            with patch(f'app.result_cache.settings.{option}', value):
+                assert compute_pipeline_version("model-a") != base, option
+        assert compute_pipeline_version("model-a") == base
+
+
+class TestProcessTedTextCache:
+    """process_ted_text 结果缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_second_run_skips_workflow(self, talk_cache):
+        """测试相同transcript第二次处理直接返回缓存结果"""
+        workflow = FakeWorkflow([{"original": "o", "imitation": "i"}])
+        llm = Mock()
+        llm.model_name = "model-a"
+
+        with patch('app.agent.get_async_parallel_shadow_writing_workflow', return_value=workflow):
+            first = await process_ted_text("same transcript", llm=llm)
+            second = await process_ted_text("same transcript", llm=llm)
+
+        assert workflow.runs == 1
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["results"] == first["results"]
+
+    @pytest.mark.asyncio
+    async def test_empty_results_not_cached(self, talk_cache):
+        """测试空结果不写入缓存"""
+        workflow = FakeWorkflow([])
+
+        with patch('app.agent.get_async_parallel_shadow_writing_workflow', return_value=workflow):
+            await process_ted_text("transcript", llm=Mock())
+            await process_ted_text("transcript", llm=Mock())
+
+        assert workflow.runs == 2
+        assert talk_cache.size() == 0
+
+    @pytest.mark.asyncio
+    async def test_partial_results_not_cached(self, talk_cache):
+        """测试部分语义块没有产出结果的运行不写入缓存"""
+        workflow = FakeWorkflow([{"original": "o", "imitation": "i"}], total_chunks=2)
+
+        with patch('app.agent.get_async_parallel_shadow_writing_workflow', return_value=workflow):
+            first = await process_ted_text("transcript", llm=Mock())
+            second = await process_ted_text("transcript", llm=Mock())
+
+        assert first["result_count"] == 1
+        assert second["cached"] is False
+        assert workflow.runs == 2
+        assert talk_cache.size() == 0
+
+    @pytest.mark.asyncio
+    async def test_failover_results_not_cached(self, talk_cache):
+        """测试运行中有LLM调用切换到其他提供商/模型时不写入缓存"""
+        class FailoverWorkflow(FakeWorkflow):
+            async def astream(self, initial_state, config=None, stream_mode="updates"):
+                _failover_tracker.get().count += 1  # 模拟路由选择了非请求的模型
+                async for update in super().astream(initial_state, config, stream_mode):
+                    yield update
+
+        workflow = FailoverWorkflow([{"original": "o", "imitation": "i"}])
+
+        with patch('app.agent.get_async_parallel_shadow_writing_workflow', return_value=workflow):
+            await process_ted_text("transcript", llm=Mock())
+            second = await process_ted_text("transcript", llm=Mock())
+
+        assert second["cached"] is False
+        assert workflow.runs == 2
+        assert talk_cache.size() == 0
+
+    @pytest.mark.asyncio
+    async def test_lossy_results_not_cached(self, talk_cache):
+        """测试运行中有LLM结果经过修复或重新整理时不写入缓存"""
+        class LossyWorkflow(FakeWorkflow):
+            async def astream(self, initial_state, config=None, stream_mode="updates"):
+                record_lossy_result()  # 模拟某个语义块的回复被截断补全
+                async for update in super().astream(initial_state, config, stream_mode):
+                    yield update
+
+        workflow = LossyWorkflow([{"original": "o", "imitation": "i"}])
+
+        with patch('app.agent.get_async_parallel_shadow_writing_workflow', return_value=workflow):
+            await process_ted_text("transcript", llm=Mock())
+            second = await process_ted_text("transcript", llm=Mock())
+
+        assert second["cached"] is False
+        assert workflow.runs == 2
+        assert talk_cache.size() == 0
+
+    def test_disabled_cache(self):
+        """测试关闭缓存时不创建缓存实例"""
+        with patch('app.result_cache.settings.result_cache_enabled', False):
+            assert result_cache.get_result_cache() is None
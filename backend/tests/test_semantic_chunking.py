@@ -0,0 +1,74 @@
+# tests/test_semantic_chunking.py
+# 语义分块测试（句子切分 + token预算）
+
+from unittest.mock import patch
+
+from app.agents.shared.semantic_chunking import Semantic_Chunking_Agent, split_sentences, count_tokens
+
+
+TALK = " ".join(
+    f"Sentence {i} is about how Dr. Lee measured a 2.5 times gain in memory, e.g. after sleep."
+    for i in range(60)
+)
+
+
+class TestSentenceSplitting:
+    """句子切分测试"""
+
+    def test_abbreviations_initials_and_decimals_do_not_split(self):
+        """测试缩写、人名首字母、小数处不断句"""
+        text = ("Dr. Smith arrived at 3.5 p.m. on Friday. He met J. K. Rowling in the U.S. and said hello... "
+                "then left! Did it work? Yes, e.g. the results were 2.75 times better. Mr. Jones agreed.")
+
+        assert split_sentences(text) == [
+            "Dr. Smith arrived at 3.5 p.m. on Friday.",
+            "He met J. K. Rowling in the U.S. and said hello... then left!",
+            "Did it work?",
+            "Yes, e.g. the results were 2.75 times better.",
+            "Mr. Jones agreed.",
+        ]
+
+    def test_closing_quotes_stay_with_sentence(self):
+        """测试句末引号/括号留在句子中，结尾无标点的文本也保留"""
+        assert split_sentences('She said "stop." (Laughter) And then we left') == [
+            'She said "stop."', "(Laughter) And then we left"
+        ]
+
+
+class TestTokenBudgets:
+    """token预算测试"""
+
+    def test_chunks_respect_token_budgets(self):
+        """测试每个语义块都在最小/最大token数之间，内容不丢失"""
+        agent = Semantic_Chunking_Agent(target_tokens=110, min_tokens=80, max_tokens=150)
+        chunks = agent.split_into_chunks(TALK)
+
+        assert len(chunks) > 1
+        assert all(80 <= count_tokens(chunk) <= 150 for chunk in chunks)
+        assert " ".join(chunks).split() == TALK.split()
+
+    def test_budgets_come_from_settings(self):
+        """测试默认预算读取配置，预算越大块数越少"""
+        with patch('app.agents.shared.semantic_chunking.settings.chunk_target_tokens', 40), \
+             patch('app.agents.shared.semantic_chunking.settings.chunk_min_tokens', 30), \
+             patch('app.agents.shared.semantic_chunking.settings.chunk_max_tokens', 60):
+            small = Semantic_Chunking_Agent()
+        large = Semantic_Chunking_Agent(target_tokens=200, min_tokens=150, max_tokens=260)
+
+        assert small.max_tokens == 60
+        assert len(small.split_into_chunks(TALK)) > 2 * len(large.split_into_chunks(TALK))
+
+    def test_long_sentence_split_at_clauses(self):
+        """测试超过最大token数的长句按从句切分"""
+        sentence = ", ".join(f"and then clause number {i} went on for a while" for i in range(30)) + "."
+        agent = Semantic_Chunking_Agent(target_tokens=40, min_tokens=20, max_tokens=50)
+
+        chunks = agent.split_into_chunks(sentence)
+        assert len(chunks) > 1
+        assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+
+    def test_short_text_single_chunk(self):
+        """测试短文本只生成一个块，空文本不生成块"""
+        agent = Semantic_Chunking_Agent()
+        assert agent.split_into_chunks("Just one short sentence.") == ["Just one short sentence."]
+        assert agent.split_into_chunks("   ") == []
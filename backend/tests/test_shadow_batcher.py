@@ -0,0 +1,207 @@
+# tests/test_shadow_batcher.py
+# Shadow Writing批量模式测试
+
+import asyncio
+import re
+import pytest
+from unittest.mock import patch
+
+from app.agents.parallel.shadow_batcher import ShadowWritingBatcher, split_batch_result
+from app.workflows import build_workflow_config, get_async_parallel_shadow_writing_workflow
+
+
+def _shadow(i) -> dict:
+    return {
+        "original": f"This is the original sentence number {i} from the talk today.",
+        "imitation": f"This is the imitation sentence number {i} for a brand new topic today.",
+        "map": {"original": ["initial"], "talk": ["speech"]}
+    }
+
+
+QUALITY_RESULT = {
+    "step1_grammar": 3, "step2_content": 2, "step3_logic": 3, "step3_issues": [],
+    "step4_topic": 2, "step5_learning": 1, "total_score": 11, "pass": True, "reasoning": "ok"
+}
+
+
+class RecordingLLM:
+    """记录调用的异步LLM；批量调用返回 answer_ids 指定的块的结果"""
+
+    def __init__(self, answer_ids=None, fail_batch=False):
+        self.batch_calls = []
+        self.single_calls = 0
+        self.quality_calls = 0
+        self.answer_ids = answer_ids
+        self.fail_batch = fail_batch
+        self.async_version = self.acall  # as_async_llm_function 使用该协程函数
+
+    def __call__(self, prompt, output_format=None, temperature=None):
+        raise AssertionError("异步路径不应调用同步版本")
+
+    async def acall(self, prompt, output_format=None, temperature=None):
+        await asyncio.sleep(0)
+        if "total_score" in output_format:
+            self.quality_calls += 1
+            return QUALITY_RESULT
+        if "results" in output_format:
+            count = len(re.findall(r"^\[Chunk \d+\]$", prompt, re.M))
+            self.batch_calls.append(count)
+            if self.fail_batch:
+                raise RuntimeError("batch failed")
+            ids = self.answer_ids or range(1, count + 1)
+            return {"results": [{"chunk_id": i, **_shadow(i)} for i in ids]}
+        self.single_calls += 1
+        return _shadow("single")
+
+
+class TestSplitBatchResult:
+    """批量结果拆分测试"""
+
+    def test_keys_by_chunk_id_and_drops_invalid_items(self):
+        """测试按块编号拆分，忽略越界、重复、缺字段的项"""
+        result = {"results": [
+            {"chunk_id": "Chunk 2", **_shadow(2)},
+            {"chunk_id": 1, **_shadow(1)},
+            {"chunk_id": 1, **_shadow(99)},
+            {"chunk_id": 5, **_shadow(5)},
+            {"chunk_id": 3, "original": "only original"},
+            "not a dict",
+        ]}
+
+        parsed = split_batch_result(result, 3)
+        assert sorted(parsed) == [0, 1]
+        assert "number 1 " in parsed[0]["original"]
+        assert "number 2 " in parsed[1]["original"]
+
+    def test_accepts_bare_list_and_rejects_garbage(self):
+        """测试接受直接返回的列表，无法识别的结果返回空"""
+        assert list(split_batch_result([{"chunk_id": 1, **_shadow(1)}], 1)) == [0]
+        assert split_batch_result(None, 2) == {}
+        assert split_batch_result({"original": "x"}, 2) == {}
+
+
+class TestShadowWritingBatcher:
+    """批处理器测试"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_chunks_share_one_call(self):
+        """测试同时提交的K个语义块合并为一次调用，结果各自返回"""
+        batcher = ShadowWritingBatcher(max_batch_size=4, max_wait_ms=1000)
+        llm = RecordingLLM()
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(llm, f"chunk {i}") for i in range(4))), 1
+        )
+
+        assert llm.batch_calls == [4] and llm.single_calls == 0
+        assert [r["original"] for r in results] == [_shadow(i)["original"] for i in range(1, 5)]
+
+    @pytest.mark.asyncio
+    async def test_partial_batch_flushes_after_wait(self):
+        """测试不足K个时等待窗口结束后发出，单个语义块使用单块prompt"""
+        batcher = ShadowWritingBatcher(max_batch_size=4, max_wait_ms=10)
+        llm = RecordingLLM()
+
+        assert await asyncio.wait_for(batcher.submit(llm, "only chunk"), 1) == _shadow("single")
+        assert llm.batch_calls == [] and llm.single_calls == 1
+
+    @pytest.mark.asyncio
+    async def test_missing_items_fall_back_to_single_calls(self):
+        """测试批量结果缺少的语义块单独调用，批量调用失败时全部单独调用"""
+        batcher = ShadowWritingBatcher(max_batch_size=3, max_wait_ms=1000)
+        llm = RecordingLLM(answer_ids=[1, 3])
+
+        results = await asyncio.gather(*(batcher.submit(llm, f"chunk {i}") for i in range(3)))
+        assert llm.single_calls == 1
+        assert results[1] == _shadow("single")
+        assert batcher.get_stats()["fallback_chunks"] == 1
+
+        failing = RecordingLLM(fail_batch=True)
+        results = await asyncio.gather(*(batcher.submit(failing, f"chunk {i}") for i in range(3)))
+        assert failing.single_calls == 3
+        assert all(r == _shadow("single") for r in results)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_chunks_cancel_batch_call(self):
+        """测试批次中所有语义块都取消时，批量调用随之取消"""
+        batcher = ShadowWritingBatcher(max_batch_size=2, max_wait_ms=1000)
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def hanging_llm(prompt, output_format=None, temperature=None):
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(batcher.submit(hanging_llm, f"chunk {i}")) for i in range(2)]
+        await asyncio.wait_for(started.wait(), 1)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    @pytest.mark.asyncio
+    async def test_tasks_batched_separately_in_own_context(self):
+        """测试不同任务的语义块不合并，批量调用在所属任务的上下文中执行"""
+        from app.token_usage import current_task_id, usage_task
+
+        batcher = ShadowWritingBatcher(max_batch_size=2, max_wait_ms=1000)
+        llm = RecordingLLM()
+        call_tasks = []
+        acall = llm.acall
+
+        async def recording_acall(prompt, output_format=None, temperature=None):
+            call_tasks.append(current_task_id())
+            return await acall(prompt, output_format, temperature)
+
+        llm.async_version = recording_acall
+
+        async def submit(task_id, payload):
+            with usage_task(task_id):
+                return await batcher.submit(llm, payload)
+
+        await asyncio.wait_for(asyncio.gather(
+            submit("task-a", "a1"), submit("task-b", "b1"), submit("task-a", "a2"), submit("task-b", "b2")
+        ), 1)
+
+        assert llm.batch_calls == [2, 2] and llm.single_calls == 0
+        assert sorted(call_tasks) == ["task-a", "task-b"]
+
+    def test_batcher_without_hooks_cannot_be_created(self):
+        """测试未实现批量/单块prompt或结果校验的批处理器在创建时报错"""
+        from app.agents.parallel.chunk_batcher import ChunkBatcher
+
+        class IncompleteBatcher(ChunkBatcher):
+            def build_batch_prompt(self, payloads):
+                return ""
+
+        with pytest.raises(TypeError):
+            IncompleteBatcher()
+
+
+class TestBatchedWorkflow:
+    """批量模式下的并行工作流测试"""
+
+    @pytest.mark.asyncio
+    async def test_workflow_batches_shadow_writing_calls(self):
+        """测试开启批量模式后改写调用数约为语义块数/K，每个语义块仍有独立结果"""
+        text = " ".join(f"This is sentence number {i} of the talk, and it is long enough to count." for i in range(60))
+        llm = RecordingLLM()
+        state = {"text": text, "task_id": None, "semantic_chunks": [], "final_shadow_chunks": [],
+                 "current_node": "", "error_message": None}
+
+        with patch('app.agents.parallel.shadow_writing_agent.settings.shadow_batch_size', 4), \
+             patch('app.agents.parallel.shadow_writing_agent.settings.shadow_batch_wait_ms', 200):
+            result = await asyncio.wait_for(
+                get_async_parallel_shadow_writing_workflow().ainvoke(state, config=build_workflow_config(llm=llm)), 10
+            )
+
+        total_chunks = len(result["semantic_chunks"])
+        assert total_chunks > 4
+        assert len(result["final_shadow_chunks"]) == total_chunks
+        assert sum(llm.batch_calls) + llm.single_calls == total_chunks
+        assert len(llm.batch_calls) + llm.single_calls <= -(-total_chunks // 4) + 1
+        assert llm.quality_calls == total_chunks
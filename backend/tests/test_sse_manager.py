@@ -0,0 +1,277 @@
+# tests/test_sse_manager.py
+# SSE管理器测试
+
+import asyncio
+import pytest
+
+from app.sse_manager import SSEManager
+from app.task_backend import InMemoryProgressLog, SQLiteProgressLog, SQLiteTaskBackend
+
+
+class TestSSESubscription:
+    """SSE订阅等待测试"""
+
+    @pytest.mark.asyncio
+    async def test_subscriber_receives_every_message_in_burst(self):
+        """测试订阅者收到突发消息中的每一条（旧实现只会拿到最新一条）"""
+        manager = SSEManager()
+        received = []
+
+        async def subscriber():
+            last_seq = 0
+            while len(received) < 20:
+                for message in await manager.wait_for_messages("task", last_seq, timeout=5):
+                    received.append(message["n"])
+                    last_seq = message["seq"]
+
+        consumer = asyncio.create_task(subscriber())
+        await asyncio.sleep(0)
+        assert manager.get_subscriber_count() == 1
+
+        await asyncio.gather(*(manager.add_message("task", {"type": "chunk_progress", "n": i}) for i in range(20)))
+        await asyncio.wait_for(consumer, 1)
+
+        assert received == list(range(20))
+        assert manager.get_last_seq("task") == 20
+        assert manager.get_subscriber_count() == 0
+
+    @pytest.mark.asyncio
+    async def test_returns_immediately_when_behind(self):
+        """测试已有未读消息时不等待"""
+        manager = SSEManager()
+        await manager.add_message("task", {"type": "started"})
+        await manager.add_message("task", {"type": "progress"})
+
+        messages = await manager.wait_for_messages("task", 1, timeout=0.01)
+        assert [m["type"] for m in messages] == ["progress"]
+
+    @pytest.mark.asyncio
+    async def test_idle_wait_times_out(self):
+        """测试无新消息时超时返回空列表（用于发送心跳）"""
+        manager = SSEManager()
+        await manager.add_message("task", {"type": "started"})
+
+        assert await manager.wait_for_messages("task", 1, timeout=0.01) == []
+
+    @pytest.mark.asyncio
+    async def test_clear_wakes_waiters(self):
+        """测试清除任务消息时唤醒等待中的订阅者"""
+        manager = SSEManager()
+        waiter = asyncio.create_task(manager.wait_for_messages("task", 0, timeout=5))
+        await asyncio.sleep(0)
+
+        await manager.clear_task_messages("task")
+        assert await asyncio.wait_for(waiter, 1) == []
+
+
+class TestSSEResume:
+    """断点续传测试"""
+
+    @pytest.mark.asyncio
+    async def test_ids_unique_within_same_millisecond(self):
+        """测试同一毫秒内的消息ID不冲突"""
+        manager = SSEManager()
+        for _ in range(50):
+            await manager.add_message("task", {"type": "chunk_progress"})
+
+        ids = [m["id"] for m in await manager.get_messages("task")]
+        assert len(set(ids)) == 50
+        assert ids[0] == "task_1" and ids[-1] == "task_50"
+
+    @pytest.mark.asyncio
+    async def test_resume_returns_exactly_missed_messages(self):
+        """测试续传只返回缺失的消息，无重复无遗漏（含序号跨位数，如9→10）"""
+        manager = SSEManager()
+        for i in range(3000):
+            await manager.add_message("task", {"type": "chunk_progress", "n": i})
+
+        missed = await manager.get_messages("task", "task_9")
+        assert [m["n"] for m in missed] == list(range(9, 3000))
+        assert await manager.get_messages("task", "task_3000") == []
+
+    @pytest.mark.asyncio
+    async def test_byte_bounded_buffer_sends_resync(self):
+        """测试缓冲区按字节淘汰，缺失消息已过期时先发送resync通知"""
+        manager = SSEManager(log=InMemoryProgressLog(max_bytes_per_task=2000))
+        for i in range(100):
+            await manager.add_message("task", {"type": "chunk_progress", "payload": "x" * 50, "n": i})
+
+        buffer = manager.log.buffers["task"]
+        assert buffer.total_bytes <= 2000
+        assert buffer.last_seq == 100
+
+        messages = await manager.get_messages("task", "task_5")
+        assert messages[0]["type"] == "resync"
+        assert "id" not in messages[0]
+        assert messages[0]["missed_from"] == 6
+        assert messages[0]["missed_to"] == buffer.first_seq - 1
+        assert [m["seq"] for m in messages[1:]] == list(range(buffer.first_seq, 101))
+
+    @pytest.mark.asyncio
+    async def test_foreign_event_id_replays_buffer(self):
+        """测试格式不符的事件ID从头发送"""
+        manager = SSEManager()
+        await manager.add_message("task", {"type": "started"})
+
+        assert len(await manager.get_messages("task", "other_7")) == 1
+        assert len(await manager.get_messages("task", "task_connected_1700000000000")) == 1
+
+    @pytest.mark.asyncio
+    async def test_cleanup_removes_expired_tasks(self):
+        """测试定期清理真正删除过期任务"""
+        manager = SSEManager(message_ttl=0)
+        await manager.add_message("task", {"type": "started"})
+        manager.log.buffers["task"].updated_at -= 10
+
+        await manager.cleanup_expired_messages()
+        assert manager.get_active_tasks_count() == 0
+
+
+class TestSharedBackend:
+    """多worker共享后端测试（两个实例模拟两个进程）"""
+
+    @pytest.mark.asyncio
+    async def test_progress_written_by_other_worker_reaches_subscriber(self, tmp_path):
+        """测试worker A写入的进度消息被worker B的订阅者收到"""
+        db_path = str(tmp_path / "shared.db")
+        worker_a = SSEManager(log=SQLiteProgressLog(db_path, poll_interval=0.01))
+        worker_b = SSEManager(log=SQLiteProgressLog(db_path, poll_interval=0.01))
+
+        waiter = asyncio.create_task(worker_b.wait_for_messages("task", 0, timeout=2))
+        await asyncio.sleep(0.02)
+        await worker_a.add_message("task", {"type": "started"})
+        await worker_a.add_message("task", {"type": "progress"})
+
+        messages = await asyncio.wait_for(waiter, 2)
+        assert [m["type"] for m in messages][:1] == ["started"]
+        assert [m["id"] for m in await worker_b.get_messages("task")] == ["task_1", "task_2"]
+
+    @pytest.mark.asyncio
+    async def test_shared_log_sequence_interleaves_across_workers(self, tmp_path):
+        """测试两个worker交替写入同一任务时序号连续不重复"""
+        db_path = str(tmp_path / "shared.db")
+        worker_a = SSEManager(log=SQLiteProgressLog(db_path))
+        worker_b = SSEManager(log=SQLiteProgressLog(db_path))
+
+        for i in range(10):
+            await (worker_a if i % 2 else worker_b).add_message("task", {"type": "progress", "n": i})
+
+        messages = await worker_a.get_messages("task", "task_4")
+        assert [m["n"] for m in messages] == list(range(4, 10))
+        assert [m["seq"] for m in messages] == list(range(5, 11))
+
+    @pytest.mark.asyncio
+    async def test_shared_log_trims_by_bytes(self, tmp_path):
+        """测试共享日志按字节上限删除旧消息，续传时发送resync通知"""
+        log = SQLiteProgressLog(str(tmp_path / "shared.db"), max_bytes_per_task=2000)
+        manager = SSEManager(log=log)
+        for i in range(100):
+            await manager.add_message("task", {"type": "progress", "payload": "x" * 50})
+
+        messages = await manager.get_messages("task", "task_1")
+        assert messages[0]["type"] == "resync"
+        assert messages[-1]["seq"] == 100
+        assert log.message_count("task") < 100
+
+    @pytest.mark.asyncio
+    async def test_locked_shared_log_does_not_block_event_loop(self, tmp_path):
+        """测试其他进程持有写锁时写入在写线程中等待，事件循环继续运行，消息按提交顺序编号"""
+        import sqlite3
+
+        db_path = str(tmp_path / "shared.db")
+        manager = SSEManager(log=SQLiteProgressLog(db_path))
+        other = sqlite3.connect(db_path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+
+        writers = [asyncio.create_task(manager.add_message("task", {"type": "progress", "n": i})) for i in range(3)]
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert ticks == 5 and not any(writer.done() for writer in writers)
+
+        other.execute("COMMIT")
+        other.close()
+        await asyncio.wait_for(asyncio.gather(*writers), 5)
+        messages = await manager.get_messages("task")
+        assert [(m["n"], m["seq"]) for m in messages] == [(0, 1), (1, 2), (2, 3)]
+
+    @pytest.mark.asyncio
+    async def test_reads_not_blocked_by_waiting_writer(self, tmp_path):
+        """测试写入等待其他进程的写锁时，本进程的读取不等待写连接的锁"""
+        import sqlite3
+        import time
+        from app.task_manager import TaskManager
+
+        db_path = str(tmp_path / "shared.db")
+        manager = SSEManager(log=SQLiteProgressLog(db_path))
+        tasks = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+        await manager.add_message("task", {"type": "started"})
+        task_id = tasks.create_task(["https://ted.com/a"])
+
+        other = sqlite3.connect(db_path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        writers = [
+            asyncio.create_task(manager.add_message("task", {"type": "progress"})),
+            asyncio.create_task(tasks.aupdate_progress(task_id, 1, "https://ted.com/a")),
+        ]
+        await asyncio.sleep(0.05)
+
+        start = time.monotonic()
+        assert [m["type"] for m in await manager.get_messages("task")] == ["started"]
+        assert await manager.wait_for_messages("task", 0, timeout=1) != []
+        assert tasks.backend.load_task(task_id)["current"] == 0
+        assert time.monotonic() - start < 1
+
+        other.execute("COMMIT")
+        other.close()
+        await asyncio.wait_for(asyncio.gather(*writers), 5)
+        assert manager.get_last_seq("task") == 2
+
+    def test_task_state_visible_across_workers(self, tmp_path):
+        """测试worker A创建和更新的任务在worker B中可见且不读到过期副本"""
+        from app.task_manager import TaskManager
+        from app.enums import TaskStatus
+
+        db_path = str(tmp_path / "shared.db")
+        worker_a = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+        worker_b = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+
+        task_id = worker_a.create_task(["https://ted.com/a"])
+        assert worker_b.get_task(task_id).status == TaskStatus.PENDING
+
+        worker_a.add_result(task_id, {"url": "https://ted.com/a"})
+        worker_a.complete_task(task_id)
+        task = worker_b.get_task(task_id)
+        assert task.status == TaskStatus.COMPLETED
+        assert len(task.results) == 1
+
+
+class TestProgressStream:
+    """SSE端点测试"""
+
+    @pytest.mark.asyncio
+    async def test_message_written_after_cached_read_is_streamed(self):
+        """测试读取缓存消息之后写入的消息仍然发送（不因另取最新序号而遗漏）"""
+        from unittest.mock import patch
+        from app.main import progress_stream
+
+        manager = SSEManager()
+        await manager.add_message("task", {"type": "started"})
+        read_messages = manager.get_messages
+
+        async def get_messages_then_append(task_id, last_event_id=None):
+            messages = await read_messages(task_id, last_event_id)
+            # 模拟其他worker/写线程在两次读取之间写入
+            await manager.add_message(task_id, {"type": "progress"})
+            return messages
+
+        with patch.object(manager, "get_messages", side_effect=get_messages_then_append), \
+             patch("app.main.sse_manager", manager):
+            response = await progress_stream("task", None, None)
+            finisher = asyncio.create_task(manager.add_message("task", {"type": "completed"}))
+            events = [event async for event in response.body_iterator]
+            await finisher
+
+        ids = [line for event in events for line in event.splitlines() if line.startswith("id: ")]
+        assert ids == ["id: task_1", "id: task_2", "id: task_3"]
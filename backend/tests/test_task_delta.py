@@ -0,0 +1,70 @@
+# tests/test_task_delta.py
+# 任务增量/进度轮询接口测试
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils import get_task_manager
+from app.task_manager import TaskManager
+from app.task_backend import InMemoryTaskBackend
+
+
+@pytest.fixture
+def manager():
+    manager = TaskManager(backend=InMemoryTaskBackend())
+    app.dependency_overrides[get_task_manager] = lambda: manager
+    yield manager
+    app.dependency_overrides.pop(get_task_manager, None)
+
+
+client = TestClient(app)
+
+
+class TestTaskDelta:
+    """增量轮询测试"""
+
+    def test_delta_returns_only_new_items(self, manager):
+        """测试每次只返回游标之后新增的结果和错误"""
+        task_id = manager.create_task(["https://ted.com/a", "https://ted.com/b", "https://ted.com/c"])
+        manager.add_result(task_id, {"url": "https://ted.com/a", "results": [{"paragraph": "p" * 1000}]})
+
+        first = client.get(f"/api/v1/task/{task_id}/delta").json()
+        assert [r["url"] for r in first["results"]] == ["https://ted.com/a"]
+        assert first["cursor"] == "1.0"
+        assert first["finished"] is False
+
+        unchanged = client.get(f"/api/v1/task/{task_id}/delta", params={"cursor": first["cursor"]}).json()
+        assert unchanged["results"] == [] and unchanged["errors"] == []
+        assert unchanged["cursor"] == "1.0"
+
+        manager.add_error(task_id, "b failed")
+        manager.add_result(task_id, {"url": "https://ted.com/c", "results": []})
+        manager.complete_task(task_id)
+
+        last = client.get(f"/api/v1/task/{task_id}/delta", params={"cursor": first["cursor"]}).json()
+        assert [r["url"] for r in last["results"]] == ["https://ted.com/c"]
+        assert last["errors"] == ["b failed"]
+        assert last["cursor"] == "2.1"
+        assert last["finished"] is True
+
+    def test_invalid_cursor_rejected(self, manager):
+        """测试非法游标返回400"""
+        task_id = manager.create_task(["https://ted.com/a"])
+        response = client.get(f"/api/v1/task/{task_id}/delta", params={"cursor": "abc"})
+        assert response.status_code == 400
+
+    def test_status_has_no_results(self, manager):
+        """测试轻量状态接口只返回计数"""
+        task_id = manager.create_task(["https://ted.com/a"])
+        manager.add_result(task_id, {"url": "https://ted.com/a"})
+
+        data = client.get(f"/api/v1/task/{task_id}/status").json()
+        assert data["result_count"] == 1
+        assert data["error_count"] == 0
+        assert "results" not in data
+
+    def test_unknown_task(self, manager):
+        """测试任务不存在返回404"""
+        assert client.get("/api/v1/task/missing/delta").status_code == 404
+        assert client.get("/api/v1/task/missing/status").status_code == 404
@@ -0,0 +1,245 @@
+# tests/test_task_manager.py
+# 任务管理器持久化与淘汰测试
+
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+
+from app.task_manager import TaskManager, STALE_TASK_SECONDS
+from app.task_backend import InMemoryTaskBackend, SQLiteTaskBackend
+from app.enums import TaskStatus
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteTaskBackend(str(tmp_path / "tasks.db"))
+
+
+class TestTaskPersistence:
+    """任务持久化测试"""
+
+    def test_results_survive_restart(self, store):
+        """测试进程重启（新的TaskManager）后仍能查询已完成任务的结果"""
+        manager = TaskManager(backend=store)
+        task_id = manager.create_task(["https://ted.com/a", "https://ted.com/b"], "user")
+        manager.add_result(task_id, {"url": "https://ted.com/a", "results": [{"original": "o"}]})
+        manager.add_error(task_id, "b failed")
+        manager.complete_task(task_id)
+
+        restarted = TaskManager(backend=store)
+        task = restarted.get_task(task_id)
+
+        assert task.status == TaskStatus.COMPLETED
+        assert task.results == [{"url": "https://ted.com/a", "results": [{"original": "o"}]}]
+        assert task.errors == ["b failed"]
+        assert restarted.disk_loads == 1
+
+    def test_results_not_kept_in_memory(self, store):
+        """测试内存中的任务只记录结果数，结果按需从存储读取"""
+        manager = TaskManager(backend=store)
+        task_id = manager.create_task(["https://ted.com/a", "https://ted.com/b"])
+        manager.add_result(task_id, {"url": "https://ted.com/a", "results": []})
+        manager.add_result(task_id, {"url": "https://ted.com/b", "results": []})
+
+        task = manager.tasks[task_id]
+        assert "results" not in vars(task)
+        assert task.result_count == 2
+        assert [r["url"] for r in task.load_results(1)] == ["https://ted.com/b"]
+        assert len(task.to_dict()["results"]) == 2
+
+    @pytest.mark.asyncio
+    async def test_async_writes_do_not_block_event_loop(self, tmp_path):
+        """测试其他进程持有写锁时异步写入在写线程中等待，事件循环继续运行；并发结果序号不重复"""
+        import asyncio
+        import sqlite3
+
+        db_path = str(tmp_path / "shared.db")
+        manager = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+        task_id = manager.create_task(["https://ted.com/a", "https://ted.com/b"], "user")
+
+        other = sqlite3.connect(db_path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        writes = [
+            asyncio.create_task(manager.aupdate_progress(task_id, 1, "https://ted.com/a")),
+            asyncio.create_task(manager.aadd_result(task_id, {"url": "https://ted.com/a"})),
+            asyncio.create_task(manager.aadd_result(task_id, {"url": "https://ted.com/b"})),
+        ]
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert ticks == 5 and not any(write.done() for write in writes)
+
+        other.execute("COMMIT")
+        other.close()
+        await asyncio.wait_for(asyncio.gather(*writes), 5)
+        await manager.acomplete_task(task_id)
+
+        restarted = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+        task = restarted.get_task(task_id)
+        assert task.status == TaskStatus.COMPLETED and task.current == 1
+        assert [r["url"] for r in task.results] == ["https://ted.com/a", "https://ted.com/b"]
+
+    @pytest.mark.asyncio
+    async def test_failed_result_write_leaves_no_gap(self):
+        """测试并发添加结果时写入失败的结果不占用序号，结果数与存储中的结果一致"""
+        import asyncio
+
+        class FlakyBackend(InMemoryTaskBackend):
+            async def aadd_result(self, task_id, seq, result):
+                await asyncio.sleep(0.01)
+                if result["url"] == "https://ted.com/a":
+                    raise OSError("disk full")
+                self.add_result(task_id, seq, result)
+
+        backend = FlakyBackend()
+        manager = TaskManager(backend=backend)
+        task_id = manager.create_task(["https://ted.com/a", "https://ted.com/b"])
+
+        await asyncio.gather(
+            manager.aadd_result(task_id, {"url": "https://ted.com/a"}),
+            manager.aadd_result(task_id, {"url": "https://ted.com/b"}),
+        )
+
+        task = manager.get_task(task_id)
+        assert task.result_count == 1
+        assert backend.load_task(task_id, with_results=False)["result_count"] == 1
+        assert task.load_results(0) == [{"url": "https://ted.com/b"}]
+
+    def test_unfinished_tasks_marked_interrupted_on_restart(self, store):
+        """测试上次运行遗留的未完成任务在启动时标记为已中断（可恢复）"""
+        manager = TaskManager(backend=store)
+        task_id = manager.create_task(["https://ted.com/a"])
+        manager.update_progress(task_id, 1, "https://ted.com/a")
+
+        restarted = TaskManager(backend=store)
+        assert restarted.recover_unfinished_tasks() == 1
+        task = restarted.get_task(task_id)
+        assert task.status == TaskStatus.INTERRUPTED
+        assert task.errors == []
+
+
+    def test_status_transition_checks_shared_storage(self, tmp_path):
+        """测试共享后端下状态转换按存储中的状态比较：其他worker取消的排队任务不能再开始"""
+        db_path = str(tmp_path / "shared.db")
+        owner = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+        other = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+        task_id = owner.create_task(["https://ted.com/a"])
+
+        assert other.update_status_if(task_id, [TaskStatus.PENDING], TaskStatus.CANCELLED) is True
+        assert owner.update_status_if(task_id, [TaskStatus.PENDING], TaskStatus.PROCESSING) is False
+        assert owner.get_task(task_id).status == TaskStatus.CANCELLED
+        assert other.update_status_if("missing", [TaskStatus.PENDING], TaskStatus.CANCELLED) is False
+
+    @pytest.mark.asyncio
+    async def test_running_task_heartbeat_and_status_kept_in_shared_storage(self, tmp_path):
+        """测试共享后端下运行中的任务有心跳不会被判定为遗留，元数据写入不覆盖其他worker设置的状态"""
+        db_path = str(tmp_path / "shared.db")
+        owner = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+        restarted = TaskManager(backend=SQLiteTaskBackend(db_path, shared=True))
+        task_id = owner.create_task(["https://ted.com/a", "https://ted.com/b"])
+        owner.update_progress(task_id, 1, "https://ted.com/a")
+
+        stale = time.time() - STALE_TASK_SECONDS - 1
+        owner.backend._conn.execute("UPDATE tasks SET updated_at = ?", (stale,))
+        assert await owner.aheartbeat() == 1
+        assert restarted.recover_unfinished_tasks() == 0
+
+        owner.backend._conn.execute("UPDATE tasks SET updated_at = ?", (stale,))
+        assert restarted.recover_unfinished_tasks() == 1
+        await owner.aupdate_progress(task_id, 2, "https://ted.com/b")
+        await owner.acomplete_task(task_id)
+        assert restarted.get_task(task_id).status == TaskStatus.INTERRUPTED
+        assert restarted.get_task(task_id).current == 2
+
+
+class TestTaskEviction:
+    """任务淘汰测试"""
+
+    def test_memory_bounded_by_count(self, store):
+        """测试内存任务数受上限约束，被淘汰的任务可从磁盘重新加载"""
+        manager = TaskManager(backend=store, max_memory_tasks=3)
+        task_ids = []
+        for _ in range(10):
+            task_id = manager.create_task(["https://ted.com/a"])
+            manager.complete_task(task_id)
+            task_ids.append(task_id)
+
+        assert len(manager.tasks) == 3
+        assert manager.get_task(task_ids[0]).status == TaskStatus.COMPLETED
+        assert len(manager.tasks) == 3
+
+    def test_active_tasks_not_evicted(self, store):
+        """测试处理中的任务不会被淘汰出内存"""
+        manager = TaskManager(backend=store, max_memory_tasks=1)
+        active = manager.create_task(["https://ted.com/a"])
+        manager.update_status(active, TaskStatus.PROCESSING)
+        for _ in range(3):
+            manager.complete_task(manager.create_task(["https://ted.com/b"]))
+
+        assert active in manager.tasks
+
+    def test_idle_finished_tasks_evicted(self, store):
+        """测试空闲超时的已结束任务移出内存，但仍保留在磁盘"""
+        manager = TaskManager(backend=store, memory_ttl_seconds=60)
+        task_id = manager.create_task(["https://ted.com/a"])
+        manager.complete_task(task_id)
+        manager._last_access[task_id] = time.time() - 120
+
+        assert manager.evict_idle_tasks() == 1
+        assert task_id not in manager.tasks
+        assert manager.get_task(task_id) is not None
+
+    def test_cleanup_by_age_and_budget(self, store):
+        """测试按保留时间和数量上限清理磁盘上的任务"""
+        manager = TaskManager(backend=store)
+        old_id = manager.create_task(["https://ted.com/old"])
+        manager.tasks[old_id].created_at = datetime.now() - timedelta(hours=48)
+        manager.complete_task(old_id)
+        recent = [manager.create_task(["https://ted.com/new"]) for _ in range(3)]
+        for task_id in recent:
+            manager.complete_task(task_id)
+
+        removed = manager.cleanup_old_tasks(max_age_hours=24, max_stored_tasks=2)
+
+        assert removed == 2
+        assert manager.get_task(old_id) is None
+        assert manager.get_task(recent[0]) is None
+        assert store.count() == 2
+
+    @pytest.mark.asyncio
+    async def test_async_cleanup_touches_memory_only_on_loop(self, store):
+        """测试异步清理只把存储操作放到线程，内存任务表在事件循环线程中修改"""
+        manager = TaskManager(backend=store)
+        old_id = manager.create_task(["https://ted.com/old"])
+        manager.tasks[old_id].created_at = datetime.now() - timedelta(hours=48)
+        manager.complete_task(old_id)
+
+        loop_thread = threading.get_ident()
+        threads = {}
+        expire_stored, forget = manager._expire_stored, manager._forget
+
+        def record_expire(*args):
+            threads["storage"] = threading.get_ident()
+            return expire_stored(*args)
+
+        def record_forget(task_id):
+            threads["memory"] = threading.get_ident()
+            forget(task_id)
+
+        manager._expire_stored, manager._forget = record_expire, record_forget
+        assert await manager.acleanup_old_tasks(max_age_hours=24) == 1
+
+        assert threads["storage"] != loop_thread
+        assert threads["memory"] == loop_thread
+        assert old_id not in manager.tasks and store.count() == 0
+
+    def test_memory_backend_keeps_evicted_tasks(self):
+        """测试进程内后端下被移出LRU的任务仍可查询"""
+        manager = TaskManager(backend=InMemoryTaskBackend(), max_memory_tasks=1)
+        ids = [manager.create_task(["https://ted.com/a"]) for _ in range(3)]
+        for task_id in ids:
+            manager.complete_task(task_id)
+
+        assert all(manager.get_task(task_id) for task_id in ids)
@@ -0,0 +1,139 @@
+# tests/test_task_resume.py
+# 任务中断恢复测试（工作流检查点 + 恢复接口）
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils import get_task_manager
+from app.task_manager import TaskManager
+from app.task_backend import InMemoryTaskBackend
+from app.checkpointer import create_checkpointer, checkpoint_thread_id
+from app.workflows import build_workflow_config, get_async_parallel_shadow_writing_workflow
+from app.agent import astream_shadow_writing
+from app.enums import TaskStatus
+
+
+SHADOW_RESULT = {
+    "original": "This is the original sentence from the talk today.",
+    "imitation": "This is the imitation sentence for a brand new topic today.",
+    "map": {"original": ["initial"], "talk": ["speech"]}
+}
+
+QUALITY_RESULT = {
+    "step1_grammar": 3, "step2_content": 2, "step3_logic": 3, "step3_issues": [],
+    "step4_topic": 2, "step5_learning": 1, "total_score": 11, "pass": True, "reasoning": "ok"
+}
+
+TEXT = " ".join(f"This is sentence number {i} of the talk, and it is long enough." for i in range(40))
+
+
+def _initial_state() -> dict:
+    return {"text": TEXT, "task_id": None, "semantic_chunks": [], "final_shadow_chunks": [],
+            "current_node": "", "error_message": None}
+
+
+class TestCheckpointResume:
+    """工作流检查点恢复测试"""
+
+    @pytest.mark.asyncio
+    async def test_resume_skips_finished_chunk_pipelines(self):
+        """测试中途退出后以相同thread_id恢复，已完成的语义块不再调用LLM"""
+        checkpointer = await create_checkpointer(":memory:")
+        workflow = get_async_parallel_shadow_writing_workflow(checkpointer)
+        config_args = {"thread_id": checkpoint_thread_id("task", "https://ted.com/a")}
+
+        # 第一次运行：只有2个语义块的改写调用返回，其余一直挂起，模拟进程中途退出
+        release = asyncio.Event()
+        shadow_calls = 0
+
+        async def stalled_llm(prompt, output_format=None, temperature=None):
+            nonlocal shadow_calls
+            if "total_score" in output_format:
+                return QUALITY_RESULT
+            shadow_calls += 1
+            if shadow_calls > 2:
+                await release.wait()
+            return SHADOW_RESULT
+
+        two_finished = asyncio.Event()
+
+        async def on_chunk(result, completed, total):
+            if completed >= 2:
+                two_finished.set()
+
+        run = asyncio.create_task(astream_shadow_writing(
+            workflow, _initial_state(), build_workflow_config(llm=stalled_llm, **config_args), on_chunk=on_chunk
+        ))
+        await asyncio.wait_for(two_finished.wait(), 5)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+
+        # 恢复：只有未完成的语义块调用LLM
+        resume_calls = 0
+
+        async def llm(prompt, output_format=None, temperature=None):
+            nonlocal resume_calls
+            resume_calls += 1
+            return QUALITY_RESULT if "total_score" in output_format else SHADOW_RESULT
+
+        totals = []
+
+        async def on_resumed_chunk(result, completed, total):
+            totals.append(total)
+
+        results = await astream_shadow_writing(
+            workflow, _initial_state(), build_workflow_config(llm=llm, **config_args), on_chunk=on_resumed_chunk
+        )
+
+        total_chunks = totals[-1]
+        assert total_chunks > 2
+        assert len(results) == total_chunks
+        assert resume_calls <= 2 * (total_chunks - 2)
+
+        # 已运行完毕的线程再次运行：直接返回最终结果
+        assert len(await astream_shadow_writing(
+            workflow, _initial_state(), build_workflow_config(llm=llm, **config_args)
+        )) == total_chunks
+        await checkpointer.conn.close()
+
+
+@pytest.fixture
+def manager():
+    manager = TaskManager(backend=InMemoryTaskBackend())
+    app.dependency_overrides[get_task_manager] = lambda: manager
+    yield manager
+    app.dependency_overrides.pop(get_task_manager, None)
+
+
+client = TestClient(app)
+
+
+class TestResumeEndpoint:
+    """恢复接口测试"""
+
+    def test_resume_interrupted_task(self, manager):
+        """测试恢复中断的任务：只重新处理没有结果的URL"""
+        urls = ["https://ted.com/a", "https://ted.com/b", "https://ted.com/c"]
+        task_id = manager.create_task(urls)
+        manager.add_result(task_id, {"url": "https://ted.com/a"})
+        manager.update_status(task_id, TaskStatus.INTERRUPTED)
+
+        with patch('app.services.ted_batch_service.process_urls_batch', new_callable=AsyncMock) as mock_batch:
+            response = client.post(f"/api/v1/task/{task_id}/resume")
+
+        assert response.status_code == 200
+        assert response.json()["message"] == "Resuming 2/3 URLs."
+        mock_batch.assert_awaited_once_with(task_id, urls, resume=True)
+        assert manager.get_task(task_id).status == TaskStatus.PENDING
+
+    def test_only_interrupted_tasks_resumable(self, manager):
+        """测试未中断的任务不能恢复，不存在的任务返回404"""
+        task_id = manager.create_task(["https://ted.com/a"])
+        manager.complete_task(task_id)
+
+        assert client.post(f"/api/v1/task/{task_id}/resume").status_code == 400
+        assert client.post("/api/v1/task/missing/resume").status_code == 404
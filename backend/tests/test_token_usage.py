@@ -0,0 +1,101 @@
+# tests/test_token_usage.py
+# LLM token用量统计测试
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.token_usage import TokenUsageTracker, llm_stage, usage_task
+from app.fair_scheduler import tenant_context
+from app.utils import create_llm_function, create_async_llm_function
+from app.workflows import create_chunk_pipeline, build_workflow_config
+
+
+class TestTokenUsageTracker:
+    """用量汇总测试"""
+
+    def test_usage_attributed_to_context(self):
+        """测试用量按上下文中的阶段、任务、用户归因"""
+        tracker = TokenUsageTracker()
+
+        with tenant_context("alice", "bulk"), usage_task("task-1"):
+            with llm_stage("shadow_writing"):
+                tracker.record("model-a", 100, 50)
+            with llm_stage("quality"):
+                tracker.record("model-a", 300, 50)
+        tracker.record("model-b", 10, 10)
+
+        stats = tracker.get_stats()
+        assert stats["totals"]["total_tokens"] == 520
+        assert stats["by_stage"]["quality"]["total_tokens"] == 350
+        assert list(stats["by_stage"]) == ["quality", "shadow_writing", "other"]
+        assert stats["by_user"]["alice"]["calls"] == 2
+        assert stats["by_stage_model"]["other"]["model-b"]["prompt_tokens"] == 10
+
+        task = tracker.get_task_usage("task-1")
+        assert task["user_id"] == "alice" and task["total_tokens"] == 500
+        assert task["by_stage"]["shadow_writing"]["completion_tokens"] == 50
+        assert tracker.get_task_usage("unknown") is None
+
+    def test_responses_without_usage_ignored(self):
+        """测试没有usage或usage不是数字的响应不计入"""
+        tracker = TokenUsageTracker()
+        tracker.record_response("m", SimpleNamespace(usage=None))
+        tracker.record_response("m", Mock())
+
+        assert tracker.get_stats()["totals"]["calls"] == 0
+
+    def test_oldest_tasks_dropped(self):
+        """测试超过上限时丢弃最早的任务"""
+        tracker = TokenUsageTracker(max_tasks=2)
+        for task_id in ("a", "b", "c"):
+            tracker.record("m", 1, 1, task_id=task_id)
+
+        assert tracker.get_task_usage("a") is None
+        assert tracker.get_stats()["tracked_tasks"] == 2
+
+
+class TestLLMFunctionUsage:
+    """LLM调用函数记录用量测试"""
+
+    @pytest.mark.asyncio
+    async def test_sync_and_async_calls_record_usage(self, llm_response):
+        """测试同步和异步调用都记录response.usage"""
+        tracker = TokenUsageTracker()
+
+        with patch('app.utils.token_usage', tracker), \
+             patch('app.utils.completion', return_value=llm_response('{"a": 1}', usage=(120, 30))), \
+             patch('app.utils.acompletion', new_callable=AsyncMock, return_value=llm_response("text", usage=(80, 20))):
+            with llm_stage("search_optimizer"):
+                create_llm_function(model="model-x", use_cache=False)("q", {"a": "int"})
+            await create_async_llm_function(model="model-y", use_cache=False)("q")
+
+        stats = tracker.get_stats()
+        assert stats["by_stage"]["search_optimizer"]["total_tokens"] == 150
+        assert stats["by_model"]["model-y"]["completion_tokens"] == 20
+
+
+class TestPipelineStages:
+    """流水线节点阶段标注测试"""
+
+    def test_nodes_tag_stage_and_task(self):
+        """测试流水线中的LLM调用按节点标注阶段，并归属config中的task_id"""
+        tracker = TokenUsageTracker()
+        shadow = {
+            "original": "We spent about three hours a day on our phones, and most of it was scrolling.",
+            "imitation": "Most evenings we rode bikes for a couple of hours, mostly climbing hills.",
+            "map": {"three": ["two"], "phones": ["bikes"]}
+        }
+
+        def llm(prompt, output_format=None, temperature=None):
+            tracker.record("fake", 10, 5)
+            if "total_score" in output_format:
+                return {"step3_logic": 1, "step3_issues": ["x"], "total_score": 5, "pass": False, "reasoning": "no"}
+            return shadow
+
+        state = {"chunk_text": shadow["original"], "chunk_id": 0, "total_chunks": 1, "final_shadow_chunks": []}
+        create_chunk_pipeline().invoke(state, config=build_workflow_config(llm=llm, task_id="task-9"))
+
+        task = tracker.get_task_usage("task-9")
+        assert set(task["by_stage"]) == {"shadow_writing", "quality", "correction"}
+        assert task["calls"] == 3
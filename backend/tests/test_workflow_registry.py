@@ -0,0 +1,116 @@
+# tests/test_workflow_registry.py
+# 工作流注册表与运行时依赖注入测试
+
+import asyncio
+import pytest
+from unittest.mock import Mock, patch
+
+from app.workflows import (
+    WorkflowRegistry, build_workflow_config,
+    get_parallel_shadow_writing_workflow, get_async_parallel_shadow_writing_workflow
+)
+from app.agent import astream_shadow_writing
+
+
+SHADOW_RESULT = {
+    "original": "This is the original sentence from the talk today.",
+    "imitation": "This is the imitation sentence for a brand new topic today.",
+    "map": {"original": ["initial"], "talk": ["speech"]}
+}
+
+QUALITY_RESULT = {
+    "step1_grammar": 3, "step2_content": 2, "step3_logic": 3, "step3_issues": [],
+    "step4_topic": 2, "step5_learning": 1, "total_score": 11, "pass": True, "reasoning": "ok"
+}
+
+
+class TestWorkflowRegistry:
+    """工作流注册表测试"""
+
+    def test_compiles_once(self):
+        """测试同一工作流只编译一次"""
+        registry = WorkflowRegistry()
+        factory = Mock(return_value=object())
+        registry.register("demo", factory)
+
+        first = registry.get("demo")
+        second = registry.get("demo")
+
+        assert first is second
+        factory.assert_called_once()
+        assert registry.get_stats()["hits"] == 1
+
+    def test_shared_parallel_workflow(self):
+        """测试并行工作流在多次获取间共享"""
+        assert get_parallel_shadow_writing_workflow() is get_parallel_shadow_writing_workflow()
+
+
+class TestRuntimeInjection:
+    """LLM函数和task_id通过config注入测试"""
+
+    def test_llm_and_task_id_reach_chunk_nodes(self):
+        """测试注入的LLM函数与task_id到达子图节点"""
+        def llm(prompt, output_format=None, temperature=None):
+            return QUALITY_RESULT if "total_score" in output_format else SHADOW_RESULT
+
+        llm_mock = Mock(side_effect=llm)
+        text = " ".join(f"This is sentence number {i} of the talk, and it is long enough." for i in range(12))
+        messages = []
+
+        with patch('app.progress_bus.progress_bus.publish',
+                   side_effect=lambda task_id, message: messages.append((task_id, message["type"]))):
+            result = get_parallel_shadow_writing_workflow().invoke(
+                {"text": text, "task_id": None, "semantic_chunks": [], "final_shadow_chunks": [],
+                 "current_node": "", "error_message": None},
+                config=build_workflow_config(llm=llm_mock, task_id="task_registry")
+            )
+
+        chunk_count = len(result["semantic_chunks"])
+        assert chunk_count > 1
+        assert len(result["final_shadow_chunks"]) == chunk_count
+        # 每个语义块：Shadow Writing + Quality 各调用一次注入的LLM
+        assert llm_mock.call_count == chunk_count * 2
+        assert ("task_registry", "chunk_progress") in messages
+
+    def test_build_workflow_config_skips_none(self):
+        """测试未提供的运行时参数不写入config"""
+        assert build_workflow_config() == {"configurable": {}}
+        assert build_workflow_config(task_id="t")["configurable"] == {"task_id": "t"}
+
+
+class TestAsyncWorkflow:
+    """异步工作流测试"""
+
+    @pytest.mark.asyncio
+    async def test_astream_yields_chunks_as_they_finish(self):
+        """测试异步工作流中语义块结果按完成顺序流式返回"""
+        in_flight = 0
+        peak = 0
+
+        async def async_llm(prompt, output_format=None, temperature=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return QUALITY_RESULT if "total_score" in output_format else SHADOW_RESULT
+
+        text = " ".join(f"This is sentence number {i} of the talk, and it is long enough." for i in range(12))
+        streamed = []
+
+        async def on_chunk(result, completed, total):
+            streamed.append((completed, total))
+
+        results = await astream_shadow_writing(
+            get_async_parallel_shadow_writing_workflow(),
+            {"text": text, "task_id": None, "semantic_chunks": [], "final_shadow_chunks": [],
+             "current_node": "", "error_message": None},
+            build_workflow_config(llm=async_llm),
+            on_chunk=on_chunk
+        )
+
+        total = streamed[-1][1]
+        assert len(results) == total > 1
+        assert [completed for completed, _ in streamed] == list(range(1, total + 1))
+        # 所有语义块的LLM调用在同一事件循环中并发
+        assert peak > 1